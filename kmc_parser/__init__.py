@@ -8,8 +8,12 @@ from .models import (
     MetadataVariable, 
     GenerativeVariable, 
     KMCDocument,
-    KMCVariableDefinition
+    KMCVariableDefinition,
+    RenderReport,
+    RenderResult,
+    VariableStatus
 )
+from .template import CompiledTemplate
 
 # Exponer componentes de la arquitectura expandible
 from .core import registry
@@ -33,6 +37,10 @@ __all__ = [
     "GenerativeVariable",
     "KMCDocument",
     "KMCVariableDefinition",
+    "RenderReport",
+    "RenderResult",
+    "VariableStatus",
+    "CompiledTemplate",
     # Componentes de la arquitectura expandible
     "registry",
     "BaseHandler",
@@ -2,5 +2,46 @@
 Core components del KMC Parser
 """
 from .registry import registry, HandlerRegistry
+from .cache import TemplateCache, OutputCache, ResultCache, DataCache, template_cache, data_cache
+from .store import ResultStore
+from .concurrency import ConcurrencyLimits
+from .dispatch import SingleFlight
+from .batching import MicroBatcher
+from .resilience import Resilience, RetryPolicy, CircuitBreaker, CircuitOpenError, is_transient_error
+from .deadline import Deadline, DeadlineExceeded, remaining_time
+from .routing import RoutingPolicy, FallbackPolicy, HedgePolicy, LatencyPolicy, LatencyTracker, Tier, TierGroup
+from .similarity import SimilarityCache
+from .scheduler import DependencyGraph, DependencyCycleError
 
-__all__ = ["registry", "HandlerRegistry"]
\ No newline at end of file
+__all__ = [
+    "registry",
+    "HandlerRegistry",
+    "TemplateCache",
+    "template_cache",
+    "OutputCache",
+    "ResultCache",
+    "DataCache",
+    "data_cache",
+    "ResultStore",
+    "ConcurrencyLimits",
+    "SingleFlight",
+    "MicroBatcher",
+    "Resilience",
+    "RetryPolicy",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "is_transient_error",
+    "Deadline",
+    "DeadlineExceeded",
+    "remaining_time",
+    "RoutingPolicy",
+    "FallbackPolicy",
+    "HedgePolicy",
+    "LatencyPolicy",
+    "LatencyTracker",
+    "Tier",
+    "TierGroup",
+    "SimilarityCache",
+    "DependencyGraph",
+    "DependencyCycleError"
+]
\ No newline at end of file
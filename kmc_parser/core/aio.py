@@ -0,0 +1,140 @@
+"""
+Aio - Invocación uniforme de handlers síncronos y asíncronos
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List
+import asyncio
+import contextvars
+import inspect
+
+
+def is_async_handler(handler: Callable) -> bool:
+    """
+    Indica si un handler es una corrutina (función async o callable con `__call__` async).
+
+    Args:
+        handler: Handler registrado
+
+    Returns:
+        True si llamar al handler retorna una corrutina
+    """
+    return inspect.iscoroutinefunction(handler) or inspect.iscoroutinefunction(
+        getattr(handler, "__call__", None)
+    )
+
+
+async def _await(awaitable: Awaitable) -> Any:
+    return await awaitable
+
+
+def run_awaitable(awaitable: Awaitable) -> Any:
+    """
+    Ejecuta un awaitable hasta completarlo desde código síncrono.
+
+    Si el hilo actual ya tiene un bucle de eventos en marcha, el awaitable se ejecuta
+    en un bucle propio dentro de otro hilo para no bloquear el bucle existente.
+
+    Args:
+        awaitable: Corrutina o awaitable a ejecutar
+
+    Returns:
+        El resultado del awaitable
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_await(awaitable))
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="kmc-aio") as pool:
+        return pool.submit(asyncio.run, _await(awaitable)).result()
+
+
+def call_handler(handler: Callable, arg: Any) -> Any:
+    """
+    Invoca un handler desde código síncrono, admitiendo handlers asíncronos.
+
+    Args:
+        handler: Handler síncrono o asíncrono
+        arg: Argumento del handler (nombre de variable o variable generativa)
+
+    Returns:
+        El valor retornado por el handler
+    """
+    result = handler(arg)
+    if inspect.isawaitable(result):
+        result = run_awaitable(result)
+    return result
+
+
+async def acall_handler(handler: Callable, arg: Any) -> Any:
+    """
+    Invoca un handler desde código asíncrono.
+
+    Se usa el hook `ahandle` de los handlers basados en clases, el propio handler si
+    es una corrutina, y en otro caso se ejecuta el handler síncrono en el executor
+    por defecto del bucle para no bloquearlo, con una copia del contexto actual
+    (nodo en curso y límite de tiempo del render).
+
+    Args:
+        handler: Handler síncrono o asíncrono
+        arg: Argumento del handler (nombre de variable o variable generativa)
+
+    Returns:
+        El valor retornado por el handler
+    """
+    ahandle = getattr(handler, "ahandle", None)
+    if ahandle is not None:
+        result = await ahandle(arg)
+    elif is_async_handler(handler):
+        result = await handler(arg)
+    else:
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, handler, arg)
+
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+def call_handler_many(handler: Callable, names: List[str]) -> Dict[str, Any]:
+    """
+    Invoca un handler contextual o de metadata para varias variables del mismo tipo.
+
+    Los handlers con `handle_many` reciben todos los nombres en una sola llamada; el
+    resto se invoca una vez por nombre.
+
+    Args:
+        handler: Handler síncrono o asíncrono
+        names: Nombres de las variables
+
+    Returns:
+        Diccionario nombre -> valor
+    """
+    handle_many = getattr(handler, "handle_many", None)
+    if handle_many is None:
+        return {name: call_handler(handler, name) for name in names}
+    return call_handler(handle_many, names)
+
+
+async def acall_handler_many(handler: Callable, names: List[str]) -> Dict[str, Any]:
+    """
+    Versión asíncrona de `call_handler_many`.
+
+    Se usa el hook `ahandle_many` de los handlers basados en clases; el resto de
+    handlers se invoca una vez por nombre de forma concurrente.
+
+    Args:
+        handler: Handler síncrono o asíncrono
+        names: Nombres de las variables
+
+    Returns:
+        Diccionario nombre -> valor
+    """
+    ahandle_many = getattr(handler, "ahandle_many", None)
+    if ahandle_many is not None:
+        return await ahandle_many(names)
+    handle_many = getattr(handler, "handle_many", None)
+    if handle_many is not None:
+        return await acall_handler(handle_many, names)
+    values = await asyncio.gather(*(acall_handler(handler, name) for name in names))
+    return dict(zip(names, values))
@@ -0,0 +1,310 @@
+"""
+Batching - Agrupación de invocaciones generativas de renders concurrentes en lotes
+"""
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+import asyncio
+import threading
+import time
+
+from ..models import GenerativeVariable
+from .aio import call_handler
+from .cache import handler_fingerprint
+from .deadline import Deadline
+
+# Función que genera un lote: recibe el handler y las variables y retorna los resultados
+BatchRunner = Callable[[Callable[[GenerativeVariable], Any], List[GenerativeVariable]], Any]
+
+
+def check_batch_results(results: Any, vars: List[GenerativeVariable]) -> List[Any]:
+    """
+    Comprueba que un lote retorne un resultado por variable.
+
+    Args:
+        results: Resultado de `generate_batch`
+        vars: Variables del lote
+
+    Returns:
+        Lista de resultados en el mismo orden que `vars`
+
+    Raises:
+        ValueError: Si el número de resultados no coincide con el de variables
+    """
+    results = list(results)
+    if len(results) != len(vars):
+        raise ValueError(
+            f"generate_batch de {vars[0].handler_key} retornó {len(results)} resultados para {len(vars)} variables"
+        )
+    return results
+
+
+class _PendingBatch:
+    """Invocaciones en espera de un mismo handler hasta que se genera su lote"""
+
+    __slots__ = ("handler", "items", "timer", "run", "deadline")
+
+    def __init__(self, handler: Callable[[GenerativeVariable], Any]):
+        self.handler = handler
+        # (variable, future del solicitante, instante de llegada)
+        self.items: List[Tuple[GenerativeVariable, Any, float]] = []
+        self.timer: Any = None
+        # Función con la que se genera el lote y límite del solicitante que la aportó
+        self.run: Optional[BatchRunner] = None
+        self.deadline: Optional[Deadline] = None
+
+    def offer(self, run: Optional[BatchRunner], deadline: Optional[Deadline]) -> None:
+        """
+        Adopta la función de generación de un solicitante si su límite es más holgado
+        que el actual: el lote se genera mientras le quede tiempo a alguno de ellos.
+        """
+        if not self.items or (self.deadline is not None
+                              and (deadline is None or deadline.expires_at > self.deadline.expires_at)):
+            self.run = run
+            self.deadline = deadline
+
+
+class MicroBatcher:
+    """
+    Agrupa en lotes las invocaciones generativas de renders concurrentes.
+
+    Cada invocación de un handler con generación en lote (`supports_batch`) espera
+    en la cola de su handler_key durante una ventana corta (`window`, en segundos)
+    o hasta completar `max_batch_size` invocaciones. Entonces se llama una sola vez
+    a `generate_batch` (o `agenerate_batch` en asyncio) y cada solicitante recibe su
+    resultado o su excepción.
+
+    Funciona entre hilos (el lote se genera en el hilo que lo completa o, al vencer
+    la ventana, en el hilo de un temporizador) y entre tareas de asyncio del mismo
+    bucle de eventos.
+
+    Cada solicitante puede aportar la función `run` con la que se genera el lote (el
+    registro de invocaciones aporta una que ocupa un único hueco de los límites de
+    concurrencia del handler, pasa por la capa de resiliencia y fija el límite de
+    tiempo del render). El lote se genera con la del solicitante con el límite de
+    tiempo más holgado; sin ninguna, se llama directamente a `generate_batch`.
+    """
+
+    def __init__(self, window: float = 0.01, max_batch_size: int = 8,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Inicializa el agrupador.
+
+        Args:
+            window: Tiempo máximo en segundos que una invocación espera a que se llene su lote
+            max_batch_size: Número máximo de invocaciones por lote. La configuración
+                `batch_size` de un handler tiene prioridad.
+            clock: Reloj monotónico usado para medir el retardo de cola
+        """
+        if window < 0:
+            raise ValueError("La ventana de agrupación no puede ser negativa")
+        if max_batch_size < 1:
+            raise ValueError("El tamaño máximo de lote debe ser mayor que cero")
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.clock = clock
+        self._pending: Dict[Tuple[Hashable, ...], _PendingBatch] = {}
+        self._tasks: Set[asyncio.Future] = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.invocations = 0
+        self.errors = 0
+        self.batch_sizes: Dict[int, int] = {}
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    def accepts(self, handler: Callable[[GenerativeVariable], Any]) -> bool:
+        """
+        Indica si las invocaciones del handler se agrupan en lotes.
+
+        Args:
+            handler: Handler generativo que se va a invocar
+
+        Returns:
+            True si el handler genera en lote y no lo desactiva con `{"micro_batch": False}`
+        """
+        supports_batch = getattr(handler, "supports_batch", None)
+        if supports_batch is None or not supports_batch():
+            return False
+        config = getattr(handler, "config", None)
+        return not (isinstance(config, dict) and config.get("micro_batch") is False)
+
+    def submit(self, var: GenerativeVariable, handler: Callable[[GenerativeVariable], Any],
+               run: Optional[BatchRunner] = None, deadline: Optional[Deadline] = None) -> Future:
+        """
+        Añade una invocación al lote en espera de su handler.
+
+        Args:
+            var: Variable generativa con el prompt ya resuelto
+            handler: Handler generativo con `generate_batch`
+            run: Función con la que generar el lote (por defecto, `generate_batch`)
+            deadline: Límite de tiempo del solicitante
+
+        Returns:
+            Future con el resultado de la variable
+        """
+        future: Future = Future()
+        key = (var.handler_key, handler_fingerprint(handler))
+        batch = self._enqueue(key, var, handler, future, self._start_timer, run, deadline)
+        if batch is not None:
+            self._run(batch)
+        return future
+
+    def asubmit(self, var: GenerativeVariable, handler: Callable[[GenerativeVariable], Any],
+                run: Optional[Callable[..., Awaitable[Any]]] = None,
+                deadline: Optional[Deadline] = None) -> asyncio.Future:
+        """
+        Versión asíncrona de `submit`: el lote se genera con `agenerate_batch` (o con la
+        corrutina `run`) en el bucle de eventos en marcha.
+
+        Returns:
+            Future de asyncio con el resultado de la variable
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (var.handler_key, handler_fingerprint(handler), loop)
+        batch = self._enqueue(key, var, handler, future,
+                              lambda key, batch: loop.call_later(self.window, self._aflush, key, batch),
+                              run, deadline)
+        if batch is not None:
+            self._spawn(batch)
+        return future
+
+    def _enqueue(self, key: Tuple[Hashable, ...], var: GenerativeVariable,
+                 handler: Callable[[GenerativeVariable], Any], future: Any,
+                 start_timer: Callable[[Tuple[Hashable, ...], _PendingBatch], Any],
+                 run: Optional[Callable[..., Any]] = None,
+                 deadline: Optional[Deadline] = None) -> Optional[_PendingBatch]:
+        """
+        Añade la invocación a la cola de su clave.
+
+        Returns:
+            El lote si la invocación lo completó y debe generarse ya, o None
+        """
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _PendingBatch(handler)
+                batch.timer = start_timer(key, batch)
+            batch.offer(run, deadline)
+            batch.items.append((var, future, self.clock()))
+            if len(batch.items) < self._batch_size(handler):
+                return None
+            del self._pending[key]
+        batch.timer.cancel()
+        return batch
+
+    def _batch_size(self, handler: Callable[[GenerativeVariable], Any]) -> int:
+        """Tamaño máximo de lote del handler"""
+        config = getattr(handler, "config", None)
+        size = config.get("batch_size", self.max_batch_size) if isinstance(config, dict) else self.max_batch_size
+        return max(1, size)
+
+    def _start_timer(self, key: Tuple[Hashable, ...], batch: _PendingBatch) -> threading.Timer:
+        """Programa la generación del lote al vencer la ventana"""
+        timer = threading.Timer(self.window, self._flush, (key, batch))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _take(self, key: Tuple[Hashable, ...], batch: _PendingBatch) -> bool:
+        """Retira el lote de la cola si nadie lo ha generado todavía"""
+        with self._lock:
+            if self._pending.get(key) is not batch:
+                return False
+            del self._pending[key]
+            return True
+
+    def _flush(self, key: Tuple[Hashable, ...], batch: _PendingBatch) -> None:
+        """Genera el lote al vencer su ventana"""
+        if self._take(key, batch):
+            self._run(batch)
+
+    def _aflush(self, key: Tuple[Hashable, ...], batch: _PendingBatch) -> None:
+        """Versión asíncrona de `_flush`"""
+        if self._take(key, batch):
+            self._spawn(batch)
+
+    def _spawn(self, batch: _PendingBatch) -> None:
+        """Genera el lote en una tarea del bucle de eventos"""
+        task = asyncio.ensure_future(self._arun(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _run(self, batch: _PendingBatch) -> None:
+        """Genera un lote con una sola llamada y reparte los resultados"""
+        vars = self._record(batch)
+        try:
+            if batch.run is not None:
+                results = batch.run(batch.handler, vars)
+            else:
+                results = call_handler(batch.handler.generate_batch, vars)
+            results = check_batch_results(results, vars)
+        except Exception as e:
+            results = [e] * len(vars)
+        self._publish(batch, results)
+
+    async def _arun(self, batch: _PendingBatch) -> None:
+        """Versión asíncrona de `_run`"""
+        vars = self._record(batch)
+        try:
+            if batch.run is not None:
+                results = await batch.run(batch.handler, vars)
+            else:
+                results = await batch.handler.agenerate_batch(vars)
+            results = check_batch_results(results, vars)
+        except asyncio.CancelledError:
+            for _, future, _ in batch.items:
+                future.cancel()
+            raise
+        except Exception as e:
+            results = [e] * len(vars)
+        self._publish(batch, results)
+
+    def _record(self, batch: _PendingBatch) -> List[GenerativeVariable]:
+        """Contabiliza el tamaño del lote y el tiempo que esperó cada invocación"""
+        now = self.clock()
+        delays = [now - enqueued for _, _, enqueued in batch.items]
+        with self._lock:
+            self.batches += 1
+            self.invocations += len(batch.items)
+            self.batch_sizes[len(batch.items)] = self.batch_sizes.get(len(batch.items), 0) + 1
+            self.queue_delay_total += sum(delays)
+            self.queue_delay_max = max([self.queue_delay_max] + delays)
+        return [var for var, _, _ in batch.items]
+
+    def _publish(self, batch: _PendingBatch, results: List[Any]) -> None:
+        """Entrega a cada solicitante su resultado o su excepción"""
+        for (_, future, _), result in zip(batch.items, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                with self._lock:
+                    self.errors += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def __len__(self) -> int:
+        """Número de invocaciones en espera"""
+        with self._lock:
+            return sum(len(batch.items) for batch in self._pending.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna las estadísticas de agrupación.
+
+        Returns:
+            Diccionario con lotes generados, invocaciones agrupadas, errores, la
+            distribución de tamaños de lote, el retardo de cola medio y máximo (en
+            segundos) y las invocaciones en espera
+        """
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "invocations": self.invocations,
+                "errors": self.errors,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "mean_queue_delay": self.queue_delay_total / self.invocations if self.invocations else 0.0,
+                "max_queue_delay": self.queue_delay_max,
+                "pending": sum(len(batch.items) for batch in self._pending.values())
+            }
@@ -0,0 +1,716 @@
+"""
+Cache - Caches en memoria del KMC Parser
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+def content_hash(content: str) -> str:
+    """
+    Calcula la clave de contenido usada por las caches.
+
+    Args:
+        content: Texto a identificar
+
+    Returns:
+        Hash hexadecimal SHA-256 del contenido codificado en UTF-8
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class TemplateCache:
+    """
+    Cache LRU de plantillas compiladas indexada por hash de contenido.
+
+    La expulsión tiene en cuenta tanto el número de entradas como el tamaño
+    estimado de cada plantilla, de modo que unas pocas plantillas muy grandes
+    no desplacen la memoria disponible. Es segura para uso desde varios hilos.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Inicializa la cache de plantillas.
+
+        Args:
+            max_entries: Número máximo de plantillas almacenadas
+            max_bytes: Tamaño máximo estimado (en bytes) del total de plantillas
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.logger = logging.getLogger("kmc.cache")
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Obtiene una plantilla compilada y la marca como usada recientemente.
+
+        Args:
+            key: Hash del contenido de la plantilla
+
+        Returns:
+            La plantilla compilada o None si no está en cache
+        """
+        with self._lock:
+            template = self._entries.get(key)
+            if template is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return template
+
+    def put(self, key: str, template: Any) -> None:
+        """
+        Almacena una plantilla compilada, expulsando las menos usadas si es necesario.
+
+        Las plantillas cuyo tamaño supera por sí solo `max_bytes` no se almacenan.
+
+        Args:
+            key: Hash del contenido de la plantilla
+            template: Plantilla compilada (debe exponer el atributo `size`)
+        """
+        size = getattr(template, "size", 0)
+        if size > self.max_bytes:
+            self.logger.debug(f"Plantilla {key[:12]} demasiado grande para la cache ({size} bytes)")
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= getattr(previous, "size", 0)
+
+            self._entries[key] = template
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= getattr(evicted, "size", 0)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Elimina todas las plantillas y reinicia los contadores"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retorna las estadísticas de uso de la cache.
+
+        Returns:
+            Diccionario con aciertos, fallos, expulsiones, entradas y bytes ocupados
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+
+
+
+class OutputCache:
+    """
+    Cache LRU de valores generados indexada por la clave Merkle de cada nodo.
+
+    La clave de un nodo resume todo lo que determina su resultado (fuente, prompt,
+    formato, valores de sus dependencias y claves de los nodos de los que depende),
+    por lo que un valor almacenado puede reutilizarse mientras la clave no cambie.
+    Es segura para uso desde varios hilos. Con `max_entries=0` no almacena nada.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        """
+        Inicializa la cache de valores generados.
+
+        Args:
+            max_entries: Número máximo de valores almacenados
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Obtiene el valor generado para una clave y lo marca como usado recientemente.
+
+        Args:
+            key: Clave Merkle del nodo
+
+        Returns:
+            El valor almacenado o None si no está en cache
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        """
+        Almacena el valor generado de un nodo, expulsando los menos usados si es necesario.
+
+        Args:
+            key: Clave Merkle del nodo
+            value: Valor generado
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Elimina todos los valores y reinicia los contadores"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retorna las estadísticas de uso de la cache.
+
+        Returns:
+            Diccionario con aciertos, fallos, expulsiones y entradas
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries)
+            }
+
+
+# Claves de configuración que controlan la cache y no forman parte de la huella del handler
+_CACHE_CONFIG_KEYS = frozenset({"cache", "cache_ttl"})
+
+
+def handler_fingerprint(handler: Callable) -> str:
+    """
+    Calcula la huella de un handler generativo para las claves de la cache de resultados.
+
+    - Los handlers con un método `cache_key()` o un atributo `fingerprint` se identifican
+      por su clase y ese valor.
+    - Los handlers con atributo `config` (como los `GenerativeHandler`) se identifican por
+      su clase y su configuración, de modo que dos instancias con la misma configuración
+      comparten resultados.
+    - Las funciones se identifican por su nombre, su código, sus valores por defecto y
+      el contenido de las variables que capturan; los métodos, además, por la huella de
+      la instancia a la que están ligados.
+    - El resto de callables se identifican por la propia instancia.
+
+    Solo las huellas que no dependen del proceso (ver `is_portable_fingerprint`) se
+    comparten entre procesos a través del almacén persistente.
+
+    Args:
+        handler: Handler generativo
+
+    Returns:
+        Huella del handler
+    """
+    return _fingerprint(handler, 0)
+
+
+def is_portable_fingerprint(fingerprint: str) -> bool:
+    """
+    Indica si una huella de `handler_fingerprint` es válida en otros procesos.
+
+    Args:
+        fingerprint: Huella del handler
+
+    Returns:
+        False si la huella depende de la identidad de algún objeto del proceso
+    """
+    return _LOCAL_FINGERPRINT not in fingerprint
+
+
+# Separador de las huellas que dependen de la identidad de un objeto del proceso
+_LOCAL_FINGERPRINT = "@local:"
+
+# Profundidad máxima al recorrer las funciones e instancias capturadas por un handler
+_MAX_FINGERPRINT_DEPTH = 4
+
+
+def _fingerprint(handler: Any, depth: int) -> str:
+    """Huella de un handler o de un callable capturado por él"""
+    handler_type = type(handler)
+    name = f"{handler_type.__module__}.{handler_type.__qualname__}"
+    cache_key = getattr(handler, "cache_key", None)
+    explicit = cache_key() if callable(cache_key) else getattr(handler, "fingerprint", None)
+    if explicit is not None:
+        return f"{name}:{content_hash(str(explicit))}"
+    config = getattr(handler, "config", None)
+    if isinstance(config, dict):
+        relevant = {key: value for key, value in config.items() if key not in _CACHE_CONFIG_KEYS}
+        serialized = json.dumps(relevant, sort_keys=True, default=repr)
+        return f"{name}:{content_hash(serialized)}"
+    if depth > _MAX_FINGERPRINT_DEPTH:
+        return f"{name}{_LOCAL_FINGERPRINT}{id(handler)}"
+
+    func = getattr(handler, "__func__", None)
+    owner = getattr(handler, "__self__", None)
+    if func is not None and owner is not None:
+        return _combine(f"{func.__module__}.{func.__qualname__}",
+                        [_fingerprint(func, depth + 1), _value_fingerprint(owner, depth + 1)])
+    code = getattr(handler, "__code__", None)
+    if code is not None:
+        parts = [repr((code.co_code, code.co_consts))]
+        parts.extend(_value_fingerprint(value, depth + 1) for value in handler.__defaults__ or ())
+        parts.extend(f"{key}={_value_fingerprint(value, depth + 1)}"
+                     for key, value in sorted((handler.__kwdefaults__ or {}).items()))
+        for cell in handler.__closure__ or ():
+            try:
+                parts.append(_value_fingerprint(cell.cell_contents, depth + 1))
+            except ValueError:
+                # Celda aún vacía (por ejemplo, una función recursiva que se captura a sí misma)
+                parts.append("<empty>")
+        return _combine(f"{handler.__module__}.{handler.__qualname__}", parts)
+    return f"{name}{_LOCAL_FINGERPRINT}{id(handler)}"
+
+
+def _value_fingerprint(value: Any, depth: int) -> str:
+    """Huella de un valor capturado por un handler: su huella si es un callable o su repr"""
+    if callable(value) or hasattr(value, "config") or hasattr(value, "cache_key") or hasattr(value, "fingerprint"):
+        return _fingerprint(value, depth)
+    serialized = repr(value)
+    if " at 0x" in serialized:
+        # El repr por defecto solo identifica a la instancia dentro del proceso
+        value_type = type(value)
+        return f"{value_type.__module__}.{value_type.__qualname__}{_LOCAL_FINGERPRINT}{id(value)}"
+    return serialized
+
+
+def _combine(name: str, parts: Iterable[str]) -> str:
+    """Combina las huellas de las partes de un handler, que es local si alguna lo es"""
+    parts = list(parts)
+    separator = _LOCAL_FINGERPRINT if any(_LOCAL_FINGERPRINT in part for part in parts) else ":"
+    digest = content_hash("\x00".join(parts))
+    return f"{name}{separator}{digest}"
+
+
+class ResultCache:
+    """
+    Cache LRU con caducidad de los resultados de handlers generativos.
+
+    Las entradas se indexan por la invocación (handler_key, nombre, prompt resuelto,
+    formato) y la huella de configuración del handler. El tiempo de vida se puede
+    ajustar por handler_key, y cada handler puede excluirse de la cache desde aquí
+    (`disable`) o desde su propia configuración (`{"cache": False}`, `{"cache_ttl": 60}`).
+    Es segura para uso desde varios hilos.
+
+    Con un `ResultStore` los resultados se escriben también en disco y los fallos en
+    memoria se buscan en él, de modo que varios procesos comparten los resultados. Los
+    handlers cuya huella depende del proceso se quedan solo en memoria.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, store=None):
+        """
+        Inicializa la cache de resultados.
+
+        Args:
+            max_entries: Número máximo de resultados almacenados en memoria
+            ttl: Tiempo de vida por defecto en segundos (None para no caducar)
+            clock: Reloj monotónico usado para calcular la caducidad
+            store: Almacén persistente (`ResultStore`) compartido entre procesos
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.store = store
+        self._ttls: Dict[str, Optional[float]] = {}
+        self._disabled: Set[str] = set()
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.store_hits = 0
+
+    def set_ttl(self, handler_key: str, ttl: Optional[float]) -> None:
+        """
+        Establece el tiempo de vida de los resultados de un handler.
+
+        Args:
+            handler_key: Clave del handler (ej: "api:weather")
+            ttl: Tiempo de vida en segundos, o None para que no caduquen
+        """
+        self._ttls[handler_key] = ttl
+
+    def disable(self, handler_key: str) -> None:
+        """Excluye un handler de la cache: sus resultados no se almacenan ni se reutilizan"""
+        self._disabled.add(handler_key)
+
+    def enable(self, handler_key: str) -> None:
+        """Vuelve a incluir en la cache un handler excluido con `disable`"""
+        self._disabled.discard(handler_key)
+
+    def key_for(self, var, handler: Callable) -> Optional[Tuple[Hashable, ...]]:
+        """
+        Calcula la clave de cache de una invocación.
+
+        Args:
+            var: Variable generativa con el prompt ya resuelto
+            handler: Handler generativo que se va a invocar
+
+        Returns:
+            La clave, o None si el handler está excluido de la cache
+        """
+        handler_key = var.handler_key
+        config = getattr(handler, "config", None)
+        if handler_key in self._disabled or (isinstance(config, dict) and config.get("cache") is False):
+            return None
+        format_type = var.parameters.get('format') if var.parameters else None
+        return (handler_key, var.name, var.prompt, format_type, handler_fingerprint(handler))
+
+    def ttl_for(self, handler_key: str, handler: Callable) -> Optional[float]:
+        """Tiempo de vida de los resultados de un handler: su configuración, el de la cache o el global"""
+        config = getattr(handler, "config", None)
+        if isinstance(config, dict) and "cache_ttl" in config:
+            return config["cache_ttl"]
+        return self._ttls.get(handler_key, self.ttl)
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Any]:
+        """
+        Obtiene un resultado vigente y lo marca como usado recientemente.
+
+        Args:
+            key: Clave calculada con `key_for`
+
+        Returns:
+            El resultado almacenado, o None si no está o ha caducado
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        stored = self.store.get(key) if self._persistent(key) else None
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.store_hits += 1
+        value, remaining = stored
+        self._remember(key, value, remaining)
+        return value
+
+    def put(self, key: Tuple[Hashable, ...], value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Almacena un resultado, expulsando los menos usados si es necesario.
+
+        Args:
+            key: Clave calculada con `key_for`
+            value: Resultado del handler (None no se almacena)
+            ttl: Tiempo de vida en segundos, o None para que no caduque
+        """
+        if value is None:
+            return
+        self._remember(key, value, ttl)
+        if self._persistent(key):
+            self.store.put(key, value, ttl, handler_key=key[0])
+
+    def _persistent(self, key: Tuple[Hashable, ...]) -> bool:
+        """Indica si la clave se comparte con otros procesos a través del almacén persistente"""
+        return self.store is not None and is_portable_fingerprint(key[-1])
+
+    def warm_start(self, limit: int = 256) -> int:
+        """
+        Precarga en memoria los resultados más usados del almacén persistente.
+
+        Args:
+            limit: Número máximo de resultados a precargar
+
+        Returns:
+            Número de resultados precargados
+        """
+        if self.store is None:
+            return 0
+        hot = self.store.hot(min(limit, self.max_entries))
+        # Los menos usados se cargan primero para que queden antes en el orden LRU
+        for key, value, remaining in reversed(hot):
+            self._remember(key, value, remaining)
+        return len(hot)
+
+    def _remember(self, key: Tuple[Hashable, ...], value: Any, ttl: Optional[float]) -> None:
+        """Guarda un resultado en memoria, expulsando los menos usados si es necesario"""
+        if self.max_entries <= 0:
+            return
+        expires = self.clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Elimina todos los resultados y reinicia los contadores"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+            self.store_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retorna las estadísticas de uso de la cache.
+
+        Returns:
+            Diccionario con aciertos (y los servidos desde el almacén persistente),
+            fallos, expulsiones, caducidades y entradas en memoria
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries)
+            }
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Calcula la firma de validación de un fichero de datos.
+
+    Args:
+        path: Ruta del fichero
+
+    Returns:
+        Tupla (mtime en nanosegundos, tamaño), o None si el fichero no existe
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class DataCache:
+    """
+    Cache compartida de los datos de los handlers contextuales y de metadata.
+
+    Cada fuente de datos (un fichero JSON, un proyecto de la base de datos...) se
+    identifica por una clave y se carga la primera vez que se consulta. En cada
+    consulta posterior se comprueba su firma de validación (mtime y tamaño del
+    fichero, o un ETag que proporciona el handler) y solo se vuelve a cargar si ha
+    cambiado. Las fuentes sin validador se mantienen hasta que se invalidan.
+    Es segura para uso desde varios hilos.
+    """
+
+    def __init__(self, check_interval: float = 0.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Inicializa la cache de datos.
+
+        Args:
+            check_interval: Segundos durante los que una fuente validada no se vuelve a
+                validar (0 para validar en cada consulta)
+            clock: Reloj monotónico usado para el intervalo de validación
+        """
+        self.check_interval = check_interval
+        self.clock = clock
+        # Fuente -> (datos, firma de validación, instante de la última validación)
+        self._entries: Dict[Hashable, Tuple[Any, Hashable, float]] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+
+    def load(self, source: Hashable, loader: Callable[[], Any],
+             validator: Optional[Callable[[], Hashable]] = None) -> Any:
+        """
+        Obtiene los datos de una fuente, cargándolos solo si no están o han cambiado.
+
+        Args:
+            source: Clave de la fuente (ej: ("project", "/ruta/proyecto.json"))
+            loader: Función que carga los datos de la fuente
+            validator: Función que retorna la firma actual de la fuente (mtime y tamaño,
+                ETag...). Si la firma cambia los datos se vuelven a cargar.
+
+        Returns:
+            Los datos de la fuente
+        """
+        entry = self._entries.get(source)
+        if entry is not None and self._fresh(source, entry, validator):
+            with self._lock:
+                self.hits += 1
+            return entry[0]
+
+        with self._lock:
+            source_lock = self._locks.setdefault(source, threading.Lock())
+        # Los hilos que piden la misma fuente esperan a una única carga
+        with source_lock:
+            entry = self._entries.get(source)
+            if entry is not None and self._fresh(source, entry, validator):
+                with self._lock:
+                    self.hits += 1
+                return entry[0]
+
+            signature = validator() if validator is not None else None
+            data = loader()
+            with self._lock:
+                if entry is not None:
+                    self.reloads += 1
+                self.loads += 1
+                self._entries[source] = (data, signature, self.clock())
+            return data
+
+    def load_file(self, source: Hashable, path: str, loader: Callable[[str], Any]) -> Any:
+        """
+        Obtiene los datos de un fichero, volviendo a cargarlo si cambia su mtime o tamaño.
+
+        Args:
+            source: Clave de la fuente
+            path: Ruta del fichero
+            loader: Función que recibe la ruta y carga los datos
+
+        Returns:
+            Los datos del fichero
+        """
+        return self.load(source, lambda: loader(path), lambda: file_signature(path))
+
+    def get_many(self, source: Hashable, names: Iterable[str], loader: Callable[[], Any],
+                 validator: Optional[Callable[[], Hashable]] = None,
+                 default: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """
+        Obtiene varios valores de una fuente con una sola carga y validación.
+
+        Args:
+            source: Clave de la fuente
+            names: Nombres de los valores
+            loader: Función que carga los datos de la fuente (un diccionario)
+            validator: Función que retorna la firma actual de la fuente
+            default: Función que retorna el valor de los nombres que no están en la fuente
+
+        Returns:
+            Diccionario nombre -> valor (los nombres sin valor ni default se omiten)
+        """
+        data = self.load(source, loader, validator)
+        values = {}
+        for name in names:
+            if name in data:
+                values[name] = data[name]
+            elif default is not None:
+                values[name] = default(name)
+        return values
+
+    def invalidate(self, source: Optional[Hashable] = None) -> None:
+        """
+        Descarta los datos de una fuente, o de todas si no se indica ninguna.
+
+        Args:
+            source: Clave de la fuente
+        """
+        with self._lock:
+            if source is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(source, None)
+
+    def clear(self) -> None:
+        """Elimina todas las fuentes y reinicia los contadores"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.loads = 0
+            self.reloads = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, source: Hashable) -> bool:
+        return source in self._entries
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retorna las estadísticas de uso de la cache.
+
+        Returns:
+            Diccionario con aciertos, cargas, recargas por cambio de la fuente y fuentes
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "loads": self.loads,
+                "reloads": self.reloads,
+                "entries": len(self._entries)
+            }
+
+    def _fresh(self, source: Hashable, entry: Tuple[Any, Hashable, float],
+               validator: Optional[Callable[[], Hashable]]) -> bool:
+        """Comprueba si los datos almacenados de una fuente siguen vigentes"""
+        if validator is None:
+            return True
+        data, signature, checked = entry
+        now = self.clock()
+        if self.check_interval and now - checked < self.check_interval:
+            return True
+        if validator() != signature:
+            return False
+        with self._lock:
+            if self._entries.get(source) is entry:
+                self._entries[source] = (data, signature, now)
+        return True
+
+
+# Instancia global de la cache de plantillas compiladas
+template_cache = TemplateCache()
+
+# Instancia global de la cache de datos de handlers contextuales y de metadata
+data_cache = DataCache()
@@ -0,0 +1,407 @@
+"""
+Concurrency - Límites de concurrencia y de ritmo por handler generativo
+"""
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional, Tuple
+import asyncio
+import threading
+import time
+
+from .deadline import DeadlineExceeded
+
+
+class TokenBucket:
+    """
+    Cubo de tokens que limita el ritmo de llamadas de un handler.
+
+    El cubo se llena a `rate` tokens por segundo hasta `burst` tokens y cada llamada
+    reserva uno. Si no hay tokens disponibles la reserva queda en deuda y retorna el
+    tiempo que la llamada debe esperar, de modo que las llamadas concurrentes se
+    reparten en el tiempo en el orden en que llegaron.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Inicializa el cubo lleno.
+
+        Args:
+            rate: Llamadas por segundo permitidas (mayor que cero)
+            burst: Llamadas que pueden hacerse seguidas sin esperar (por defecto,
+                el ritmo redondeado hacia arriba)
+            clock: Reloj monotónico
+        """
+        if rate <= 0:
+            raise ValueError("El ritmo del cubo de tokens debe ser mayor que cero")
+        self.rate = rate
+        self.burst = max(1, burst if burst is not None else int(-(-rate // 1)))
+        self.clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Reserva un token.
+
+        Args:
+            timeout: Espera máxima aceptable en segundos (None para esperar lo necesario)
+
+        Returns:
+            Segundos que hay que esperar antes de hacer la llamada (0 si hay token), o
+            None si la espera superaría `timeout`, en cuyo caso no se reserva nada
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            delay = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if timeout is not None and delay > timeout:
+                return None
+            self._tokens -= 1
+            return delay
+
+    def refund(self) -> None:
+        """Devuelve un token reservado que finalmente no se usó"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class _InFlightGate:
+    """
+    Semáforo de invocaciones en vuelo compartido entre hilos y tareas de asyncio.
+
+    Los hilos esperan con un `threading.Event` y las tareas con un future de su bucle,
+    en una misma cola por orden de llegada.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: Deque[Tuple[Any, ...]] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Reserva un hueco; retorna True si tuvo que esperar.
+
+        Raises:
+            DeadlineExceeded: Si no se obtuvo el hueco en `timeout` segundos; la
+                espera sale de la cola
+        """
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return False
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded("Sin tiempo para esperar un hueco de ejecución")
+            waiter = (threading.Event(),)
+            self._waiters.append(waiter)
+        if not waiter[0].wait(timeout):
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            # Si el hueco se cedió justo al expirar la espera, se conserva
+            if queued:
+                raise DeadlineExceeded(f"Sin hueco de ejecución tras {timeout:.3f}s")
+        return True
+
+    async def aacquire(self, timeout: Optional[float] = None) -> bool:
+        """Versión asíncrona de `acquire`"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return False
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded("Sin tiempo para esperar un hueco de ejecución")
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            done, _ = await asyncio.wait({waiter[1]}, timeout=timeout)
+            if not done:
+                with self._lock:
+                    queued = waiter in self._waiters
+                    if queued:
+                        self._waiters.remove(waiter)
+                if queued:
+                    raise DeadlineExceeded(f"Sin hueco de ejecución tras {timeout:.3f}s")
+                # El hueco ya se cedió a esta tarea: se espera a que llegue
+                await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            # Si el hueco ya se había cedido a esta tarea, se devuelve
+            if not queued and waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+        return True
+
+    def release(self) -> None:
+        """Libera un hueco o lo cede al primero de la cola"""
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            # El hueco pasa directamente al siguiente en la cola
+            waiter = self._waiters.popleft()
+        if len(waiter) == 1:
+            waiter[0].set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(self._grant, future)
+
+    def _grant(self, future: asyncio.Future) -> None:
+        """Cede el hueco a una tarea o lo devuelve si la tarea se canceló entretanto"""
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class ConcurrencyLimits:
+    """
+    Gobernador de invocaciones por handler_key: límite de invocaciones simultáneas
+    y ritmo máximo de llamadas (cubo de tokens).
+
+    Los límites se comparten entre todos los renders del parser que los define, y
+    entre hilos y tareas de asyncio, de modo que varios renders concurrentes no
+    superen el número de llamadas en vuelo ni el ritmo permitidos para un
+    proveedor. Los handlers sin límite no se restringen.
+
+    Los límites también pueden venir de la configuración del handler
+    (`max_in_flight`, `rate_limit` en llamadas por segundo y `rate_burst`); los
+    establecidos explícitamente tienen prioridad.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None,
+                 rates: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Inicializa los límites de concurrencia.
+
+        Args:
+            limits: Número máximo de invocaciones simultáneas por handler_key
+            rates: Número máximo de llamadas por segundo por handler_key
+            clock: Reloj monotónico usado para el ritmo y las esperas
+        """
+        self.clock = clock
+        self._gates: Dict[str, _InFlightGate] = {}
+        self._limits: Dict[str, int] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._explicit: Dict[str, set] = {}
+        self._configured: set = set()
+        self._waits: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        for handler_key, limit in (limits or {}).items():
+            self.set_limit(handler_key, limit)
+        for handler_key, rate in (rates or {}).items():
+            self.set_rate(handler_key, rate)
+
+    def set_limit(self, handler_key: str, limit: Optional[int]) -> None:
+        """
+        Establece el límite de un handler. None elimina el límite.
+
+        Args:
+            handler_key: Clave del handler (ej: "ai:gpt4")
+            limit: Número máximo de invocaciones simultáneas (mayor que cero)
+        """
+        self._set_limit(handler_key, limit)
+        with self._lock:
+            self._explicit.setdefault(handler_key, set()).add("limit")
+
+    def set_rate(self, handler_key: str, rate: Optional[float], burst: Optional[int] = None) -> None:
+        """
+        Establece el ritmo máximo de llamadas de un handler. None elimina el límite.
+
+        Args:
+            handler_key: Clave del handler (ej: "api:stock")
+            rate: Llamadas por segundo (mayor que cero)
+            burst: Llamadas que pueden hacerse seguidas sin esperar
+        """
+        self._set_rate(handler_key, rate, burst)
+        with self._lock:
+            self._explicit.setdefault(handler_key, set()).add("rate")
+
+    def _set_limit(self, handler_key: str, limit: Optional[int]) -> None:
+        if limit is not None and limit < 1:
+            raise ValueError(f"El límite de concurrencia de '{handler_key}' debe ser mayor que cero")
+
+        with self._lock:
+            if limit is None:
+                self._limits.pop(handler_key, None)
+                self._gates.pop(handler_key, None)
+            else:
+                self._limits[handler_key] = limit
+                self._gates[handler_key] = _InFlightGate(limit)
+
+    def _set_rate(self, handler_key: str, rate: Optional[float], burst: Optional[int]) -> None:
+        if rate is not None and rate <= 0:
+            raise ValueError(f"El ritmo de llamadas de '{handler_key}' debe ser mayor que cero")
+
+        with self._lock:
+            if rate is None:
+                self._buckets.pop(handler_key, None)
+            else:
+                self._buckets[handler_key] = TokenBucket(rate, burst, self.clock)
+
+    def configure(self, handler_key: str, handler: Optional[Callable] = None) -> None:
+        """
+        Aplica, la primera vez que se invoca un handler, los límites de su configuración
+        que no se hayan establecido explícitamente.
+
+        Args:
+            handler_key: Clave del handler
+            handler: Handler con la configuración (`max_in_flight`, `rate_limit`, `rate_burst`)
+        """
+        with self._lock:
+            if handler_key in self._configured:
+                return
+            self._configured.add(handler_key)
+            explicit = self._explicit.get(handler_key, set())
+        config = getattr(handler, "config", None)
+        if not isinstance(config, dict):
+            return
+        if "limit" not in explicit and config.get("max_in_flight"):
+            self._set_limit(handler_key, config["max_in_flight"])
+        if "rate" not in explicit and config.get("rate_limit"):
+            self._set_rate(handler_key, config["rate_limit"], config.get("rate_burst"))
+
+    def get_limit(self, handler_key: str) -> Optional[int]:
+        """Obtiene el límite configurado para un handler, o None si no tiene"""
+        return self._limits.get(handler_key)
+
+    def get_rate(self, handler_key: str) -> Optional[float]:
+        """Obtiene el ritmo máximo (llamadas por segundo) de un handler, o None si no tiene"""
+        bucket = self._buckets.get(handler_key)
+        return bucket.rate if bucket is not None else None
+
+    @property
+    def limits(self) -> Dict[str, int]:
+        """Copia de los límites configurados"""
+        return dict(self._limits)
+
+    @contextmanager
+    def slot(self, handler_key: str, handler: Optional[Callable] = None,
+             timeout: Optional[float] = None) -> Iterator[None]:
+        """
+        Espera el turno del handler según su ritmo y reserva un hueco de ejecución
+        mientras dura el bloque.
+
+        Args:
+            handler_key: Clave del handler a invocar
+            handler: Handler a invocar, para aplicar los límites de su configuración
+            timeout: Espera máxima en segundos (por ejemplo, el tiempo que le queda al
+                render); None para esperar lo necesario
+
+        Raises:
+            DeadlineExceeded: Si el turno no llega a tiempo; no se consume ningún token
+                ni se ocupa ningún hueco
+        """
+        self.configure(handler_key, handler)
+        started = self.clock()
+        delay = self._reserve(handler_key, timeout)
+        gate = self._gates.get(handler_key)
+        try:
+            if delay > 0:
+                time.sleep(delay)
+            queued = gate.acquire(self._left(started, timeout)) if gate is not None else False
+        except BaseException:
+            self._refund(handler_key)
+            raise
+        if gate is None:
+            self._record(handler_key, started, delay > 0)
+            yield
+            return
+
+        self._record(handler_key, started, delay > 0, queued)
+        try:
+            yield
+        finally:
+            gate.release()
+
+    @asynccontextmanager
+    async def aslot(self, handler_key: str, handler: Optional[Callable] = None,
+                    timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Versión asíncrona de `slot`: las esperas no bloquean el bucle de eventos"""
+        self.configure(handler_key, handler)
+        started = self.clock()
+        delay = self._reserve(handler_key, timeout)
+        gate = self._gates.get(handler_key)
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queued = await gate.aacquire(self._left(started, timeout)) if gate is not None else False
+        except BaseException:
+            self._refund(handler_key)
+            raise
+        if gate is None:
+            self._record(handler_key, started, delay > 0)
+            yield
+            return
+
+        self._record(handler_key, started, delay > 0, queued)
+        try:
+            yield
+        finally:
+            gate.release()
+
+    def _reserve(self, handler_key: str, timeout: Optional[float]) -> float:
+        """Reserva un token del cubo del handler y retorna la espera hasta poder usarlo"""
+        bucket = self._buckets.get(handler_key)
+        if bucket is None:
+            return 0.0
+        delay = bucket.reserve(timeout)
+        if delay is None:
+            raise DeadlineExceeded(f"El ritmo de '{handler_key}' no deja llamar en {timeout:.3f}s")
+        return delay
+
+    def _refund(self, handler_key: str) -> None:
+        """Devuelve el token reservado por una invocación que no llegó a ejecutarse"""
+        bucket = self._buckets.get(handler_key)
+        if bucket is not None:
+            bucket.refund()
+
+    def _left(self, started: float, timeout: Optional[float]) -> Optional[float]:
+        """Parte de la espera máxima que queda tras la espera por el ritmo"""
+        return None if timeout is None else max(0.0, timeout - (self.clock() - started))
+
+    def _record(self, handler_key: str, started: float, throttled: bool, queued: bool = False) -> None:
+        """Contabiliza el tiempo que una invocación esperó su turno"""
+        wait = max(0.0, self.clock() - started) if throttled or queued else 0.0
+        with self._lock:
+            waits = self._waits.setdefault(handler_key, {
+                "acquired": 0, "throttled": 0, "queued": 0, "wait_total": 0.0, "wait_max": 0.0
+            })
+            waits["acquired"] += 1
+            waits["throttled"] += 1 if throttled else 0
+            waits["queued"] += 1 if throttled or queued else 0
+            waits["wait_total"] += wait
+            waits["wait_max"] = max(waits["wait_max"], wait)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Retorna las estadísticas de espera por handler_key.
+
+        Returns:
+            Para cada handler: invocaciones admitidas, cuántas esperaron por el ritmo
+            (`throttled`) o por el ritmo o el límite de vuelo (`queued`), la espera total, media y
+            máxima en segundos, las invocaciones en vuelo y los límites vigentes
+        """
+        with self._lock:
+            stats = {}
+            for handler_key in set(self._waits) | set(self._limits) | set(self._buckets):
+                waits = dict(self._waits.get(handler_key, {
+                    "acquired": 0, "throttled": 0, "queued": 0, "wait_total": 0.0, "wait_max": 0.0
+                }))
+                waits["wait_mean"] = waits["wait_total"] / waits["acquired"] if waits["acquired"] else 0.0
+                gate = self._gates.get(handler_key)
+                bucket = self._buckets.get(handler_key)
+                waits["in_flight"] = gate.active if gate is not None else None
+                waits["max_in_flight"] = self._limits.get(handler_key)
+                waits["rate_limit"] = bucket.rate if bucket is not None else None
+                stats[handler_key] = waits
+            return stats
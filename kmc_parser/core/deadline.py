@@ -0,0 +1,67 @@
+"""
+Deadline - Presupuesto de tiempo de un render
+"""
+from contextvars import ContextVar
+from typing import Callable, Optional
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """Se agotó el presupuesto de tiempo del render antes de invocar al handler"""
+
+
+class Deadline:
+    """
+    Instante límite de un render.
+
+    Se crea con el presupuesto en segundos y se comparte con todas las invocaciones
+    del render: el registro de invocaciones no llama a los handlers una vez agotado,
+    la capa de resiliencia no reintenta si la espera no cabe en el tiempo restante y
+    los handlers pueden consultar el tiempo que les queda con `remaining_time()`.
+    """
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            seconds: Presupuesto de tiempo en segundos desde ahora
+            clock: Reloj monotónico
+        """
+        if seconds < 0:
+            raise ValueError("El presupuesto de tiempo no puede ser negativo")
+        self.seconds = seconds
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        """Segundos que quedan hasta el límite (0 si ya pasó)"""
+        return max(0.0, self.expires_at - self.clock())
+
+    def expired(self) -> bool:
+        """Indica si se agotó el presupuesto"""
+        return self.clock() >= self.expires_at
+
+    def check(self) -> None:
+        """
+        Comprueba que queda tiempo.
+
+        Raises:
+            DeadlineExceeded: Si se agotó el presupuesto
+        """
+        if self.expired():
+            raise DeadlineExceeded(f"Presupuesto de {self.seconds}s agotado")
+
+
+# Límite del render que se está generando en el contexto actual
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("kmc_current_deadline", default=None)
+
+
+def remaining_time() -> Optional[float]:
+    """
+    Tiempo que le queda al render en curso, para que los handlers ajusten sus
+    llamadas (por ejemplo, el timeout de una petición HTTP).
+
+    Returns:
+        Segundos restantes, o None si el render no tiene límite
+    """
+    deadline = current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
@@ -0,0 +1,900 @@
+"""
+Dispatch - Capa de invocación de handlers generativos
+"""
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor, Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple, Union
+import asyncio
+import contextvars
+import threading
+
+from ..models import GenerativeVariable
+from .aio import acall_handler, call_handler, run_awaitable
+from .batching import MicroBatcher, check_batch_results
+from .cache import ResultCache, handler_fingerprint
+from .concurrency import ConcurrencyLimits
+from .deadline import Deadline, DeadlineExceeded, current_deadline
+from .resilience import CircuitOpenError, Resilience, RetryBudget
+from .routing import LatencyTracker, RoutedHandler, current_dispatcher
+from .similarity import SimilarityCache
+from .streaming import DeltaStream, current_node, is_delta_stream
+
+
+def invocation_key(var: GenerativeVariable) -> Tuple[Hashable, ...]:
+    """
+    Calcula la clave que identifica una invocación de handler generativo.
+
+    La clave incluye el handler, el nombre de la variable, el prompt ya resuelto y el
+    formato. El nombre forma parte de la identidad porque hay handlers (por ejemplo
+    `api:stock`) que generan su salida a partir de él.
+
+    Args:
+        var: Variable generativa con el prompt ya resuelto
+
+    Returns:
+        Tupla (handler_key, nombre, prompt, formato)
+    """
+    format_type = var.parameters.get('format') if var.parameters else None
+    return (var.handler_key, var.name, var.prompt, format_type)
+
+
+class FlightAbandoned(Exception):
+    """El render que ejecutaba una invocación compartida la abandonó sin resultado"""
+
+
+class SingleFlight:
+    """
+    Tabla de invocaciones generativas en curso compartida entre renders.
+
+    Cuando varias peticiones con la misma clave coinciden en el tiempo, solo la
+    primera ejecuta el handler; el resto espera el mismo future y recibe su
+    resultado o su excepción. Funciona entre hilos y entre tareas de asyncio (que
+    esperan el future con `asyncio.wrap_future`). La entrada se elimina al terminar,
+    de modo que una petición posterior vuelve a ejecutar el handler.
+
+    Si el render que ejecuta la invocación se cancela o agota su límite de tiempo, la
+    abandona con `abandon`: los que esperan reciben `FlightAbandoned` y vuelven a
+    unirse a la tabla, de modo que uno de ellos pasa a ejecutarla.
+    """
+
+    def __init__(self):
+        """Inicializa una tabla vacía"""
+        self._flights: Dict[Tuple[Hashable, ...], Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key_for(var: GenerativeVariable, handler: Callable[[GenerativeVariable], Any]) -> Tuple[Hashable, ...]:
+        """
+        Calcula la clave de una invocación: la de `invocation_key` más la huella del handler.
+
+        Args:
+            var: Variable generativa con el prompt ya resuelto
+            handler: Handler generativo que se va a invocar
+
+        Returns:
+            Clave de la invocación
+        """
+        return invocation_key(var) + (handler_fingerprint(handler),)
+
+    def join(self, key: Tuple[Hashable, ...]) -> Tuple[Future, bool]:
+        """
+        Se une a la invocación en curso con esa clave o la inicia.
+
+        Args:
+            key: Clave calculada con `key_for`
+
+        Returns:
+            Tupla (future de la invocación, True si el llamador debe ejecutarla)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = Future()
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, key: Tuple[Hashable, ...], flight: Future, result: Any = None,
+               error: Optional[BaseException] = None) -> None:
+        """
+        Completa una invocación iniciada con `join` y despierta a los que esperan.
+
+        Args:
+            key: Clave de la invocación
+            flight: Future retornado por `join`
+            result: Resultado del handler
+            error: Excepción del handler, que se propaga a todos los que esperan
+        """
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+
+    def abandon(self, key: Tuple[Hashable, ...], flight: Future) -> None:
+        """
+        Retira una invocación sin publicar su resultado para que otro la ejecute.
+
+        Args:
+            key: Clave de la invocación
+            flight: Future retornado por `join`
+        """
+        self.finish(key, flight, error=FlightAbandoned())
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retorna las estadísticas de coalescencia.
+
+        Returns:
+            Diccionario con invocaciones ejecutadas, llamadas agrupadas y vuelos en curso
+        """
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights)
+            }
+
+
+class InvocationLedger:
+    """
+    Registro de las invocaciones de handlers generativos de un render.
+
+    Garantiza que cada invocación (handler_key, nombre, prompt resuelto, formato) se
+    ejecute como máximo una vez; el resto de placeholders que necesiten el mismo
+    resultado lo comparten, incluidos los errores. Es segura para uso desde varios hilos.
+
+    Los handlers que retornan un iterador de deltas se consumen hasta el final y su
+    resultado es el texto completo; el flujo se notifica a `on_stream` para que el
+    render por fragmentos pueda reenviar los deltas mientras se generan.
+
+    Con una cache de resultados, las invocaciones cuyo resultado ya está almacenado
+    no llegan a llamar al handler, y los resultados nuevos se guardan en ella. Con
+    una tabla `SingleFlight`, las invocaciones idénticas de renders simultáneos
+    esperan al que llegó primero en lugar de volver a llamar al handler. Con una
+    cache de similitud, los handlers que lo toleran reutilizan el resultado de un
+    prompt casi idéntico.
+
+    Las invocaciones de handlers con generación en lote se pueden reservar con
+    `prepare_batch` (o `aprepare_batch`): el lote se genera con una sola llamada a
+    `generate_batch` y las llamadas a `invoke` de sus variables esperan su resultado.
+    Con un `MicroBatcher`, el resto de invocaciones de esos handlers se agrupan en
+    lotes con las de otros renders simultáneos: cada lote ocupa un hueco del límite de
+    concurrencia y pasa por la capa de resiliencia, y cada render espera su resultado
+    como máximo hasta su límite de tiempo.
+
+    Con una capa `Resilience`, las llamadas fallidas se reintentan con espera
+    exponencial mientras quede presupuesto de reintentos del render, y las de un
+    handler con el cortacircuitos abierto fallan al momento.
+
+    Con un `Deadline`, agotado el presupuesto de tiempo del render no se invoca a
+    ningún handler más (`DeadlineExceeded`) y los handlers pueden consultar el
+    tiempo restante con `remaining_time()` mientras se ejecutan.
+
+    Las rutas (`RoutedHandler`) no ocupan límite ni cortacircuitos propios: cada
+    intento contra uno de sus backends pasa por `call_backend` (o `acall_backend`) con
+    el límite de concurrencia, el cortacircuitos y el registro de latencias del backend.
+    """
+
+    def __init__(self, limits: Optional[ConcurrencyLimits] = None,
+                 on_stream: Optional[Callable[[DeltaStream], None]] = None,
+                 result_cache: Optional[ResultCache] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 similarity_cache: Optional[SimilarityCache] = None,
+                 micro_batcher: Optional[MicroBatcher] = None,
+                 resilience: Optional[Resilience] = None,
+                 retry_budget: Optional[RetryBudget] = None,
+                 deadline: Optional[Deadline] = None,
+                 latency: Optional[LatencyTracker] = None,
+                 route_executor: Optional[Callable[[], Executor]] = None):
+        """
+        Inicializa un registro vacío.
+
+        Args:
+            limits: Límites de invocaciones simultáneas por handler_key
+            on_stream: Función llamada con cada flujo de deltas al empezar a consumirlo
+            result_cache: Cache de resultados compartida entre renders
+            single_flight: Tabla de invocaciones en curso compartida entre renders
+            similarity_cache: Cache de resultados de prompts casi idénticos
+            micro_batcher: Agrupador de invocaciones compartido entre renders
+            resilience: Capa de reintentos y cortacircuitos compartida entre renders
+            retry_budget: Presupuesto de reintentos del render (por defecto, ilimitado)
+            deadline: Límite de tiempo del render
+            latency: Registro de latencias por handler_key donde se mide cada llamada
+            route_executor: Función que obtiene el executor acotado en el que las rutas
+                lanzan sus coberturas en hilos
+        """
+        self.limits = limits or ConcurrencyLimits()
+        self.on_stream = on_stream
+        self.result_cache = result_cache
+        self.single_flight = single_flight
+        self.similarity_cache = similarity_cache
+        self.micro_batcher = micro_batcher
+        self.resilience = resilience
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget(None)
+        self.deadline = deadline
+        self.latency = latency
+        self._route_executor = route_executor
+        self._streams: Dict[Tuple[Hashable, ...], DeltaStream] = {}
+        self._entries: Dict[Tuple[Hashable, ...], Future] = {}
+        self._async_entries: Dict[Tuple[Hashable, ...], asyncio.Future] = {}
+        self._reserved: Set[Tuple[Hashable, ...]] = set()
+        # Llamadas en curso que se están midiendo: (handler_key, inicio, identificador)
+        self._timings: Set[Tuple[str, float, object]] = set()
+        self._lock = threading.Lock()
+        self.invocations = 0
+        self.shared = 0
+        self.cached = 0
+        self.coalesced = 0
+        self.approximate = 0
+        self.batches = 0
+        self.batched = 0
+        self.micro_batched = 0
+        self.rejected = 0
+        self.by_handler: Dict[str, int] = {}
+        # Nodos del grafo cuyo resultado salió de la cache de resultados o de similitud
+        self.cached_nodes: Set[Hashable] = set()
+
+    def invoke(self, var: GenerativeVariable, handler: Callable[[GenerativeVariable], Any]) -> Any:
+        """
+        Ejecuta el handler para la variable, o reutiliza el resultado si ya se ejecutó.
+
+        Args:
+            var: Variable generativa con el prompt ya resuelto
+            handler: Handler generativo a invocar
+
+        Returns:
+            El valor retornado por el handler
+
+        Raises:
+            Exception: La excepción lanzada por el handler, para todos los solicitantes
+        """
+        key = invocation_key(var)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                owner = entry is None
+                if owner:
+                    entry = Future()
+                    self._entries[key] = entry
+                else:
+                    self._share(key)
+                    stream = self._streams.get(key)
+
+            if owner:
+                try:
+                    entry.set_result(self._execute(key, var, handler))
+                except Exception as e:
+                    entry.set_exception(e)
+            elif stream is not None and self.on_stream is not None:
+                self.on_stream(stream)
+
+            try:
+                return entry.result()
+            except FlightAbandoned:
+                # El render que ejecutaba la invocación compartida la abandonó: se reintenta
+                self._discard(self._entries, key, entry)
+
+    def _execute(self, key: Tuple[Hashable, ...], var: GenerativeVariable,
+                 handler: Callable[[GenerativeVariable], Any]) -> Any:
+        """Obtiene el resultado de la cache, de una invocación en curso o llamando al handler"""
+        cache_key, result = self._cached(var, handler)
+        if result is not None:
+            return result
+
+        flight_key, flight = self._join_flight(var, handler)
+        if flight_key is None:
+            return flight.result()
+        if self.deadline is not None:
+            self._check_deadline(flight_key, flight)
+
+        try:
+            self._count(var.handler_key)
+            if self._micro_batch(handler):
+                result = self._wait_micro_batch(
+                    self.micro_batcher.submit(var, handler, self._run_micro_batch, self.deadline))
+            elif isinstance(handler, RoutedHandler):
+                result = self._call_routed(key, handler, var)
+            else:
+                result = self._guarded(var.handler_key, handler, self._call, key, handler, var)
+        except BaseException as e:
+            self._fail_flight(flight_key, flight, e)
+            raise
+        self._store(cache_key, var, handler, result)
+        self._finish_flight(flight_key, flight, result)
+        return result
+
+    def _call(self, key: Tuple[Hashable, ...], handler: Callable[[GenerativeVariable], Any],
+              var: GenerativeVariable) -> Any:
+        """Invoca el handler dentro de su límite de concurrencia y consume su flujo de deltas"""
+        with self.limits.slot(var.handler_key, handler, self._remaining()):
+            context_token = current_deadline.set(self.deadline)
+            timing = self._start_timing(var.handler_key)
+            try:
+                result = self._consume(key, call_handler(handler, var))
+            finally:
+                current_deadline.reset(context_token)
+                self._stop_timing(timing)
+        return result
+
+    def _consume(self, key: Tuple[Hashable, ...], result: Any) -> Any:
+        """Consume el flujo de deltas de un handler, si retorna uno, y retorna el texto completo"""
+        if not is_delta_stream(result):
+            return result
+        stream = self._open_stream(key)
+        if isinstance(result, AsyncIterator):
+            return run_awaitable(stream.aconsume(result))
+        return stream.consume(result)
+
+    def _call_routed(self, key: Tuple[Hashable, ...], handler: RoutedHandler, var: GenerativeVariable) -> Any:
+        """Invoca una ruta: sus intentos vuelven a este registro a través de `call_backend`"""
+        dispatcher_token = current_dispatcher.set(self)
+        context_token = current_deadline.set(self.deadline)
+        try:
+            return self._consume(key, handler(var))
+        finally:
+            current_deadline.reset(context_token)
+            current_dispatcher.reset(dispatcher_token)
+
+    def call_backend(self, var: GenerativeVariable, handler: Callable[[GenerativeVariable], Any]) -> Any:
+        """
+        Ejecuta un intento de una ruta contra uno de sus backends, con el límite de
+        concurrencia, el cortacircuitos y el registro de latencias de ese backend.
+
+        Args:
+            var: Variable dirigida al handler_key del backend
+            handler: Handler del backend
+
+        Returns:
+            El valor retornado por el backend
+        """
+        return self._guarded(var.handler_key, handler, self._call_backend, handler, var)
+
+    def _call_backend(self, handler: Callable[[GenerativeVariable], Any], var: GenerativeVariable) -> Any:
+        """Llama al handler de un backend dentro de su límite de concurrencia"""
+        with self.limits.slot(var.handler_key, handler, self._remaining()):
+            timing = self._start_timing(var.handler_key)
+            try:
+                return call_handler(handler, var)
+            finally:
+                self._stop_timing(timing)
+
+    async def acall_backend(self, var: GenerativeVariable, handler: Callable[[GenerativeVariable], Any]) -> Any:
+        """Versión asíncrona de `call_backend`"""
+        return await self._aguarded(var.handler_key, handler, self._acall_backend, handler, var)
+
+    async def _acall_backend(self, handler: Callable[[GenerativeVariable], Any], var: GenerativeVariable) -> Any:
+        """Versión asíncrona de `_call_backend`"""
+        async with self.limits.aslot(var.handler_key, handler, self._remaining()):
+            timing = self._start_timing(var.handler_key)
+            try:
+                return await acall_handler(handler, var)
+            finally:
+                self._stop_timing(timing)
+
+    async def _acall_routed(self, key: Tuple[Hashable, ...], handler: RoutedHandler,
+                            var: GenerativeVariable) -> Any:
+        """Versión asíncrona de `_call_routed`"""
+        dispatcher_token = current_dispatcher.set(self)
+        context_token = current_deadline.set(self.deadline)
+        try:
+            return await self._aconsume(key, await acall_handler(handler, var))
+        finally:
+            current_deadline.reset(context_token)
+            current_dispatcher.reset(dispatcher_token)
+
+    def _remaining(self) -> Optional[float]:
+        """Tiempo que le queda al render, con el que se acotan las esperas del gobernador"""
+        return self.deadline.remaining() if self.deadline is not None else None
+
+    def route_executor(self) -> Optional[Executor]:
+        """Executor en el que las rutas lanzan sus coberturas en hilos (None si no hay)"""
+        return self._route_executor() if self._route_executor is not None else None
+
+    async def ainvoke(self, var: GenerativeVariable, handler: Callable[[GenerativeVariable], Any]) -> Any:
+        """
+        Versión asíncrona de `invoke` para renders con asyncio.
+
+        Los límites por handler_key se esperan sin bloquear el bucle de eventos y se
+        comparten con las invocaciones de otros hilos.
+
+        Args:
+            var: Variable generativa con el prompt ya resuelto
+            handler: Handler generativo (síncrono o asíncrono) a invocar
+
+        Returns:
+            El valor retornado por el handler
+        """
+        key = invocation_key(var)
+        while True:
+            with self._lock:
+                entry = self._async_entries.get(key)
+                owner = entry is None
+                if owner:
+                    entry = asyncio.get_running_loop().create_future()
+                    self._async_entries[key] = entry
+                else:
+                    self._share(key)
+                    stream = self._streams.get(key)
+
+            if owner:
+                try:
+                    entry.set_result(await self._aexecute(key, var, handler))
+                except asyncio.CancelledError:
+                    entry.cancel()
+                    raise
+                except Exception as e:
+                    entry.set_exception(e)
+            elif stream is not None and self.on_stream is not None:
+                self.on_stream(stream)
+
+            try:
+                return await entry
+            except FlightAbandoned:
+                self._discard(self._async_entries, key, entry)
+
+    async def _aexecute(self, key: Tuple[Hashable, ...], var: GenerativeVariable,
+                        handler: Callable[[GenerativeVariable], Any]) -> Any:
+        """Versión asíncrona de `_execute`"""
+        cache_key, result = self._cached(var, handler)
+        if result is not None:
+            return result
+
+        flight_key, flight = self._join_flight(var, handler)
+        if flight_key is None:
+            return await asyncio.wrap_future(flight)
+        if self.deadline is not None:
+            self._check_deadline(flight_key, flight)
+
+        try:
+            self._count(var.handler_key)
+            if self._micro_batch(handler):
+                result = await self._await_micro_batch(
+                    self.micro_batcher.asubmit(var, handler, self._arun_micro_batch, self.deadline))
+            elif isinstance(handler, RoutedHandler):
+                result = await self._acall_routed(key, handler, var)
+            else:
+                result = await self._aguarded(var.handler_key, handler, self._alimited, key, handler, var)
+        except BaseException as e:
+            self._fail_flight(flight_key, flight, e)
+            raise
+        self._store(cache_key, var, handler, result)
+        self._finish_flight(flight_key, flight, result)
+        return result
+
+    def prepare_batch(self, vars: List[GenerativeVariable],
+                      handler: Callable[[GenerativeVariable], Any]) -> Optional[Callable[[], None]]:
+        """
+        Reserva las invocaciones de un lote para que `invoke` espere su resultado.
+
+        Las invocaciones que ya están en curso o resueltas en este render no se
+        incluyen en el lote.
+
+        Args:
+            vars: Variables generativas con el prompt ya resuelto, del mismo handler
+            handler: Handler generativo con `generate_batch`
+
+        Returns:
+            Función que genera el lote y publica sus resultados, o None si no queda
+            ninguna invocación que generar
+        """
+        owned = self._reserve(vars, self._entries, Future)
+        if not owned:
+            return None
+        return lambda: self._execute_batch(owned, handler)
+
+    def aprepare_batch(self, vars: List[GenerativeVariable],
+                       handler: Callable[[GenerativeVariable], Any]) -> Optional[Callable[[], Awaitable[None]]]:
+        """
+        Versión asíncrona de `prepare_batch` para las invocaciones de `ainvoke`.
+
+        Returns:
+            Corrutina que genera el lote, o None si no queda ninguna invocación que generar
+        """
+        owned = self._reserve(vars, self._async_entries, asyncio.get_running_loop().create_future)
+        if not owned:
+            return None
+        return lambda: self._aexecute_batch(owned, handler)
+
+    def _reserve(self, vars: List[GenerativeVariable], entries: Dict[Tuple[Hashable, ...], Any],
+                 new_entry: Callable[[], Any]) -> List[Tuple[GenerativeVariable, Any]]:
+        """Crea las entradas de las invocaciones del lote que aún no existen"""
+        owned = []
+        with self._lock:
+            for var in vars:
+                key = invocation_key(var)
+                if key in entries:
+                    continue
+                entry = new_entry()
+                entries[key] = entry
+                self._reserved.add(key)
+                owned.append((var, entry))
+        return owned
+
+    def _share(self, key: Tuple[Hashable, ...]) -> None:
+        """Contabiliza un resultado compartido, salvo la primera espera de una invocación reservada"""
+        if key in self._reserved:
+            self._reserved.discard(key)
+        else:
+            self.shared += 1
+
+    def _execute_batch(self, owned: List[Tuple[GenerativeVariable, Future]],
+                       handler: Callable[[GenerativeVariable], Any]) -> None:
+        """Genera con una sola llamada las invocaciones del lote que no estén en cache ni en curso"""
+        try:
+            pending = self._batch_pending(owned, handler)
+        except Exception as e:
+            self._abandon_batch(owned, e)
+            return
+        if not pending:
+            return
+        vars = [item[0] for item in pending]
+        try:
+            self._count_batch(vars[0].handler_key, len(vars))
+            results = self._guarded(vars[0].handler_key, handler, self._call_batch, handler, vars)
+            results = check_batch_results(results, vars)
+        except Exception as e:
+            results = [e] * len(vars)
+        self._complete_batch(pending, handler, results)
+
+    async def _aexecute_batch(self, owned: List[Tuple[GenerativeVariable, asyncio.Future]],
+                              handler: Callable[[GenerativeVariable], Any]) -> None:
+        """Versión asíncrona de `_execute_batch`"""
+        try:
+            pending = self._batch_pending(owned, handler)
+        except Exception as e:
+            self._abandon_batch(owned, e)
+            return
+        if not pending:
+            return
+        vars = [item[0] for item in pending]
+        try:
+            self._count_batch(vars[0].handler_key, len(vars))
+            results = await self._aguarded(vars[0].handler_key, handler, self._acall_batch, handler, vars)
+            results = check_batch_results(results, vars)
+        except asyncio.CancelledError:
+            for _, entry, _, flight_key, flight in pending:
+                self._abandon_flight(flight_key, flight)
+                entry.cancel()
+            raise
+        except Exception as e:
+            results = [e] * len(vars)
+        self._complete_batch(pending, handler, results)
+
+    def _batch_pending(self, owned: List[Tuple[GenerativeVariable, Any]],
+                       handler: Callable[[GenerativeVariable], Any]) -> List[Tuple[Any, ...]]:
+        """
+        Resuelve las invocaciones del lote que están en la cache o en curso en otro
+        render, y retorna las que hay que generar.
+
+        Returns:
+            Lista de tuplas (variable, entrada, clave de cache, clave de vuelo, vuelo)
+        """
+        pending = []
+        for var, entry in owned:
+            cache_key, result = self._cached(var, handler)
+            if result is not None:
+                entry.set_result(result)
+                continue
+            flight_key, flight = self._join_flight(var, handler)
+            if flight_key is None:
+                self._follow(flight, entry)
+                continue
+            pending.append((var, entry, cache_key, flight_key, flight))
+        return pending
+
+    @staticmethod
+    def _abandon_batch(owned: List[Tuple[GenerativeVariable, Any]], error: Exception) -> None:
+        """Publica un error en las entradas del lote que aún no tienen resultado"""
+        for _, entry in owned:
+            if not entry.done():
+                entry.set_exception(error)
+
+    @staticmethod
+    def _follow(flight: Future, entry: Union[Future, asyncio.Future]) -> None:
+        """Publica en la entrada el resultado de una invocación en curso en otro render"""
+        def copy(done: Future) -> None:
+            if entry.done():
+                return
+            error = done.exception()
+            if error is not None:
+                entry.set_exception(error)
+            else:
+                entry.set_result(done.result())
+
+        if isinstance(entry, asyncio.Future):
+            loop = entry.get_loop()
+            flight.add_done_callback(lambda done: loop.call_soon_threadsafe(copy, done))
+        else:
+            flight.add_done_callback(copy)
+
+    def _complete_batch(self, pending: List[Tuple[Any, ...]], handler: Callable[[GenerativeVariable], Any],
+                        results: List[Any]) -> None:
+        """Almacena y publica los resultados de un lote a los que los esperan"""
+        for (var, entry, cache_key, flight_key, flight), result in zip(pending, results):
+            if isinstance(result, BaseException):
+                self._finish_flight(flight_key, flight, error=result)
+                entry.set_exception(result)
+                continue
+            self._store(cache_key, var, handler, result)
+            self._finish_flight(flight_key, flight, result)
+            entry.set_result(result)
+
+    def _micro_batch(self, handler: Callable[[GenerativeVariable], Any]) -> bool:
+        """Indica si la invocación se agrupa con las de otros renders y la contabiliza"""
+        if self.micro_batcher is None or not self.micro_batcher.accepts(handler):
+            return False
+        with self._lock:
+            self.micro_batched += 1
+        return True
+
+    def _run_micro_batch(self, handler: Callable[[GenerativeVariable], Any],
+                         vars: List[GenerativeVariable]) -> Any:
+        """Genera un lote del agrupador con el límite de concurrencia, la resiliencia y el límite de tiempo"""
+        return self._guarded(vars[0].handler_key, handler, self._call_batch, handler, vars)
+
+    async def _arun_micro_batch(self, handler: Callable[[GenerativeVariable], Any],
+                                vars: List[GenerativeVariable]) -> Any:
+        """Versión asíncrona de `_run_micro_batch`"""
+        return await self._aguarded(vars[0].handler_key, handler, self._acall_batch, handler, vars)
+
+    def _wait_micro_batch(self, future: Future) -> Any:
+        """
+        Espera el resultado de una invocación agrupada como máximo hasta el límite del
+        render; después el nodo se abandona aunque el lote siga en curso.
+        """
+        try:
+            return future.result(timeout=self._remaining())
+        except DeadlineExceeded:
+            raise
+        except FutureTimeoutError:
+            raise DeadlineExceeded("Límite de tiempo agotado esperando el lote")
+
+    async def _await_micro_batch(self, future: asyncio.Future) -> Any:
+        """Versión asíncrona de `_wait_micro_batch`"""
+        try:
+            return await asyncio.wait_for(future, self._remaining())
+        except DeadlineExceeded:
+            raise
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Límite de tiempo agotado esperando el lote")
+
+    def _count_batch(self, handler_key: str, size: int) -> None:
+        """Contabiliza una llamada en lote como una invocación efectiva del handler"""
+        self._count(handler_key)
+        with self._lock:
+            self.batches += 1
+            self.batched += size
+
+    def _call_batch(self, handler: Callable[[GenerativeVariable], Any], vars: List[GenerativeVariable]) -> Any:
+        """Llama a `generate_batch` dentro del límite de concurrencia del handler"""
+        with self.limits.slot(vars[0].handler_key, handler, self._remaining()):
+            context_token = current_deadline.set(self.deadline)
+            try:
+                return call_handler(handler.generate_batch, vars)
+            finally:
+                current_deadline.reset(context_token)
+
+    async def _acall_batch(self, handler: Callable[[GenerativeVariable], Any],
+                           vars: List[GenerativeVariable]) -> Any:
+        """Versión asíncrona de `_call_batch`"""
+        async with self.limits.aslot(vars[0].handler_key, handler, self._remaining()):
+            context_token = current_deadline.set(self.deadline)
+            try:
+                return await handler.agenerate_batch(vars)
+            finally:
+                current_deadline.reset(context_token)
+
+    async def _alimited(self, key: Tuple[Hashable, ...], handler: Callable[[GenerativeVariable], Any],
+                        var: GenerativeVariable) -> Any:
+        """Invoca el handler dentro de su límite de concurrencia"""
+        async with self.limits.aslot(var.handler_key, handler, self._remaining()):
+            return await self._acall(key, handler, var)
+
+    def _guarded(self, handler_key: str, handler: Callable[[GenerativeVariable], Any],
+                 func: Callable[..., Any], *args: Any) -> Any:
+        """Ejecuta una llamada al handler con la capa de resiliencia, si la hay"""
+        if self.resilience is None:
+            return func(*args)
+        try:
+            return self.resilience.call(handler_key, func, *args, budget=self.retry_budget,
+                                        config=getattr(handler, "config", None), deadline=self.deadline)
+        except CircuitOpenError:
+            with self._lock:
+                self.rejected += 1
+            raise
+
+    async def _aguarded(self, handler_key: str, handler: Callable[[GenerativeVariable], Any],
+                        func: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """Versión asíncrona de `_guarded`"""
+        if self.resilience is None:
+            return await func(*args)
+        try:
+            return await self.resilience.acall(handler_key, func, *args, budget=self.retry_budget,
+                                               config=getattr(handler, "config", None),
+                                               deadline=self.deadline)
+        except CircuitOpenError:
+            with self._lock:
+                self.rejected += 1
+            raise
+
+    async def _acall(self, key: Tuple[Hashable, ...], handler: Callable[[GenerativeVariable], Any],
+                     var: GenerativeVariable) -> Any:
+        """Invoca el handler y consume su flujo de deltas, si retorna uno"""
+        context_token = current_deadline.set(self.deadline)
+        timing = self._start_timing(var.handler_key)
+        try:
+            result = await self._aconsume(key, await acall_handler(handler, var))
+        finally:
+            current_deadline.reset(context_token)
+            self._stop_timing(timing)
+        return result
+
+    async def _aconsume(self, key: Tuple[Hashable, ...], result: Any) -> Any:
+        """Versión asíncrona de `_consume`"""
+        if not is_delta_stream(result):
+            return result
+        stream = self._open_stream(key)
+        if isinstance(result, AsyncIterator):
+            return await stream.aconsume(result)
+        # Los iteradores síncronos pueden bloquear: se consumen fuera del bucle de eventos
+        return await asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, stream.consume, result)
+
+    def _open_stream(self, key: Tuple[Hashable, ...]) -> DeltaStream:
+        """Registra un nuevo flujo de deltas para la invocación y lo notifica"""
+        stream = DeltaStream()
+        with self._lock:
+            self._streams[key] = stream
+        if self.on_stream is not None:
+            self.on_stream(stream)
+        return stream
+
+    def _cached(self, var: GenerativeVariable,
+                handler: Callable[[GenerativeVariable], Any]) -> Tuple[Optional[Tuple[Hashable, ...]], Any]:
+        """
+        Busca el resultado de la invocación en la cache de resultados y, si no está, el
+        de un prompt casi idéntico en la cache de similitud.
+
+        Returns:
+            Tupla (clave de cache o None si no aplica, resultado almacenado o None)
+        """
+        cache_key = self.result_cache.key_for(var, handler) if self.result_cache is not None else None
+        result = self.result_cache.get(cache_key) if cache_key is not None else None
+        if result is not None:
+            with self._lock:
+                self.cached += 1
+                self._mark_cached()
+            return cache_key, result
+
+        if self.similarity_cache is not None:
+            result = self.similarity_cache.get(var, handler)
+            if result is not None:
+                with self._lock:
+                    self.approximate += 1
+                    self._mark_cached()
+        return cache_key, result
+
+    def _start_timing(self, handler_key: str) -> Optional[Tuple[str, float, object]]:
+        """Empieza a medir una llamada al handler, si hay registro de latencias"""
+        if self.latency is None:
+            return None
+        timing = (handler_key, self.latency.clock(), object())
+        with self._lock:
+            self._timings.add(timing)
+        return timing
+
+    def _stop_timing(self, timing: Optional[Tuple[str, float, object]]) -> None:
+        """
+        Registra la duración de una llamada al handler, haya terminado bien, con error o
+        cancelada, salvo que ya se registrara al agotarse el límite de tiempo.
+        """
+        if timing is None:
+            return
+        with self._lock:
+            if timing not in self._timings:
+                return
+            self._timings.discard(timing)
+        handler_key, start, _ = timing
+        self.latency.record(handler_key, self.latency.clock() - start)
+
+    def record_timeouts(self) -> None:
+        """
+        Registra una muestra de latencia para las llamadas que siguen en curso al
+        agotarse el límite del render: el tiempo transcurrido y, como mínimo, el
+        presupuesto del render. La muestra es una cota inferior de su latencia real, de
+        modo que los niveles que no terminan a tiempo dejan de parecer rápidos.
+        """
+        if self.latency is None:
+            return
+        with self._lock:
+            timings, self._timings = self._timings, set()
+        now = self.latency.clock()
+        budget = self.deadline.seconds if self.deadline is not None else 0.0
+        for handler_key, start, _ in timings:
+            self.latency.record(handler_key, max(now - start, budget))
+
+    def _mark_cached(self) -> None:
+        """Registra que el nodo en curso obtuvo su resultado de una cache"""
+        node = current_node.get()
+        if node is not None:
+            self.cached_nodes.add(node)
+
+    def _check_deadline(self, flight_key: Tuple[Hashable, ...], flight: Optional[Future]) -> None:
+        """Lanza `DeadlineExceeded` si ya no queda tiempo, cediendo la invocación a los que esperan"""
+        try:
+            self.deadline.check()
+        except DeadlineExceeded:
+            self._abandon_flight(flight_key, flight)
+            raise
+
+    def _join_flight(self, var: GenerativeVariable,
+                     handler: Callable[[GenerativeVariable], Any]) -> Tuple[Optional[Tuple[Hashable, ...]], Optional[Future]]:
+        """
+        Se une a una invocación idéntica en curso en otro render, si la hay.
+
+        Returns:
+            Tupla (clave, future) si este llamador debe ejecutar el handler (la clave es
+            None sin tabla SingleFlight), o (None, future) si debe esperar el resultado
+        """
+        if self.single_flight is None:
+            return (), None
+        flight_key = self.single_flight.key_for(var, handler)
+        flight, leader = self.single_flight.join(flight_key)
+        if leader:
+            return flight_key, flight
+        with self._lock:
+            self.coalesced += 1
+        return None, flight
+
+    def _finish_flight(self, flight_key: Tuple[Hashable, ...], flight: Optional[Future],
+                       result: Any = None, error: Optional[BaseException] = None) -> None:
+        """Publica el resultado de la invocación a los renders que la esperan"""
+        if flight is not None:
+            self.single_flight.finish(flight_key, flight, result, error)
+
+    def _fail_flight(self, flight_key: Tuple[Hashable, ...], flight: Optional[Future],
+                     error: BaseException) -> None:
+        """
+        Publica el error de la invocación a los renders que la esperan, salvo la
+        cancelación o el límite de tiempo de este render, que no les afectan: en ese
+        caso la invocación se abandona para que la ejecute uno de ellos.
+        """
+        if isinstance(error, (asyncio.CancelledError, DeadlineExceeded)):
+            self._abandon_flight(flight_key, flight)
+        else:
+            self._finish_flight(flight_key, flight, error=error)
+
+    def _abandon_flight(self, flight_key: Tuple[Hashable, ...], flight: Optional[Future]) -> None:
+        """Retira la invocación de la tabla sin resultado para que otro render la ejecute"""
+        if flight is not None:
+            self.single_flight.abandon(flight_key, flight)
+
+    def _discard(self, entries: Dict[Tuple[Hashable, ...], Any], key: Tuple[Hashable, ...], entry: Any) -> None:
+        """Elimina una entrada abandonada para que la siguiente petición la vuelva a crear"""
+        with self._lock:
+            if entries.get(key) is entry:
+                del entries[key]
+
+    def _store(self, cache_key: Optional[Tuple[Hashable, ...]], var: GenerativeVariable,
+               handler: Callable[[GenerativeVariable], Any], result: Any) -> None:
+        """Guarda el resultado de una invocación en la cache de resultados y en la de similitud"""
+        if cache_key is not None:
+            self.result_cache.put(cache_key, result, self.result_cache.ttl_for(var.handler_key, handler))
+        if self.similarity_cache is not None:
+            self.similarity_cache.put(var, handler, result)
+
+    def _count(self, handler_key: str) -> None:
+        """Contabiliza una invocación efectiva del handler"""
+        with self._lock:
+            self.invocations += 1
+            self.by_handler[handler_key] = self.by_handler.get(handler_key, 0) + 1
@@ -5,6 +5,8 @@ from typing import Dict, Any, List, Optional, Callable, Type
 import logging
 import inspect
 
+from .routing import RoutedHandler, RoutingPolicy
+
 class HandlerRegistry:
     """
     Registro centralizado para handlers de variables KMC.
@@ -19,6 +21,7 @@ class HandlerRegistry:
         self.context_handlers: Dict[str, Callable] = {}
         self.metadata_handlers: Dict[str, Callable] = {}
         self.generative_handlers: Dict[str, Callable] = {}
+        self.routes: Dict[str, RoutedHandler] = {}
         self.logger = logging.getLogger("kmc.registry")
     
     def register_context_handler(self, var_type: str, handler: Callable) -> None:
@@ -27,7 +30,7 @@ class HandlerRegistry:
         
         Args:
             var_type: Tipo de variable contextual (ej. "project", "user", "org")
-            handler: Función que procesa la variable y retorna un valor
+            handler: Función que procesa la variable y retorna un valor (puede ser una corrutina)
         """
         self.logger.debug(f"Registrando handler de contexto para '{var_type}'")
         self.context_handlers[var_type] = handler
@@ -38,7 +41,7 @@ class HandlerRegistry:
         
         Args:
             var_type: Tipo de variable metadata (ej. "doc", "kb")
-            handler: Función que procesa la variable y retorna un valor
+            handler: Función que procesa la variable y retorna un valor (puede ser una corrutina)
         """
         self.logger.debug(f"Registrando handler de metadata para '{var_type}'")
         self.metadata_handlers[var_type] = handler
@@ -50,6 +53,7 @@ class HandlerRegistry:
         Args:
             var_type: Tipo de variable generativa (ej. "ai:gpt4", "api:weather")
             handler: Función que procesa la variable generativa y retorna un valor
+                (puede ser una corrutina)
         """
         self.logger.debug(f"Registrando handler generativo para '{var_type}'")
         self.generative_handlers[var_type] = handler
@@ -62,10 +66,46 @@ class HandlerRegistry:
         """Obtiene el handler registrado para un tipo de variable de metadata"""
         return self.metadata_handlers.get(var_type)
     
-    def get_generative_handler(self, var_type: str) -> Optional[Callable]:
-        """Obtiene el handler registrado para un tipo de variable generativa"""
+    def get_generative_handler(self, var_type: str, routed: bool = True) -> Optional[Callable]:
+        """
+        Obtiene el handler registrado para un tipo de variable generativa.
+        
+        Args:
+            var_type: Tipo de variable generativa
+            routed: Si se retorna la ruta del tipo cuando tiene política de enrutado
+                (con False se obtiene siempre el handler registrado)
+        """
+        if routed and var_type in self.routes:
+            return self.routes[var_type]
         return self.generative_handlers.get(var_type)
     
+    def set_routing_policy(self, var_type: str, policy: Optional[RoutingPolicy]) -> Optional[RoutedHandler]:
+        """
+        Enruta las variables generativas de un tipo entre varios backends.
+        
+        Los backends son otros tipos generativos registrados (puede incluirse el propio
+        tipo, que usa su handler registrado). Por ejemplo, `HedgePolicy(["ai:gpt4", "ai:qa"])`
+        para "ai:gpt4" lanza "ai:qa" en paralelo si "ai:gpt4" tarda más que su p95.
+        
+        Args:
+            var_type: Tipo de variable generativa (ej. "ai:gpt4")
+            policy: Política de enrutado (None elimina la ruta)
+            
+        Returns:
+            La ruta creada, con sus estadísticas por backend en `stats()`
+        """
+        if policy is None:
+            self.routes.pop(var_type, None)
+            return None
+        self.logger.debug(f"Enrutando '{var_type}' entre {policy.backends} ({policy.name})")
+        route = RoutedHandler(var_type, policy, lambda backend: self.get_generative_handler(backend, routed=False))
+        self.routes[var_type] = route
+        return route
+    
+    def routing_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Estadísticas por backend de cada tipo generativo enrutado"""
+        return {var_type: route.stats() for var_type, route in self.routes.items()}
+    
     def register_handlers_from_module(self, module) -> int:
         """
         Registra automáticamente todos los handlers definidos en un módulo.
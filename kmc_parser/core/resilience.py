@@ -0,0 +1,435 @@
+"""
+Resilience - Reintentos con espera exponencial y cortacircuitos por handler
+"""
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple, Type
+import asyncio
+import random
+import socket
+import threading
+import time
+
+from .deadline import Deadline, DeadlineExceeded
+
+
+class CircuitOpenError(Exception):
+    """Se rechaza una llamada porque el cortacircuitos de su clave está abierto"""
+
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"Cortacircuitos abierto para '{key}' (reintento en {retry_after:.1f}s)")
+        self.key = key
+        self.retry_after = retry_after
+
+
+# Errores transitorios por tipo y por nombre de clase (clientes HTTP y SDKs de proveedores)
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    TimeoutError, asyncio.TimeoutError, FutureTimeoutError, socket.timeout, ConnectionError
+)
+_TRANSIENT_NAMES = ("Timeout", "ConnectionError", "ConnectError", "RateLimit", "ServiceUnavailable")
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Código de estado HTTP de un error, en el propio error, en su respuesta o en su detalle"""
+    candidates = [error, getattr(error, "response", None)]
+    if error.args and isinstance(error.args[0], dict):
+        candidates.append(error.args[0])
+    for candidate in candidates:
+        for name in ("status_code", "statusCode", "status"):
+            value = candidate.get(name) if isinstance(candidate, dict) else getattr(candidate, name, None)
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                continue
+    return None
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Indica si un error es transitorio y tiene sentido reintentar la llamada: timeouts,
+    errores de conexión y respuestas HTTP 429 o 5xx. Los errores del llamador (por
+    ejemplo un ValueError, un KeyError o un 404) no lo son.
+
+    Args:
+        error: Error lanzado por la llamada
+
+    Returns:
+        True si el error es transitorio
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return any(name in cls.__name__ for cls in type(error).__mro__ for name in _TRANSIENT_NAMES)
+
+
+class RetryPolicy:
+    """
+    Política de reintentos con espera exponencial y variación aleatoria (jitter).
+
+    La espera antes del reintento n es `base_delay * multiplier ** n`, limitada a
+    `max_delay` y reducida aleatoriamente hasta un `jitter` de su valor para que los
+    clientes que fallaron a la vez no reintenten a la vez.
+
+    Por defecto solo se reintentan los errores transitorios (`is_transient_error`).
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.1, max_delay: float = 5.0,
+                 multiplier: float = 2.0, jitter: float = 0.5,
+                 retry_on: Optional[Tuple[Type[BaseException], ...]] = None,
+                 random_source: Callable[[], float] = random.random,
+                 retry_if: Optional[Callable[[BaseException], bool]] = None):
+        """
+        Inicializa la política.
+
+        Args:
+            max_attempts: Número máximo de intentos, incluido el primero
+            base_delay: Espera en segundos antes del primer reintento
+            max_delay: Espera máxima entre intentos
+            multiplier: Factor de crecimiento de la espera
+            jitter: Fracción (0-1) de la espera que se reduce aleatoriamente
+            retry_on: Excepciones que se reintentan; el resto se propaga al momento. Por
+                defecto, los errores transitorios.
+            random_source: Generador de números aleatorios en [0, 1)
+            retry_if: Función que decide si un error se reintenta; tiene prioridad sobre
+                `retry_on`
+        """
+        if max_attempts < 1:
+            raise ValueError("El número de intentos debe ser mayor que cero")
+        if not 0 <= jitter <= 1:
+            raise ValueError("El jitter debe estar entre 0 y 1")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retry_on = retry_on
+        self.random_source = random_source
+        self.retry_if = retry_if
+
+    def delays(self) -> Iterator[float]:
+        """
+        Esperas antes de cada reintento.
+
+        Returns:
+            Iterador con `max_attempts - 1` esperas en segundos
+        """
+        for attempt in range(self.max_attempts - 1):
+            delay = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+            yield delay * (1 - self.jitter * self.random_source())
+
+    def retryable(self, error: BaseException) -> bool:
+        """Indica si un error puede reintentarse"""
+        if isinstance(error, CircuitOpenError):
+            return False
+        if self.retry_if is not None:
+            return self.retry_if(error)
+        if self.retry_on is not None:
+            return isinstance(error, self.retry_on)
+        return is_transient_error(error)
+
+
+class RetryBudget:
+    """
+    Número máximo de reintentos que puede consumir un render.
+
+    Evita que un proveedor caído multiplique el trabajo de un render: agotado el
+    presupuesto, los errores se propagan sin reintentar.
+    """
+
+    def __init__(self, max_retries: Optional[int]):
+        """
+        Args:
+            max_retries: Reintentos disponibles (None para no limitarlos)
+        """
+        self.max_retries = max_retries
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def spend(self) -> bool:
+        """
+        Consume un reintento.
+
+        Returns:
+            True si quedaba presupuesto
+        """
+        with self._lock:
+            if self.max_retries is not None and self.spent >= self.max_retries:
+                return False
+            self.spent += 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Cortacircuitos de una clave (un handler_key o un servicio de I/O).
+
+    Tras `failure_threshold` fallos seguidos se abre y rechaza las llamadas durante
+    `recovery_time` segundos. Después deja pasar una llamada de prueba (semiabierto):
+    si tiene éxito se cierra y si falla vuelve a abrirse.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, key: str, failure_threshold: int = 5, recovery_time: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            key: Clave protegida
+            failure_threshold: Fallos seguidos que abren el cortacircuitos
+            recovery_time: Segundos que permanece abierto antes de la llamada de prueba
+            clock: Reloj monotónico
+        """
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        """
+        Comprueba si se puede hacer una llamada.
+
+        Raises:
+            CircuitOpenError: Si el cortacircuitos está abierto o ya hay una llamada de prueba
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self._opened_at + self.recovery_time - self.clock()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.key, max(0.0, remaining))
+
+    def record_success(self) -> None:
+        """Registra una llamada correcta: cierra el cortacircuitos"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        """Registra una llamada fallida: abre el cortacircuitos si se alcanza el umbral"""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+            self._probing = False
+
+    def abandon(self) -> None:
+        """Libera la llamada de prueba si se canceló antes de terminar"""
+        with self._lock:
+            self._probing = False
+
+
+class Resilience:
+    """
+    Capa de resiliencia para llamadas a handlers generativos y servicios de I/O.
+
+    Cada clave (handler_key o nombre de servicio) tiene su cortacircuitos. Las
+    llamadas fallidas se reintentan según la política, mientras quede presupuesto de
+    reintentos del render, y con el cortacircuitos abierto fallan al momento con
+    `CircuitOpenError` en lugar de ocupar un hilo esperando a un servicio caído.
+
+    Los handlers pueden ajustar su política en la configuración: `{"retry": False}`
+    desactiva los reintentos, `{"max_attempts": n}` cambia el número de intentos y
+    `{"circuit_breaker": False}` excluye el handler del cortacircuitos.
+    """
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, failure_threshold: int = 5,
+                 recovery_time: float = 30.0, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Any] = time.sleep,
+                 async_sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep):
+        """
+        Inicializa la capa.
+
+        Args:
+            policy: Política de reintentos (por defecto, 3 intentos con espera exponencial)
+            failure_threshold: Fallos seguidos que abren el cortacircuitos de una clave
+            recovery_time: Segundos que un cortacircuitos permanece abierto
+            clock: Reloj monotónico de los cortacircuitos
+            sleep: Función de espera de las llamadas síncronas
+            async_sleep: Corrutina de espera de las llamadas asíncronas
+        """
+        self.policy = policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.clock = clock
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.failures = 0
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        """Obtiene (o crea) el cortacircuitos de una clave"""
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(
+                    key, self.failure_threshold, self.recovery_time, self.clock)
+            return breaker
+
+    def call(self, key: str, func: Callable[..., Any], *args: Any, budget: Optional[RetryBudget] = None,
+             config: Optional[Dict[str, Any]] = None, deadline: Optional[Deadline] = None) -> Any:
+        """
+        Ejecuta una llamada con reintentos y cortacircuitos.
+
+        Args:
+            key: Clave del cortacircuitos (handler_key o nombre del servicio)
+            func: Función a llamar
+            *args: Argumentos de la función
+            budget: Presupuesto de reintentos del render
+            config: Configuración del handler, para los ajustes por handler
+            deadline: Límite de tiempo del render; no se reintenta si la espera no cabe
+
+        Returns:
+            El resultado de la función
+
+        Raises:
+            CircuitOpenError: Si el cortacircuitos está abierto
+            Exception: El último error de la función si se agotan los intentos
+        """
+        breaker = self._breaker_for(key, config)
+        delays = self._delays(config)
+        while True:
+            if breaker is not None:
+                breaker.allow()
+            try:
+                result = func(*args)
+            except DeadlineExceeded:
+                # Sin tiempo para la llamada (por ejemplo, esperando su turno): no es un fallo del servicio
+                if breaker is not None:
+                    breaker.abandon()
+                raise
+            except Exception as e:
+                delay = self._on_failure(breaker, e, delays, budget, deadline)
+                if delay is None:
+                    raise
+                self.sleep(delay)
+                continue
+            except BaseException:
+                if breaker is not None:
+                    breaker.abandon()
+                raise
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+    async def acall(self, key: str, func: Callable[..., Awaitable[Any]], *args: Any,
+                    budget: Optional[RetryBudget] = None, config: Optional[Dict[str, Any]] = None,
+                    deadline: Optional[Deadline] = None) -> Any:
+        """Versión asíncrona de `call` para corrutinas: las esperas no bloquean el bucle"""
+        breaker = self._breaker_for(key, config)
+        delays = self._delays(config)
+        while True:
+            if breaker is not None:
+                breaker.allow()
+            try:
+                result = await func(*args)
+            except DeadlineExceeded:
+                # Sin tiempo para la llamada (por ejemplo, esperando su turno): no es un fallo del servicio
+                if breaker is not None:
+                    breaker.abandon()
+                raise
+            except Exception as e:
+                delay = self._on_failure(breaker, e, delays, budget, deadline)
+                if delay is None:
+                    raise
+                await self.async_sleep(delay)
+                continue
+            except BaseException:
+                if breaker is not None:
+                    breaker.abandon()
+                raise
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+    def _breaker_for(self, key: str, config: Optional[Dict[str, Any]]) -> Optional[CircuitBreaker]:
+        if isinstance(config, dict) and config.get("circuit_breaker") is False:
+            return None
+        return self.breaker(key)
+
+    def _delays(self, config: Optional[Dict[str, Any]]) -> Iterator[float]:
+        """Esperas de la política, ajustadas con la configuración del handler"""
+        if not isinstance(config, dict):
+            return self.policy.delays()
+        if config.get("retry") is False:
+            return iter(())
+        max_attempts = config.get("max_attempts")
+        if max_attempts is None:
+            return self.policy.delays()
+        policy = RetryPolicy(max_attempts, self.policy.base_delay, self.policy.max_delay,
+                             self.policy.multiplier, self.policy.jitter, self.policy.retry_on,
+                             self.policy.random_source, self.policy.retry_if)
+        return policy.delays()
+
+    def _on_failure(self, breaker: Optional[CircuitBreaker], error: Exception,
+                    delays: Iterator[float], budget: Optional[RetryBudget],
+                    deadline: Optional[Deadline] = None) -> Optional[float]:
+        """
+        Registra un fallo y decide si reintentar.
+
+        Solo los errores que la política reintenta cuentan para el cortacircuitos: un
+        error del llamador (por ejemplo, una entrada no válida) no indica que el
+        servicio esté caído.
+
+        Returns:
+            La espera antes del reintento, o None si el error debe propagarse
+        """
+        with self._lock:
+            self.failures += 1
+        if not self.policy.retryable(error):
+            if breaker is not None:
+                breaker.abandon()
+            return None
+        if breaker is not None:
+            breaker.record_failure()
+        delay = next(delays, None)
+        if delay is None or (deadline is not None and delay >= deadline.remaining()):
+            return None
+        if budget is not None and not budget.spend():
+            return None
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna las estadísticas de la capa.
+
+        Returns:
+            Diccionario con reintentos, fallos y el estado de cada cortacircuitos
+        """
+        with self._lock:
+            breakers = list(self._breakers.values())
+            stats = {"retries": self.retries, "failures": self.failures}
+        stats["breakers"] = {
+            breaker.key: {
+                "state": breaker.state,
+                "failures": breaker.failures,
+                "opened": breaker.opened,
+                "rejected": breaker.rejected
+            }
+            for breaker in breakers
+        }
+        return stats
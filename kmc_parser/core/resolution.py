@@ -0,0 +1,288 @@
+"""
+Resolution - Tabla de resolución de variables contextuales y de metadata por render
+"""
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import threading
+
+from ..lexer import Token, TokenKind, tokenize
+
+
+class ResolutionTable:
+    """
+    Tabla de resolución de variables para un único render.
+
+    Cada variable distinta (tipo de token, tipo, nombre) se resuelve exactamente una
+    vez; el reemplazo en el cuerpo del documento y la interpolación de prompts
+    reutilizan el mismo valor. Es segura para uso desde varios hilos: el primer hilo
+    que pide una variable la reclama y la resuelve fuera del lock, y los demás
+    esperan su resultado. Admite resolución asíncrona mediante `aresolve` y
+    `ainterpolate`.
+
+    Con funciones de resolución en bloque, `prefetch` y `aprefetch` resuelven de una
+    vez todas las variables de un mismo tipo antes de empezar el render.
+    """
+
+    def __init__(self, resolvers: Dict[TokenKind, Callable[[str, str], Any]],
+                 async_resolvers: Optional[Dict[TokenKind, Callable[[str, str], Awaitable[Any]]]] = None,
+                 bulk_resolvers: Optional[Dict[TokenKind, Callable[[str, List[str]], Dict[str, Any]]]] = None,
+                 async_bulk_resolvers: Optional[Dict[TokenKind, Callable[[str, List[str]], Awaitable[Dict[str, Any]]]]] = None):
+        """
+        Inicializa la tabla de resolución.
+
+        Args:
+            resolvers: Función de resolución por tipo de token. Recibe el tipo y el
+                nombre de la variable y retorna su valor (o None si no se resolvió).
+            async_resolvers: Versiones asíncronas de las funciones de resolución. Los
+                tipos sin versión asíncrona usan la función síncrona.
+            bulk_resolvers: Función de resolución en bloque por tipo de token. Recibe el
+                tipo de variable y la lista de nombres y retorna un diccionario
+                nombre -> valor.
+            async_bulk_resolvers: Versiones asíncronas de las funciones en bloque
+        """
+        self._resolvers = resolvers
+        self._async_resolvers = async_resolvers or {}
+        self._bulk_resolvers = bulk_resolvers or {}
+        self._async_bulk_resolvers = async_bulk_resolvers or {}
+        self._values: Dict[Tuple[TokenKind, str], Any] = {}
+        self._pending: Dict[Tuple[TokenKind, str], asyncio.Future] = {}
+        self._claims: Dict[Tuple[TokenKind, str], Future] = {}
+        self._lock = threading.RLock()
+        self.resolved = 0
+        self.bulk_calls = 0
+
+    def resolve(self, kind: TokenKind, target: str) -> Any:
+        """
+        Obtiene el valor de una variable, resolviéndola solo la primera vez.
+
+        Args:
+            kind: Tipo de token (CONTEXTUAL o METADATA)
+            target: Nombre de la variable en formato "tipo:nombre"
+
+        Returns:
+            Valor resuelto o None si no se pudo resolver
+        """
+        key = (kind, target)
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            claim = self._claims.get(key)
+            if claim is None:
+                claim = self._claims[key] = Future()
+                owned = True
+            else:
+                owned = False
+        if not owned:
+            return claim.result()
+
+        var_type, var_name = target.split(':', 1)
+        try:
+            value = self._resolvers[kind](var_type, var_name)
+        except BaseException as e:
+            self._release([key], e)
+            raise
+        with self._lock:
+            self._values.setdefault(key, value)
+            self.resolved += 1
+            value = self._values[key]
+        self._release([key])
+        return value
+
+    def prefetch(self, groups: Dict[Tuple[TokenKind, str], List[str]]) -> None:
+        """
+        Resuelve con una sola llamada por grupo las variables aún no resueltas.
+
+        Los tipos de token sin función en bloque se resuelven después variable a
+        variable, como hasta ahora. Las variables que otro hilo está resolviendo no se
+        vuelven a pedir.
+
+        Args:
+            groups: Nombres de variables por (tipo de token, tipo de variable)
+        """
+        for (kind, var_type), names in groups.items():
+            resolver = self._bulk_resolvers.get(kind)
+            if resolver is None:
+                continue
+            with self._lock:
+                pending = [name for name in self._unresolved(kind, var_type, names)
+                           if (kind, f"{var_type}:{name}") not in self._claims]
+                keys = [(kind, f"{var_type}:{name}") for name in pending]
+                for key in keys:
+                    self._claims[key] = Future()
+            if not pending:
+                continue
+            try:
+                values = resolver(var_type, pending)
+            except BaseException as e:
+                self._release(keys, e)
+                raise
+            with self._lock:
+                self._store_bulk(kind, var_type, pending, values)
+            self._release(keys)
+
+    async def aprefetch(self, groups: Dict[Tuple[TokenKind, str], List[str]]) -> None:
+        """
+        Versión asíncrona de `prefetch`: los grupos se resuelven de forma concurrente.
+
+        Args:
+            groups: Nombres de variables por (tipo de token, tipo de variable)
+        """
+        async def fetch(kind: TokenKind, var_type: str, names: List[str]) -> None:
+            resolver = self._async_bulk_resolvers.get(kind)
+            if resolver is None:
+                if kind in self._bulk_resolvers:
+                    self.prefetch({(kind, var_type): names})
+                return
+            pending = self._unresolved(kind, var_type, names)
+            if pending:
+                values = await resolver(var_type, pending)
+                with self._lock:
+                    self._store_bulk(kind, var_type, self._unresolved(kind, var_type, pending), values)
+
+        await asyncio.gather(*(fetch(kind, var_type, names) for (kind, var_type), names in groups.items()))
+
+    def _unresolved(self, kind: TokenKind, var_type: str, names: Iterable[str]) -> List[str]:
+        """Nombres de un grupo que aún no tienen valor en la tabla"""
+        return [name for name in names if (kind, f"{var_type}:{name}") not in self._values]
+
+    def _release(self, keys: List[Tuple[TokenKind, str]], error: Optional[BaseException] = None) -> None:
+        """Libera las variables reclamadas y despierta a los hilos que las esperan"""
+        with self._lock:
+            claims = [self._claims.pop(key) for key in keys]
+        for key, claim in zip(keys, claims):
+            if error is not None:
+                claim.set_exception(error)
+            else:
+                claim.set_result(self._values.get(key))
+
+    def _store_bulk(self, kind: TokenKind, var_type: str, names: List[str], values: Dict[str, Any]) -> None:
+        """Registra los valores de una resolución en bloque"""
+        for name in names:
+            self._values[(kind, f"{var_type}:{name}")] = values.get(name)
+        self.resolved += len(names)
+        self.bulk_calls += 1
+
+    def provide(self, kind: TokenKind, target: str, value: Any) -> None:
+        """
+        Registra el valor ya generado de una variable (definición o variable generativa)
+        para que los prompts que dependen de ella lo reciban al interpolarse.
+
+        Args:
+            kind: Tipo de token (METADATA o GENERATIVE)
+            target: Nombre de la variable
+            value: Valor generado
+        """
+        with self._lock:
+            self._values[(kind, target)] = value
+
+    def interpolate(self, text: str, tokens: Optional[List[Token]] = None) -> str:
+        """
+        Sustituye en una sola pasada las variables contextuales y de metadata de un texto,
+        así como las variables generativas cuyo valor ya se ha registrado con `provide`.
+
+        Las variables sin valor (None) se dejan sin reemplazar.
+
+        Args:
+            text: Texto a interpolar (normalmente un prompt)
+            tokens: Tokens del texto ya calculados, si se dispone de ellos
+
+        Returns:
+            Texto con las variables resueltas
+        """
+        if tokens is None:
+            tokens = tokenize(text)
+
+        segments = []
+        for token in tokens:
+            if token.kind is TokenKind.CONTEXTUAL or token.kind is TokenKind.METADATA:
+                value = self.resolve(token.kind, token.target)
+            elif token.kind is TokenKind.GENERATIVE:
+                value = self._values.get((token.kind, token.target))
+            else:
+                value = None
+            if value is not None:
+                segments.append(str(value))
+                continue
+            segments.append(text[token.start:token.end])
+
+        return ''.join(segments)
+
+    async def aresolve(self, kind: TokenKind, target: str) -> Any:
+        """
+        Versión asíncrona de `resolve`. Las peticiones simultáneas de una misma
+        variable esperan a una única resolución.
+
+        Args:
+            kind: Tipo de token (CONTEXTUAL o METADATA)
+            target: Nombre de la variable en formato "tipo:nombre"
+
+        Returns:
+            Valor resuelto o None si no se pudo resolver
+        """
+        key = (kind, target)
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._aresolve_new(key))
+            self._pending[key] = pending
+        return await pending
+
+    async def _aresolve_new(self, key: Tuple[TokenKind, str]) -> Any:
+        """Resuelve por primera vez una variable con el resolvedor asíncrono de su tipo"""
+        kind, target = key
+        resolver = self._async_resolvers.get(kind)
+        if resolver is None:
+            return self.resolve(kind, target)
+
+        var_type, var_name = target.split(':', 1)
+        value = await resolver(var_type, var_name)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = value
+                self.resolved += 1
+            return self._values[key]
+
+    async def ainterpolate(self, text: str, tokens: Optional[List[Token]] = None) -> str:
+        """
+        Versión asíncrona de `interpolate`. Las variables del texto se resuelven de
+        forma concurrente.
+
+        Args:
+            text: Texto a interpolar (normalmente un prompt)
+            tokens: Tokens del texto ya calculados, si se dispone de ellos
+
+        Returns:
+            Texto con las variables resueltas
+        """
+        if tokens is None:
+            tokens = tokenize(text)
+
+        variables = [
+            token for token in tokens
+            if token.kind is TokenKind.CONTEXTUAL or token.kind is TokenKind.METADATA
+        ]
+        resolved = await asyncio.gather(*(self.aresolve(token.kind, token.target) for token in variables))
+        values = dict(zip((id(token) for token in variables), resolved))
+
+        segments = []
+        for token in tokens:
+            if token.kind is TokenKind.GENERATIVE:
+                value = self._values.get((token.kind, token.target))
+            else:
+                value = values.get(id(token))
+            if value is not None:
+                segments.append(str(value))
+            else:
+                segments.append(text[token.start:token.end])
+
+        return ''.join(segments)
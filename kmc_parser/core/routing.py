@@ -0,0 +1,518 @@
+"""
+Routing - Enrutado de un handler_key entre varios backends generativos
+"""
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from contextvars import ContextVar
+from dataclasses import replace
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import math
+import threading
+import time
+
+from ..models import GenerativeVariable
+from .aio import acall_handler, call_handler
+
+
+# Límites superiores (en milisegundos) de los tramos de los histogramas de latencia
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Registro de invocaciones (`InvocationLedger`) que ejecuta la invocación en curso. Los
+# intentos de una ruta se hacen a través de él (`call_backend`/`acall_backend`) para
+# aplicar a cada backend su límite de concurrencia, su cortacircuitos y su registro de
+# latencias, y las coberturas en hilos usan su executor (`route_executor`).
+current_dispatcher: ContextVar[Optional[Any]] = ContextVar("kmc_current_dispatcher", default=None)
+
+
+class LatencyHistogram:
+    """
+    Histograma de latencias de un backend.
+
+    Cuenta las llamadas por tramos fijos y conserva una ventana de las últimas
+    latencias para calcular percentiles.
+    """
+
+    def __init__(self, window: int = 512):
+        """
+        Args:
+            window: Número de latencias recientes usadas para los percentiles
+        """
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """Registra la latencia de una llamada"""
+        with self._lock:
+            self.counts[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+            self.count += 1
+            self.total += seconds
+            self._recent.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Percentil de las latencias recientes.
+
+        Args:
+            percent: Percentil entre 0 y 100
+
+        Returns:
+            Latencia en segundos, o None si no hay muestras
+        """
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(percent / 100 * len(samples)) - 1))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Retorna el histograma.
+
+        Returns:
+            Diccionario con el número de llamadas, la media, los percentiles 50, 95 y 99
+            y las llamadas por tramo (`"<=5ms"`, ..., `">10000ms"`)
+        """
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.total
+        buckets = {f"<={bound}ms": n for bound, n in zip(LATENCY_BUCKETS_MS, counts)}
+        buckets[f">{LATENCY_BUCKETS_MS[-1]}ms"] = counts[-1]
+        return {
+            "count": count,
+            "mean": total / count if count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": buckets
+        }
+
+
+class LatencyTracker:
+    """
+    Latencias observadas de los handlers generativos por handler_key.
+
+    El registro de invocaciones mide cada llamada a un handler (sin las esperas de
+    los límites de concurrencia) y los grupos de niveles la consultan para decidir
+    qué nivel cabe en el tiempo que le queda al render.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            clock: Reloj monotónico con el que se miden las llamadas
+        """
+        self.clock = clock
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, handler_key: str) -> LatencyHistogram:
+        """Obtiene (o crea) el histograma de un handler_key"""
+        with self._lock:
+            histogram = self._histograms.get(handler_key)
+            if histogram is None:
+                histogram = self._histograms[handler_key] = LatencyHistogram()
+            return histogram
+
+    def record(self, handler_key: str, seconds: float) -> None:
+        """Registra la latencia de una llamada al handler"""
+        self.histogram(handler_key).record(seconds)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Histograma de latencias de cada handler_key"""
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {handler_key: histogram.snapshot() for handler_key, histogram in histograms.items()}
+
+
+class BackendStats:
+    """Estadísticas de un backend dentro de una ruta"""
+
+    def __init__(self):
+        self.calls = 0      # Llamadas lanzadas al backend
+        self.wins = 0       # Llamadas cuyo resultado se usó
+        self.errors = 0     # Llamadas fallidas
+        self.hedged = 0     # Llamadas lanzadas como cobertura de otra lenta
+        self.cancelled = 0  # Llamadas perdedoras canceladas o descartadas
+        self.latency = LatencyHistogram()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "wins": self.wins,
+            "errors": self.errors,
+            "hedged": self.hedged,
+            "cancelled": self.cancelled,
+            "latency": self.latency.snapshot()
+        }
+
+
+class RoutingPolicy:
+    """
+    Política de enrutado: decide el orden en que se prueban los backends de un
+    handler_key y cuándo se lanza una llamada de cobertura.
+
+    La política base prueba los backends en el orden indicado y pasa al siguiente
+    cuando uno falla (fallback).
+    """
+
+    name = "fallback"
+
+    def __init__(self, backends: List[str]):
+        """
+        Args:
+            backends: handler_keys de los backends, por orden de preferencia
+        """
+        if not backends:
+            raise ValueError("Una política de enrutado necesita al menos un backend")
+        self.backends = list(backends)
+
+    def order(self, stats: Dict[str, BackendStats]) -> List[str]:
+        """Backends en el orden en que se prueban"""
+        return list(self.backends)
+
+    def hedge_delay(self, backend: str, stats: Dict[str, BackendStats]) -> Optional[float]:
+        """
+        Segundos que se espera a un backend antes de lanzar el siguiente en paralelo.
+
+        Returns:
+            La espera, o None si solo se pasa al siguiente cuando el backend falla
+        """
+        return None
+
+
+class FallbackPolicy(RoutingPolicy):
+    """Prueba los backends en orden y pasa al siguiente cuando uno falla"""
+
+
+class HedgePolicy(RoutingPolicy):
+    """
+    Cobertura de latencia de cola: si un backend no ha respondido en su percentil
+    `percentile` de latencia observada (o en `after` segundos si se indica), se lanza
+    el siguiente en paralelo y se usa la primera respuesta. La llamada perdedora se
+    cancela. Un error lanza el siguiente backend al momento.
+    """
+
+    name = "hedge"
+
+    def __init__(self, backends: List[str], after: Optional[float] = None, percentile: float = 95,
+                 min_samples: int = 20, initial_delay: float = 1.0):
+        """
+        Args:
+            backends: handler_keys de los backends, por orden de preferencia
+            after: Espera fija antes de la cobertura (por defecto, el percentil observado)
+            percentile: Percentil de latencia del backend tras el que se lanza la cobertura
+            min_samples: Muestras necesarias para usar el percentil observado
+            initial_delay: Espera antes de la cobertura mientras no hay muestras suficientes
+        """
+        super().__init__(backends)
+        self.after = after
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+
+    def hedge_delay(self, backend: str, stats: Dict[str, BackendStats]) -> Optional[float]:
+        if self.after is not None:
+            return self.after
+        latency = stats[backend].latency
+        if latency.count < self.min_samples:
+            return self.initial_delay
+        return latency.percentile(self.percentile)
+
+
+class LatencyPolicy(RoutingPolicy):
+    """
+    Enrutado por latencia observada: se prueba primero el backend con menor
+    percentil `percentile` y se pasa al siguiente cuando falla. Los backends con
+    menos de `min_samples` muestras se prueban antes para conocer su latencia.
+    """
+
+    name = "latency"
+
+    def __init__(self, backends: List[str], percentile: float = 50, min_samples: int = 5):
+        """
+        Args:
+            backends: handler_keys de los backends, por orden de preferencia en caso de empate
+            percentile: Percentil de latencia con el que se comparan los backends
+            min_samples: Muestras necesarias para comparar un backend por su latencia
+        """
+        super().__init__(backends)
+        self.percentile = percentile
+        self.min_samples = min_samples
+
+    def order(self, stats: Dict[str, BackendStats]) -> List[str]:
+        def rank(item: Tuple[int, str]) -> Tuple[int, float, int]:
+            index, backend = item
+            latency = stats[backend].latency
+            if latency.count < self.min_samples:
+                return 0, 0.0, index
+            return 1, latency.percentile(self.percentile), index
+        return [backend for _, backend in sorted(enumerate(self.backends), key=rank)]
+
+
+class RoutedHandler:
+    """
+    Handler generativo que reparte las invocaciones de un handler_key entre varios
+    backends según una política de enrutado.
+
+    Cada backend recibe la variable con su propio handler_key. Se registran por
+    backend las llamadas, las victorias (respuestas usadas), los errores, las
+    coberturas, las llamadas perdedoras canceladas y un histograma de latencias.
+    En asyncio las llamadas perdedoras se cancelan; en hilos se cancelan si aún no
+    empezaron y, si ya están en curso, su resultado se descarta.
+
+    Dentro de un render cada intento pasa por el registro de invocaciones, como
+    cualquier otra llamada a un handler, y las coberturas en hilos se ejecutan en el
+    executor acotado del parser. Llamada directamente, la ruta invoca a los backends
+    en el hilo actual y no lanza coberturas en hilos.
+    """
+
+    def __init__(self, handler_key: str, policy: RoutingPolicy,
+                 resolve: Callable[[str], Optional[Callable]], clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            handler_key: handler_key enrutado (ej. "ai:gpt4")
+            policy: Política de enrutado
+            resolve: Función que obtiene el handler de cada backend
+            clock: Reloj monotónico para medir las latencias
+        """
+        self.handler_key = handler_key
+        self.policy = policy
+        self.resolve = resolve
+        self.clock = clock
+        self.config = {"routing": policy.name, "backends": list(policy.backends)}
+        self._stats: Dict[str, BackendStats] = {backend: BackendStats() for backend in policy.backends}
+        self._lock = threading.Lock()
+
+    def __call__(self, var: GenerativeVariable) -> Any:
+        order = self.policy.order(self._stats)
+        dispatcher = current_dispatcher.get()
+        executor = dispatcher.route_executor() if dispatcher is not None else None
+        if executor is None or self.policy.hedge_delay(order[0], self._stats) is None:
+            return self._fallback(order, var)
+        return self._hedge(order, var, executor)
+
+    async def ahandle(self, var: GenerativeVariable) -> Any:
+        """Versión asíncrona: las coberturas son tareas y las perdedoras se cancelan"""
+        order = self.policy.order(self._stats)
+        pending: Dict[asyncio.Future, str] = {}
+        error: Optional[BaseException] = None
+        current = order.pop(0)
+        pending[asyncio.ensure_future(self._acall(current, var))] = current
+        try:
+            while pending:
+                delay = self.policy.hedge_delay(current, self._stats) if order else None
+                done, _ = await asyncio.wait(list(pending), timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    current = order.pop(0)
+                    self._count(current, "hedged")
+                    pending[asyncio.ensure_future(self._acall(current, var))] = current
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        self._win(backend, pending)
+                        return task.result()
+                    error = task.exception()
+                if not pending and order:
+                    current = order.pop(0)
+                    pending[asyncio.ensure_future(self._acall(current, var))] = current
+            raise error
+        finally:
+            # Las llamadas perdedoras (o todas, si se cancela la invocación) se cancelan
+            for loser in pending:
+                loser.cancel()
+
+    def _fallback(self, order: List[str], var: GenerativeVariable) -> Any:
+        """Prueba los backends en orden en el hilo actual hasta que uno responde"""
+        for backend in order[:-1]:
+            try:
+                result = self._call(backend, var)
+            except Exception:
+                continue
+            self._win(backend, {})
+            return result
+        result = self._call(order[-1], var)
+        self._win(order[-1], {})
+        return result
+
+    def _hedge(self, order: List[str], var: GenerativeVariable, executor: Executor) -> Any:
+        """Versión con hilos de `ahandle`: las llamadas se ejecutan en el executor del parser"""
+        pending: Dict[Future, str] = {}
+        error: Optional[BaseException] = None
+        current = order.pop(0)
+        pending[self._submit(executor, current, var)] = current
+        while pending:
+            delay = self.policy.hedge_delay(current, self._stats) if order else None
+            done, _ = wait(list(pending), timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                current = order.pop(0)
+                self._count(current, "hedged")
+                pending[self._submit(executor, current, var)] = current
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                if future.exception() is None:
+                    self._win(backend, pending)
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+                error = future.exception()
+            if not pending and order:
+                current = order.pop(0)
+                pending[self._submit(executor, current, var)] = current
+        raise error
+
+    def _submit(self, executor: Executor, backend: str, var: GenerativeVariable) -> Future:
+        """Envía la llamada a un backend al executor con el contexto actual (registro y límite de tiempo)"""
+        return executor.submit(contextvars.copy_context().run, self._call, backend, var)
+
+    def _call(self, backend: str, var: GenerativeVariable) -> Any:
+        """Llama a un backend y registra su latencia o su error"""
+        handler, backend_var = self._backend(backend, var)
+        self._count(backend, "calls")
+        dispatcher = current_dispatcher.get()
+        start = self.clock()
+        try:
+            if dispatcher is not None:
+                result = dispatcher.call_backend(backend_var, handler)
+            else:
+                result = call_handler(handler, backend_var)
+        except Exception:
+            self._count(backend, "errors")
+            raise
+        self._stats[backend].latency.record(self.clock() - start)
+        return result
+
+    async def _acall(self, backend: str, var: GenerativeVariable) -> Any:
+        """Versión asíncrona de `_call`"""
+        handler, backend_var = self._backend(backend, var)
+        self._count(backend, "calls")
+        dispatcher = current_dispatcher.get()
+        start = self.clock()
+        try:
+            if dispatcher is not None:
+                result = await dispatcher.acall_backend(backend_var, handler)
+            else:
+                result = await acall_handler(handler, backend_var)
+        except Exception:
+            self._count(backend, "errors")
+            raise
+        self._stats[backend].latency.record(self.clock() - start)
+        return result
+
+    def _backend(self, backend: str, var: GenerativeVariable) -> Tuple[Callable, GenerativeVariable]:
+        """Handler del backend y variable con su handler_key"""
+        handler = self.resolve(backend)
+        if handler is None:
+            self._count(backend, "errors")
+            raise KeyError(f"No hay handler generativo para el backend '{backend}'")
+        category, subtype = backend.split(':')[:2]
+        return handler, replace(var, category=category, subtype=subtype)
+
+    def _win(self, backend: str, losers: Dict[Any, str]) -> None:
+        """Registra la victoria de un backend y las llamadas perdedoras que se cancelan"""
+        with self._lock:
+            self._stats[backend].wins += 1
+            for loser in losers.values():
+                self._stats[loser].cancelled += 1
+
+    def _count(self, backend: str, counter: str) -> None:
+        with self._lock:
+            stats = self._stats[backend]
+            setattr(stats, counter, getattr(stats, counter) + 1)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Retorna las estadísticas de cada backend.
+
+        Returns:
+            Para cada backend: llamadas, victorias, errores, coberturas, llamadas
+            canceladas e histograma de latencias
+        """
+        with self._lock:
+            return {backend: stats.snapshot() for backend, stats in self._stats.items()}
+
+
+class Tier:
+    """Nivel de un grupo de handlers: un handler_key con su coste y su latencia esperada"""
+
+    def __init__(self, handler_key: str, cost: float = 1.0, latency: Optional[float] = None):
+        """
+        Args:
+            handler_key: handler_key del nivel (ej. "ai:gpt4-mini")
+            cost: Coste relativo de una invocación
+            latency: Latencia esperada en segundos mientras no hay muestras observadas
+                (None si se asume que cabe en cualquier presupuesto)
+        """
+        self.handler_key = handler_key
+        self.cost = cost
+        self.latency = latency
+
+    def __repr__(self) -> str:
+        return f"Tier({self.handler_key!r}, cost={self.cost}, latency={self.latency})"
+
+
+class TierGroup:
+    """
+    Grupo de niveles de un handler_key, del mejor y más caro al más barato (por
+    ejemplo `ai:gpt4` → un modelo más pequeño → un stub local).
+
+    Para cada variable se elige el primer nivel cuya latencia (el percentil
+    `percentile` observado, o la declarada si aún no hay `min_samples` muestras) cabe
+    en el tiempo que le queda al render. Un nivel sin latencia conocida se considera
+    apto mientras queden al menos `unknown_floor` segundos. Si ninguno cabe se usa el
+    último. Sin límite de tiempo se usa siempre el primero.
+    """
+
+    def __init__(self, tiers: List[Tier], percentile: float = 95, min_samples: int = 5,
+                 unknown_floor: Optional[float] = 1.0):
+        """
+        Args:
+            tiers: Niveles por orden de preferencia (Tier o handler_keys)
+            percentile: Percentil de latencia observada con el que se estima cada nivel
+            min_samples: Muestras necesarias para usar la latencia observada
+            unknown_floor: Tiempo restante mínimo en segundos para probar un nivel sin
+                latencia conocida (None para probarlo siempre)
+        """
+        if not tiers:
+            raise ValueError("Un grupo de niveles necesita al menos un nivel")
+        self.tiers = [tier if isinstance(tier, Tier) else Tier(tier) for tier in tiers]
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.unknown_floor = unknown_floor
+
+    def expected_latency(self, tier: Tier, latency: LatencyTracker) -> Optional[float]:
+        """Latencia estimada de un nivel: la observada o, sin muestras suficientes, la declarada"""
+        histogram = latency.histogram(tier.handler_key)
+        if histogram.count >= self.min_samples:
+            return histogram.percentile(self.percentile)
+        return tier.latency
+
+    def select(self, remaining: Optional[float], latency: LatencyTracker) -> Tier:
+        """
+        Elige el nivel de una variable.
+
+        Args:
+            remaining: Segundos que le quedan al render (None sin límite de tiempo)
+            latency: Latencias observadas por handler_key
+
+        Returns:
+            El nivel elegido
+        """
+        if remaining is None:
+            return self.tiers[0]
+        for tier in self.tiers:
+            expected = self.expected_latency(tier, latency)
+            if expected is None:
+                if self.unknown_floor is None or remaining >= self.unknown_floor:
+                    return tier
+            elif expected <= remaining:
+                return tier
+        return self.tiers[-1]
@@ -0,0 +1,276 @@
+"""
+Scheduler - Planificación de las invocaciones generativas según sus dependencias
+"""
+from concurrent.futures import Executor, Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+import asyncio
+import inspect
+import threading
+
+
+class DependencyCycleError(ValueError):
+    """Error lanzado cuando las definiciones o variables generativas forman un ciclo"""
+
+    def __init__(self, cycle: List[Hashable]):
+        self.cycle = cycle
+        names = ", ".join(str(node[1]) if isinstance(node, tuple) else str(node) for node in cycle)
+        super().__init__(f"Dependencia circular entre variables generativas: {names}")
+
+
+class DependencyGraph:
+    """
+    Grafo dirigido acíclico de invocaciones generativas.
+
+    Cada nodo es una definición KMC o una variable generativa, y sus dependencias son
+    los nodos cuyo resultado aparece en su prompt. El grafo se agrupa en oleadas
+    topológicas: los nodos de una oleada solo dependen de oleadas anteriores. Los
+    ciclos se detectan al construir el grafo y se notifican al ejecutarlo.
+    """
+
+    def __init__(self, dependencies: Dict[Hashable, List[Hashable]]):
+        """
+        Inicializa el grafo.
+
+        Args:
+            dependencies: Dependencias de cada nodo, en el orden en que deben
+                ejecutarse los nodos independientes (normalmente el del documento)
+        """
+        self.dependencies: Dict[Hashable, List[Hashable]] = {
+            node: list(dict.fromkeys(deps)) for node, deps in dependencies.items()
+        }
+        self.dependents: Dict[Hashable, List[Hashable]] = {node: [] for node in self.dependencies}
+        for node, deps in self.dependencies.items():
+            for dep in deps:
+                self.dependents[dep].append(node)
+
+        self.waves: List[List[Hashable]] = []
+        self.cycle: List[Hashable] = []
+        self._build_waves()
+
+    def _build_waves(self) -> None:
+        """Agrupa los nodos en oleadas topológicas (algoritmo de Kahn por niveles)"""
+        remaining = {node: len(deps) for node, deps in self.dependencies.items()}
+        wave = [node for node, count in remaining.items() if count == 0]
+        while wave:
+            self.waves.append(wave)
+            next_wave = []
+            for node in wave:
+                for dependent in self.dependents[node]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        next_wave.append(dependent)
+            wave = next_wave
+
+        scheduled = sum(len(wave) for wave in self.waves)
+        if scheduled < len(self.dependencies):
+            self.cycle = [node for node, count in remaining.items() if count > 0]
+
+    def __len__(self) -> int:
+        return len(self.dependencies)
+
+    def __contains__(self, node: Hashable) -> bool:
+        return node in self.dependencies
+
+    def check(self) -> None:
+        """
+        Comprueba que el grafo no tenga ciclos.
+
+        Raises:
+            DependencyCycleError: Si hay nodos que dependen circularmente entre sí
+        """
+        if self.cycle:
+            raise DependencyCycleError(self.cycle)
+
+    def run(self, execute: Callable[[Hashable], Any], executor: Optional[Executor] = None,
+            prepare: Optional[Callable[[List[Hashable]], Any]] = None) -> Dict[Hashable, Any]:
+        """
+        Ejecuta todos los nodos respetando sus dependencias.
+
+        Sin executor los nodos se ejecutan oleada a oleada en el hilo actual. Con
+        executor cada nodo se envía en cuanto terminan todas sus dependencias, sin
+        esperar al resto de su oleada.
+
+        Con `prepare`, antes de ejecutar un grupo de nodos se llama a `prepare` con
+        ellos (por ejemplo para agrupar sus invocaciones en lotes). Sin executor el
+        grupo es cada oleada; con executor, los nodos que quedan listos a la vez.
+
+        Args:
+            execute: Función que ejecuta un nodo y retorna su resultado
+            executor: Executor opcional para ejecutar nodos en paralelo
+            prepare: Función llamada con los nodos de cada oleada antes de ejecutarlos
+
+        Returns:
+            Resultado de cada nodo
+
+        Raises:
+            DependencyCycleError: Si el grafo tiene ciclos
+        """
+        self.check()
+        results: Dict[Hashable, Any] = {}
+
+        if executor is None or len(self) < 2:
+            for wave in self.waves:
+                if prepare is not None:
+                    prepare(wave)
+                for node in wave:
+                    results[node] = execute(node)
+            return results
+
+        futures = self.submit(execute, executor, prepare)
+        for node, future in futures.items():
+            results[node] = future.result()
+        return results
+
+    def submit(self, execute: Callable[[Hashable], Any], executor: Executor,
+               prepare: Optional[Callable[[List[Hashable]], Any]] = None) -> Dict[Hashable, Future]:
+        """
+        Programa todos los nodos en el executor sin esperar a que terminen.
+
+        Cada nodo se envía en cuanto terminan todas sus dependencias. Con `prepare`
+        se llama a `prepare` con los nodos que quedan listos a la vez (los de la
+        primera oleada, o los dependientes que completa un mismo nodo) antes de
+        enviarlos; ningún nodo listo espera a otros de su oleada. `prepare` se ejecuta
+        en el hilo que completa la última dependencia, por lo que no debe bloquear.
+
+        Args:
+            execute: Función que ejecuta un nodo y retorna su resultado
+            executor: Executor donde se ejecutan los nodos
+            prepare: Función llamada con cada grupo de nodos listos antes de enviarlos
+
+        Returns:
+            Future con el resultado de cada nodo
+
+        Raises:
+            DependencyCycleError: Si el grafo tiene ciclos
+        """
+        self.check()
+        futures: Dict[Hashable, Future] = {node: Future() for node in self.dependencies}
+        remaining = {node: len(deps) for node, deps in self.dependencies.items()}
+        lock = threading.Lock()
+
+        def launch(nodes: List[Hashable]) -> None:
+            if prepare is not None:
+                prepare(nodes)
+            for node in nodes:
+                start(node)
+
+        def start(node: Hashable) -> None:
+            try:
+                inner = executor.submit(execute, node)
+            except RuntimeError as e:
+                # El executor se cerró antes de llegar a este nodo
+                futures[node].set_exception(e)
+                return
+            inner.add_done_callback(lambda done: finish(node, done))
+
+        def finish(node: Hashable, done: Future) -> None:
+            if done.cancelled():
+                futures[node].cancel()
+            elif done.exception() is not None:
+                futures[node].set_exception(done.exception())
+            else:
+                futures[node].set_result(done.result())
+
+            ready = []
+            with lock:
+                for dependent in self.dependents[node]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        ready.append(dependent)
+            if ready:
+                launch(ready)
+
+        if self.waves:
+            launch(self.waves[0])
+        return futures
+
+    async def arun(self, execute: Callable[[Hashable], Awaitable[Any]],
+                   prepare: Optional[Callable[[List[Hashable]], Any]] = None) -> Dict[Hashable, Any]:
+        """
+        Versión asíncrona de `run`: cada nodo se espera en cuanto terminan sus dependencias.
+
+        Args:
+            execute: Corrutina que ejecuta un nodo y retorna su resultado
+            prepare: Función (o corrutina) llamada con los nodos de cada oleada antes
+                de ejecutarlos
+
+        Returns:
+            Resultado de cada nodo
+
+        Raises:
+            DependencyCycleError: Si el grafo tiene ciclos
+        """
+        tasks = self.schedule(execute, prepare)
+        results = await asyncio.gather(*tasks.values())
+        return dict(zip(tasks, results))
+
+    def schedule(self, execute: Callable[[Hashable], Awaitable[Any]],
+                 prepare: Optional[Callable[[List[Hashable]], Any]] = None) -> Dict[Hashable, asyncio.Future]:
+        """
+        Crea una tarea de asyncio por nodo; cada tarea espera a las de sus dependencias.
+
+        Con `prepare`, los nodos que quedan listos a la vez (los de la primera oleada,
+        o los dependientes que completa un mismo nodo) esperan a que `prepare` los
+        procese antes de ejecutarse; ningún nodo listo espera a otros de su oleada.
+
+        Debe llamarse desde un bucle de eventos en marcha.
+
+        Args:
+            execute: Corrutina que ejecuta un nodo y retorna su resultado
+            prepare: Función (o corrutina) llamada con cada grupo de nodos listos
+                antes de ejecutarlos
+
+        Returns:
+            Tarea de cada nodo
+
+        Raises:
+            DependencyCycleError: Si el grafo tiene ciclos
+        """
+        self.check()
+        tasks: Dict[Hashable, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+        prepared: Dict[Hashable, asyncio.Future] = {}
+        remaining = {node: len(deps) for node, deps in self.dependencies.items()}
+
+        async def prepare_group(nodes: List[Hashable]) -> None:
+            try:
+                result = prepare(nodes)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                for node in nodes:
+                    if not prepared[node].done():
+                        prepared[node].set_exception(e)
+                return
+            for node in nodes:
+                if not prepared[node].done():
+                    prepared[node].set_result(None)
+
+        def finish(node: Hashable) -> None:
+            ready = []
+            for dependent in self.dependents[node]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+            if ready:
+                asyncio.ensure_future(prepare_group(ready))
+
+        async def run_node(node: Hashable) -> Any:
+            if prepare is not None:
+                await prepared[node]
+            deps = self.dependencies[node]
+            if deps:
+                await asyncio.gather(*(tasks[dep] for dep in deps))
+            return await execute(node)
+
+        if prepare is not None:
+            prepared.update((node, loop.create_future()) for node in self.dependencies)
+        for wave in self.waves:
+            for node in wave:
+                tasks[node] = asyncio.ensure_future(run_node(node))
+                if prepare is not None:
+                    tasks[node].add_done_callback(lambda done, node=node: finish(node))
+
+        if prepare is not None and self.waves:
+            asyncio.ensure_future(prepare_group(self.waves[0]))
+        return tasks
@@ -0,0 +1,261 @@
+"""
+Session - Estado de un render en curso
+"""
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+import asyncio
+import threading
+
+from ..lexer import Token, TokenKind, VARIABLE_KINDS
+from ..models import RenderReport, VariableStatus
+from .cache import ResultCache, content_hash
+from .concurrency import ConcurrencyLimits
+from .deadline import Deadline
+from .batching import MicroBatcher
+from .dispatch import InvocationLedger, SingleFlight
+from .resilience import Resilience, RetryBudget
+from .routing import LatencyTracker, Tier
+from .similarity import SimilarityCache
+from .resolution import ResolutionTable
+from .streaming import DeltaStream, current_node
+
+
+class RenderSession:
+    """
+    Agrupa el estado de un único render: la plantilla compilada, la tabla de
+    resolución de variables, el registro de invocaciones generativas y el reporte.
+    """
+
+    def __init__(self, template, table: ResolutionTable, limits: Optional[ConcurrencyLimits] = None,
+                 result_cache: Optional[ResultCache] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 similarity_cache: Optional[SimilarityCache] = None,
+                 micro_batcher: Optional[MicroBatcher] = None,
+                 resilience: Optional[Resilience] = None,
+                 retry_budget: Optional[int] = None,
+                 deadline: Optional[Deadline] = None,
+                 latency: Optional[LatencyTracker] = None,
+                 route_executor: Optional[Callable[[], Executor]] = None):
+        """
+        Inicializa la sesión de render.
+
+        Args:
+            template: Plantilla compilada que se está renderizando
+            table: Tabla de resolución de variables contextuales y de metadata
+            limits: Límites de invocaciones simultáneas por handler_key
+            result_cache: Cache de resultados de handlers generativos compartida entre renders
+            single_flight: Tabla de invocaciones en curso compartida entre renders
+            similarity_cache: Cache de resultados de prompts casi idénticos
+            micro_batcher: Agrupador de invocaciones compartido entre renders
+            resilience: Capa de reintentos y cortacircuitos compartida entre renders
+            retry_budget: Número máximo de reintentos del render (None para no limitarlos)
+            deadline: Límite de tiempo del render
+            latency: Registro de latencias por handler_key compartido entre renders
+            route_executor: Función que obtiene el executor de las coberturas de las rutas
+        """
+        self.template = template
+        self.table = table
+        self.ledger = InvocationLedger(limits, on_stream=self._register_stream, result_cache=result_cache,
+                                       single_flight=single_flight, similarity_cache=similarity_cache,
+                                       micro_batcher=micro_batcher, resilience=resilience,
+                                       retry_budget=RetryBudget(retry_budget), deadline=deadline,
+                                       latency=latency, route_executor=route_executor)
+        self.deadline = deadline
+        self.report = RenderReport()
+
+        # Flujos de deltas por nodo del grafo, para el render por fragmentos
+        self.streams: Dict[Hashable, DeltaStream] = {}
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+        # Claves Merkle de los nodos y nodos reutilizados o regenerados en este render
+        self.node_keys: Dict[Hashable, str] = {}
+        self.reused: Set[Hashable] = set()
+        self.regenerated: Set[Hashable] = set()
+
+        # Estado final de cada nodo del grafo
+        self.status: Dict[Hashable, VariableStatus] = {}
+
+        # Nivel elegido para cada nodo cuyo handler tiene grupo de niveles, y los
+        # nodos que se degradaron a un nivel que no es el primero
+        self.tiers: Dict[Hashable, Tier] = {}
+        self.degraded: Set[Hashable] = set()
+
+    def _register_stream(self, stream: DeltaStream) -> None:
+        """Asocia un flujo de deltas al nodo que se está generando en el contexto actual"""
+        node = current_node.get()
+        if node is None:
+            return
+        with self._condition:
+            self.streams.setdefault(node, stream)
+            self._condition.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def notify(self, *_) -> None:
+        """Despierta a los lectores que esperan un flujo (por ejemplo, al terminar un nodo)"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def wait_stream(self, node: Hashable, future: Future) -> Optional[DeltaStream]:
+        """
+        Espera a que el nodo empiece a emitir deltas o termine.
+
+        Args:
+            node: Nodo del grafo de dependencias
+            future: Future con el resultado del nodo
+
+        Returns:
+            El flujo de deltas del nodo, o None si terminó sin emitir deltas
+        """
+        with self._condition:
+            while node not in self.streams and not future.done():
+                self._condition.wait()
+            return self.streams.get(node)
+
+    async def await_stream(self, node: Hashable, task: asyncio.Future) -> Optional[DeltaStream]:
+        """
+        Versión asíncrona de `wait_stream`.
+
+        Args:
+            node: Nodo del grafo de dependencias
+            task: Tarea que genera el valor del nodo
+
+        Returns:
+            El flujo de deltas del nodo, o None si terminó sin emitir deltas
+        """
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._condition:
+            self._async_waiters.append(waiter)
+        try:
+            while True:
+                with self._condition:
+                    event.clear()
+                    stream = self.streams.get(node)
+                if stream is not None or task.done():
+                    return stream
+                waiting = asyncio.ensure_future(event.wait())
+                try:
+                    await asyncio.wait({task, waiting}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    waiting.cancel()
+        finally:
+            with self._condition:
+                self._async_waiters.remove(waiter)
+
+    def node_key(self, node: Tuple[TokenKind, str]) -> str:
+        """
+        Calcula la clave Merkle de un nodo del grafo de dependencias.
+
+        La clave resume la fuente generativa, el prompt sin resolver y el formato del
+        nodo, los valores de las variables contextuales y de metadata de su prompt y
+        las claves de los nodos de los que depende, que ya deben estar calculadas.
+
+        Args:
+            node: Tipo de token y nombre de la variable
+
+        Returns:
+            Hash hexadecimal que identifica el resultado del nodo
+        """
+        inputs = {}
+        for token in self._input_tokens(node):
+            dependency = (token.kind, token.target)
+            if dependency not in self.node_keys:
+                inputs[dependency] = self.table.resolve(*dependency)
+        return self._store_key(node, inputs)
+
+    async def anode_key(self, node: Tuple[TokenKind, str]) -> str:
+        """Versión asíncrona de `node_key`"""
+        inputs = {}
+        for token in self._input_tokens(node):
+            dependency = (token.kind, token.target)
+            if dependency not in self.node_keys:
+                inputs[dependency] = await self.table.aresolve(*dependency)
+        return self._store_key(node, inputs)
+
+    def _input_tokens(self, node: Tuple[TokenKind, str]) -> List[Token]:
+        """Variables del prompt de un nodo"""
+        return [token for token in self.template.node_prompt_tokens(*node) if token.kind in VARIABLE_KINDS]
+
+    def _store_key(self, node: Tuple[TokenKind, str], values: Dict[Tuple[TokenKind, str], Any]) -> str:
+        """
+        Combina la firma del nodo con sus entradas: la clave de las dependencias que
+        son nodos del grafo y el valor resuelto del resto de variables.
+        """
+        kind, target = node
+        source, prompt, format_type = self.template.node_signature(kind, target)
+        parts = [kind.value, target, source, prompt or "", format_type or ""]
+        for token in self._input_tokens(node):
+            dependency = (token.kind, token.target)
+            if dependency in self.node_keys:
+                parts.append(f"{token.kind.value}:{token.target}#{self.node_keys[dependency]}")
+            else:
+                parts.append(f"{token.kind.value}:{token.target}={values.get(dependency)!r}")
+        key = content_hash("\x00".join(parts))
+        self.node_keys[node] = key
+        return key
+
+    def degrade_key(self, node: Tuple[TokenKind, str]) -> None:
+        """
+        Distingue la clave Merkle de un nodo generado con un nivel degradado, para que
+        los nodos que dependen de él no compartan clave con los generados a partir del
+        valor del primer nivel.
+
+        Args:
+            node: Tipo de token y nombre de la variable
+        """
+        key = self.node_keys.get(node)
+        tier = self.tiers.get(node)
+        if key is not None and tier is not None:
+            self.node_keys[node] = content_hash(f"{key}\x00{tier.handler_key}")
+
+    def finish(self) -> RenderReport:
+        """
+        Completa el reporte con los contadores acumulados durante el render.
+
+        Returns:
+            El reporte del render
+        """
+        self.report.handler_invocations = self.ledger.invocations
+        self.report.shared_invocations = self.ledger.shared
+        self.report.cached_invocations = self.ledger.cached
+        self.report.coalesced_invocations = self.ledger.coalesced
+        self.report.approximate_invocations = self.ledger.approximate
+        self.report.batch_calls = self.ledger.batches
+        self.report.batched_invocations = self.ledger.batched
+        self.report.micro_batched_invocations = self.ledger.micro_batched
+        self.report.retries = self.ledger.retry_budget.spent
+        self.report.rejected_invocations = self.ledger.rejected
+        self.report.invocations_by_handler = dict(self.ledger.by_handler)
+        self.report.variables_resolved = self.table.resolved
+        self.report.bulk_lookups = self.table.bulk_calls
+        self.report.dependency_waves = len(self.template.graph.waves)
+        nodes = list(self.template.graph.dependencies)
+        self.report.reused_nodes = [node_label(node) for node in nodes if node in self.reused]
+        self.report.regenerated_nodes = [node_label(node) for node in nodes if node in self.regenerated]
+        self.report.variable_status = {node_label(node): self.status[node].value
+                                       for node in nodes if node in self.status}
+        self.report.deadline_exceeded = VariableStatus.TIMED_OUT in self.status.values()
+        tiers = [(node, self.tiers[node]) for node in nodes if node in self.tiers]
+        self.report.tier_choices = {node_label(node): tier.handler_key for node, tier in tiers}
+        self.report.degraded_nodes = [node_label(node) for node, _ in tiers if node in self.degraded]
+        self.report.tier_cost = sum(tier.cost for _, tier in tiers)
+        return self.report
+
+
+def node_label(node: Tuple[TokenKind, str]) -> str:
+    """
+    Nombre con sintaxis KMC de un nodo del grafo de dependencias.
+
+    Args:
+        node: Tipo de token y nombre de la variable
+
+    Returns:
+        `[{tipo:nombre}]` para definiciones o `{{categoria:subtipo:nombre}}`
+    """
+    kind, target = node
+    if kind is TokenKind.METADATA:
+        return f"[{{{target}}}]"
+    return f"{{{{{target}}}}}"
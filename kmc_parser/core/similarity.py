@@ -0,0 +1,317 @@
+"""
+Similarity - Cache de resultados generativos para prompts casi idénticos
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+
+from .cache import handler_fingerprint
+
+
+_DATE_PATTERN = re.compile(
+    r"\b(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4})(?:[ t]\d{1,2}:\d{2}(?::\d{2})?)?\b"
+)
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]+")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+SIGNATURE_BITS = 64
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normaliza un prompt para comparar solo su contenido.
+
+    Pasa a minúsculas, elimina acentos y signos de puntuación, sustituye las fechas
+    por un marcador común y colapsa los espacios en blanco.
+
+    Args:
+        prompt: Prompt ya resuelto
+
+    Returns:
+        Prompt normalizado
+    """
+    text = unicodedata.normalize("NFKD", prompt.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _DATE_PATTERN.sub(" fecha ", text)
+    text = _PUNCTUATION_PATTERN.sub(" ", text)
+    return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def shingles(text: str, size: int = 4) -> List[str]:
+    """
+    Divide un texto en fragmentos solapados de `size` caracteres.
+
+    Args:
+        text: Texto normalizado
+        size: Longitud de cada fragmento
+
+    Returns:
+        Lista de fragmentos (el propio texto si es más corto que `size`)
+    """
+    if len(text) <= size:
+        return [text]
+    return [text[index:index + size] for index in range(len(text) - size + 1)]
+
+
+def simhash(features: Iterable[str]) -> int:
+    """
+    Calcula la firma SimHash de 64 bits de un conjunto de características.
+
+    Textos con muchas características en común tienen firmas que difieren en pocos bits.
+
+    Args:
+        features: Características del texto (por ejemplo sus fragmentos)
+
+    Returns:
+        Firma como entero de 64 bits
+    """
+    weights = [0] * SIGNATURE_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIGNATURE_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    signature = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            signature |= 1 << bit
+    return signature
+
+
+def signature_similarity(a: int, b: int) -> float:
+    """
+    Calcula la similitud entre dos firmas SimHash.
+
+    Returns:
+        Fracción de bits iguales (1.0 para firmas idénticas)
+    """
+    return 1.0 - bin(a ^ b).count("1") / SIGNATURE_BITS
+
+
+class SimilarityCache:
+    """
+    Cache de resultados generativos que reutiliza el resultado de un prompt casi idéntico.
+
+    Cada prompt se normaliza y se resume en una firma SimHash. Las firmas se indexan
+    con LSH por bandas: la firma se divide en tantas bandas como bits pueden diferir
+    dos prompts por encima del umbral, más uno, de modo que dos firmas similares
+    comparten al menos una banda y solo se comparan con las candidatas de sus bandas.
+    Todo el cálculo es local.
+
+    Solo se usa con los handlers que toleran reutilizar un resultado aproximado: los
+    habilitados con `allow(handler_key)` o cuya configuración incluye
+    `{"approximate_cache": True}`. Los resultados solo se comparten entre invocaciones
+    con el mismo handler_key, nombre, formato y configuración del handler.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_entries: int = 1024, ttl: Optional[float] = None,
+                 shingle_size: int = 4, clock: Callable[[], float] = time.monotonic):
+        """
+        Inicializa la cache de similitud.
+
+        Args:
+            threshold: Similitud mínima (0-1) entre firmas para reutilizar un resultado
+            max_entries: Número máximo de resultados almacenados
+            ttl: Tiempo de vida por defecto en segundos (None para no caducar)
+            shingle_size: Longitud de los fragmentos del prompt normalizado
+            clock: Reloj monotónico usado para calcular la caducidad
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("El umbral de similitud debe estar en (0, 1]")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shingle_size = shingle_size
+        self.clock = clock
+        self._bands = self._band_masks(threshold)
+        self._allowed: Set[str] = set()
+        # Clave de entrada -> (firma, resultado, caducidad)
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[int, Any, Optional[float]]]" = OrderedDict()
+        # (ámbito, banda, valor de la banda) -> claves de entrada
+        self._buckets: Dict[Tuple[Hashable, ...], Set[Tuple[Hashable, ...]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _band_masks(threshold: float) -> List[Tuple[int, int]]:
+        """Divide la firma en bandas de forma que dos firmas similares compartan alguna"""
+        max_distance = int((1.0 - threshold) * SIGNATURE_BITS + 1e-9)
+        count = min(max_distance + 1, SIGNATURE_BITS)
+        bands = []
+        start = 0
+        for index in range(count):
+            width = SIGNATURE_BITS // count + (1 if index < SIGNATURE_BITS % count else 0)
+            bands.append((start, (1 << width) - 1))
+            start += width
+        return bands
+
+    def allow(self, handler_key: str) -> None:
+        """Habilita la reutilización aproximada de resultados para un handler"""
+        self._allowed.add(handler_key)
+
+    def deny(self, handler_key: str) -> None:
+        """Deshabilita la reutilización aproximada habilitada con `allow`"""
+        self._allowed.discard(handler_key)
+
+    def accepts(self, var, handler: Callable) -> bool:
+        """
+        Indica si una invocación admite reutilizar un resultado aproximado.
+
+        Args:
+            var: Variable generativa con el prompt ya resuelto
+            handler: Handler generativo que se va a invocar
+
+        Returns:
+            True si el handler tolera resultados aproximados y la invocación tiene prompt
+        """
+        if not var.prompt:
+            return False
+        config = getattr(handler, "config", None)
+        if isinstance(config, dict):
+            if config.get("cache") is False:
+                return False
+            if config.get("approximate_cache"):
+                return True
+        return var.handler_key in self._allowed
+
+    def signature(self, prompt: str) -> int:
+        """
+        Calcula la firma SimHash de un prompt normalizado.
+
+        Args:
+            prompt: Prompt ya resuelto
+
+        Returns:
+            Firma de 64 bits
+        """
+        return simhash(shingles(normalize_prompt(prompt), self.shingle_size))
+
+    def get(self, var, handler: Callable) -> Optional[Any]:
+        """
+        Busca el resultado de un prompt casi idéntico al de la invocación.
+
+        Args:
+            var: Variable generativa con el prompt ya resuelto
+            handler: Handler generativo que se va a invocar
+
+        Returns:
+            El resultado del prompt más similar por encima del umbral, o None
+        """
+        if not self.accepts(var, handler):
+            return None
+        scope = self._scope(var, handler)
+        signature = self.signature(var.prompt)
+        now = self.clock()
+
+        with self._lock:
+            candidates = set()
+            for band in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(band, ()))
+
+            best_key, best_similarity = None, self.threshold
+            for key in candidates:
+                stored_signature, _, expires = self._entries[key]
+                if expires is not None and expires <= now:
+                    self._discard(key)
+                    self.expirations += 1
+                    continue
+                similarity = signature_similarity(signature, stored_signature)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][1]
+
+    def put(self, var, handler: Callable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Almacena el resultado de una invocación, expulsando los menos usados si es necesario.
+
+        Args:
+            var: Variable generativa con el prompt ya resuelto
+            handler: Handler generativo invocado
+            value: Resultado del handler (None no se almacena)
+            ttl: Tiempo de vida en segundos; por defecto el de la configuración del
+                handler (`cache_ttl`) o el de la cache
+        """
+        if value is None or self.max_entries <= 0 or not self.accepts(var, handler):
+            return
+        if ttl is None:
+            config = getattr(handler, "config", None)
+            ttl = config.get("cache_ttl", self.ttl) if isinstance(config, dict) else self.ttl
+        scope = self._scope(var, handler)
+        signature = self.signature(var.prompt)
+        key = scope + (signature,)
+        expires = self.clock() + ttl if ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (signature, value, expires)
+            for band in self._band_keys(scope, signature):
+                self._buckets.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Elimina todos los resultados y reinicia los contadores"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retorna las estadísticas de uso de la cache.
+
+        Returns:
+            Diccionario con aciertos, fallos, expulsiones, caducidades, entradas y bandas LSH
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "bands": len(self._bands)
+            }
+
+    @staticmethod
+    def _scope(var, handler: Callable) -> Tuple[Hashable, ...]:
+        """Parte de la invocación que debe coincidir exactamente para reutilizar un resultado"""
+        format_type = var.parameters.get('format') if var.parameters else None
+        return (var.handler_key, var.name, format_type, handler_fingerprint(handler))
+
+    def _band_keys(self, scope: Tuple[Hashable, ...], signature: int) -> List[Tuple[Hashable, ...]]:
+        """Claves de los cubos LSH de una firma"""
+        return [
+            (scope, index, signature >> start & mask)
+            for index, (start, mask) in enumerate(self._bands)
+        ]
+
+    def _discard(self, key: Tuple[Hashable, ...]) -> None:
+        """Elimina una entrada y sus referencias en los cubos LSH"""
+        signature, _, _ = self._entries.pop(key)
+        for band in self._band_keys(key[:-1], signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
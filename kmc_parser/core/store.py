@@ -0,0 +1,328 @@
+"""
+Store - Almacén persistente de resultados generativos compartido entre procesos
+"""
+from typing import Dict, Hashable, List, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from .cache import content_hash
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    ident TEXT NOT NULL,
+    handler_key TEXT,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access);
+CREATE TABLE IF NOT EXISTS store_meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_meta (name, value) VALUES ('bytes', 0);
+"""
+
+
+class ResultStore:
+    """
+    Almacén persistente y direccionado por contenido de resultados generativos.
+
+    Los resultados se guardan comprimidos en una base de datos SQLite en modo WAL, de
+    modo que varios procesos (por ejemplo los workers de gunicorn) pueden leer y
+    escribir a la vez y los resultados sobreviven a los reinicios. Cuando el tamaño
+    comprimido total supera `max_bytes` se expulsan los resultados usados hace más
+    tiempo. Cada proceso e hilo usa su propia conexión.
+
+    Las lecturas no escriben en la base de datos: los accesos se acumulan en memoria y
+    se vuelcan en una sola transacción cada `access_batch` accesos o cada
+    `access_interval` segundos. Los errores de SQLite al leer o escribir y los
+    resultados dañados (que no se pueden descomprimir) se registran como aviso y se
+    tratan como ausentes, de modo que un fallo del almacén no hace fallar la
+    generación.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024,
+                 compression_level: int = 6, timeout: float = 30.0,
+                 access_batch: int = 64, access_interval: float = 5.0):
+        """
+        Inicializa el almacén, creando la base de datos si no existe.
+
+        Args:
+            path: Ruta del fichero SQLite
+            max_bytes: Tamaño máximo (comprimido) del total de resultados
+            compression_level: Nivel de compresión zlib (1-9)
+            timeout: Segundos de espera cuando otro proceso tiene bloqueada la base de datos
+            access_batch: Accesos acumulados que provocan su volcado a la base de datos
+            access_interval: Segundos máximos entre volcados de los accesos acumulados
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self.timeout = timeout
+        self.access_batch = access_batch
+        self.access_interval = access_interval
+        self._local = threading.local()
+        self.logger = logging.getLogger("kmc.store")
+        # Accesos pendientes de volcar: dirección -> (aciertos, último acceso)
+        self._accesses: Dict[str, Tuple[int, float]] = {}
+        self._pending_accesses = 0
+        self._accesses_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+
+    @staticmethod
+    def digest(key: Tuple[Hashable, ...]) -> str:
+        """
+        Calcula la dirección de contenido de una clave de la cache de resultados.
+
+        Args:
+            key: Clave de la invocación
+
+        Returns:
+            Hash hexadecimal de la clave serializada
+        """
+        return content_hash(json.dumps(list(key), default=repr))
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Tuple[str, Optional[float]]]:
+        """
+        Obtiene un resultado vigente del almacén.
+
+        Args:
+            key: Clave de la invocación
+
+        Returns:
+            Tupla (resultado, segundos de vida restantes o None), o None si no está
+            o ha caducado
+        """
+        digest = self.digest(key)
+        now = time.time()
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT value, expires FROM results WHERE key = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, expires = row
+            if expires is not None and expires <= now:
+                with connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    self._delete(connection, digest)
+                return None
+        except sqlite3.Error as e:
+            self.logger.warning(f"No se pudo leer un resultado de {self.path}: {e}")
+            return None
+        result = self._decode(value)
+        if result is None:
+            return None
+        self._record_access(digest, now)
+        return result, (expires - now if expires is not None else None)
+
+    def put(self, key: Tuple[Hashable, ...], value: str, ttl: Optional[float] = None,
+            handler_key: Optional[str] = None) -> None:
+        """
+        Almacena un resultado y expulsa los menos usados si se supera el tamaño máximo.
+
+        Args:
+            key: Clave de la invocación
+            value: Resultado (solo se almacenan cadenas de texto)
+            ttl: Tiempo de vida en segundos, o None para que no caduque
+            handler_key: Handler que generó el resultado
+        """
+        if not isinstance(value, str):
+            return
+        digest = self.digest(key)
+        blob = zlib.compress(value.encode("utf-8"), self.compression_level)
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+
+        try:
+            connection = self._connection()
+            with connection:
+                # BEGIN IMMEDIATE serializa a los escritores de todos los procesos
+                connection.execute("BEGIN IMMEDIATE")
+                self._write_accesses(connection, self._take_accesses())
+                previous = connection.execute(
+                    "SELECT size FROM results WHERE key = ?", (digest,)
+                ).fetchone()
+                connection.execute(
+                    "INSERT OR REPLACE INTO results "
+                    "(key, ident, handler_key, value, size, expires, last_access, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                    (digest, json.dumps(list(key), default=repr), handler_key, blob, len(blob), expires, now)
+                )
+                total = self._add_bytes(connection, len(blob) - (previous[0] if previous else 0))
+                if total > self.max_bytes:
+                    self._evict(connection, total)
+        except sqlite3.Error as e:
+            self.logger.warning(f"No se pudo guardar un resultado en {self.path}: {e}")
+
+    def hot(self, limit: int = 256) -> List[Tuple[Tuple[Hashable, ...], str, Optional[float]]]:
+        """
+        Obtiene los resultados vigentes más usados, para precargarlos al arrancar.
+
+        Args:
+            limit: Número máximo de resultados
+
+        Returns:
+            Lista de tuplas (clave, resultado, segundos de vida restantes o None); vacía
+            si no se pudo leer el almacén
+        """
+        self.flush_accesses()
+        now = time.time()
+        try:
+            rows = self._connection().execute(
+                "SELECT ident, value, expires FROM results "
+                "WHERE expires IS NULL OR expires > ? "
+                "ORDER BY hits DESC, last_access DESC LIMIT ?",
+                (now, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            self.logger.warning(f"No se pudieron leer los resultados más usados de {self.path}: {e}")
+            return []
+        hot = []
+        for ident, value, expires in rows:
+            result = self._decode(value)
+            if result is not None:
+                hot.append((tuple(json.loads(ident)), result, expires - now if expires is not None else None))
+        return hot
+
+    def clear(self) -> None:
+        """Elimina todos los resultados del almacén"""
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM results")
+            connection.execute("UPDATE store_meta SET value = 0 WHERE name = 'bytes'")
+
+    def flush_accesses(self) -> None:
+        """Vuelca a la base de datos los accesos acumulados por `get`"""
+        accesses = self._take_accesses()
+        if not accesses:
+            return
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                self._write_accesses(connection, accesses)
+        except sqlite3.Error as e:
+            self.logger.warning(f"No se pudieron registrar {len(accesses)} accesos en {self.path}: {e}")
+
+    def close(self) -> None:
+        """Vuelca los accesos pendientes y cierra la conexión del hilo actual"""
+        self.flush_accesses()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __len__(self) -> int:
+        try:
+            return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.warning(f"No se pudieron contar los resultados de {self.path}: {e}")
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retorna el estado del almacén.
+
+        Returns:
+            Diccionario con el número de entradas y los bytes comprimidos ocupados (a
+            cero si no se pudo leer el almacén)
+        """
+        try:
+            connection = self._connection()
+            entries = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            size = connection.execute("SELECT value FROM store_meta WHERE name = 'bytes'").fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.warning(f"No se pudo leer el estado de {self.path}: {e}")
+            return {"entries": 0, "bytes": 0}
+        return {"entries": entries, "bytes": size}
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión del proceso e hilo actuales (las conexiones no se heredan tras un fork)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _record_access(self, digest: str, now: float) -> None:
+        """Acumula un acierto y lo vuelca junto con el resto si toca"""
+        with self._accesses_lock:
+            hits, _ = self._accesses.get(digest, (0, now))
+            self._accesses[digest] = (hits + 1, now)
+            self._pending_accesses += 1
+            due = (self._pending_accesses >= self.access_batch
+                   or time.monotonic() - self._flushed_at >= self.access_interval)
+        if due:
+            self.flush_accesses()
+
+    def _take_accesses(self) -> List[Tuple[int, float, str]]:
+        """Retira los accesos acumulados como parámetros de su UPDATE"""
+        with self._accesses_lock:
+            accesses, self._accesses = self._accesses, {}
+            self._pending_accesses = 0
+            self._flushed_at = time.monotonic()
+        return [(hits, last_access, digest) for digest, (hits, last_access) in accesses.items()]
+
+    @staticmethod
+    def _write_accesses(connection: sqlite3.Connection, accesses: List[Tuple[int, float, str]]) -> None:
+        """Aplica los accesos acumulados (dentro de una transacción ya abierta)"""
+        if accesses:
+            connection.executemany(
+                "UPDATE results SET hits = hits + ?, last_access = MAX(last_access, ?) WHERE key = ?", accesses
+            )
+
+    def _add_bytes(self, connection: sqlite3.Connection, delta: int) -> int:
+        """Actualiza el tamaño total almacenado y lo retorna"""
+        connection.execute("UPDATE store_meta SET value = value + ? WHERE name = 'bytes'", (delta,))
+        return connection.execute("SELECT value FROM store_meta WHERE name = 'bytes'").fetchone()[0]
+
+    def _delete(self, connection: sqlite3.Connection, digest: str) -> None:
+        """Elimina un resultado y descuenta su tamaño"""
+        row = connection.execute("SELECT size FROM results WHERE key = ?", (digest,)).fetchone()
+        if row is not None:
+            connection.execute("DELETE FROM results WHERE key = ?", (digest,))
+            self._add_bytes(connection, -row[0])
+
+    def _evict(self, connection: sqlite3.Connection, total: int) -> None:
+        """Expulsa los resultados usados hace más tiempo hasta bajar del 90% del tamaño máximo"""
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        evicted = []
+        for digest, size in connection.execute("SELECT key, size FROM results ORDER BY last_access"):
+            if total - freed <= target:
+                break
+            evicted.append((digest,))
+            freed += size
+        connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+        self._add_bytes(connection, -freed)
+        self.logger.debug(f"Expulsados {len(evicted)} resultados ({freed} bytes) de {self.path}")
+
+    def _decode(self, value: bytes) -> Optional[str]:
+        """Descomprime un resultado almacenado, o retorna None si está dañado"""
+        try:
+            return zlib.decompress(value).decode("utf-8")
+        except (zlib.error, UnicodeDecodeError) as e:
+            self.logger.warning(f"Resultado dañado en {self.path}: {e}")
+            return None
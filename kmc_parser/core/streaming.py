@@ -0,0 +1,161 @@
+"""
+Streaming - Protocolo de handlers que generan su contenido por fragmentos (deltas)
+"""
+from collections.abc import AsyncIterator, Iterator
+from contextvars import ContextVar
+from typing import Any, AsyncIterator as AsyncIteratorType, Hashable, Iterator as IteratorType, List, Optional, Tuple
+import asyncio
+import threading
+
+
+# Nodo del grafo de dependencias que se está generando en el contexto actual
+current_node: ContextVar[Optional[Hashable]] = ContextVar("kmc_current_node", default=None)
+
+
+def is_delta_stream(value: Any) -> bool:
+    """
+    Indica si el valor retornado por un handler es un flujo de deltas de texto.
+
+    Un handler generativo puede retornar un iterador o un iterador asíncrono de
+    fragmentos de texto en lugar del texto completo. Las cadenas, listas y demás
+    colecciones no se consideran flujos.
+
+    Args:
+        value: Valor retornado por el handler
+
+    Returns:
+        True si el valor es un iterador (síncrono o asíncrono)
+    """
+    return isinstance(value, (Iterator, AsyncIterator)) and not isinstance(value, (str, bytes))
+
+
+class DeltaStream:
+    """
+    Flujo de deltas de texto producido por un handler generativo.
+
+    El productor consume el iterador del handler y acumula los deltas; cualquier
+    número de lectores puede recorrerlos desde el principio mientras se generan,
+    tanto desde hilos (`for delta in stream`) como desde asyncio (`async for`).
+    """
+
+    def __init__(self):
+        """Inicializa un flujo vacío"""
+        self._deltas: List[str] = []
+        self._done = False
+        self.error: Optional[BaseException] = None
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    @property
+    def done(self) -> bool:
+        """Indica si el handler terminó de generar (con o sin error)"""
+        return self._done
+
+    @property
+    def text(self) -> str:
+        """Texto generado hasta el momento"""
+        with self._condition:
+            return ''.join(self._deltas)
+
+    def append(self, delta: Any) -> None:
+        """Añade un delta y despierta a los lectores"""
+        if delta is None:
+            return
+        with self._condition:
+            self._deltas.append(str(delta))
+            self._condition.notify_all()
+            waiters = list(self._async_waiters)
+        self._wake(waiters)
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """Marca el flujo como terminado, opcionalmente con el error del handler"""
+        with self._condition:
+            self._done = True
+            self.error = error
+            self._condition.notify_all()
+            waiters = list(self._async_waiters)
+        self._wake(waiters)
+
+    @staticmethod
+    def _wake(waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]) -> None:
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def consume(self, deltas: IteratorType[Any]) -> str:
+        """
+        Consume un iterador de deltas hasta el final.
+
+        Args:
+            deltas: Iterador retornado por el handler
+
+        Returns:
+            El texto completo generado
+
+        Raises:
+            Exception: El error lanzado por el iterador del handler
+        """
+        try:
+            for delta in deltas:
+                self.append(delta)
+        except Exception as e:
+            self.close(e)
+            raise
+        self.close()
+        return self.text
+
+    async def aconsume(self, deltas: AsyncIteratorType[Any]) -> str:
+        """
+        Consume un iterador asíncrono de deltas hasta el final.
+
+        Args:
+            deltas: Iterador asíncrono retornado por el handler
+
+        Returns:
+            El texto completo generado
+        """
+        try:
+            async for delta in deltas:
+                self.append(delta)
+        except Exception as e:
+            self.close(e)
+            raise
+        self.close()
+        return self.text
+
+    def __iter__(self) -> IteratorType[str]:
+        """Recorre los deltas desde el principio, bloqueando hasta que llegan nuevos"""
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._deltas) and not self._done:
+                    self._condition.wait()
+                chunk = self._deltas[index:]
+                finished = self._done
+            index += len(chunk)
+            yield from chunk
+            if finished and not chunk:
+                return
+
+    async def __aiter__(self) -> AsyncIteratorType[str]:
+        """Recorre los deltas desde el principio sin bloquear el bucle de eventos"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._condition:
+            self._async_waiters.append(waiter)
+        try:
+            index = 0
+            while True:
+                with self._condition:
+                    event.clear()
+                    chunk = self._deltas[index:]
+                    finished = self._done
+                index += len(chunk)
+                for delta in chunk:
+                    yield delta
+                if finished and not chunk:
+                    return
+                if not chunk:
+                    await event.wait()
+        finally:
+            with self._condition:
+                self._async_waiters.remove(waiter)
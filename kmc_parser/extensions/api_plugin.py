@@ -1,7 +1,7 @@
 """
 API Plugin - Plugin de ejemplo para KMC Parser que integra APIs externas
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
 import json
 import os
@@ -30,6 +30,10 @@ class WeatherAPIHandler(GenerativeHandler):
                 - api_key: Clave de API del servicio de clima
                 - units: Unidades de medida (metric, imperial)
                 - lang: Idioma de las respuestas
+                - cache: False para excluir el handler de la cache de resultados
+                - cache_ttl: Tiempo de vida (segundos) de sus resultados en la cache
+                - rate_limit: Llamadas por segundo permitidas por la cuota del servicio
+                - max_in_flight: Llamadas simultáneas permitidas
         """
         super().__init__(config)
         self.api_key = config.get("api_key", "demo_key")
@@ -49,6 +53,29 @@ class WeatherAPIHandler(GenerativeHandler):
         """
         # En producción, aquí se haría una llamada a la API real
         # Por ahora, simulamos respuestas para demostrar el concepto
+        return self._simulate_weather_data(self._location(var))
+    
+    def generate_batch(self, vars: List[GenerativeVariable]) -> List[str]:
+        """
+        Obtiene el clima de todas las ubicaciones del lote con una sola consulta.
+        
+        Args:
+            vars: Variables generativas con la ciudad o ubicación
+            
+        Returns:
+            Datos de clima formateados de cada variable
+        """
+        locations = [self._location(var) for var in vars]
+        # En producción se usaría el endpoint de consulta agrupada del servicio, p. ej.:
+        # response = requests.get(f"{base_url}/group", params={
+        #     "id": ",".join(city_ids), "units": self.units, "lang": self.lang, "appid": self.api_key
+        # })
+        weather = self._fetch_weather(list(dict.fromkeys(location.lower() for location in locations)))
+        return [self._format_weather_data(location, weather.get(location.lower())) for location in locations]
+    
+    @staticmethod
+    def _location(var: GenerativeVariable) -> str:
+        """Obtiene la ciudad de la variable o, si lo indica, de su prompt"""
         location = var.name or "desconocida"
         if var.prompt:
             # Si hay un prompt, buscamos la ciudad en él
@@ -56,8 +83,7 @@ class WeatherAPIHandler(GenerativeHandler):
             match = re.search(r'ciudad[:\s]+([a-zA-ZáéíóúÁÉÍÓÚñÑ\s]+)', var.prompt, re.IGNORECASE)
             if match:
                 location = match.group(1).strip()
-        
-        return self._simulate_weather_data(location)
+        return location
     
     def _simulate_weather_data(self, location: str) -> str:
         """
@@ -69,6 +95,18 @@ class WeatherAPIHandler(GenerativeHandler):
         Returns:
             Datos de clima simulados en formato texto
         """
+        return self._format_weather_data(location, self._fetch_weather([location.lower()]).get(location.lower()))
+    
+    def _fetch_weather(self, locations: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Consulta (de forma simulada) el clima de varias ubicaciones a la vez.
+        
+        Args:
+            locations: Ubicaciones en minúsculas
+            
+        Returns:
+            Datos de cada ubicación conocida
+        """
         # Simulación básica - en producción se consultaría una API real
         weather_data = {
             "madrid": {
@@ -103,9 +141,20 @@ class WeatherAPIHandler(GenerativeHandler):
             }
         }
         
-        location_lower = location.lower()
-        if location_lower in weather_data:
-            data = weather_data[location_lower]
+        return {location: weather_data[location] for location in locations if location in weather_data}
+    
+    def _format_weather_data(self, location: str, data: Optional[Dict[str, Any]]) -> str:
+        """
+        Formatea los datos de clima de una ubicación.
+        
+        Args:
+            location: Ciudad o ubicación
+            data: Datos consultados, o None si no hay datos de la ubicación
+            
+        Returns:
+            Datos de clima en formato texto
+        """
+        if data is not None:
             units_symbol = "°C" if self.units == "metric" else "°F"
             
             return f"""### Clima actual en {location.title()}
@@ -143,6 +192,10 @@ class StockAPIHandler(GenerativeHandler):
             config: Configuración del handler, puede incluir:
                 - api_key: Clave de API del servicio financiero
                 - currency: Moneda para los precios
+                - cache: False para excluir el handler de la cache de resultados
+                - cache_ttl: Tiempo de vida (segundos) de sus resultados en la cache
+                - rate_limit: Llamadas por segundo permitidas por la cuota del servicio
+                - max_in_flight: Llamadas simultáneas permitidas
         """
         super().__init__(config)
         self.api_key = config.get("api_key", "demo_key")
@@ -164,6 +217,24 @@ class StockAPIHandler(GenerativeHandler):
         
         return self._simulate_stock_data(symbol)
     
+    def generate_batch(self, vars: List[GenerativeVariable]) -> List[str]:
+        """
+        Obtiene las cotizaciones de todos los símbolos del lote con una sola consulta.
+        
+        Args:
+            vars: Variables generativas con el símbolo o empresa
+            
+        Returns:
+            Datos financieros formateados de cada variable
+        """
+        symbols = [var.name.upper() if var.name else "UNKNOWN" for var in vars]
+        # En producción se usaría el endpoint de cotizaciones múltiples del servicio, p. ej.:
+        # response = requests.get(f"{base_url}/quote", params={
+        #     "symbols": ",".join(symbols), "apikey": self.api_key
+        # })
+        quotes = self._fetch_quotes(list(dict.fromkeys(symbols)))
+        return [self._format_stock_data(symbol, quotes.get(symbol)) for symbol in symbols]
+    
     def _simulate_stock_data(self, symbol: str) -> str:
         """
         Simula datos financieros para demostración.
@@ -174,6 +245,18 @@ class StockAPIHandler(GenerativeHandler):
         Returns:
             Datos financieros simulados en formato texto
         """
+        return self._format_stock_data(symbol, self._fetch_quotes([symbol]).get(symbol))
+    
+    def _fetch_quotes(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Consulta (de forma simulada) las cotizaciones de varios símbolos a la vez.
+        
+        Args:
+            symbols: Símbolos bursátiles
+            
+        Returns:
+            Datos de cada símbolo conocido
+        """
         # Simulación básica - en producción se consultaría una API real
         stock_data = {
             "AAPL": {
@@ -206,8 +289,20 @@ class StockAPIHandler(GenerativeHandler):
             }
         }
         
-        if symbol in stock_data:
-            data = stock_data[symbol]
+        return {symbol: stock_data[symbol] for symbol in symbols if symbol in stock_data}
+    
+    def _format_stock_data(self, symbol: str, data: Optional[Dict[str, Any]]) -> str:
+        """
+        Formatea los datos financieros de un símbolo.
+        
+        Args:
+            symbol: Símbolo bursátil
+            data: Cotización consultada, o None si no se encontró el símbolo
+            
+        Returns:
+            Datos financieros en formato texto
+        """
+        if data is not None:
             change_symbol = "+" if data['change'] > 0 else ""
             
             return f"""### Datos financieros de {data['company']} ({symbol})
@@ -262,16 +357,28 @@ class ExternalAPIsPlugin(KMCPlugin):
         """
         count = 0
         
-        # Configuración para los handlers
+        # Configuración para los handlers. Los datos de clima y de mercado cambian con
+        # el tiempo, así que sus resultados caducan pronto en la cache de resultados.
+        # Los límites de ritmo y de vuelo los aplica el parser al invocar los handlers
         weather_config = {
             "api_key": self.config.get("weather_api_key"),
             "units": self.config.get("weather_units", "metric"),
-            "lang": self.config.get("weather_lang", "es")
+            "lang": self.config.get("weather_lang", "es"),
+            "cache": self.config.get("weather_cache", True),
+            "cache_ttl": self.config.get("weather_cache_ttl", 600),
+            "rate_limit": self.config.get("weather_rate_limit"),
+            "rate_burst": self.config.get("weather_rate_burst"),
+            "max_in_flight": self.config.get("weather_max_in_flight")
         }
         
         stock_config = {
             "api_key": self.config.get("stock_api_key"),
-            "currency": self.config.get("currency", "USD")
+            "currency": self.config.get("currency", "USD"),
+            "cache": self.config.get("stock_cache", True),
+            "cache_ttl": self.config.get("stock_cache_ttl", 60),
+            "rate_limit": self.config.get("stock_rate_limit"),
+            "rate_burst": self.config.get("stock_rate_burst"),
+            "max_in_flight": self.config.get("stock_max_in_flight")
         }
         
         # Registrar handlers
@@ -1,7 +1,6 @@
 import logging
 import sys
 import os
-import time
 
 from llama_index.core import SimpleDirectoryReader, Document, StorageContext
 from llama_index.core import VectorStoreIndex
@@ -12,6 +11,9 @@ from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding
 from llama_index.core import Settings
 from supabase import create_client, Client
 
+from ...core.deadline import Deadline, remaining_time
+from ...core.resilience import Resilience, RetryPolicy
+
 llm = AzureOpenAI(
     model=os.environ["AZURE_OPENAI_DEPLOYMENT"],
     deployment_name=os.environ["AZURE_OPENAI_DEPLOYMENT"],
@@ -32,6 +34,32 @@ embed_model = AzureOpenAIEmbedding(
 Settings.llm = llm
 Settings.embed_model = embed_model
 
+# Retries with exponential backoff and per-service circuit breakers for Supabase storage
+# and vector-store calls. While a service is down its breaker fails fast instead of
+# blocking a worker on every request. Only transient errors (timeouts, connection errors,
+# HTTP 429/5xx) are retried or counted by the breakers: a missing object (404) fails at
+# once and does not open the breaker for other documents.
+STORAGE_SERVICE = "supabase:storage"
+VECTOR_STORE_SERVICE = "supabase:vector_store"
+# Longest time a single I/O operation may spend on attempts and backoff together
+IO_RETRY_WINDOW = 10.0
+io_resilience = Resilience(
+    RetryPolicy(max_attempts=4, base_delay=0.5, max_delay=4.0),
+    failure_threshold=5,
+    recovery_time=30.0,
+)
+
+
+def io_deadline() -> Deadline:
+    """
+    Time limit for the retries of one storage or vector-store operation: the time left
+    to the render in progress, capped at IO_RETRY_WINDOW. No retry is attempted once
+    its backoff would not fit in that window.
+    """
+    remaining = remaining_time()
+    return Deadline(IO_RETRY_WINDOW if remaining is None else min(remaining, IO_RETRY_WINDOW))
+
+
 class SupaBasePosgresMiddleware:
     
     def __init__(self):
@@ -137,14 +165,17 @@ class LlamaIndexMiddleware:
         logging.info(f"Using PostgreSQL connection string: {postgres_connection_string}")
         logging.info(f"Collection name: {self.collection_name}")
         
-        vector_store = SupabaseVectorStore(
-            postgres_connection_string=(
-                postgres_connection_string
-            ),
-            collection_name=self.collection_name,
-        )
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, storage_context=storage_context)
+        def connect():
+            vector_store = SupabaseVectorStore(
+                postgres_connection_string=(
+                    postgres_connection_string
+                ),
+                collection_name=self.collection_name,
+            )
+            storage_context = StorageContext.from_defaults(vector_store=vector_store)
+            return VectorStoreIndex.from_vector_store(vector_store=vector_store, storage_context=storage_context)
+        
+        index = io_resilience.call(VECTOR_STORE_SERVICE, connect, deadline=io_deadline())
         logging.info("Index retrieved successfully from database.")
         return index
     
@@ -230,37 +261,56 @@ class LlamaIndexMiddleware:
 
         queryEngine = index.as_query_engine(filters=metadataFilters)
         #queryEngine = index.as_query_engine()
-        response = queryEngine.query(query)
+        response = io_resilience.call(VECTOR_STORE_SERVICE, queryEngine.query, query, deadline=io_deadline())
         return response
 
-    def query_index(self, index, query: str):
+    def query_index(self, index, query: str, stream: bool = False):
         """
         Query the index with a given query.
+        When stream is True, returns an iterator of text deltas from a streaming query engine.
         """
         logging.info(f"Querying index with query: {query}")
+        if stream:
+            queryEngine = index.as_query_engine(streaming=True)
+            response = io_resilience.call(VECTOR_STORE_SERVICE, queryEngine.query, query, deadline=io_deadline())
+            return response.response_gen
         queryEngine = index.as_query_engine()
-        response = queryEngine.query(query)
+        response = io_resilience.call(VECTOR_STORE_SERVICE, queryEngine.query, query, deadline=io_deadline())
         logging.info(f"Query response: {response}")
         return response
     
     
-    def llm_query(self, query: str):
+    def llm_query(self, query: str, stream: bool = False):
         """
         Query the LLM with a given query.
+        When stream is True, returns an iterator of text deltas (llm.stream_complete).
         """
         logging.info(f"LLM query initiated with query: {query}")
+        if stream:
+            return self.llm_stream(query)
         response = llm.complete(prompt=query)
         logging.info(f"LLM query response: {response}")
         return response.text if hasattr(response, "text") else str(response)
     
-    def agent_query(self, query: str):
+    def llm_stream(self, query: str):
+        """
+        Stream the LLM completion for a given query, yielding text deltas.
+        """
+        logging.info(f"LLM stream initiated with query: {query}")
+        for response in llm.stream_complete(prompt=query):
+            delta = getattr(response, "delta", None)
+            if delta:
+                yield delta
+    
+    def agent_query(self, query: str, stream: bool = False):
         """
         Query the documents with a given query.
+        When stream is True, returns an iterator of text deltas.
         """
         #logging.info(f"Agent query initiated with query: {query}")
         #documents = self.load_documents(self.directory)
         index = self.get_index_from_db()
-        response = self.query_index(index, query)
+        response = self.query_index(index, query, stream=stream)
         
         #logging.info(f"Agent query response: {response}")
         return response
@@ -296,42 +346,33 @@ class LlamaIndexMiddleware:
     def download_document(self, document: str):
         """
         Download a document directly from the given URL and save it to the specified directory.
-        Retries up to 5 times in case of HTTP errors.
+        Retries with exponential backoff in case of HTTP errors, within the time given by
+        io_deadline(); fails fast while the storage circuit breaker is open.
         """
     
         supabase = SupabaseMiddleware().get_client()
         bucketName = "project-documents"
-        attempts = 0
-        max_attempts = 5
         
         supabase_storage, basename = self.get_path_supabase_storage( document, bucketName, document )
         
         docuemnt_to_download = document.split("project-documents/")[-1]
         logging.info(f"Downloading document: {document}")
         logging.info(f"Document to download: {docuemnt_to_download}")
-        while attempts < max_attempts:
-            
-            logging.info(f"Attempting to download document (attempt {attempts + 1}/{max_attempts})")
-            
-            try:
-                response = (
-                    supabase.storage
-                    .from_(bucketName)
-                    .download(docuemnt_to_download)
-                )
-                with open(self.directory + f"/{basename}", "wb+") as f:
-                    f.write(response)
-                logging.info("Document downloaded successfully.")
-                return self.directory + f"/{basename}"
-            except Exception as e:
-                attempts += 1
-                logging.error(f"Error downloading document (attempt {attempts}/{max_attempts}): {e}")
-                if attempts < max_attempts:
-                    logging.info("Retrying in 1 second...")
-                    time.sleep(1)
-
-        logging.error(f"Failed to download document after {max_attempts} attempts. Returning the original URL.")
-        return document
+        try:
+            response = io_resilience.call(
+                STORAGE_SERVICE,
+                supabase.storage.from_(bucketName).download,
+                docuemnt_to_download,
+                deadline=io_deadline(),
+            )
+        except Exception as e:
+            logging.error(f"Failed to download document: {e}. Returning the original URL.")
+            return document
+        
+        with open(self.directory + f"/{basename}", "wb+") as f:
+            f.write(response)
+        logging.info("Document downloaded successfully.")
+        return self.directory + f"/{basename}"
             
     def downlaod_docs( self, documents: list ):
         """
@@ -345,13 +386,13 @@ class LlamaIndexMiddleware:
         for document in documents:
             logging.info(f"Downloading document: {document}")
             basename = os.path.basename(document)
+            response = io_resilience.call(
+                STORAGE_SERVICE,
+                supabase.storage.from_(bucketName).download,
+                document,
+                deadline=io_deadline(),
+            )
             with open( self.directory + f"/{basename}" , "wb+") as f:
-                response = (
-                    supabase.storage
-                    .from_(bucketName)
-                    .download(document)
-                )
-        
                 f.write(response)
         logging.info("Documents downloaded successfully.")
         
@@ -385,11 +426,14 @@ class LlamaIndexMiddleware:
         supabase_storage, basename = self.get_path_supabase_storage(md_file, bucketName)
         
         with open(md_file, "rb") as f:
-            response = (
-                supabase.storage
-                .from_(bucketName)
-                .upload(f"{supabase_storage}/{basename}", f)
-            )
+            content = f.read()
+        response = io_resilience.call(
+            STORAGE_SERVICE,
+            supabase.storage.from_(bucketName).upload,
+            f"{supabase_storage}/{basename}",
+            content,
+            deadline=io_deadline(),
+        )
         
         logging.info(f"Markdown file {basename} saved to Supabase storage.")
         
@@ -49,7 +49,8 @@ class LlamaIndexQuery(GenerativeHandler):
         # Procesar el prompt asociado a la variable
         print("Cargando LlamaIndex Middleware para la consulta...")
         if hasattr(var, 'prompt') and var.prompt:
-            return llamaindex_middleware.llm_query(var.prompt)
+            # Con "stream" en la configuración se retornan los deltas del LLM según se generan
+            return llamaindex_middleware.llm_query(var.prompt, stream=self.config.get("stream", False))
         return "Prompt no proporcionado"
 
 class LlamaIndexGenerativeHandler(KMCPlugin):
@@ -69,7 +70,10 @@ class LlamaIndexGenerativeHandler(KMCPlugin):
     def register_handlers(self):
         """Registra los handlers proporcionados por este plugin."""
        
-        toolLlamaindex = LlamaIndexQuery()
+        # Límites de la cuota del despliegue de Azure OpenAI (llamadas por segundo y en vuelo)
+        config = {key: self.config[key] for key in ("stream", "rate_limit", "rate_burst", "max_in_flight")
+                  if key in self.config}
+        toolLlamaindex = LlamaIndexQuery(config)
         registry.register_generative_handler("tool:llamaindex", toolLlamaindex )
         return 1
 
@@ -2,12 +2,22 @@
 Base Handlers - Clases base para los handlers de variables KMC
 """
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional, Callable, ClassVar, Type
+from typing import Any, Dict, List, Optional, Callable, ClassVar, Type
 from enum import Enum
+import asyncio
+import contextvars
 
 from ..models import ContextualVariable, MetadataVariable, GenerativeVariable
 
 
+async def _run_in_executor(func: Callable[[Any], Any], arg: Any) -> Any:
+    """
+    Ejecuta un método síncrono en el executor por defecto del bucle con una copia del
+    contexto actual, para que vea el nodo en curso y el límite de tiempo del render.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, func, arg)
+
+
 class HandlerType(Enum):
     """Enumeración de los tipos de handlers disponibles"""
     CONTEXT = "context"
@@ -55,6 +65,21 @@ class BaseHandler(ABC):
             Valor procesado por el handler
         """
         return self.handle(var_name)
+    
+    async def ahandle(self, var_name: str) -> Any:
+        """
+        Versión asíncrona de `handle`.
+        
+        Por defecto ejecuta `handle` en el executor del bucle de eventos; las
+        subclases pueden sobrescribir sus hooks asíncronos para evitar el hilo.
+        
+        Args:
+            var_name: Nombre de la variable o la variable completa
+            
+        Returns:
+            Valor procesado por el handler
+        """
+        return await _run_in_executor(self.handle, var_name)
 
 
 class ContextHandler(BaseHandler):
@@ -82,6 +107,55 @@ class ContextHandler(BaseHandler):
         
         return self._get_context_value(var_name)
     
+    async def ahandle(self, var_name: str) -> Any:
+        """
+        Procesa una variable de contexto de forma asíncrona.
+        
+        Args:
+            var_name: Nombre de la variable de contexto
+            
+        Returns:
+            Valor de la variable contextual
+        """
+        if isinstance(var_name, ContextualVariable):
+            var_name = var_name.name
+        
+        return await self._aget_context_value(var_name)
+    
+    def handle_many(self, names: List[str]) -> Dict[str, Any]:
+        """
+        Procesa varias variables de contexto con una sola llamada.
+        
+        Por defecto llama a `handle` para cada nombre. Los handlers respaldados por una
+        base de datos o un servicio deben sobrescribirlo para obtener todos los valores
+        con una única consulta.
+        
+        Args:
+            names: Nombres de las variables de contexto
+            
+        Returns:
+            Diccionario nombre -> valor
+        """
+        return {name: self.handle(name) for name in names}
+    
+    async def ahandle_many(self, names: List[str]) -> Dict[str, Any]:
+        """
+        Versión asíncrona de `handle_many`.
+        
+        Si la subclase sobrescribe `handle_many` se ejecuta en el executor del bucle de
+        eventos; si no, las variables se resuelven de forma concurrente con `ahandle`.
+        
+        Args:
+            names: Nombres de las variables de contexto
+            
+        Returns:
+            Diccionario nombre -> valor
+        """
+        if type(self).handle_many is not ContextHandler.handle_many:
+            return await _run_in_executor(self.handle_many, names)
+        values = await asyncio.gather(*(self.ahandle(name) for name in names))
+        return dict(zip(names, values))
+    
     @abstractmethod
     def _get_context_value(self, var_name: str) -> Any:
         """
@@ -94,6 +168,20 @@ class ContextHandler(BaseHandler):
             Valor de la variable contextual
         """
         pass
+    
+    async def _aget_context_value(self, var_name: str) -> Any:
+        """
+        Hook asíncrono opcional para obtener el valor de una variable contextual.
+        
+        Por defecto ejecuta `_get_context_value` en el executor del bucle de eventos.
+        
+        Args:
+            var_name: Nombre de la variable contextual
+            
+        Returns:
+            Valor de la variable contextual
+        """
+        return await _run_in_executor(self._get_context_value, var_name)
 
 
 class MetadataHandler(BaseHandler):
@@ -121,6 +209,55 @@ class MetadataHandler(BaseHandler):
         
         return self._get_metadata_value(var_name)
     
+    async def ahandle(self, var_name: str) -> Any:
+        """
+        Procesa una variable de metadata de forma asíncrona.
+        
+        Args:
+            var_name: Nombre de la variable de metadata
+            
+        Returns:
+            Valor de la variable de metadata
+        """
+        if isinstance(var_name, MetadataVariable):
+            var_name = var_name.name
+        
+        return await self._aget_metadata_value(var_name)
+    
+    def handle_many(self, names: List[str]) -> Dict[str, Any]:
+        """
+        Procesa varias variables de metadata con una sola llamada.
+        
+        Por defecto llama a `handle` para cada nombre. Los handlers respaldados por una
+        base de datos o un servicio deben sobrescribirlo para obtener todos los valores
+        con una única consulta.
+        
+        Args:
+            names: Nombres de las variables de metadata
+            
+        Returns:
+            Diccionario nombre -> valor
+        """
+        return {name: self.handle(name) for name in names}
+    
+    async def ahandle_many(self, names: List[str]) -> Dict[str, Any]:
+        """
+        Versión asíncrona de `handle_many`.
+        
+        Si la subclase sobrescribe `handle_many` se ejecuta en el executor del bucle de
+        eventos; si no, las variables se resuelven de forma concurrente con `ahandle`.
+        
+        Args:
+            names: Nombres de las variables de metadata
+            
+        Returns:
+            Diccionario nombre -> valor
+        """
+        if type(self).handle_many is not MetadataHandler.handle_many:
+            return await _run_in_executor(self.handle_many, names)
+        values = await asyncio.gather(*(self.ahandle(name) for name in names))
+        return dict(zip(names, values))
+    
     @abstractmethod
     def _get_metadata_value(self, var_name: str) -> Any:
         """
@@ -133,6 +270,20 @@ class MetadataHandler(BaseHandler):
             Valor de la variable de metadata
         """
         pass
+    
+    async def _aget_metadata_value(self, var_name: str) -> Any:
+        """
+        Hook asíncrono opcional para obtener el valor de una variable de metadata.
+        
+        Por defecto ejecuta `_get_metadata_value` en el executor del bucle de eventos.
+        
+        Args:
+            var_name: Nombre de la variable de metadata
+            
+        Returns:
+            Valor de la variable de metadata
+        """
+        return await _run_in_executor(self._get_metadata_value, var_name)
 
 
 class GenerativeHandler(BaseHandler):
@@ -157,18 +308,95 @@ class GenerativeHandler(BaseHandler):
         """
         return self._generate_content(var)
     
+    async def ahandle(self, var: GenerativeVariable) -> Any:
+        """
+        Procesa una variable generativa de forma asíncrona.
+        
+        Args:
+            var: Variable generativa a procesar
+            
+        Returns:
+            Contenido generado
+        """
+        return await self._agenerate_content(var)
+    
+    def generate_batch(self, vars: List[GenerativeVariable]) -> List[Any]:
+        """
+        Genera el contenido de varias variables con una sola llamada al backend.
+        
+        Por defecto llama a `handle` para cada variable. Los handlers cuyo backend
+        admite peticiones agrupadas (varias cotizaciones en una consulta, varios
+        prompts en una misma completion) deben sobrescribirlo; el render agrupa
+        entonces las variables pendientes de cada handler_key en lotes.
+        
+        Args:
+            vars: Variables generativas con el prompt ya resuelto
+            
+        Returns:
+            Lista de contenidos en el mismo orden que `vars`. Un elemento puede ser una
+            excepción para indicar que solo esa variable falló.
+        """
+        return [self.handle(var) for var in vars]
+    
+    async def agenerate_batch(self, vars: List[GenerativeVariable]) -> List[Any]:
+        """
+        Versión asíncrona de `generate_batch`.
+        
+        Si la subclase sobrescribe `generate_batch` se ejecuta en el executor del bucle
+        de eventos; si no, las variables se generan de forma concurrente con `ahandle`.
+        
+        Args:
+            vars: Variables generativas con el prompt ya resuelto
+            
+        Returns:
+            Lista de contenidos en el mismo orden que `vars`
+        """
+        if type(self).generate_batch is not GenerativeHandler.generate_batch:
+            return await _run_in_executor(self.generate_batch, vars)
+        return list(await asyncio.gather(*(self.ahandle(var) for var in vars)))
+    
+    def supports_batch(self) -> bool:
+        """
+        Indica si el handler genera varias variables de forma más eficiente en lote.
+        
+        Returns:
+            True si la subclase implementa `generate_batch` o `agenerate_batch`
+        """
+        cls = type(self)
+        return (cls.generate_batch is not GenerativeHandler.generate_batch
+                or cls.agenerate_batch is not GenerativeHandler.agenerate_batch)
+    
     @abstractmethod
     def _generate_content(self, var: GenerativeVariable) -> Any:
         """
         Método abstracto para generar contenido dinámico.
         
+        Los handlers de modelos que admiten streaming pueden retornar un iterador
+        (o iterador asíncrono) de deltas de texto en lugar del texto completo; el
+        render los reenvía según se generan.
+        
         Args:
             var: Variable generativa con información de prompt, formato, etc.
             
         Returns:
-            Contenido generado
+            Contenido generado, o un iterador de deltas de texto
         """
         pass
+    
+    async def _agenerate_content(self, var: GenerativeVariable) -> Any:
+        """
+        Hook asíncrono opcional para generar contenido dinámico.
+        
+        Por defecto ejecuta `_generate_content` en el executor del bucle de eventos.
+        Los handlers con un cliente asíncrono nativo deben sobrescribirlo.
+        
+        Args:
+            var: Variable generativa con información de prompt, formato, etc.
+            
+        Returns:
+            Contenido generado
+        """
+        return await _run_in_executor(self._generate_content, var)
 
 
 # Decoradores para facilitar el registro de handlers
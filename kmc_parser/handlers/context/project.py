@@ -1,10 +1,12 @@
 """
 Project Handler - Handler para variables contextuales de proyecto [[project:nombre]]
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Hashable, Iterable, List, Optional, Tuple
 import os
 import json
+import logging
 
+from ...core.cache import data_cache, file_signature
 from ...handlers.base import ContextHandler, context_handler
 
 
@@ -20,37 +22,86 @@ class ProjectHandler(ContextHandler):
         """
         Inicializa el handler de proyecto.
         
+        Los datos no se cargan aquí: se obtienen bajo demanda de la cache de datos
+        compartida, que solo vuelve a leer el archivo JSON si cambia.
+        
         Args:
             config: Configuración del handler, puede incluir:
                 - project_id: ID del proyecto
                 - project_data: Datos del proyecto (dict)
                 - project_path: Ruta al archivo JSON con datos del proyecto
+                - data_cache: Cache de datos (DataCache) a usar en lugar de la global
         """
         super().__init__(config)
-        self.project_data = {}
-        self._load_project_data()
+        self.logger = logging.getLogger("kmc.handlers.project")
+        self.data_cache = self.config["data_cache"] if self.config.get("data_cache") is not None else data_cache
+    
+    @property
+    def project_data(self) -> Dict[str, Any]:
+        """Datos del proyecto, obtenidos de la cache de datos compartida"""
+        return self._load_project_data()
     
-    def _load_project_data(self):
+    def _load_project_data(self) -> Dict[str, Any]:
         """Carga datos del proyecto desde la configuración o archivo"""
         # Prioridad 1: Datos directos en configuración
         if "project_data" in self.config:
-            self.project_data = self.config["project_data"]
-            return
+            return self.config["project_data"]
+        
+        source, loader, validator = self._data_source()
+        return self.data_cache.load(source, loader, validator)
+    
+    def _data_source(self) -> Tuple[Hashable, Callable[[], Dict[str, Any]], Optional[Callable[[], Hashable]]]:
+        """
+        Identifica la fuente de los datos del proyecto en la cache de datos.
+        
+        Returns:
+            Tupla (clave de la fuente, función de carga, función de validación)
+        """
+        project_id = self.config.get("project_id", "default")
         
         # Prioridad 2: Cargar desde archivo JSON si se proporciona una ruta
         if "project_path" in self.config:
             path = self.config["project_path"]
-            if os.path.exists(path):
-                try:
-                    with open(path, 'r', encoding='utf-8') as f:
-                        self.project_data = json.load(f)
-                    return
-                except Exception as e:
-                    self.logger.error(f"Error al cargar datos de proyecto desde {path}: {str(e)}")
+            return (
+                ("project", os.path.abspath(path), project_id),
+                lambda: self._read_project_file(path, project_id),
+                lambda: file_signature(path)
+            )
         
         # Prioridad 3: Cargar datos simulados si hay un project_id o usar valores por defecto
-        project_id = self.config.get("project_id", "default")
-        self.project_data = self._get_mock_data(project_id)
+        return ("project", project_id), lambda: self._get_mock_data(project_id), None
+    
+    def _read_project_file(self, path: str, project_id: str) -> Dict[str, Any]:
+        """Lee el archivo JSON del proyecto, o los datos simulados si no se puede leer"""
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.error(f"Error al cargar datos de proyecto desde {path}: {str(e)}")
+        return self._get_mock_data(project_id)
+    
+    def handle_many(self, names: List[str]) -> Dict[str, Any]:
+        """Resuelve varias variables con una sola carga de los datos (ver `get_many`)"""
+        return self.get_many(names)
+    
+    def get_many(self, names: Iterable[str]) -> Dict[str, Any]:
+        """
+        Obtiene varias variables de proyecto con una sola carga de los datos.
+        
+        Args:
+            names: Nombres de las variables de proyecto
+            
+        Returns:
+            Diccionario nombre -> valor (o placeholder si no existe)
+        """
+        if "project_data" in self.config:
+            data = self.config["project_data"]
+            return {name: data.get(name, f"<project:{name}>") for name in names}
+        
+        source, loader, validator = self._data_source()
+        return self.data_cache.get_many(source, names, loader, validator,
+                                        default=lambda name: f"<project:{name}>")
     
     def _get_mock_data(self, project_id: str) -> Dict[str, Any]:
         """
@@ -1,7 +1,7 @@
 """
 GPT-4 Handler - Handler para variables generativas de tipo {{ai:gpt4:nombre}}
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional, Union
 import logging
 import re
 
@@ -29,6 +29,8 @@ class GPT4Handler(GenerativeHandler):
                 - max_tokens: Límite de tokens en la respuesta
                 - temperature: Temperatura para generación (0-1)
                 - client: Cliente personalizado de OpenAI ya configurado
+                - stream: Si es True, retorna un iterador de deltas en lugar del texto completo
+                - stream_chunk_size: Palabras por delta en el modo simulación (por defecto, 4)
         """
         super().__init__(config)
         self.logger = logging.getLogger("kmc.handlers.gpt4")
@@ -37,6 +39,8 @@ class GPT4Handler(GenerativeHandler):
         self.temperature = self.config.get("temperature", 0.7)
         self.api_key = self.config.get("api_key")
         self.client = self.config.get("client")
+        self.stream = self.config.get("stream", False)
+        self.stream_chunk_size = self.config.get("stream_chunk_size", 4)
         
         # En un entorno de producción, aquí se inicializaría el cliente de OpenAI
         # Si no se proporciona un cliente personalizado
@@ -50,7 +54,7 @@ class GPT4Handler(GenerativeHandler):
                 self.logger.warning("Módulo OpenAI no disponible. Se usará un generador de respuestas simulado.")
                 self.client = None
         
-    def _generate_content(self, var: GenerativeVariable) -> str:
+    def _generate_content(self, var: GenerativeVariable) -> Union[str, Iterator[str]]:
         """
         Genera contenido dinámico utilizando GPT-4 o simulación.
         
@@ -58,8 +62,11 @@ class GPT4Handler(GenerativeHandler):
             var: Variable generativa con información de prompt, formato, etc.
             
         Returns:
-            Contenido generado
+            Contenido generado, o un iterador de deltas si `stream` está activado
         """
+        if self.stream:
+            return self._stream_content(var)
+        
         # Procesamiento del prompt
         prompt = var.prompt or f"Genera contenido para {var.name}"
         format_type = var.format or "text"
@@ -85,6 +92,114 @@ class GPT4Handler(GenerativeHandler):
             # Modo simulación para desarrollo y testing
             return self._simulate_response(prompt, var.name, format_type)
     
+    def generate_batch(self, vars: List[GenerativeVariable]) -> List[str]:
+        """
+        Genera el contenido de varias variables con una sola completion.
+        
+        Los prompts se numeran en un mismo mensaje y la respuesta se pide como JSON
+        estructurado con un resultado por prompt.
+        
+        Args:
+            vars: Variables generativas con el prompt ya resuelto
+            
+        Returns:
+            Contenido generado de cada variable, en el mismo orden que `vars`
+        """
+        requests = [
+            (var.prompt or f"Genera contenido para {var.name}", var.name, var.format or "text")
+            for var in vars
+        ]
+        
+        if self.client:
+            try:
+                # En producción, aquí se llamaría a la API de OpenAI con salida estructurada
+                # tasks = [{"id": index, "format": format_type, "prompt": prompt}
+                #          for index, (prompt, _, format_type) in enumerate(requests)]
+                # response = self.client.chat.completions.create(
+                #     model=self.model,
+                #     messages=[
+                #         {"role": "system", "content": "Responde cada tarea por separado. "
+                #          "Retorna {\"results\": [{\"id\": n, \"content\": \"...\"}]}."},
+                #         {"role": "user", "content": json.dumps(tasks, ensure_ascii=False)},
+                #     ],
+                #     max_tokens=self.max_tokens * len(requests),
+                #     temperature=self.temperature,
+                #     response_format={"type": "json_object"},
+                # )
+                # results = json.loads(response.choices[0].message.content)["results"]
+                # contents = {item["id"]: item["content"] for item in results}
+                # return [contents.get(index, ValueError(f"Sin respuesta para {name}"))
+                #         for index, (_, name, _) in enumerate(requests)]
+                
+                # Simulación para desarrollo
+                return [self._simulate_response(*request) for request in requests]
+            except Exception as e:
+                self.logger.error(f"Error al generar contenido con GPT-4: {str(e)}")
+                return [f"<Error en GPT-4: {str(e)}>"] * len(requests)
+        
+        # Modo simulación para desarrollo y testing
+        return [self._simulate_response(*request) for request in requests]
+    
+    def supports_batch(self) -> bool:
+        """
+        Indica si el handler genera en lote: en modo streaming cada variable se genera
+        por separado para reenviar sus deltas.
+        """
+        return not self.stream
+    
+    def _stream_content(self, var: GenerativeVariable) -> Iterator[str]:
+        """
+        Genera contenido dinámico como un flujo de deltas de texto.
+        
+        Args:
+            var: Variable generativa con información de prompt, formato, etc.
+            
+        Returns:
+            Iterador de deltas cuya concatenación es el contenido generado
+        """
+        prompt = var.prompt or f"Genera contenido para {var.name}"
+        format_type = var.format or "text"
+        
+        if self.client:
+            try:
+                # En producción, aquí se llamaría a la API de OpenAI en modo streaming
+                # response = self.client.chat.completions.create(
+                #     model=self.model,
+                #     messages=[{"role": "user", "content": prompt}],
+                #     max_tokens=self.max_tokens,
+                #     temperature=self.temperature,
+                #     stream=True,
+                # )
+                # for chunk in response:
+                #     delta = chunk.choices[0].delta.content
+                #     if delta:
+                #         yield delta
+                # return
+                
+                # Simulación para desarrollo
+                yield from self._simulate_stream(prompt, var.name, format_type)
+            except Exception as e:
+                self.logger.error(f"Error al generar contenido con GPT-4: {str(e)}")
+                yield f"<Error en GPT-4: {str(e)}>"
+        else:
+            yield from self._simulate_stream(prompt, var.name, format_type)
+    
+    def _simulate_stream(self, prompt: str, var_name: str, format_type: str) -> Iterator[str]:
+        """
+        Emite la respuesta simulada en deltas de unas pocas palabras, como lo haría la API.
+        
+        Args:
+            prompt: Prompt para generación
+            var_name: Nombre de la variable
+            format_type: Formato solicitado
+            
+        Returns:
+            Iterador de deltas de la respuesta simulada
+        """
+        pieces = re.split(r'(?<=\s)(?=\S)', self._simulate_response(prompt, var_name, format_type))
+        for index in range(0, len(pieces), self.stream_chunk_size):
+            yield ''.join(pieces[index:index + self.stream_chunk_size])
+    
     def _simulate_response(self, prompt: str, var_name: str, format_type: str) -> str:
         """
         Genera una respuesta simulada para desarrollo y testing.
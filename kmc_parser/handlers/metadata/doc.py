@@ -1,10 +1,12 @@
 """
 Document Metadata Handler - Handler para variables de metadata de documento [{doc:nombre}]
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Hashable, Iterable, List, Optional, Tuple
 import os
 import json
+import logging
 
+from ...core.cache import data_cache, file_signature
 from ...handlers.base import MetadataHandler, metadata_handler
 
 
@@ -20,37 +22,86 @@ class DocumentMetadataHandler(MetadataHandler):
         """
         Inicializa el handler de metadata de documento.
         
+        La metadata no se carga aquí: se obtiene bajo demanda de la cache de datos
+        compartida, que solo vuelve a leer el archivo JSON si cambia.
+        
         Args:
             config: Configuración del handler, puede incluir:
                 - doc_id: ID del documento
                 - metadata: Datos de metadata directamente (dict)
                 - metadata_path: Ruta al archivo JSON con metadata
+                - data_cache: Cache de datos (DataCache) a usar en lugar de la global
         """
         super().__init__(config)
-        self.metadata = {}
-        self._load_metadata()
+        self.logger = logging.getLogger("kmc.handlers.doc")
+        self.data_cache = self.config["data_cache"] if self.config.get("data_cache") is not None else data_cache
+    
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Metadata del documento, obtenida de la cache de datos compartida"""
+        return self._load_metadata()
     
-    def _load_metadata(self):
+    def _load_metadata(self) -> Dict[str, Any]:
         """Carga metadata del documento desde la configuración o archivo"""
         # Prioridad 1: Datos directos en configuración
         if "metadata" in self.config:
-            self.metadata = self.config["metadata"]
-            return
+            return self.config["metadata"]
+        
+        source, loader, validator = self._data_source()
+        return self.data_cache.load(source, loader, validator)
+    
+    def _data_source(self) -> Tuple[Hashable, Callable[[], Dict[str, Any]], Optional[Callable[[], Hashable]]]:
+        """
+        Identifica la fuente de la metadata en la cache de datos.
+        
+        Returns:
+            Tupla (clave de la fuente, función de carga, función de validación)
+        """
+        doc_id = self.config.get("doc_id", "default")
         
         # Prioridad 2: Cargar desde archivo JSON si se proporciona una ruta
         if "metadata_path" in self.config:
             path = self.config["metadata_path"]
-            if os.path.exists(path):
-                try:
-                    with open(path, 'r', encoding='utf-8') as f:
-                        self.metadata = json.load(f)
-                    return
-                except Exception as e:
-                    self.logger.error(f"Error al cargar metadata desde {path}: {str(e)}")
+            return (
+                ("doc", os.path.abspath(path), doc_id),
+                lambda: self._read_metadata_file(path, doc_id),
+                lambda: file_signature(path)
+            )
         
         # Prioridad 3: Cargar datos por defecto
-        doc_id = self.config.get("doc_id", "default")
-        self.metadata = self._get_default_metadata(doc_id)
+        return ("doc", doc_id), lambda: self._get_default_metadata(doc_id), None
+    
+    def _read_metadata_file(self, path: str, doc_id: str) -> Dict[str, Any]:
+        """Lee el archivo JSON de metadata, o la metadata por defecto si no se puede leer"""
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.error(f"Error al cargar metadata desde {path}: {str(e)}")
+        return self._get_default_metadata(doc_id)
+    
+    def handle_many(self, names: List[str]) -> Dict[str, Any]:
+        """Resuelve varias variables con una sola carga de los datos (ver `get_many`)"""
+        return self.get_many(names)
+    
+    def get_many(self, names: Iterable[str]) -> Dict[str, Any]:
+        """
+        Obtiene varias variables de metadata con una sola carga de los datos.
+        
+        Args:
+            names: Nombres de las variables de metadata
+            
+        Returns:
+            Diccionario nombre -> valor (o placeholder si no existe)
+        """
+        if "metadata" in self.config:
+            data = self.config["metadata"]
+            return {name: data.get(name, f"<doc:{name}>") for name in names}
+        
+        source, loader, validator = self._data_source()
+        return self.data_cache.get_many(source, names, loader, validator,
+                                        default=lambda name: f"<doc:{name}>")
     
     def _get_default_metadata(self, doc_id: str) -> Dict[str, Any]:
         """
@@ -0,0 +1,327 @@
+"""
+Re-análisis incremental de documentos KMC para sesiones de edición
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .lexer import Token, TokenKind, COMMENT_KINDS, VARIABLE_KINDS, iter_tokens, tokenize
+from .models import (
+    ContextualVariable,
+    MetadataVariable,
+    GenerativeVariable,
+    KMCDocument,
+    KMCVariableDefinition,
+    DocumentChanges
+)
+
+# Número máximo de comillas que contiene un comentario KMC inline (prompt y FORMAT)
+_INLINE_QUOTES = 4
+
+
+def apply_edit(doc: KMCDocument, offset: int, deleted_len: int, inserted_text: str) -> DocumentChanges:
+    """
+    Aplica una edición a un documento KMC re-tokenizando solo la región dañada.
+
+    La re-tokenización empieza en el token que contiene la edición (o en un `<!--`
+    anterior que aún no estaba cerrado) y se detiene en cuanto el lexer vuelve a
+    emitir un token idéntico a uno existente tras la edición. Los tokens posteriores
+    se conservan desplazando sus posiciones.
+
+    Args:
+        doc: Documento a modificar
+        offset: Posición donde empieza la edición
+        deleted_len: Número de caracteres eliminados a partir de `offset`
+        inserted_text: Texto insertado en `offset`
+
+    Returns:
+        DocumentChanges: Variables añadidas, eliminadas o modificadas por la edición
+    """
+    content = doc.content or ""
+    if offset < 0 or deleted_len < 0 or offset + deleted_len > len(content):
+        raise ValueError(
+            f"Edición fuera de rango: offset={offset}, deleted_len={deleted_len}, "
+            f"longitud={len(content)}"
+        )
+
+    tokens = doc.tokens
+    if content and not tokens:
+        tokens[:] = tokenize(content)
+
+    new_content = content[:offset] + inserted_text + content[offset + deleted_len:]
+    delta = len(inserted_text) - deleted_len
+    old_edit_end = offset + deleted_len
+    new_edit_end = offset + len(inserted_text)
+
+    first = _restart_index(content, tokens, offset)
+    restart = tokens[first].start if first < len(tokens) else len(content)
+
+    # Re-tokenizar hasta volver a sincronizar con los tokens anteriores
+    relexed: List[Token] = []
+    sync = len(tokens)
+    old_index = first
+    while old_index < len(tokens) and tokens[old_index].start < old_edit_end:
+        old_index += 1
+    for token in iter_tokens(new_content, restart):
+        if token.kind is not TokenKind.TEXT and token.start >= new_edit_end:
+            while old_index < len(tokens) and tokens[old_index].start + delta < token.start:
+                old_index += 1
+            if old_index < len(tokens) and _same_token(tokens[old_index], token, delta):
+                sync = old_index
+                break
+        relexed.append(token)
+
+    removed_tokens = tokens[first:sync]
+    # Contar las variables previas a la región desde el extremo más corto del documento
+    if first <= len(tokens) - sync:
+        prefix = _count_variables(tokens[:first])
+    else:
+        suffix = _count_variables(tokens[sync:])
+        old_counts = _count_variables(removed_tokens)
+        prefix = Counter({
+            TokenKind.CONTEXTUAL: len(doc.contextual_vars),
+            TokenKind.METADATA: len(doc.metadata_vars),
+            TokenKind.GENERATIVE: len(doc.generative_vars),
+        })
+        prefix.subtract(suffix)
+        prefix.subtract(old_counts)
+    for token in tokens[sync:]:
+        _shift(token, delta)
+    tokens[first:sync] = relexed
+    doc.content = new_content
+
+    changes = DocumentChanges(relexed=(restart, relexed[-1].end if relexed else restart))
+    comments_touched = _comment_signature(removed_tokens) != _comment_signature(relexed)
+
+    # Sustituir las variables de la región re-tokenizada en las listas del documento
+    old_vars = _count_variables(removed_tokens)
+    new_vars = _build_variables(relexed)
+    removed_names: Counter = Counter()
+    added_names: Counter = Counter()
+    for kind, variables in (
+        (TokenKind.CONTEXTUAL, doc.contextual_vars),
+        (TokenKind.METADATA, doc.metadata_vars),
+        (TokenKind.GENERATIVE, doc.generative_vars),
+    ):
+        start = prefix[kind]
+        end = start + old_vars[kind]
+        removed_names.update(var.fullname for var in variables[start:end])
+        added_names.update(var.fullname for var in new_vars[kind])
+        variables[start:end] = new_vars[kind]
+
+    changes.added = sorted((added_names - removed_names).elements())
+    changes.removed = sorted((removed_names - added_names).elements())
+
+    changed = set()
+    fresh = new_vars[TokenKind.GENERATIVE]
+    if comments_touched:
+        # Los prompts pueden cambiar para cualquier variable del documento
+        targets = (
+            token.target for token in _variable_tokens(tokens)
+            if token.kind is TokenKind.GENERATIVE
+        )
+        changed.update(_update_prompts(doc, zip(doc.generative_vars, targets), fresh))
+    elif fresh:
+        targets = (
+            token.target for token in _variable_tokens(relexed)
+            if token.kind is TokenKind.GENERATIVE
+        )
+        _update_prompts(doc, zip(fresh, targets), fresh)
+    if comments_touched:
+        changed.update(_update_definitions(doc))
+    changes.changed = sorted(changed)
+    return changes
+
+
+def _restart_index(content: str, tokens: Sequence[Token], offset: int) -> int:
+    """
+    Calcula el índice del primer token que debe volver a tokenizarse.
+
+    Un token que termina justo en `offset` también puede verse afectado (por ejemplo
+    un texto `[` seguido de `[x:y]]` insertado), igual que cualquier `<!--` anterior
+    a la edición que no tenía un `-->` completo antes de ella o cuyo KMC inline aún
+    podría alcanzarla. Si el token anterior es texto también se incluye, porque el
+    texto re-tokenizado puede fusionarse con él.
+    """
+    index = _token_at(tokens, offset)
+
+    # Un KMC inline puede extenderse más allá del primer '-->' mientras su prompt
+    # no se cierre con comillas, así que basta con que queden pocas comillas
+    closed = content.rfind('-->', 0, offset)
+    position = offset
+    quotes = 0
+    while True:
+        opening = content.rfind('<!--', 0, position)
+        if opening == -1:
+            break
+        quotes += content.count('"', opening, position)
+        if opening < closed and quotes > _INLINE_QUOTES:
+            break
+        candidate = _token_at(tokens, opening)
+        # Los comentarios ya reconocidos que terminan antes de la edición no cambian
+        if opening >= closed or tokens[candidate].kind is TokenKind.TEXT:
+            index = min(index, candidate)
+        position = opening
+
+    if index > 0 and tokens[index - 1].kind is TokenKind.TEXT:
+        index -= 1
+    return index
+
+
+def _token_at(tokens: Sequence[Token], position: int) -> int:
+    """Búsqueda binaria del primer token cuyo final es mayor o igual que `position`"""
+    low, high = 0, len(tokens)
+    while low < high:
+        middle = (low + high) // 2
+        if tokens[middle].end < position:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _same_token(old: Token, new: Token, delta: int) -> bool:
+    """Indica si un token anterior a la edición coincide con uno nuevo ya desplazado"""
+    return (
+        old.kind is new.kind
+        and old.start + delta == new.start
+        and old.end + delta == new.end
+    )
+
+
+def _shift(token: Token, delta: int) -> None:
+    """Desplaza un token y sus hijos `delta` posiciones"""
+    if not delta:
+        return
+    token.start += delta
+    token.end += delta
+    for child in token.children:
+        child.start += delta
+        child.end += delta
+
+
+def _comment_signature(tokens: Sequence[Token]) -> List[Tuple]:
+    """Contenido de los comentarios KMC de los tokens, sin tener en cuenta sus posiciones"""
+    return [
+        (token.kind, token.target, token.prompt, token.format, token.source)
+        for token in tokens if token.kind in COMMENT_KINDS
+    ]
+
+
+def _variable_tokens(tokens: Sequence[Token]):
+    """Recorre los tokens de variable en orden de documento, incluidos los de comentarios"""
+    for token in tokens:
+        if token.kind is TokenKind.TEXT:
+            continue
+        if token.kind in VARIABLE_KINDS:
+            yield token
+        else:
+            yield from token.children
+
+
+def _count_variables(tokens: Sequence[Token]) -> Counter:
+    """Cuenta las variables de cada tipo que aportan los tokens"""
+    return Counter(token.kind for token in _variable_tokens(tokens))
+
+
+def _build_variables(tokens: Sequence[Token]) -> Dict[TokenKind, list]:
+    """Construye las variables del documento que aportan los tokens"""
+    variables = {kind: [] for kind in VARIABLE_KINDS}
+    for token in _variable_tokens(tokens):
+        if token.kind is TokenKind.CONTEXTUAL:
+            variables[token.kind].append(ContextualVariable(*token.parts))
+        elif token.kind is TokenKind.METADATA:
+            variables[token.kind].append(MetadataVariable(*token.parts))
+        else:
+            variables[token.kind].append(GenerativeVariable.from_target(token.target))
+    return variables
+
+
+def _update_prompts(doc: KMCDocument, variables: Iterable[Tuple[GenerativeVariable, str]],
+                    fresh: List[GenerativeVariable]) -> List[str]:
+    """
+    Recalcula los prompts del documento y los aplica a las variables generativas.
+
+    Sigue las mismas reglas que el análisis completo: el primer KMC inline tiene
+    prioridad sobre el primer AI_PROMPT, y `doc.prompts` conserva el último AI_PROMPT.
+
+    Args:
+        doc: Documento a actualizar
+        variables: Pares (variable, nombre sin llaves) a actualizar
+        fresh: Variables creadas por la edición
+
+    Returns:
+        Nombres completos de las variables ya existentes cuyo prompt o formato cambió
+    """
+    inline_prompts: Dict[str, Token] = {}
+    ai_prompts: Dict[str, str] = {}
+    prompts: Dict[str, str] = {}
+    for token in doc.tokens:
+        if token.kind is TokenKind.AI_PROMPT and token.target:
+            prompts[token.target] = token.prompt
+            ai_prompts.setdefault(token.target, token.prompt)
+        elif token.kind is TokenKind.INLINE:
+            inline_prompts.setdefault(token.target, token)
+
+    if prompts != doc.prompts:
+        doc.prompts.clear()
+        doc.prompts.update(prompts)
+
+    fresh_ids = {id(var) for var in fresh}
+    changed = []
+    for var, target in variables:
+        inline = inline_prompts.get(target)
+        if inline:
+            prompt, format_type = inline.prompt, inline.format
+        else:
+            prompt, format_type = ai_prompts.get(target) or None, None
+
+        if var.prompt == prompt and var.parameters.get('format') == format_type:
+            continue
+        # Las variables recién creadas se reportan como añadidas, no como modificadas
+        if id(var) not in fresh_ids:
+            changed.append(var.fullname)
+        var.prompt = prompt
+        if format_type:
+            var.parameters['format'] = format_type
+        else:
+            var.parameters.pop('format', None)
+    return changed
+
+
+def _update_definitions(doc: KMCDocument) -> List[str]:
+    """
+    Recalcula las definiciones del documento reutilizando las que no cambiaron.
+
+    Returns:
+        Nombres completos de las variables de metadata cuya definición cambió
+    """
+    definitions: Dict[str, KMCVariableDefinition] = {}
+    for token in doc.tokens:
+        if token.kind is not TokenKind.DEFINITION or not (token.source and token.prompt):
+            continue
+        current: Optional[KMCVariableDefinition] = doc.definitions.get(token.target)
+        if _definition_key(current) == (token.source, token.prompt, token.format):
+            definitions[token.target] = current
+        else:
+            definitions[token.target] = KMCVariableDefinition(
+                var_name=token.target.strip(),
+                source_var=token.source,
+                prompt=token.prompt,
+                format_type=token.format
+            )
+
+    changed = [
+        f"[{{{name.strip()}}}]"
+        for name in set(definitions) | set(doc.definitions)
+        if definitions.get(name) is not doc.definitions.get(name)
+    ]
+    doc.definitions.clear()
+    doc.definitions.update(definitions)
+    return changed
+
+
+def _definition_key(definition: Optional[KMCVariableDefinition]) -> Optional[Tuple]:
+    """Clave que identifica el contenido de una definición"""
+    if definition is None:
+        return None
+    return (definition.source_var, definition.prompt, definition.format_type)
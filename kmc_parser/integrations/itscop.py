@@ -3,7 +3,7 @@ Integración específica de KMC con la infraestructura de Kimfe/itscop
 """
 import os
 import sys
-from typing import Dict, Any, Callable, Optional, List, Union
+from typing import Dict, Any, Callable, Optional, List, Tuple, Union
 
 # Añadir directorio principal para importación de módulos itscop
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
@@ -14,6 +14,9 @@ from src.utils.documentBuilder import DocumentBuilder
 from src.models.models import ChainFactory, ChainConfig
 
 from src.kmc.kmc_parser.parser import KMCParser
+from src.kmc.kmc_parser.core.cache import data_cache
+from src.kmc.kmc_parser.core.routing import RoutingPolicy
+from src.kmc.kmc_parser.handlers.base import ContextHandler
 
 
 class ITSCOPIntegration:
@@ -31,6 +34,7 @@ class ITSCOPIntegration:
         user_id: Optional[str] = None,
         org_id: Optional[str] = None,
         kb_ids: Optional[List[str]] = None,
+        routing_policies: Optional[Dict[str, RoutingPolicy]] = None,
     ):
         """
         Inicializa la integración con itscop.
@@ -40,11 +44,15 @@ class ITSCOPIntegration:
             user_id: ID del usuario (opcional) 
             org_id: ID de la organización (opcional)
             kb_ids: Lista de IDs de bases de conocimiento para indexar (opcional)
+            routing_policies: Políticas de enrutado entre los motores registrados sobre
+                el índice, por handler_key (ej. {"ai:gpt4": HedgePolicy(["ai:gpt4", "ai:qa"])}
+                lanza "ai:qa" en paralelo cuando "ai:gpt4" tarda más que su p95) (opcional)
         """
         self.project_id = project_id
         self.user_id = user_id
         self.org_id = org_id
         self.kb_ids = kb_ids or []
+        self.routing_policies = routing_policies or {}
         
         # Inicializa componentes de itscop
         self.index = None
@@ -83,38 +91,59 @@ class ITSCOPIntegration:
             self.parser.register_generative_handler("ai:gpt4", qa_handler)
             self.parser.register_generative_handler("ai:summary", summary_handler)
             self.parser.register_generative_handler("ai:qa", qa_handler)
+            
+            # Enruta los motores entre sí (cobertura de latencia de cola, fallback...)
+            for handler_key, policy in self.routing_policies.items():
+                self.parser.set_routing_policy(handler_key, policy)
+    
+    def routing_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Victorias, errores e histogramas de latencia por motor de cada handler_key enrutado"""
+        return self.parser.routing_stats()
     
     def load_context_data(self):
         """
         Carga datos contextuales (proyecto, usuario, org) y configura los handlers correspondientes
+        
+        Los datos se obtienen de la cache de datos compartida, indexada por el ID de cada
+        entidad, de modo que solo se cargan la primera vez que se consultan y no en cada
+        petición. `invalidate_context_data` los descarta cuando cambian en origen.
         """
         # En una implementación real, esto cargaría datos de la base de datos
         if self.project_id:
             # Ejemplo: Carga datos del proyecto desde BD
-            project_data = self._mock_project_data(self.project_id)
-            
-            def project_handler(var_name):
-                return project_data.get(var_name, f"[[project:{var_name} - No encontrado]]")
-            
-            self.parser.register_context_handler("project", project_handler)
+            self.parser.register_context_handler("project", self._cached_context_handler(
+                "project", self.project_id, self._mock_project_data))
         
         if self.org_id:
             # Ejemplo: Carga datos de organización desde BD
-            org_data = self._mock_org_data(self.org_id)
-            
-            def org_handler(var_name):
-                return org_data.get(var_name, f"[[org:{var_name} - No encontrado]]")
-            
-            self.parser.register_context_handler("org", org_handler)
+            self.parser.register_context_handler("org", self._cached_context_handler(
+                "org", self.org_id, self._mock_org_data))
             
         if self.user_id:
             # Ejemplo: Carga datos de usuario desde BD
-            user_data = self._mock_user_data(self.user_id)
-            
-            def user_handler(var_name):
-                return user_data.get(var_name, f"[[user:{var_name} - No encontrado]]")
+            self.parser.register_context_handler("user", self._cached_context_handler(
+                "user", self.user_id, self._mock_user_data))
+    
+    def invalidate_context_data(self):
+        """Descarta de la cache los datos contextuales de las entidades de esta integración"""
+        for var_type, entity_id in (("project", self.project_id), ("org", self.org_id), ("user", self.user_id)):
+            if entity_id:
+                data_cache.invalidate(("itscop", var_type, entity_id))
+    
+    def _cached_context_handler(self, var_type: str, entity_id: str,
+                                loader: Callable[[str], Dict[str, Any]]) -> "EntityContextHandler":
+        """
+        Crea un handler contextual que obtiene los datos de la entidad de la cache de datos.
+        
+        Args:
+            var_type: Tipo de variable contextual (ej. "project")
+            entity_id: ID de la entidad
+            loader: Función que carga los datos de la entidad a partir de su ID
             
-            self.parser.register_context_handler("user", user_handler)
+        Returns:
+            Handler contextual
+        """
+        return EntityContextHandler(var_type, ("itscop", var_type, entity_id), lambda: loader(entity_id))
     
     def register_document_metadata(self, metadata: Dict[str, Any]):
         """
@@ -172,4 +201,41 @@ class ITSCOPIntegration:
             "nombre_completo": "Usuario Demo",
             "email": "demo@kimfe.com",
             "rol": "Desarrollador"
-        }
\ No newline at end of file
+        }
+
+
+class EntityContextHandler(ContextHandler):
+    """
+    Handler contextual de una entidad de itscop (proyecto, organización o usuario).
+    
+    Todas las variables de la entidad se obtienen de una única carga de sus datos
+    en la cache de datos compartida; `handle_many` resuelve todas las variables de
+    un render con una sola consulta.
+    """
+    
+    def __init__(self, var_type: str, source: Tuple[str, ...], loader: Callable[[], Dict[str, Any]]):
+        """
+        Inicializa el handler de la entidad.
+        
+        Args:
+            var_type: Tipo de variable contextual (ej. "project")
+            source: Clave de la entidad en la cache de datos
+            loader: Función que carga los datos de la entidad
+        """
+        super().__init__()
+        self.var_type = var_type
+        self.source = source
+        self.loader = loader
+    
+    def _not_found(self, var_name: str) -> str:
+        """Valor de las variables que la entidad no tiene"""
+        return f"[[{self.var_type}:{var_name} - No encontrado]]"
+    
+    def _get_context_value(self, var_name: str) -> Any:
+        """Obtiene una variable de los datos de la entidad"""
+        data = data_cache.load(self.source, self.loader)
+        return data.get(var_name, self._not_found(var_name))
+    
+    def handle_many(self, names: List[str]) -> Dict[str, Any]:
+        """Obtiene varias variables con una sola consulta de los datos de la entidad"""
+        return data_cache.get_many(self.source, names, self.loader, default=self._not_found)
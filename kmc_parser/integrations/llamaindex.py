@@ -18,7 +18,8 @@ class LlamaIndexHandler:
         index: Optional[VectorStoreIndex] = None,
         query_engine: Optional[Any] = None,
         synthesizer: Optional[Any] = None,
-        context_vars: Dict[str, Any] = None
+        context_vars: Dict[str, Any] = None,
+        streaming: bool = False
     ):
         """
         Inicializa el handler de LlamaIndex.
@@ -28,15 +29,18 @@ class LlamaIndexHandler:
             query_engine: Motor de consultas personalizado (opcional)
             synthesizer: Sintetizador de respuestas personalizado (opcional)
             context_vars: Variables de contexto para usar en todas las consultas
+            streaming: Si es True, retorna un iterador de deltas de texto en lugar de
+                la respuesta completa (el motor de consultas debe admitir streaming)
         """
         self.index = index
         self.query_engine = query_engine
         self.synthesizer = synthesizer
         self.context_vars = context_vars or {}
+        self.streaming = streaming
         
         # Si se proporciona índice pero no query_engine, crear uno predeterminado
         if self.index is not None and self.query_engine is None:
-            self.query_engine = self.index.as_query_engine()
+            self.query_engine = self.index.as_query_engine(streaming=streaming)
     
     def __call__(self, var):
         """
@@ -75,6 +79,10 @@ class LlamaIndexHandler:
         # Realizar la consulta
         response = self.query_engine.query(prompt)
         
+        # Con un motor en modo streaming, reenviar los deltas según se generan
+        if self.streaming and hasattr(response, "response_gen"):
+            return response.response_gen
+        
         # Retornar el texto de la respuesta
         return str(response)
 
@@ -0,0 +1,257 @@
+"""
+Lexer - Tokenizador de una sola pasada para documentos KMC
+"""
+import re
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterator, List, Optional, Tuple
+
+
+class TokenKind(Enum):
+    """Enumeración de los tipos de token que emite el lexer KMC"""
+    TEXT = "text"                # Texto plano entre marcadores
+    CONTEXTUAL = "contextual"    # [[tipo:nombre]]
+    METADATA = "metadata"        # [{tipo:nombre}]
+    GENERATIVE = "generative"    # {{categoria:subtipo:nombre}}
+    DEFINITION = "definition"    # <!-- KMC_DEFINITION FOR [{tipo:nombre}]: ... -->
+    AI_PROMPT = "ai_prompt"      # <!-- AI_PROMPT FOR {{categoria:subtipo:nombre}}: ... -->
+    INLINE = "inline"            # <!-- KMC {{categoria:subtipo:nombre}}:"prompt" FORMAT "fmt" -->
+
+
+# Tipos de token que corresponden a variables KMC
+VARIABLE_KINDS = frozenset({TokenKind.CONTEXTUAL, TokenKind.METADATA, TokenKind.GENERATIVE})
+
+# Tipos de token que corresponden a comentarios KMC (se eliminan al renderizar)
+COMMENT_KINDS = frozenset({TokenKind.DEFINITION, TokenKind.AI_PROMPT, TokenKind.INLINE})
+
+
+@dataclass
+class Token:
+    """
+    Representa un token del documento KMC.
+
+    Los offsets `start` y `end` son posiciones en el string original (end exclusivo).
+    Los comentarios KMC incluyen en su rango el salto de línea que los sigue, de modo
+    que el renderizado puede eliminarlos simplemente omitiendo el token.
+    """
+    kind: TokenKind
+    start: int
+    end: int
+    target: Optional[str] = None   # "tipo:nombre" de la variable o variable a la que apunta el comentario
+    prompt: Optional[str] = None   # Prompt asociado (AI_PROMPT, KMC inline o PROMPT de la definición)
+    format: Optional[str] = None   # Formato declarado (FORMAT)
+    source: Optional[str] = None   # GENERATIVE_SOURCE de una definición
+    body: Optional[str] = None     # Texto interno del comentario, desde la palabra clave hasta '-->'
+    children: Tuple['Token', ...] = ()  # Variables referenciadas dentro del comentario
+
+    @property
+    def parts(self) -> List[str]:
+        """Retorna las partes separadas por ':' del nombre de la variable"""
+        return self.target.split(':') if self.target else []
+
+
+_MARKER_PATTERN = re.compile(r'<!--|\[\[|\[\{|\{\{')
+_CONTEXTUAL_PATTERN = re.compile(r'\[\[([\w]+):([\w_]+)\]\]')
+_METADATA_PATTERN = re.compile(r'\[\{([\w]+):([\w_]+)\}\]')
+_GENERATIVE_PATTERN = re.compile(r'\{\{([\w:]+)\}\}')
+_INLINE_PATTERN = re.compile(r'<!-- KMC \{\{([\w:]+)\}\}:"([^"]+)"(?:\s*FORMAT\s+"([^"]+)")?\s*-->')
+_DEFINITION_HEADER_PATTERN = re.compile(r'KMC_DEFINITION FOR \[{(.+?)}\]:\s*\n', re.DOTALL)
+_AI_PROMPT_HEADER_PATTERN = re.compile(r'AI_PROMPT FOR \{\{(.+?)\}\}:\s*\n', re.DOTALL)
+_SOURCE_PATTERN = re.compile(r'GENERATIVE_SOURCE\s*=\s*{{(.+?)}}')
+_PROMPT_PATTERN = re.compile(r'PROMPT\s*=\s*"(.+?)"')
+_FORMAT_PATTERN = re.compile(r'FORMAT\s*=\s*"(.+?)"')
+
+
+def has_markers(content: str, start: int = 0, end: Optional[int] = None) -> bool:
+    """
+    Indica si el contenido contiene algún marcador KMC.
+
+    Args:
+        content: Contenido a inspeccionar
+        start: Posición inicial
+        end: Posición final (exclusiva)
+
+    Returns:
+        True si hay al menos un posible marcador KMC
+    """
+    end = len(content) if end is None else end
+    return _MARKER_PATTERN.search(content, start, end) is not None
+
+
+def tokenize(content: str, start: int = 0, end: Optional[int] = None) -> List[Token]:
+    """
+    Recorre el contenido una sola vez y emite la secuencia de tokens KMC.
+
+    Los tokens cubren el rango [start, end) sin huecos ni solapamientos. Los comentarios
+    KMC se emiten como un único token cuyo atributo `children` contiene las variables
+    referenciadas en su interior.
+
+    Args:
+        content: Contenido markdown completo
+        start: Posición desde la que tokenizar
+        end: Posición hasta la que tokenizar (exclusiva)
+
+    Returns:
+        Lista de tokens en orden de documento
+    """
+    end = len(content) if end is None else end
+    if start >= end:
+        return []
+
+    # Camino rápido: documentos sin ningún marcador son un único bloque de texto
+    if not has_markers(content, start, end):
+        return [Token(TokenKind.TEXT, start, end)]
+
+    return _scan(content, start, end, comments=True)
+
+
+def iter_tokens(content: str, start: int = 0) -> Iterator[Token]:
+    """
+    Emite de forma perezosa los tokens desde `start` hasta el final del contenido.
+
+    Permite re-tokenizar solo una región del documento: quien consume el iterador
+    puede detenerse en cuanto los tokens vuelven a coincidir con los anteriores.
+
+    Args:
+        content: Contenido markdown completo
+        start: Posición desde la que tokenizar (debe ser un límite de token)
+
+    Returns:
+        Iterador de tokens en orden de documento
+    """
+    return _iter_scan(content, start, len(content), comments=True)
+
+
+def _scan(content: str, start: int, end: int, comments: bool) -> List[Token]:
+    """Bucle principal del lexer"""
+    return list(_iter_scan(content, start, end, comments))
+
+
+def _iter_scan(content: str, start: int, end: int, comments: bool) -> Iterator[Token]:
+    """Recorre el contenido emitiendo los tokens según se reconocen"""
+    text_start = start
+    pos = start
+
+    while True:
+        match = _MARKER_PATTERN.search(content, pos, end)
+        if not match:
+            break
+
+        index = match.start()
+        marker = match.group()
+        if marker == '<!--':
+            token = _lex_comment(content, index, end) if comments else None
+        elif marker == '[[':
+            token = _lex_variable(TokenKind.CONTEXTUAL, _CONTEXTUAL_PATTERN, content, index, end)
+        elif marker == '[{':
+            token = _lex_variable(TokenKind.METADATA, _METADATA_PATTERN, content, index, end)
+        else:
+            token = _lex_variable(TokenKind.GENERATIVE, _GENERATIVE_PATTERN, content, index, end)
+
+        if token is None:
+            # No es un marcador válido: seguir buscando desde el siguiente carácter
+            pos = index + 1
+            continue
+
+        if index > text_start:
+            yield Token(TokenKind.TEXT, text_start, index)
+        yield token
+        pos = text_start = token.end
+
+    if text_start < end:
+        yield Token(TokenKind.TEXT, text_start, end)
+
+
+def _lex_variable(kind: TokenKind, pattern, content: str, index: int, end: int) -> Optional[Token]:
+    """Intenta reconocer una variable KMC en la posición indicada"""
+    match = pattern.match(content, index, end)
+    if not match:
+        return None
+
+    if kind is TokenKind.GENERATIVE:
+        target = match.group(1)
+        # Las variables generativas necesitan al menos categoría y nombre
+        if ':' not in target:
+            return None
+    else:
+        target = f"{match.group(1)}:{match.group(2)}"
+
+    return Token(kind, index, match.end(), target=target)
+
+
+def _lex_comment(content: str, index: int, end: int) -> Optional[Token]:
+    """
+    Intenta reconocer un comentario KMC (KMC_DEFINITION, AI_PROMPT o KMC inline).
+
+    Los comentarios HTML que no son KMC no generan token: su contenido se sigue
+    tokenizando como texto normal.
+    """
+    close = content.find('-->', index + 4, end)
+    if close == -1:
+        return None
+
+    keyword_start = index + 4
+    while keyword_start < close and content[keyword_start].isspace():
+        keyword_start += 1
+
+    if content.startswith('KMC_DEFINITION', keyword_start, close):
+        token = _lex_definition(content[keyword_start:close], index, close + 3)
+    elif content.startswith('AI_PROMPT', keyword_start, close):
+        token = _lex_ai_prompt(content[keyword_start:close], index, close + 3)
+    else:
+        match = _INLINE_PATTERN.match(content, index, end)
+        if not match:
+            return None
+        token = Token(
+            TokenKind.INLINE,
+            index,
+            match.end(),
+            target=match.group(1),
+            prompt=match.group(2),
+            format=match.group(3) or None
+        )
+
+    # El salto de línea que sigue al comentario forma parte del token
+    if token.end < end and content[token.end] == '\n':
+        token.end += 1
+
+    token.children = tuple(
+        child for child in _scan(content, token.start, token.end, comments=False)
+        if child.kind is not TokenKind.TEXT
+    )
+    return token
+
+
+def _lex_definition(body: str, start: int, end: int) -> Token:
+    """Construye el token de un bloque KMC_DEFINITION"""
+    token = Token(TokenKind.DEFINITION, start, end, body=body)
+
+    header = _DEFINITION_HEADER_PATTERN.match(body)
+    if not header:
+        return token
+
+    token.target = header.group(1)
+    definition_text = body[header.end():]
+
+    source_match = _SOURCE_PATTERN.search(definition_text)
+    prompt_match = _PROMPT_PATTERN.search(definition_text)
+    format_match = _FORMAT_PATTERN.search(definition_text)
+
+    if source_match and prompt_match:
+        token.source = source_match.group(1).strip()
+        token.prompt = prompt_match.group(1).strip()
+        token.format = format_match.group(1).strip() if format_match else None
+
+    return token
+
+
+def _lex_ai_prompt(body: str, start: int, end: int) -> Token:
+    """Construye el token de un bloque AI_PROMPT"""
+    token = Token(TokenKind.AI_PROMPT, start, end, body=body)
+
+    header = _AI_PROMPT_HEADER_PATTERN.match(body)
+    if header:
+        token.target = header.group(1)
+        token.prompt = body[header.end():].strip()
+
+    return token
@@ -2,10 +2,12 @@
 Modelos de datos para el parser KMC
 """
 from enum import Enum
-from typing import Dict, Any, List, Optional, Union
-from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple, Union
+from dataclasses import dataclass, field
 import re
 
+from .lexer import tokenize, TokenKind
+
 
 class VariableType(Enum):
     """Enumeración de tipos de variables KMC"""
@@ -14,6 +16,14 @@ class VariableType(Enum):
     GENERATIVE = "generative"  # Variables {{categoria:subtipo:nombre}}
 
 
+class VariableStatus(Enum):
+    """Estado final de cada variable generativa o definición en un render"""
+    RESOLVED = "resolved"    # Generada por su handler en este render
+    CACHED = "cached"        # Reutilizada de la cache de valores o de resultados
+    FAILED = "failed"        # El handler falló o no existe: se emitió su placeholder
+    TIMED_OUT = "timed_out"  # Se agotó el límite de tiempo del render: se emitió su placeholder
+
+
 @dataclass
 class ContextualVariable:
     """Representa una variable contextual [[tipo:nombre]]"""
@@ -68,6 +78,37 @@ class GenerativeVariable:
     def handler_key(self) -> str:
         """Retorna la clave para buscar el handler correspondiente"""
         return f"{self.category}:{self.subtype}" if self.subtype else self.category
+    
+    @classmethod
+    def from_target(cls, target: str, prompt: Optional[str] = None,
+                    format_type: Optional[str] = None) -> 'GenerativeVariable':
+        """
+        Crea una variable generativa a partir de su nombre completo sin llaves.
+        
+        Args:
+            target (str): Nombre de la variable (ej: "ai:gpt4:resumen")
+            prompt (str, optional): Prompt asociado
+            format_type (str, optional): Formato declarado
+            
+        Returns:
+            GenerativeVariable: La variable generativa
+        """
+        var_parts = target.split(':')
+        category = var_parts[0]
+        if len(var_parts) == 3:
+            subtype = var_parts[1]
+            name = var_parts[2]
+        else:
+            subtype = None
+            name = var_parts[1]
+        
+        return cls(
+            category=category,
+            subtype=subtype,
+            name=name,
+            prompt=prompt,
+            parameters={'format': format_type} if format_type else None
+        )
 
 
 @dataclass
@@ -79,6 +120,7 @@ class KMCDocument:
     generative_vars: List[GenerativeVariable] = None  # Variables generativas
     prompts: Dict[str, str] = None  # Prompts asociados a variables
     definitions: Dict[str, 'KMCVariableDefinition'] = None  # Definiciones de variables
+    tokens: List[Any] = None  # Secuencia de tokens emitida por el lexer
 
     def __post_init__(self):
         """Inicializa listas vacías para las variables"""
@@ -92,6 +134,8 @@ class KMCDocument:
             self.prompts = {}
         if self.definitions is None:
             self.definitions = {}
+        if self.tokens is None:
+            self.tokens = []
     
     @property
     def all_variables(self) -> Dict[str, List[Union[ContextualVariable, MetadataVariable, GenerativeVariable]]]:
@@ -101,6 +145,73 @@ class KMCDocument:
             VariableType.METADATA.value: self.metadata_vars,
             VariableType.GENERATIVE.value: self.generative_vars
         }
+    
+    def apply_edit(self, offset: int, deleted_len: int, inserted_text: str) -> 'DocumentChanges':
+        """
+        Aplica una edición al contenido y actualiza el documento de forma incremental.
+        
+        Solo se vuelve a tokenizar la región afectada por la edición; las variables,
+        definiciones y prompts se actualizan en el propio documento.
+        
+        Args:
+            offset: Posición donde empieza la edición
+            deleted_len: Número de caracteres eliminados a partir de `offset`
+            inserted_text: Texto insertado en `offset`
+            
+        Returns:
+            DocumentChanges: Variables añadidas, eliminadas o modificadas por la edición
+        """
+        from .incremental import apply_edit
+        return apply_edit(self, offset, deleted_len, inserted_text)
+
+
+@dataclass
+class DocumentChanges:
+    """Cambios producidos en un documento por una edición incremental"""
+    added: List[str] = field(default_factory=list)    # Ocurrencias nuevas (nombre completo KMC)
+    removed: List[str] = field(default_factory=list)  # Ocurrencias desaparecidas
+    changed: List[str] = field(default_factory=list)  # Variables cuyo prompt, formato o definición cambió
+    relexed: Tuple[int, int] = (0, 0)  # Rango [inicio, fin) re-tokenizado en el nuevo contenido
+
+
+@dataclass
+class RenderReport:
+    """Reporte de la ejecución de un render"""
+    handler_invocations: int = 0  # Llamadas efectivas a handlers generativos
+    shared_invocations: int = 0   # Resultados reutilizados en lugar de volver a llamar al handler
+    cached_invocations: int = 0   # Resultados obtenidos de la cache de resultados entre renders
+    coalesced_invocations: int = 0  # Resultados recibidos de una invocación idéntica en curso en otro render
+    approximate_invocations: int = 0  # Resultados reutilizados de un prompt casi idéntico
+    batch_calls: int = 0          # Llamadas a generate_batch de handlers generativos
+    batched_invocations: int = 0  # Variables generadas dentro de un lote
+    micro_batched_invocations: int = 0  # Invocaciones agrupadas en lotes con las de otros renders
+    retries: int = 0              # Reintentos de llamadas fallidas a handlers generativos
+    rejected_invocations: int = 0  # Invocaciones rechazadas por un cortacircuitos abierto
+    invocations_by_handler: Dict[str, int] = field(default_factory=dict)  # Llamadas por handler_key
+    variables_resolved: int = 0   # Variables contextuales y de metadata resueltas
+    bulk_lookups: int = 0         # Llamadas en bloque a handlers contextuales y de metadata
+    dependency_waves: int = 0     # Oleadas del grafo de dependencias generativas
+    reused_nodes: List[str] = field(default_factory=list)       # Nodos cuyo valor almacenado se reutilizó
+    regenerated_nodes: List[str] = field(default_factory=list)  # Nodos generados de nuevo en este render
+    deadline_exceeded: bool = False  # El render agotó su límite de tiempo y la salida es parcial
+    variable_status: Dict[str, str] = field(default_factory=dict)  # Estado (VariableStatus) de cada nodo
+    tier_choices: Dict[str, str] = field(default_factory=dict)  # handler_key del nivel elegido por nodo
+    degraded_nodes: List[str] = field(default_factory=list)  # Nodos generados con un nivel más barato
+    tier_cost: float = 0.0        # Coste acumulado de los niveles elegidos
+
+
+class RenderResult(str):
+    """
+    Documento renderizado.
+    
+    Se comporta como un str normal y expone además el reporte del render
+    en el atributo `report`.
+    """
+    
+    def __new__(cls, content: str, report: Optional[RenderReport] = None):
+        instance = super().__new__(cls, content)
+        instance.report = report or RenderReport()
+        return instance
 
 
 class KMCVariableDefinition:
@@ -224,13 +335,11 @@ class KMCVariableDefinition:
             dict: Diccionario de definiciones con la variable como clave
         """
         definitions = {}
-        # Buscar comentarios de definición
-        comment_pattern = r'<!--\s*(KMC_DEFINITION.+?)-->'
-        comments = re.finditer(comment_pattern, content, re.DOTALL)
-        
-        for comment_match in comments:
-            comment = comment_match.group(1)
-            definition = cls.from_comment(comment)
+        # Recorrer los comentarios de definición emitidos por el lexer
+        for token in tokenize(content):
+            if token.kind is not TokenKind.DEFINITION:
+                continue
+            definition = cls.from_comment(token.body)
             if definition:
                 # Usar el nombre completo de la variable como clave
                 definitions[definition.var_name] = definition
@@ -1,24 +1,159 @@
 """
 KMC Parser - Core parser para Kimfe Markdown Convention
 """
-import re
-from typing import Dict, List, Any, Callable, Optional, Union
+from typing import Dict, List, Any, AsyncIterator, Awaitable, Callable, Iterator, Optional, Set, TextIO, Tuple, Union
+import asyncio
 import logging
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
+from dataclasses import replace
 from importlib import import_module
 
-from .models import ContextualVariable, MetadataVariable, GenerativeVariable, KMCDocument, KMCVariableDefinition
+from .models import (
+    ContextualVariable,
+    MetadataVariable,
+    GenerativeVariable,
+    KMCDocument,
+    KMCVariableDefinition,
+    RenderReport,
+    RenderResult,
+    VariableStatus
+)
+from .lexer import Token, TokenKind, VARIABLE_KINDS, tokenize
+from .template import CompiledTemplate
 # Importar el sistema de registro centralizado
 from .core import registry
+from .core.cache import OutputCache, ResultCache, TemplateCache, template_cache as default_template_cache, content_hash
+from .core.aio import acall_handler, acall_handler_many, call_handler, call_handler_many
+from .core.concurrency import ConcurrencyLimits
+from .core.deadline import Deadline
+from .core.batching import MicroBatcher
+from .core.dispatch import SingleFlight
+from .core.resilience import Resilience
+from .core.routing import LatencyTracker, RoutedHandler, RoutingPolicy, Tier, TierGroup
+from .core.similarity import SimilarityCache
+from .core.resolution import ResolutionTable
+from .core.session import RenderSession
+from .core.streaming import current_node
+
+
+class _RenderPool(ThreadPoolExecutor):
+    """
+    Executor propio de un render que, al cerrarse sin esperar, cancela las tareas que
+    aún no empezaron (`shutdown(cancel_futures=True)` no existe en Python 3.8).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending: Set[Future] = set()
+        self._pending_lock = threading.Lock()
+
+    def submit(self, *args, **kwargs) -> Future:
+        future = super().submit(*args, **kwargs)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future: Future) -> None:
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def shutdown_now(self) -> None:
+        """Cierra el executor sin esperar a las tareas en curso y cancela las pendientes"""
+        self.shutdown(wait=False)
+        with self._pending_lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
 
 
 class KMCParser:
     """Parser principal para documentos KMC"""
     
-    def __init__(self):
-        """Inicializa el parser KMC"""
+    def __init__(self, template_cache: Optional[TemplateCache] = None,
+                 concurrency_limits: Optional[Union[Dict[str, int], ConcurrencyLimits]] = None,
+                 output_cache: Optional[OutputCache] = None,
+                 result_cache: Optional[ResultCache] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 similarity_cache: Optional[SimilarityCache] = None,
+                 batch_size: int = 8,
+                 micro_batcher: Optional[MicroBatcher] = None,
+                 resilience: Optional[Resilience] = None,
+                 retry_budget: Optional[int] = 10,
+                 latency_tracker: Optional[LatencyTracker] = None,
+                 route_workers: int = 8):
+        """
+        Inicializa el parser KMC
+        
+        Args:
+            template_cache (TemplateCache, optional): Cache de plantillas compiladas.
+                Por defecto se usa la cache global compartida por todos los parsers.
+            concurrency_limits (Dict[str, int] | ConcurrencyLimits, optional): Número máximo
+                de invocaciones simultáneas por handler_key (ej: {"ai:gpt4": 4}), o un
+                gobernador `ConcurrencyLimits` con límites de vuelo y de ritmo que puede
+                compartirse entre parsers. Los handlers pueden fijar los suyos en su
+                configuración (`max_in_flight`, `rate_limit`, `rate_burst`).
+            output_cache (OutputCache, optional): Cache de valores generados indexada por la
+                clave Merkle de cada nodo. Con ella, volver a renderizar un documento solo
+                invoca los handlers de los nodos cuya clave cambió. Sin ella cada render
+                genera de nuevo todos los nodos.
+            result_cache (ResultCache, optional): Cache LRU con caducidad de los resultados
+                de los handlers generativos, indexada por handler_key, prompt resuelto,
+                formato y configuración del handler. Puede compartirse entre parsers.
+            single_flight (SingleFlight, optional): Tabla de invocaciones generativas en
+                curso. Los renders simultáneos que piden el mismo resultado esperan a la
+                primera invocación en lugar de repetirla. Por defecto cada parser tiene la
+                suya; compartir una instancia agrupa también las peticiones de otros parsers.
+            similarity_cache (SimilarityCache, optional): Cache de resultados para prompts
+                casi idénticos (espacios, puntuación o fechas distintas). Solo se aplica a
+                los handlers que toleran resultados aproximados. Sin ella solo se
+                reutilizan resultados de prompts idénticos.
+            batch_size (int, optional): Número máximo de variables por lote para los
+                handlers con generación en lote (`generate_batch`). Las variables
+                pendientes que quedan listas a la vez se agrupan por handler_key y se
+                generan con una llamada por lote. La configuración `batch_size` de un
+                handler tiene prioridad. Con 1 se desactiva la generación en lote.
+            micro_batcher (MicroBatcher, optional): Agrupador de invocaciones entre renders.
+                Las invocaciones de handlers con generación en lote de renders
+                simultáneos esperan una ventana corta y se generan juntas. Compartir una
+                instancia entre parsers agrupa también sus peticiones. Sin él cada
+                render solo agrupa sus propias variables.
+            resilience (Resilience, optional): Capa de reintentos con espera exponencial y
+                cortacircuitos por handler_key. Con el cortacircuitos de un handler
+                abierto sus variables fallan al momento a su placeholder. Sin ella un
+                error del handler se convierte directamente en el placeholder.
+            retry_budget (int, optional): Número máximo de reintentos por render con
+                `resilience` (None para no limitarlos).
+            latency_tracker (LatencyTracker, optional): Registro de las latencias observadas
+                de cada handler_key, con el que se eligen los niveles de los grupos de
+                `set_handler_tiers`. Puede compartirse entre parsers.
+            route_workers (int, optional): Número máximo de hilos con los que las rutas de
+                `set_routing_policy` lanzan sus llamadas de cobertura. El executor se crea
+                al primer uso y se cierra con `close()`.
+        """
+        self.template_cache = template_cache if template_cache is not None else default_template_cache
+        self.output_cache = output_cache
+        self.result_cache = result_cache
+        self.single_flight = single_flight if single_flight is not None else SingleFlight()
+        self.similarity_cache = similarity_cache
+        self.batch_size = batch_size
+        self.micro_batcher = micro_batcher
+        self.resilience = resilience
+        self.retry_budget = retry_budget
+        self.latency_tracker = latency_tracker if latency_tracker is not None else LatencyTracker()
+        self.route_workers = route_workers
+        self._route_executor: Optional[ThreadPoolExecutor] = None
+        self._route_lock = threading.Lock()
+        if isinstance(concurrency_limits, ConcurrencyLimits):
+            self.concurrency_limits = concurrency_limits
+        else:
+            self.concurrency_limits = ConcurrencyLimits(concurrency_limits)
         self.context_handlers: Dict[str, Callable] = {}
         self.metadata_handlers: Dict[str, Callable] = {}
         self.generative_handlers: Dict[str, Callable] = {}
+        self.routes: Dict[str, RoutedHandler] = {}
+        self.tier_groups: Dict[str, TierGroup] = {}
         self.variable_definitions: Dict[str, KMCVariableDefinition] = {}
         self.logger = logging.getLogger("kmc.parser")
         
@@ -39,6 +174,65 @@ class KMCParser:
     def register_generative_handler(self, source_type: str, handler: Callable) -> None:
         """Registra un handler para variables generativas."""
         self.generative_handlers[source_type] = handler
+
+    def set_concurrency_limit(self, handler_key: str, limit: Optional[int]) -> None:
+        """Limita las invocaciones simultáneas de un handler generativo (None elimina el límite)."""
+        self.concurrency_limits.set_limit(handler_key, limit)
+
+    def set_rate_limit(self, handler_key: str, rate: Optional[float], burst: Optional[int] = None) -> None:
+        """Limita las llamadas por segundo de un handler generativo (None elimina el límite)."""
+        self.concurrency_limits.set_rate(handler_key, rate, burst)
+
+    def set_routing_policy(self, handler_key: str, policy: Optional[RoutingPolicy]) -> Optional[RoutedHandler]:
+        """
+        Enruta un handler generativo entre varios backends (cobertura de latencia, fallback
+        o latencia observada). Los backends se buscan como el resto de handlers: primero
+        los del parser y después los del registro. None elimina la ruta.
+        """
+        if policy is None:
+            self.routes.pop(handler_key, None)
+            return None
+        route = RoutedHandler(handler_key, policy, self._get_backend_handler)
+        self.routes[handler_key] = route
+        return route
+
+    def set_handler_tiers(self, handler_key: str, tiers: Optional[List[Union[Tier, str]]],
+                          percentile: float = 95, min_samples: int = 5,
+                          unknown_floor: Optional[float] = 1.0) -> Optional[TierGroup]:
+        """
+        Define los niveles de coste y latencia de un handler generativo, del mejor al más
+        barato (ej. "ai:gpt4" → un modelo más pequeño → un stub local). En los renders con
+        `deadline`, cada variable se genera con el primer nivel cuya latencia observada
+        (percentil `percentile`) cabe en el tiempo restante; los niveles sin latencia
+        conocida se saltan si quedan menos de `unknown_floor` segundos. None elimina los niveles.
+        """
+        if tiers is None:
+            self.tier_groups.pop(handler_key, None)
+            return None
+        group = TierGroup(tiers, percentile, min_samples, unknown_floor)
+        self.tier_groups[handler_key] = group
+        return group
+
+    def _route_pool(self) -> ThreadPoolExecutor:
+        """Executor acotado de las coberturas de las rutas, creado al primer uso"""
+        with self._route_lock:
+            if self._route_executor is None:
+                self._route_executor = ThreadPoolExecutor(max_workers=self.route_workers,
+                                                          thread_name_prefix="kmc-route")
+            return self._route_executor
+
+    def close(self) -> None:
+        """Cierra el executor de las coberturas de las rutas; no espera a las llamadas perdedoras"""
+        with self._route_lock:
+            executor, self._route_executor = self._route_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def routing_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Estadísticas por backend (victorias, errores, histograma de latencias) de cada ruta"""
+        stats = registry.routing_stats()
+        stats.update({handler_key: route.stats() for handler_key, route in self.routes.items()})
+        return stats
     
     def _load_default_plugins(self):
         """
@@ -55,93 +249,85 @@ class KMCParser:
         except (ImportError, AttributeError) as e:
             self.logger.debug(f"No se pudieron cargar handlers automáticamente: {str(e)}")
     
-    def _parse_contextual_vars(self, content: str) -> List[ContextualVariable]:
-        """Extrae las variables contextuales del texto"""
-        pattern = r'\[\[([\w]+):([\w_]+)\]\]'
-        vars_found = []
+    def _build_document(self, content: str, tokens: List[Token]) -> KMCDocument:
+        """
+        Construye un KMCDocument a partir de la secuencia de tokens del lexer.
         
-        for match in re.finditer(pattern, content):
-            var_type, var_name = match.groups()
-            vars_found.append(ContextualVariable(var_type, var_name))
+        Args:
+            content (str): Contenido markdown completo
+            tokens (List[Token]): Tokens emitidos por el lexer para ese contenido
             
-            print(f"Variable contextual encontrada: {var_type}:{var_name}")
-        
-        return vars_found
-    
-    def _parse_metadata_vars(self, content: str) -> List[MetadataVariable]:
-        """Extrae las variables de metadata del texto"""
-        pattern = r'\[\{([\w]+):([\w_]+)\}\]'
-        vars_found = []
-        
-        for match in re.finditer(pattern, content):
-            var_type, var_name = match.groups()
-            vars_found.append(MetadataVariable(var_type, var_name))
-        
-        return vars_found
-    
-    def _parse_generative_vars(self, content: str) -> List[GenerativeVariable]:
-        """
-        Extrae variables generativas del contenido.
+        Returns:
+            KMCDocument: Documento con variables, definiciones y prompts
         """
-        variables = []
+        doc = KMCDocument(content=content, tokens=tokens)
+        generative_targets: List[str] = []
+        inline_prompts: Dict[str, Token] = {}
+        ai_prompts: Dict[str, str] = {}
         
-        # Buscar variables generativas y sus definiciones o prompts
-        var_pattern = r'{{([\w:]+)}}'
-        for match in re.finditer(var_pattern, content):
-            var_fullname = match.group(1)
-            var_parts = var_fullname.split(':')
+        for token in tokens:
+            if token.kind is TokenKind.TEXT:
+                continue
             
-            # Extraer partes de la variable
-            if len(var_parts) >= 2:
-                category = var_parts[0]
-                if len(var_parts) == 3:
-                    subtype = var_parts[1]
-                    name = var_parts[2]
+            if token.kind is TokenKind.DEFINITION:
+                if token.source and token.prompt:
+                    doc.definitions[token.target] = KMCVariableDefinition(
+                        var_name=token.target.strip(),
+                        source_var=token.source,
+                        prompt=token.prompt,
+                        format_type=token.format
+                    )
+            elif token.kind is TokenKind.AI_PROMPT:
+                if token.target:
+                    doc.prompts[token.target] = token.prompt
+                    ai_prompts.setdefault(token.target, token.prompt)
+            elif token.kind is TokenKind.INLINE:
+                inline_prompts.setdefault(token.target, token)
+            
+            # Las variables de los comentarios también forman parte del documento
+            variable_tokens = (token,) if token.kind in VARIABLE_KINDS else token.children
+            for var_token in variable_tokens:
+                if var_token.kind is TokenKind.CONTEXTUAL:
+                    var_type, var_name = var_token.parts
+                    doc.contextual_vars.append(ContextualVariable(var_type, var_name))
+                elif var_token.kind is TokenKind.METADATA:
+                    var_type, var_name = var_token.parts
+                    doc.metadata_vars.append(MetadataVariable(var_type, var_name))
                 else:
-                    subtype = None
-                    name = var_parts[1]
-                
-                # Buscar definición KMC o prompt tradicional
-                kmc_pattern = r'<!-- KMC {{' + re.escape(var_fullname) + r'}}:"([^"]+)"(?:\s*FORMAT\s+"([^"]+)")?\s*-->'
-                ai_prompt_pattern = r'<!-- AI_PROMPT FOR {{' + re.escape(var_fullname) + r'}}:\s*\n(.*?)\n-->'
-                
-                prompt = None
-                format_type = None
-                
-                # Primero intentar con definición KMC
-                kmc_match = re.search(kmc_pattern, content, re.DOTALL)
-                if kmc_match:
-                    prompt = kmc_match.group(1)
-                    format_type = kmc_match.group(2) if kmc_match.group(2) else None
-                
-                # Si no hay definición KMC, buscar prompt tradicional
-                if not prompt:
-                    ai_match = re.search(ai_prompt_pattern, content, re.DOTALL)
-                    if ai_match:
-                        prompt = ai_match.group(1).strip()
-                
-                # Crear la variable
-                var = GenerativeVariable(
-                    category=category,
-                    subtype=subtype,
-                    name=name,
-                    prompt=prompt,
-                    parameters={'format': format_type} if format_type else None
-                )
-                variables.append(var)
+                    generative_targets.append(var_token.target)
         
-        return variables
-    
-    def _parse_prompts(self, content: str) -> Dict[str, str]:
-        """Extrae los prompts asociados a variables generativas"""
-        pattern = r'<!-- AI_PROMPT FOR (\{\{[\w:]+\}\}): (.*?) -->'
-        prompts = {}
+        # Las variables generativas se construyen al final porque sus prompts
+        # (KMC inline o AI_PROMPT) suelen aparecer después de la variable
+        for target in generative_targets:
+            prompt = None
+            format_type = None
+            
+            # Primero intentar con definición KMC inline, luego con prompt tradicional
+            inline = inline_prompts.get(target)
+            if inline:
+                prompt = inline.prompt
+                format_type = inline.format
+            else:
+                prompt = ai_prompts.get(target) or None
+            
+            doc.generative_vars.append(self._make_generative_var(target, prompt, format_type))
         
-        for match in re.finditer(pattern, content, re.DOTALL):
-            var_name, prompt = match.groups()
-            prompts[var_name] = prompt.strip()
+        return doc
+    
+    def _make_generative_var(self, target: str, prompt: Optional[str] = None,
+                             format_type: Optional[str] = None) -> GenerativeVariable:
+        """
+        Crea una variable generativa a partir de su nombre completo sin llaves.
         
-        return prompts
+        Args:
+            target (str): Nombre de la variable (ej: "ai:gpt4:resumen")
+            prompt (str, optional): Prompt asociado
+            format_type (str, optional): Formato declarado
+            
+        Returns:
+            GenerativeVariable: La variable generativa
+        """
+        return GenerativeVariable.from_target(target, prompt, format_type)
     
     def _parse_variable_definitions(self, content: str) -> Dict[str, KMCVariableDefinition]:
         """
@@ -166,11 +352,19 @@ class KMCParser:
         # Si no hay handler local, buscar en el registro centralizado
         registry_handler = registry.get_context_handler(var.type)
         if registry_handler:
-            print(f"Handler de registro encontrado para {var.type}")
-            return registry_handler(var.name)
+            self.logger.debug(f"Handler de registro encontrado para {var.type}")
+            return call_handler(registry_handler, var.name)
             
         return None
     
+    async def _aresolve_contextual_var(self, var: ContextualVariable) -> Optional[str]:
+        """Resuelve el valor de una variable contextual de forma asíncrona"""
+        registry_handler = registry.get_context_handler(var.type)
+        if registry_handler:
+            return await acall_handler(registry_handler, var.name)
+        
+        return None
+    
     def _resolve_metadata_var(self, var: MetadataVariable) -> str:
         """
         Resuelve el valor de una variable de metadata.
@@ -187,336 +381,957 @@ class KMCParser:
         # Si no hay handler local, buscar en el registro centralizado
         registry_handler = registry.get_metadata_handler(var.type)
         if registry_handler:
-            value = registry_handler(var.name)
-            if var.name == 'version' and str(value).startswith('v'):
-                return str(value)[1:]
-            return str(value)
+            return self._format_metadata_value(var, call_handler(registry_handler, var.name))
             
         # Si no hay handler, devolver un placeholder
         return f"<{var.type}:{var.name}>"
     
-    def _resolve_generative_var(self, var: GenerativeVariable, doc: KMCDocument) -> str:
-        """
-        Resuelve el valor de una variable generativa.
+    async def _aresolve_metadata_var(self, var: MetadataVariable) -> str:
+        """Resuelve el valor de una variable de metadata de forma asíncrona"""
+        registry_handler = registry.get_metadata_handler(var.type)
+        if registry_handler:
+            return self._format_metadata_value(var, await acall_handler(registry_handler, var.name))
+        
+        return f"<{var.type}:{var.name}>"
+    
+    def _resolve_contextual_many(self, var_type: str, names: List[str]) -> Dict[str, Any]:
+        """Resuelve con una sola llamada al handler varias variables contextuales del mismo tipo"""
+        registry_handler = registry.get_context_handler(var_type)
+        if registry_handler:
+            return call_handler_many(registry_handler, names)
+        
+        return {}
+    
+    async def _aresolve_contextual_many(self, var_type: str, names: List[str]) -> Dict[str, Any]:
+        """Versión asíncrona de `_resolve_contextual_many`"""
+        registry_handler = registry.get_context_handler(var_type)
+        if registry_handler:
+            return await acall_handler_many(registry_handler, names)
+        
+        return {}
+    
+    def _resolve_metadata_many(self, var_type: str, names: List[str]) -> Dict[str, str]:
+        """Resuelve con una sola llamada al handler varias variables de metadata del mismo tipo"""
+        registry_handler = registry.get_metadata_handler(var_type)
+        values = call_handler_many(registry_handler, names) if registry_handler else None
+        return self._format_metadata_values(var_type, names, values)
+    
+    async def _aresolve_metadata_many(self, var_type: str, names: List[str]) -> Dict[str, str]:
+        """Versión asíncrona de `_resolve_metadata_many`"""
+        registry_handler = registry.get_metadata_handler(var_type)
+        values = await acall_handler_many(registry_handler, names) if registry_handler else None
+        return self._format_metadata_values(var_type, names, values)
+    
+    def _format_metadata_values(self, var_type: str, names: List[str],
+                                values: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Convierte a texto los valores de una resolución en bloque (placeholders sin handler)"""
+        if values is None:
+            return {name: f"<{var_type}:{name}>" for name in names}
+        return {
+            name: self._format_metadata_value(MetadataVariable(var_type, name), values.get(name))
+            for name in names
+        }
+    
+    @staticmethod
+    def _format_metadata_value(var: MetadataVariable, value: Any) -> str:
+        """Convierte el valor de metadata a texto, eliminando el prefijo 'v' de las versiones"""
+        if var.name == 'version' and str(value).startswith('v'):
+            return str(value)[1:]
+        return str(value)
+    
+    def _new_resolution_table(self) -> ResolutionTable:
         """
-        # Obtener el handler correspondiente
-        handler_key = var.handler_key
-        handler = self.generative_handlers.get(handler_key)
+        Crea la tabla de resolución de variables contextuales y de metadata de un render.
         
-        # Si no hay handler local, intentar obtener del registro
-        if not handler:
-            handler = registry.get_generative_handler(handler_key)
+        Returns:
+            ResolutionTable: Tabla vacía que resuelve cada variable una sola vez
+        """
+        return ResolutionTable({
+            TokenKind.CONTEXTUAL: lambda var_type, var_name: self._resolve_contextual_var(
+                ContextualVariable(var_type, var_name)),
+            TokenKind.METADATA: lambda var_type, var_name: self._resolve_metadata_var(
+                MetadataVariable(var_type, var_name)),
+        }, {
+            TokenKind.CONTEXTUAL: lambda var_type, var_name: self._aresolve_contextual_var(
+                ContextualVariable(var_type, var_name)),
+            TokenKind.METADATA: lambda var_type, var_name: self._aresolve_metadata_var(
+                MetadataVariable(var_type, var_name)),
+        }, {
+            TokenKind.CONTEXTUAL: self._resolve_contextual_many,
+            TokenKind.METADATA: self._resolve_metadata_many,
+        }, {
+            TokenKind.CONTEXTUAL: self._aresolve_contextual_many,
+            TokenKind.METADATA: self._aresolve_metadata_many,
+        })
+    
+    def _new_session(self, template: CompiledTemplate, deadline: Optional[float] = None) -> RenderSession:
+        """Crea el estado de un nuevo render de la plantilla, con un límite de `deadline` segundos"""
+        return RenderSession(template, self._new_resolution_table(), self.concurrency_limits,
+                             self.result_cache, self.single_flight, self.similarity_cache,
+                             self.micro_batcher, self.resilience, self.retry_budget,
+                             Deadline(deadline) if deadline is not None else None, self.latency_tracker,
+                             self._route_pool)
+    
+    def parse(self, content: str) -> KMCDocument:
+        """
+        Analiza un documento KMC y extrae todas las variables y sus definiciones.
         
-        if not handler:
-            # Si no hay handler, devolver un placeholder
-            return f"<Contenido generativo para {handler_key}>"
-
-        # Buscar el prompt asociado
-        prompt = var.prompt
-        if not prompt:
-            prompt = doc.prompts.get(var.fullname)
-            
-        if not prompt:
-            # Si no hay prompt directo ni en las definiciones, usar un placeholder
-            return f"<{var.handler_key}:{var.name}>"
-
-        # Resolver el prompt (reemplazar variables contextuales y de metadata)
-        resolved_prompt = self._resolve_variables_in_text(prompt, doc)
-        var.prompt = resolved_prompt
-
-        # Llamar al handler con el prompt resuelto
-        try:
-            format_type = var.parameters.get('format') if var.parameters else None
-            if format_type:
-                result = handler(var)
-                if result is None:
-                    return f"Contenido generado para {var.name} en formato {format_type}"
-                return str(result)
-            else:
-                result = handler(var)
-                if result is None:
-                    return f"Contenido generado para {var.name}"
-                return str(result)
-        except Exception as e:
-            self.logger.error(f"Error al ejecutar el handler para {var.fullname}: {str(e)}")
-            return f"ERROR:{handler_key}:{var.name}"
+        El contenido se recorre una única vez con el lexer; variables, definiciones
+        y prompts se construyen a partir de la secuencia de tokens resultante.
+        """
+        return self._build_document(content, tokenize(content))
     
-    def _resolve_variable_definition(self, definition: KMCVariableDefinition) -> Optional[str]:
+    def compile(self, content: str) -> CompiledTemplate:
         """
-        Resuelve una definición de variable KMC.
+        Compila un documento KMC para poder renderizarlo muchas veces.
+        
+        Las plantillas compiladas se guardan en una cache LRU indexada por el hash del
+        contenido, de modo que compilar de nuevo el mismo contenido no vuelve a analizarlo.
         
         Args:
-            definition (KMCVariableDefinition): La definición a resolver
+            content (str): Contenido markdown completo
             
         Returns:
-            Optional[str]: El valor generado o None si no se pudo resolver
+            CompiledTemplate: La plantilla compilada
         """
-        # Obtener las partes de la variable generativa
-        gen_parts = definition.generative_var.split(':')
-        if len(gen_parts) < 2:
-            return None
+        key = content_hash(content)
+        template = self.template_cache.get(key)
+        if template is not None and template.content == content:
+            return template
+        
+        template = CompiledTemplate(content, key, self._build_document(content, tokenize(content)))
+        self.template_cache.put(key, template)
+        return template
+    
+    def render(self, content: Union[str, CompiledTemplate], max_workers: Optional[int] = None,
+               executor: Optional[Executor] = None, deadline: Optional[float] = None) -> RenderResult:
+        """
+        Renderiza un documento KMC, reemplazando todas las variables.
+        
+        Los valores se resuelven primero en un mapa y la salida se construye después en
+        una única pasada de izquierda a derecha sobre los tokens, uniendo los fragmentos
+        de texto con los valores resueltos. Los comentarios KMC se eliminan en esa misma
+        pasada.
+        
+        Cada invocación generativa (handler, variable, prompt resuelto, formato) se
+        ejecuta como máximo una vez por render y su resultado se comparte entre todos
+        los placeholders que lo necesitan.
+        
+        Con `max_workers` o `executor` las definiciones y variables generativas del
+        cuerpo se resuelven de forma concurrente; el resultado es idéntico al del modo
+        secuencial porque la salida se construye siempre en el orden del documento.
+        
+        Con `deadline` el render termina como máximo a los `deadline` segundos: los
+        nodos que no terminaron a tiempo se abandonan y se emite su placeholder, y
+        `report.variable_status` indica el estado de cada variable generativa o
+        definición (resolved, cached, failed o timed_out) para poder completar los
+        huecos más adelante. Las variables se resuelven entonces siempre en un
+        executor para no esperar a las invocaciones rezagadas; sin `max_workers` ni
+        `executor` es un único hilo, de modo que los handlers no se invocan en paralelo.
+        
+        Args:
+            content (Union[str, CompiledTemplate]): Contenido markdown o plantilla ya compilada
+            max_workers (int, optional): Número de hilos para resolver las variables
+                generativas. Con None o 1 el render es secuencial.
+            executor (Executor, optional): Executor propio para las variables generativas.
+                Tiene prioridad sobre `max_workers` y no se cierra al terminar.
+            deadline (float, optional): Presupuesto de tiempo del render en segundos.
+                Los handlers pueden consultar el tiempo restante con `remaining_time()`.
             
-        category = gen_parts[0]
-        subtype = gen_parts[1]
-        name = gen_parts[2] if len(gen_parts) > 2 else ""
+        Returns:
+            RenderResult: Documento renderizado (un str) con el reporte del render en `report`
+        """
+        template = content if isinstance(content, CompiledTemplate) else self.compile(content)
         
-        # Crear la variable generativa
-        gen_var = GenerativeVariable(category, subtype, name, prompt=definition.prompt)
+        # Camino rápido: sin variables ni comentarios KMC no hay nada que sustituir
+        if template.is_static:
+            return RenderResult(template.content)
         
-        # Resolver el prompt (reemplazar variables)
-        resolved_prompt = self._resolve_variables_in_prompt(definition.prompt)
-        gen_var.prompt = resolved_prompt
+        session = self._new_session(template, deadline)
+        if executor is None and deadline is not None:
+            # Al agotar el límite no se espera a los nodos rezagados. Sin `max_workers` basta
+            # un hilo: los handlers se siguen invocando de uno en uno, como en modo secuencial
+            pool = _RenderPool(max_workers=max_workers or 1, thread_name_prefix="kmc-render")
+            try:
+                values = self._resolve_values(session, pool)
+            finally:
+                pool.shutdown_now()
+        elif executor is None and max_workers and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kmc-render") as pool:
+                values = self._resolve_values(session, pool)
+        else:
+            values = self._resolve_values(session, executor)
+        return RenderResult(template.emit(values), session.finish())
+    
+    async def arender(self, content: Union[str, CompiledTemplate],
+                      deadline: Optional[float] = None) -> RenderResult:
+        """
+        Versión asíncrona de `render` para aplicaciones basadas en asyncio.
         
-        # Buscar el handler correspondiente
-        handler_key = f"{category}:{subtype}"
-        handler = self.generative_handlers.get(handler_key)
-        if not handler:
-            return None
+        Las variables independientes se esperan de forma concurrente con
+        `asyncio.gather`. Los handlers asíncronos (corrutinas o handlers con hooks
+        `_agenerate_content`, `_aget_context_value`, `_aget_metadata_value`) se esperan
+        directamente y los síncronos se ejecutan en el executor por defecto del bucle.
+        Los límites de concurrencia por handler_key se aplican con un semáforo por handler.
+        
+        Con `deadline`, las tareas que no terminaron a tiempo se cancelan y se emite su
+        placeholder, igual que en `render`.
+        
+        Args:
+            content (Union[str, CompiledTemplate]): Contenido markdown o plantilla ya compilada
+            deadline (float, optional): Presupuesto de tiempo del render en segundos
             
-        # Llamar al handler con la variable generativa
-        return handler(gen_var)
+        Returns:
+            RenderResult: Documento renderizado (un str) con el reporte del render en `report`
+        """
+        template = content if isinstance(content, CompiledTemplate) else self.compile(content)
+        
+        if template.is_static:
+            return RenderResult(template.content)
+        
+        session = self._new_session(template, deadline)
+        values = await self._aresolve_values(session)
+        return RenderResult(template.emit(values), session.finish())
     
-    def _resolve_variables_in_text(self, text: str, doc: KMCDocument) -> str:
+    async def _aresolve_values(self, session: RenderSession) -> Dict[Tuple[TokenKind, str], Optional[str]]:
         """
-        Resuelve todas las variables en un texto.
+        Versión asíncrona de `_resolve_values`: todas las variables distintas del cuerpo
+        se resuelven de forma concurrente.
         
         Args:
-            text (str): El texto con variables
-            doc (KMCDocument): El documento KMC completo
+            session (RenderSession): Estado del render en curso
             
         Returns:
-            str: El texto con las variables resueltas
+            Dict[Tuple[TokenKind, str], Optional[str]]: Valores indexados por tipo de token
+            y nombre de variable. None indica que el marcador se deja sin reemplazar.
         """
-        result = text
+        template = session.template
+        template.graph.check()
+        await session.table.aprefetch(template.lookup_groups)
+        keys: List[Tuple[TokenKind, str]] = []
+        seen = set()
         
-        # Resolver variables contextuales
-        for var in doc.contextual_vars:
-            if var.fullname in result:
-                value = self._resolve_contextual_var(var)
-                if value is not None:
-                    result = result.replace(var.fullname, value)
+        for token in template.occurrences:
+            key = (token.kind, token.target)
+            if key in seen or key in template.graph:
+                continue
+            seen.add(key)
+            keys.append(key)
         
-        # Resolver variables de metadata
-        for var in doc.metadata_vars:
-            if var.fullname in result:
-                value = self._resolve_metadata_var(var)
-                if value is not None:
-                    result = result.replace(var.fullname, value)
+        execute = lambda node: self._aresolve_node(node, session)
+        prepare = self._batch_preparer(session, self._async_batch_runner(), asynchronous=True)
+        if session.deadline is None:
+            nodes = template.graph.arun(execute, prepare)
+        else:
+            nodes = self._arun_until_deadline(session, execute, prepare)
+        body_values, node_values = await asyncio.gather(
+            asyncio.gather(*(self._aresolve_body_value(kind, target, session) for kind, target in keys)),
+            nodes
+        )
+        values = dict(zip(keys, body_values))
+        values.update(node_values)
+        return values
+    
+    async def _arun_until_deadline(self, session: RenderSession,
+                                   execute: Callable[[Tuple[TokenKind, str]], Awaitable[str]],
+                                   prepare: Optional[Callable]) -> Dict[Tuple[TokenKind, str], str]:
+        """
+        Ejecuta el grafo de dependencias hasta el límite de tiempo del render y cancela
+        las tareas que no terminaron.
         
-        return result
+        Returns:
+            Dict[Tuple[TokenKind, str], str]: Valor de cada nodo, o su placeholder si se abandonó
+        """
+        tasks = session.template.graph.schedule(execute, prepare)
+        try:
+            if tasks:
+                await asyncio.wait(list(tasks.values()), timeout=session.deadline.remaining())
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+        return {node: task.result() if task.done() and not task.cancelled() else self._abandon_node(node, session)
+                for node, task in tasks.items()}
+    
+    async def _aresolve_body_value(self, kind: TokenKind, target: str, session: RenderSession) -> Optional[str]:
+        """Resuelve una variable contextual o de metadata del cuerpo del documento"""
+        value = await session.table.aresolve(kind, target)
+        return str(value) if value else None
     
-    def _resolve_variables_in_prompt(self, prompt: str) -> str:
+    def _resolve_node(self, node: Tuple[TokenKind, str], session: RenderSession) -> str:
         """
-        Resuelve las variables en un prompt de definición.
+        Genera el valor de un nodo del grafo de dependencias y lo registra en la tabla
+        de resolución para los prompts que dependen de él.
+        
+        Si la clave Merkle del nodo (fuente, prompt, formato, valores de sus variables y
+        claves de sus dependencias) coincide con la de un render anterior, se reutiliza
+        el valor almacenado sin invocar al handler.
         
         Args:
-            prompt (str): El prompt con variables
+            node (Tuple[TokenKind, str]): Tipo de token y nombre de la variable
+            session (RenderSession): Estado del render en curso
             
         Returns:
-            str: El prompt con variables resueltas
-        """
-        result = prompt
-        
-        # Resolver variables contextuales
-        context_pattern = r'\[\[([\w]+):([\w_]+)\]\]'
-        for match in re.finditer(context_pattern, prompt):
-            var_type, var_name = match.groups()
-            var = ContextualVariable(var_type, var_name)
-            value = self._resolve_contextual_var(var)
-            if value is not None:
-                result = result.replace(var.fullname, value)
-        
-        # Resolver variables de metadata
-        metadata_pattern = r'\[\{([\w]+):([\w_]+)\}\]'
-        for match in re.finditer(metadata_pattern, prompt):
-            var_type, var_name = match.groups()
-            var = MetadataVariable(var_type, var_name)
-            value = self._resolve_metadata_var(var)
-            if value is not None:
-                result = result.replace(var.fullname, value)
-                
-        return result
+            str: El valor generado o su placeholder
+        """
+        kind, target = node
+        template = session.template
+        if session.deadline is not None and session.deadline.expired():
+            return self._abandon_node(node, session)
+        key = value = None
+        if self.output_cache is not None:
+            key = session.node_key(node)
+            value = self.output_cache.get(key)
+        if value is not None:
+            session.reused.add(node)
+        else:
+            context_token = current_node.set(node)
+            try:
+                if kind is TokenKind.METADATA:
+                    value = self._resolve_definition_value(target, template.definitions[target], session)
+                else:
+                    var = template.generative_vars.get(f"{{{{{target}}}}}") or self._make_generative_var(target)
+                    value = self._resolve_generative_value(var, session)
+            finally:
+                current_node.reset(context_token)
+            self._store_node_value(node, key, value, session)
+        self._record_status(node, value, session)
+        session.table.provide(kind, target, value)
+        return value
     
-    def parse(self, content: str) -> KMCDocument:
+    async def _aresolve_node(self, node: Tuple[TokenKind, str], session: RenderSession) -> str:
+        """Versión asíncrona de `_resolve_node`"""
+        kind, target = node
+        template = session.template
+        if session.deadline is not None and session.deadline.expired():
+            return self._abandon_node(node, session)
+        key = value = None
+        if self.output_cache is not None:
+            key = await session.anode_key(node)
+            value = self.output_cache.get(key)
+        if value is not None:
+            session.reused.add(node)
+        else:
+            context_token = current_node.set(node)
+            try:
+                if kind is TokenKind.METADATA:
+                    value = await self._aresolve_definition_value(target, template.definitions[target], session)
+                else:
+                    var = template.generative_vars.get(f"{{{{{target}}}}}") or self._make_generative_var(target)
+                    value = await self._aresolve_generative_value(var, session)
+            finally:
+                current_node.reset(context_token)
+            self._store_node_value(node, key, value, session)
+        self._record_status(node, value, session)
+        session.table.provide(kind, target, value)
+        return value
+    
+    def _store_node_value(self, node: Tuple[TokenKind, str], key: Optional[str], value: str,
+                          session: RenderSession) -> None:
         """
-        Analiza un documento KMC y extrae todas las variables y sus definiciones.
+        Almacena el valor generado de un nodo salvo que sea su placeholder de error o
+        se haya generado con un nivel degradado, que no debe reutilizarse en renders
+        con tiempo para el primer nivel.
+        """
+        session.regenerated.add(node)
+        if node in session.degraded:
+            session.degrade_key(node)
+        elif key is not None and value != self._node_placeholder(node, session.template):
+            self.output_cache.put(key, value)
+    
+    def _record_status(self, node: Tuple[TokenKind, str], value: str, session: RenderSession) -> None:
+        """Registra el estado final de un nodo en el reporte del render"""
+        if node in session.reused or node in session.ledger.cached_nodes:
+            status = VariableStatus.CACHED
+        elif value != self._node_placeholder(node, session.template):
+            status = VariableStatus.RESOLVED
+        elif session.deadline is not None and session.deadline.expired():
+            status = VariableStatus.TIMED_OUT
+        else:
+            status = VariableStatus.FAILED
+        session.status.setdefault(node, status)
+    
+    def _abandon_node(self, node: Tuple[TokenKind, str], session: RenderSession) -> str:
+        """
+        Abandona un nodo al agotarse el límite de tiempo del render: se emite su
+        placeholder, también en los prompts que dependen de él, y las llamadas que
+        siguen en curso cuentan como muestras de latencia de su handler.
+        
+        Returns:
+            str: El placeholder del nodo
         """
-        doc = KMCDocument(content=content)
+        placeholder = self._node_placeholder(node, session.template)
+        session.status.setdefault(node, VariableStatus.TIMED_OUT)
+        session.ledger.record_timeouts()
+        session.table.provide(*node, placeholder)
+        return placeholder
+    
+    def _node_placeholder(self, node: Tuple[TokenKind, str], template: CompiledTemplate) -> str:
+        """Placeholder que se emite cuando un nodo no se pudo generar"""
+        kind, target = node
+        if kind is TokenKind.METADATA:
+            return f"<{target}>"
+        var = template.generative_vars.get(f"{{{{{target}}}}}") or self._make_generative_var(target)
+        return f"<{var.handler_key}:{var.name}>"
+    
+    def render_stream(self, content: Union[str, CompiledTemplate], max_workers: Optional[int] = None,
+                      executor: Optional[Executor] = None) -> Iterator[str]:
+        """
+        Renderiza un documento KMC por fragmentos, en orden de documento.
         
-        # Extraer variables contextuales
-        doc.contextual_vars = self._parse_contextual_vars(content)
+        Las definiciones y variables generativas se resuelven en segundo plano según el
+        grafo de dependencias mientras se emite el texto; la emisión solo se detiene en
+        un placeholder generativo cuyo valor aún no está disponible. La salida
+        concatenada es idéntica a la de `render`.
         
-        # Extraer variables de metadata
-        doc.metadata_vars = self._parse_metadata_vars(content)
+        Si el handler del placeholder que se está emitiendo retorna un iterador de
+        deltas, los deltas se reenvían según se generan. Si el flujo falla a mitad, el
+        texto parcial ya emitido va seguido del placeholder de error.
         
-        # Extraer variables generativas
-        doc.generative_vars = self._parse_generative_vars(content)
+        Args:
+            content (Union[str, CompiledTemplate]): Contenido markdown o plantilla ya compilada
+            max_workers (int, optional): Hilos en segundo plano para las variables generativas
+                (por defecto uno)
+            executor (Executor, optional): Executor propio para las variables generativas
+            
+        Returns:
+            Iterator[str]: Fragmentos del documento renderizado
+        """
+        template = content if isinstance(content, CompiledTemplate) else self.compile(content)
+        session = self._new_session(template)
+        return self._stream(session, max_workers, executor)
+    
+    def render_to(self, content: Union[str, CompiledTemplate], sink: TextIO, max_workers: Optional[int] = None,
+                  executor: Optional[Executor] = None) -> RenderReport:
+        """
+        Renderiza un documento KMC escribiendo cada fragmento en un fichero o stream de texto,
+        sin mantener el documento completo en memoria.
         
-        # Extraer definiciones KMC
-        kmc_def_pattern = r'<!-- KMC_DEFINITION FOR \[{(.+?)}\]:\s*\n(.*?)-->'
-        for match in re.finditer(kmc_def_pattern, content, re.DOTALL):
-            var_name = match.group(1)
-            definition_text = match.group(2)
+        Args:
+            content (Union[str, CompiledTemplate]): Contenido markdown o plantilla ya compilada
+            sink (TextIO): Destino con método `write` (fichero abierto, StringIO, socket...)
+            max_workers (int, optional): Hilos en segundo plano para las variables generativas
+            executor (Executor, optional): Executor propio para las variables generativas
             
-            # Extraer propiedades de la definición
-            source_match = re.search(r'GENERATIVE_SOURCE\s*=\s*{{(.+?)}}', definition_text)
-            prompt_match = re.search(r'PROMPT\s*=\s*"(.+?)"', definition_text)
-            format_match = re.search(r'FORMAT\s*=\s*"(.+?)"', definition_text)
+        Returns:
+            RenderReport: Reporte del render
+        """
+        template = content if isinstance(content, CompiledTemplate) else self.compile(content)
+        session = self._new_session(template)
+        for chunk in self._stream(session, max_workers, executor):
+            sink.write(chunk)
+        return session.finish()
+    
+    def _stream(self, session: RenderSession, max_workers: Optional[int],
+                executor: Optional[Executor]) -> Iterator[str]:
+        """Genera los fragmentos de `render_stream` para una sesión de render"""
+        template = session.template
+        if template.is_static:
+            if template.content:
+                yield template.content
+            return
+        
+        session.table.prefetch(template.lookup_groups)
+        own_executor = None
+        if executor is None:
+            own_executor = executor = _RenderPool(max_workers=max_workers or 1,
+                                                  thread_name_prefix="kmc-stream")
+        try:
+            futures = template.graph.submit(lambda node: self._resolve_node(node, session), executor,
+                                            self._batch_preparer(session, self._executor_batch_runner(executor)))
+            for future in futures.values():
+                future.add_done_callback(session.notify)
+            content = template.content
+            buffer: List[str] = []
             
-            if source_match and prompt_match:
-                # Asegurarnos de limpiar los espacios en blanco extras
-                format_value = format_match.group(1).strip() if format_match else None
+            for token in template.tokens:
+                if token.kind is TokenKind.TEXT:
+                    buffer.append(content[token.start:token.end])
+                    continue
+                if token.kind not in VARIABLE_KINDS:
+                    continue
                 
-                definition = KMCVariableDefinition(
-                    var_name=var_name.strip(),
-                    source_var=source_match.group(1).strip(),
-                    prompt=prompt_match.group(1).strip(),
-                    format_type=format_value
-                )
-                doc.definitions[var_name] = definition
-        
-        # Extraer prompts tradicionales
-        prompt_pattern = r'<!-- AI_PROMPT FOR {{(.+?)}}:\s*\n(.*?)-->'
-        for match in re.finditer(prompt_pattern, content, re.DOTALL):
-            var_name = match.group(1)
-            prompt = match.group(2).strip()
-            doc.prompts[var_name] = prompt
+                node = (token.kind, token.target)
+                future = futures.get(node)
+                if future is None:
+                    value = session.table.resolve(token.kind, token.target)
+                    value = str(value) if value else None
+                else:
+                    if not future.done():
+                        # Emitir lo ya resuelto antes de esperar al valor generativo
+                        if buffer:
+                            yield ''.join(buffer)
+                            buffer = []
+                        stream = session.wait_stream(node, future)
+                        if stream is not None:
+                            yield from stream
+                            value = future.result()
+                            if stream.error is None:
+                                continue
+                            buffer.append(value)
+                            continue
+                    value = future.result()
+                buffer.append(content[token.start:token.end] if value is None else value)
+            
+            if buffer:
+                yield ''.join(buffer)
+        finally:
+            if own_executor is not None:
+                own_executor.shutdown_now()
+    
+    def arender_stream(self, content: Union[str, CompiledTemplate]) -> AsyncIterator[str]:
+        """
+        Versión asíncrona de `render_stream`: generador asíncrono de fragmentos.
         
-        return doc
+        Args:
+            content (Union[str, CompiledTemplate]): Contenido markdown o plantilla ya compilada
+            
+        Returns:
+            AsyncIterator[str]: Fragmentos del documento renderizado
+        """
+        template = content if isinstance(content, CompiledTemplate) else self.compile(content)
+        session = self._new_session(template)
+        return self._astream(session)
     
-    def render(self, content: str) -> str:
+    async def arender_to(self, content: Union[str, CompiledTemplate], sink: TextIO) -> RenderReport:
         """
-        Renderiza un documento KMC, reemplazando todas las variables.
+        Versión asíncrona de `render_to`.
+        
+        Args:
+            content (Union[str, CompiledTemplate]): Contenido markdown o plantilla ya compilada
+            sink (TextIO): Destino con método `write`
+            
+        Returns:
+            RenderReport: Reporte del render
         """
-        doc = self.parse(content)
-        result = content
-
-        # Limpiar comentarios de definición KMC
-        result = re.sub(r'<!--\s*KMC_DEFINITION.+?-->\n?', '', result, flags=re.DOTALL)
-        # Limpiar comentarios de AI_PROMPT
-        result = re.sub(r'<!--\s*AI_PROMPT.+?-->\n?', '', result, flags=re.DOTALL)
-
-        # Procesar definiciones KMC primero
-        for var_name, definition in doc.definitions.items():
-            # Extraer el handler de la fuente generativa
-            source_parts = definition.source_var.split(':')
-            if len(source_parts) < 2:
-                continue
+        template = content if isinstance(content, CompiledTemplate) else self.compile(content)
+        session = self._new_session(template)
+        async for chunk in self._astream(session):
+            sink.write(chunk)
+        return session.finish()
+    
+    async def _astream(self, session: RenderSession) -> AsyncIterator[str]:
+        """Genera los fragmentos de `arender_stream` para una sesión de render"""
+        template = session.template
+        if template.is_static:
+            if template.content:
+                yield template.content
+            return
+        
+        await session.table.aprefetch(template.lookup_groups)
+        tasks = template.graph.schedule(lambda node: self._aresolve_node(node, session),
+                                        self._batch_preparer(session, self._async_batch_runner(), asynchronous=True))
+        try:
+            content = template.content
+            buffer: List[str] = []
+            
+            for token in template.tokens:
+                if token.kind is TokenKind.TEXT:
+                    buffer.append(content[token.start:token.end])
+                    continue
+                if token.kind not in VARIABLE_KINDS:
+                    continue
                 
-            handler_key = ':'.join(source_parts[:2]) if len(source_parts) > 2 else source_parts[0] + ':' + source_parts[1]
-            handler = self.generative_handlers.get(handler_key)
-            
-            if not handler:
-                handler = registry.get_generative_handler(handler_key)
-            
-            if handler:
-                try:
-                    # Resolver variables en el prompt
-                    resolved_prompt = self._resolve_variables_in_text(definition.prompt, doc)
-                    var_obj = GenerativeVariable(
-                        category=source_parts[0],
-                        subtype=source_parts[1],
-                        name=source_parts[2] if len(source_parts) > 2 else var_name.split(':')[-1],
-                        prompt=resolved_prompt,
-                        parameters={'format': definition.format} if definition.format else None
-                    )
-                    
-                    value = handler(var_obj)
-                    if value is not None:
-                        pattern = r'\[{' + re.escape(var_name) + r'}\]'
-                        result = re.sub(pattern, str(value), result)
-                    else:
-                        pattern = r'\[{' + re.escape(var_name) + r'}\]'
-                        result = re.sub(pattern, f"<{var_name}>", result)
-                except Exception as e:
-                    self.logger.error(f"Error al procesar definición {var_name}: {str(e)}")
-                    pattern = r'\[{' + re.escape(var_name) + r'}\]'
-                    result = re.sub(pattern, f"<{var_name}>", result)
-            else:
-                pattern = r'\[{' + re.escape(var_name) + r'}\]'
-                result = re.sub(pattern, f"<{var_name}>", result)
-
-        print("Comienza a procesar variables contextuales")
-        # Procesar variables contextuales
-        for var in doc.contextual_vars:
-            value = self._resolve_contextual_var(var)
-            print(f"Variable contextual: {var.fullname} -> {value}")
-            if value:
-                result = re.sub(r'\[\[' + re.escape(var.type) + r':' + re.escape(var.name) + r'\]\]', str(value), result)
+                node = (token.kind, token.target)
+                task = tasks.get(node)
+                if task is None:
+                    value = await session.table.aresolve(token.kind, token.target)
+                    value = str(value) if value else None
+                else:
+                    if not task.done():
+                        if buffer:
+                            yield ''.join(buffer)
+                            buffer = []
+                        stream = await session.await_stream(node, task)
+                        if stream is not None:
+                            async for delta in stream:
+                                yield delta
+                            value = await task
+                            if stream.error is None:
+                                continue
+                            buffer.append(value)
+                            continue
+                    value = await task
+                buffer.append(content[token.start:token.end] if value is None else value)
             
-        # Procesar variables de metadata
-        for var in doc.metadata_vars:
-            value = self._resolve_metadata_var(var)
-            print(f"Variable de metadata: {var.fullname} -> {value}")
-            if value:
-                result = re.sub(r'\[{' + re.escape(var.type) + r':' + re.escape(var.name) + r'}\]', str(value), result)
-        for var_name, definition in doc.definitions.items():
-            # Extraer el handler de la fuente generativa
-            source_parts = definition.source_var.split(':')
-            if len(source_parts) < 2:
+            if buffer:
+                yield ''.join(buffer)
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+    
+    def _resolve_values(self, session: RenderSession,
+                        executor: Optional[Executor] = None) -> Dict[Tuple[TokenKind, str], Optional[str]]:
+        """
+        Resuelve el valor de cada variable que aparece en el cuerpo del documento.
+        
+        Cada variable distinta se resuelve una sola vez por render: el cuerpo y los
+        prompts comparten la misma tabla de resolución. Las definiciones y variables
+        generativas se ejecutan según el grafo de dependencias de la plantilla, de modo
+        que un prompt que usa `[{doc:x}]` o `{{...}}` recibe el valor ya generado. Con
+        executor cada nodo se envía en cuanto sus dependencias están listas, y si el
+        render tiene límite de tiempo los nodos que no terminaron a tiempo se abandonan.
+        
+        Args:
+            session (RenderSession): Estado del render en curso
+            executor (Executor, optional): Executor para las invocaciones generativas
+            
+        Returns:
+            Dict[Tuple[TokenKind, str], Optional[str]]: Valores indexados por tipo de token
+            y nombre de variable. None indica que el marcador se deja sin reemplazar.
+        """
+        template = session.template
+        template.graph.check()
+        session.table.prefetch(template.lookup_groups)
+        values: Dict[Tuple[TokenKind, str], Optional[str]] = {}
+        
+        for token in template.occurrences:
+            key = (token.kind, token.target)
+            if key in values or key in template.graph:
                 continue
-                
-            handler_key = ':'.join(source_parts[:2]) if len(source_parts) > 2 else source_parts[0] + ':' + source_parts[1]
-            handler = self.generative_handlers.get(handler_key)
-            
-            if not handler:
-                handler = registry.get_generative_handler(handler_key)
-            
-            if handler:
-                try:
-                    # Resolver variables en el prompt
-                    resolved_prompt = self._resolve_variables_in_text(definition.prompt, doc)
-                    var_obj = GenerativeVariable(
-                        category=source_parts[0],
-                        subtype=source_parts[1],
-                        name=source_parts[2] if len(source_parts) > 2 else var_name.split(':')[-1],
-                        prompt=resolved_prompt,
-                        parameters={'format': definition.format} if definition.format else None
-                    )
-                    
-                    value = handler(var_obj)
-                    if value is not None:
-                        pattern = r'\[{' + re.escape(var_name) + r'}\]'
-                        result = re.sub(pattern, str(value), result)
-                    else:
-                        pattern = r'\[{' + re.escape(var_name) + r'}\]'
-                        result = re.sub(pattern, f"<{var_name}>", result)
-                except Exception as e:
-                    self.logger.error(f"Error al procesar definición {var_name}: {str(e)}")
-                    pattern = r'\[{' + re.escape(var_name) + r'}\]'
-                    result = re.sub(pattern, f"<{var_name}>", result)
-            else:
-                pattern = r'\[{' + re.escape(var_name) + r'}\]'
-                result = re.sub(pattern, f"<{var_name}>", result)
+            value = session.table.resolve(token.kind, token.target)
+            values[key] = str(value) if value else None
         
-        # Procesar las variables generativas restantes
-        for var in doc.generative_vars:
-            pattern = re.escape(var.fullname)
-            if re.search(pattern, result): # Solo procesar si aún existe en el resultado
-                handler_key = var.handler_key
-                handler = self.generative_handlers.get(handler_key)
-                
-                if not handler:
-                    handler = registry.get_generative_handler(handler_key)
-                
-                if handler:
-                    try:
-                        if var.prompt:
-                            resolved_prompt = self._resolve_variables_in_text(var.prompt, doc)
-                            var.prompt = resolved_prompt
-                            
-                        value = handler(var)
-                        if value is not None:
-                            result = re.sub(pattern, str(value), result)
-                        else:
-                            result = re.sub(pattern, f"<{handler_key}:{var.name}>", result)
-                    except Exception as e:
-                        self.logger.error(f"Error al procesar variable generativa {var.fullname}: {str(e)}")
-                        result = re.sub(pattern, f"<{handler_key}:{var.name}>", result)
-                else:
-                    result = re.sub(pattern, f"<{handler_key}:{var.name}>", result)
+        runner = self._executor_batch_runner(executor) if executor is not None else None
+        execute = lambda node: self._resolve_node(node, session)
+        prepare = self._batch_preparer(session, runner)
+        if session.deadline is None or executor is None:
+            values.update(template.graph.run(execute, executor, prepare))
+            return values
+        
+        # Con límite de tiempo se espera a los nodos solo hasta agotarlo
+        futures = template.graph.submit(execute, executor, prepare)
+        done, _ = wait(list(futures.values()), timeout=session.deadline.remaining())
+        for node, future in futures.items():
+            values[node] = future.result() if future in done else self._abandon_node(node, session)
+        return values
+    
+    def _batch_preparer(self, session: RenderSession,
+                        runner: Optional[Callable[[Callable], Any]] = None,
+                        asynchronous: bool = False) -> Optional[Callable[[List[Tuple[TokenKind, str]]], Any]]:
+        """
+        Crea la función que agrupa en lotes las invocaciones de los nodos del grafo
+        que quedan listos a la vez.
+        
+        Args:
+            session (RenderSession): Estado del render en curso
+            runner (Callable, optional): Función que ejecuta cada lote preparado (por
+                ejemplo enviándolo a un executor). Por defecto se ejecuta en el acto.
+            asynchronous (bool): Si los nodos se resuelven en el bucle de eventos
+            
+        Returns:
+            La función para `DependencyGraph.run`/`submit`/`schedule`, o None si ningún
+            handler de la plantilla puede generar varias variables en lote
+        """
+        if self.batch_size <= 1:
+            return None
+        template = session.template
+        counts: Dict[str, int] = {}
+        for kind, target in template.graph.dependencies:
+            source = template.definitions[target].source_var if kind is TokenKind.METADATA else target
+            handler_key = ':'.join(source.split(':')[:2])
+            counts[handler_key] = counts.get(handler_key, 0) + 1
+        if not any(count > 1 and self._batch_handler(handler_key) for handler_key, count in counts.items()):
+            return None
+        
+        run = runner or (lambda batch: batch())
+        if asynchronous:
+            return lambda nodes: self._aprepare_batches(nodes, session, run)
+        return lambda nodes: self._prepare_batches(nodes, session, run)
+    
+    def _batch_handler(self, handler_key: str) -> Optional[Callable]:
+        """Obtiene el handler de una handler_key si genera varias variables en lote"""
+        handler = self._get_generative_handler(handler_key)
+        supports_batch = getattr(handler, "supports_batch", None)
+        return handler if supports_batch is not None and supports_batch() else None
+    
+    def _prepare_batches(self, nodes: List[Tuple[TokenKind, str]], session: RenderSession,
+                         run: Callable[[Callable], Any]) -> None:
+        """
+        Agrupa por handler_key las invocaciones de un grupo de nodos listos y prepara
+        un lote por cada `batch_size` variables. Los nodos del grupo esperan después el
+        resultado de su lote en lugar de invocar al handler.
+        
+        Args:
+            nodes (List[Tuple[TokenKind, str]]): Nodos listos para ejecutarse
+            session (RenderSession): Estado del render en curso
+            run (Callable): Función que ejecuta cada lote preparado
+        """
+        if session.deadline is not None and session.deadline.expired():
+            return
+        try:
+            invocations = []
+            for node in nodes:
+                # Los nodos cuyo valor se reutiliza de la cache de valores no se generan
+                if self.output_cache is not None and session.node_key(node) in self.output_cache:
+                    continue
+                invocations.append(self._batch_invocation(node, session, session.table.interpolate))
+        except Exception as e:
+            self.logger.error(f"Error al agrupar variables generativas en lotes: {str(e)}")
+            return
+        for vars, handler in self._batch_groups(invocations):
+            batch = session.ledger.prepare_batch(vars, handler)
+            if batch is not None:
+                run(batch)
+    
+    async def _aprepare_batches(self, nodes: List[Tuple[TokenKind, str]], session: RenderSession,
+                                run: Callable[[Callable], Any]) -> None:
+        """Versión asíncrona de `_prepare_batches`"""
+        if session.deadline is not None and session.deadline.expired():
+            return
+        try:
+            invocations = []
+            for node in nodes:
+                if self.output_cache is not None and await session.anode_key(node) in self.output_cache:
+                    continue
+                invocation = self._batch_invocation(node, session, session.table.ainterpolate)
+                if invocation is not None:
+                    var, handler = invocation
+                    if var.prompt:
+                        var.prompt = await var.prompt
+                invocations.append(invocation)
+        except Exception as e:
+            self.logger.error(f"Error al agrupar variables generativas en lotes: {str(e)}")
+            return
+        for vars, handler in self._batch_groups(invocations):
+            batch = session.ledger.aprepare_batch(vars, handler)
+            if batch is not None:
+                run(batch)
+    
+    def _batch_groups(self, invocations: List[Optional[Tuple[GenerativeVariable, Callable]]]
+                      ) -> Iterator[Tuple[List[GenerativeVariable], Callable]]:
+        """Agrupa las invocaciones por handler_key en lotes de como máximo `batch_size` variables"""
+        groups: Dict[str, Tuple[Callable, List[GenerativeVariable]]] = {}
+        for invocation in invocations:
+            if invocation is not None:
+                var, handler = invocation
+                groups.setdefault(var.handler_key, (handler, []))[1].append(var)
         
-        return result
+        for handler, vars in groups.values():
+            if len(vars) < 2:
+                continue
+            config = getattr(handler, "config", None)
+            size = config.get("batch_size", self.batch_size) if isinstance(config, dict) else self.batch_size
+            size = max(1, size)
+            for start in range(0, len(vars), size):
+                if len(vars[start:start + size]) > 1:
+                    yield vars[start:start + size], handler
+    
+    def _batch_invocation(self, node: Tuple[TokenKind, str], session: RenderSession,
+                          interpolate: Callable) -> Optional[Tuple[GenerativeVariable, Callable]]:
+        """
+        Construye la variable que generará un nodo igual que `_resolve_definition_value`
+        y `_resolve_generative_value`, con el prompt interpolado por `interpolate`.
+        
+        Returns:
+            Tupla (variable, handler), o None si el handler del nodo no genera en lote
+        """
+        kind, target = node
+        template = session.template
+        if kind is TokenKind.METADATA:
+            definition = template.definitions[target]
+            source_parts = definition.source_var.split(':')
+            handler_key = self._tier_key(node, source_parts[0] + ':' + source_parts[1], session)
+            handler = self._batch_handler(handler_key)
+            if handler is None:
+                return None
+            resolved_prompt = interpolate(definition.prompt, template.prompt_tokens.get(definition.prompt))
+            return self._retarget(self._definition_variable(target, definition, resolved_prompt), handler_key), handler
+        
+        var = template.generative_vars.get(f"{{{{{target}}}}}") or self._make_generative_var(target)
+        handler_key = self._tier_key(node, var.handler_key, session)
+        handler = self._batch_handler(handler_key)
+        if handler is None:
+            return None
+        var = replace(self._retarget(var, handler_key), parameters=dict(var.parameters))
+        if var.prompt:
+            var.prompt = interpolate(var.prompt, template.prompt_tokens.get(var.prompt))
+        return var, handler
+    
+    @staticmethod
+    def _executor_batch_runner(executor: Executor) -> Callable[[Callable[[], None]], None]:
+        """Ejecuta los lotes en el executor del render (en el acto si ya se cerró)"""
+        def run(batch: Callable[[], None]) -> None:
+            try:
+                executor.submit(batch)
+            except RuntimeError:
+                batch()
+        return run
+    
+    @staticmethod
+    def _async_batch_runner() -> Callable[[Callable[[], Awaitable[None]]], None]:
+        """Ejecuta los lotes asíncronos como tareas del bucle de eventos"""
+        tasks = set()
+        
+        def run(batch: Callable[[], Awaitable[None]]) -> None:
+            task = asyncio.ensure_future(batch())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        return run
+    
+    def _get_generative_handler(self, handler_key: str) -> Optional[Callable]:
+        """Obtiene la ruta o el handler generativo local o, si no existen, los del registro centralizado"""
+        handler = self.routes.get(handler_key) or self.generative_handlers.get(handler_key)
+        if not handler:
+            handler = registry.get_generative_handler(handler_key)
+        return handler
+    
+    def _tier_key(self, node: Optional[Tuple[TokenKind, str]], handler_key: str, session: RenderSession) -> str:
+        """
+        Elige el nivel con el que se genera un nodo si su handler_key tiene grupo de
+        niveles, según el tiempo que le queda al render y la latencia observada de
+        cada nivel. La elección se guarda en la sesión y se repite para el nodo.
+        
+        Args:
+            node (Tuple[TokenKind, str], optional): Nodo del grafo que se genera
+            handler_key (str): handler_key de la variable
+            session (RenderSession): Estado del render en curso
+            
+        Returns:
+            str: handler_key con el que se genera el nodo
+        """
+        group = self.tier_groups.get(handler_key)
+        if group is None:
+            return handler_key
+        tier = session.tiers.get(node)
+        if tier is None:
+            remaining = session.deadline.remaining() if session.deadline is not None else None
+            tier = group.select(remaining, self.latency_tracker)
+            if node is not None:
+                tier = session.tiers.setdefault(node, tier)
+                if tier is not group.tiers[0]:
+                    session.degraded.add(node)
+        return tier.handler_key
+    
+    @staticmethod
+    def _retarget(var: GenerativeVariable, handler_key: str) -> GenerativeVariable:
+        """Variable dirigida al handler_key de otro nivel (la misma si no cambia)"""
+        if var.handler_key == handler_key:
+            return var
+        category, subtype = handler_key.split(':')[:2]
+        return replace(var, category=category, subtype=subtype)
+    
+    def _get_backend_handler(self, handler_key: str) -> Optional[Callable]:
+        """Obtiene el handler generativo de un backend de una ruta, sin volver a enrutarlo"""
+        handler = self.generative_handlers.get(handler_key)
+        if not handler:
+            handler = registry.get_generative_handler(handler_key, routed=False)
+        return handler
+    
+    def _resolve_definition_value(self, var_name: str, definition: KMCVariableDefinition,
+                                  session: RenderSession) -> str:
+        """
+        Genera el valor de una definición KMC_DEFINITION.
+        
+        Args:
+            var_name (str): Nombre de la variable de metadata definida
+            definition (KMCVariableDefinition): La definición a resolver
+            session (RenderSession): Estado del render en curso
+            
+        Returns:
+            str: El valor generado o el placeholder `<var_name>` si no se pudo generar
+        """
+        # Extraer el handler de la fuente generativa (o del nivel elegido para el render)
+        source_parts = definition.source_var.split(':')
+        handler_key = self._tier_key(current_node.get(), source_parts[0] + ':' + source_parts[1], session)
+        handler = self._get_generative_handler(handler_key)
+        if not handler:
+            return f"<{var_name}>"
+        
+        try:
+            # Resolver variables en el prompt
+            resolved_prompt = session.table.interpolate(
+                definition.prompt, session.template.prompt_tokens.get(definition.prompt))
+            var_obj = self._retarget(self._definition_variable(var_name, definition, resolved_prompt), handler_key)
+            
+            value = session.ledger.invoke(var_obj, handler)
+            return str(value) if value is not None else f"<{var_name}>"
+        except Exception as e:
+            self.logger.error(f"Error al procesar definición {var_name}: {str(e)}")
+            return f"<{var_name}>"
+    
+    async def _aresolve_definition_value(self, var_name: str, definition: KMCVariableDefinition,
+                                         session: RenderSession) -> str:
+        """Versión asíncrona de `_resolve_definition_value`"""
+        source_parts = definition.source_var.split(':')
+        handler_key = self._tier_key(current_node.get(), source_parts[0] + ':' + source_parts[1], session)
+        handler = self._get_generative_handler(handler_key)
+        if not handler:
+            return f"<{var_name}>"
+        
+        try:
+            resolved_prompt = await session.table.ainterpolate(
+                definition.prompt, session.template.prompt_tokens.get(definition.prompt))
+            var_obj = self._retarget(self._definition_variable(var_name, definition, resolved_prompt), handler_key)
+            
+            value = await session.ledger.ainvoke(var_obj, handler)
+            return str(value) if value is not None else f"<{var_name}>"
+        except Exception as e:
+            self.logger.error(f"Error al procesar definición {var_name}: {str(e)}")
+            return f"<{var_name}>"
+    
+    @staticmethod
+    def _definition_variable(var_name: str, definition: KMCVariableDefinition,
+                             resolved_prompt: str) -> GenerativeVariable:
+        """Crea la variable generativa que se pasa al handler de una definición"""
+        source_parts = definition.source_var.split(':')
+        return GenerativeVariable(
+            category=source_parts[0],
+            subtype=source_parts[1],
+            name=source_parts[2] if len(source_parts) > 2 else var_name.split(':')[-1],
+            prompt=resolved_prompt,
+            parameters={'format': definition.format} if definition.format else None
+        )
+    
+    def _resolve_generative_value(self, var: GenerativeVariable, session: RenderSession) -> str:
+        """
+        Genera el valor de una variable generativa que aparece en el cuerpo del documento.
+        
+        Args:
+            var (GenerativeVariable): La variable generativa
+            session (RenderSession): Estado del render en curso
+            
+        Returns:
+            str: El valor generado o el placeholder `<handler_key:nombre>`
+        """
+        handler_key = var.handler_key
+        tier_key = self._tier_key(current_node.get(), handler_key, session)
+        handler = self._get_generative_handler(tier_key)
+        if not handler:
+            return f"<{handler_key}:{var.name}>"
+        
+        try:
+            # Trabajar sobre una copia: la variable pertenece a una plantilla compilada compartida
+            var = replace(self._retarget(var, tier_key), parameters=dict(var.parameters))
+            if var.prompt:
+                var.prompt = session.table.interpolate(var.prompt, session.template.prompt_tokens.get(var.prompt))
+            
+            value = session.ledger.invoke(var, handler)
+            return str(value) if value is not None else f"<{handler_key}:{var.name}>"
+        except Exception as e:
+            self.logger.error(f"Error al procesar variable generativa {var.fullname}: {str(e)}")
+            return f"<{handler_key}:{var.name}>"
+    
+    async def _aresolve_generative_value(self, var: GenerativeVariable, session: RenderSession) -> str:
+        """Versión asíncrona de `_resolve_generative_value`"""
+        handler_key = var.handler_key
+        tier_key = self._tier_key(current_node.get(), handler_key, session)
+        handler = self._get_generative_handler(tier_key)
+        if not handler:
+            return f"<{handler_key}:{var.name}>"
+        
+        try:
+            var = replace(self._retarget(var, tier_key), parameters=dict(var.parameters))
+            if var.prompt:
+                var.prompt = await session.table.ainterpolate(
+                    var.prompt, session.template.prompt_tokens.get(var.prompt))
+            
+            value = await session.ledger.ainvoke(var, handler)
+            return str(value) if value is not None else f"<{handler_key}:{var.name}>"
+        except Exception as e:
+            self.logger.error(f"Error al procesar variable generativa {var.fullname}: {str(e)}")
+            return f"<{handler_key}:{var.name}>"
     
     def auto_register_handlers(self, markdown_path: Optional[str] = None, 
                                markdown_content: Optional[str] = None,
@@ -531,7 +1346,24 @@ class KMCParser:
                 content = f.read()
         else:
             content = markdown_content
+        
+        # Compilar el documento (o reutilizar la plantilla en cache) para identificar todas las variables
+        return self._auto_register_template(self.compile(content), default_handlers)
+    
+    def _auto_register_template(self, template: CompiledTemplate,
+                                default_handlers: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Registra handlers para todas las variables de una plantilla compilada.
+        
+        Args:
+            template (CompiledTemplate): La plantilla compilada
+            default_handlers (Dict, optional): Handlers predefinidos por tipo de variable
             
+        Returns:
+            Dict[str, Dict[str, int]]: Número de variables encontradas por tipo
+        """
+        doc = template.document
+        
         # Configurar handlers predeterminados
         default_handlers = default_handlers or {
             "context": {},
@@ -539,9 +1371,6 @@ class KMCParser:
             "generative": {}
         }
         
-        # Analizar el documento para identificar todas las variables
-        doc = self.parse(content)
-        
         # Estadísticas para el retorno
         stats = {
             "context": {},
@@ -601,9 +1430,15 @@ class KMCParser:
         
     def process_document(self, markdown_path: Optional[str] = None,
                           markdown_content: Optional[str] = None,
-                          default_handlers: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+                          default_handlers: Optional[Dict[str, Dict[str, Any]]] = None,
+                          max_workers: Optional[int] = None,
+                          executor: Optional[Executor] = None,
+                          deadline: Optional[float] = None) -> RenderResult:
         """
         Procesa un documento KMC completo, registrando handlers y renderizando el contenido.
+        
+        `max_workers` y `executor` se pasan a `render()` para el modo concurrente, y
+        `deadline` como presupuesto de tiempo del render.
         """
         # Obtener el contenido del documento
         content = ""
@@ -613,8 +1448,34 @@ class KMCParser:
         else:
             content = markdown_content or ""
             
+        # Compilar una sola vez y reutilizar la plantilla para el registro y el renderizado
+        template = self.compile(content)
+        
         # Auto-registrar handlers con los valores predeterminados
-        self.auto_register_handlers(markdown_content=content, default_handlers=default_handlers)
+        self._auto_register_template(template, default_handlers)
         
         # Renderizar el documento
-        return self.render(content)
\ No newline at end of file
+        return self.render(template, max_workers=max_workers, executor=executor, deadline=deadline)
+    
+    async def aprocess_document(self, markdown_path: Optional[str] = None,
+                                markdown_content: Optional[str] = None,
+                                default_handlers: Optional[Dict[str, Dict[str, Any]]] = None,
+                                deadline: Optional[float] = None) -> RenderResult:
+        """
+        Versión asíncrona de `process_document`, que renderiza con `arender`.
+        """
+        content = ""
+        if markdown_path:
+            content = await asyncio.get_running_loop().run_in_executor(None, self._read_file, markdown_path)
+        else:
+            content = markdown_content or ""
+        
+        template = self.compile(content)
+        self._auto_register_template(template, default_handlers)
+        return await self.arender(template, deadline=deadline)
+    
+    @staticmethod
+    def _read_file(path: str) -> str:
+        """Lee un documento markdown en UTF-8"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""
+Plantillas compiladas del KMC Parser
+"""
+from typing import Dict, List, Optional, Tuple
+import itertools
+import sys
+
+from .lexer import Token, TokenKind, VARIABLE_KINDS, tokenize
+from .models import GenerativeVariable, KMCDocument
+from .core.scheduler import DependencyGraph
+
+# Estimación del coste en memoria de cada token y variable analizada
+_OBJECT_OVERHEAD = 256
+
+
+class CompiledTemplate:
+    """
+    Plantilla KMC compilada.
+
+    Contiene el resultado de analizar un documento una sola vez: tokens, ocurrencias
+    de variables en el cuerpo, definiciones, prompts y dependencias. Una misma
+    plantilla compilada puede renderizarse muchas veces con contextos distintos, por
+    lo que su contenido se trata como inmutable.
+    """
+
+    def __init__(self, content: str, key: str, document: KMCDocument):
+        """
+        Inicializa una plantilla compilada.
+
+        Args:
+            content: Contenido markdown original
+            key: Hash del contenido
+            document: Documento KMC analizado a partir del contenido
+        """
+        self.content = content
+        self.key = key
+        self.document = document
+        self.tokens: List[Token] = document.tokens
+        self.definitions = document.definitions
+        self.prompts = document.prompts
+
+        # Variables que aparecen en el cuerpo del documento (fuera de comentarios KMC)
+        self.occurrences: List[Token] = [token for token in self.tokens if token.kind in VARIABLE_KINDS]
+
+        # Primera variable generativa analizada para cada nombre completo
+        self.generative_vars: Dict[str, GenerativeVariable] = {}
+        for var in document.generative_vars:
+            self.generative_vars.setdefault(var.fullname, var)
+
+        # Tokens de cada prompt, para interpolarlos sin volver a analizarlos en cada render
+        self.prompt_tokens: Dict[str, List[Token]] = {}
+        for definition in self.definitions.values():
+            self.prompt_tokens.setdefault(definition.prompt, tokenize(definition.prompt))
+        for var in self.generative_vars.values():
+            if var.prompt:
+                self.prompt_tokens.setdefault(var.prompt, tokenize(var.prompt))
+
+        # Dependencias de cada definición y de cada variable generativa con prompt
+        self.dependencies: Dict[str, Dict[str, List[str]]] = {
+            var_name: definition.dependencies for var_name, definition in self.definitions.items()
+        }
+        for var in self.generative_vars.values():
+            if var.prompt:
+                self.dependencies.setdefault(
+                    var.fullname, prompt_dependencies(var.prompt, self.prompt_tokens[var.prompt])
+                )
+
+        # Grafo de invocaciones generativas: definiciones y variables generativas del
+        # cuerpo, más las que sus prompts necesitan para encadenar resultados
+        self.graph = self._build_graph()
+
+        # Variables contextuales y de metadata del cuerpo y de los prompts agrupadas por
+        # tipo, para resolver todas las de un mismo tipo con una sola llamada al handler
+        self.lookup_groups = self._lookup_groups()
+
+        self.is_static = all(token.kind is TokenKind.TEXT for token in self.tokens)
+
+        variable_count = (
+            len(document.contextual_vars) + len(document.metadata_vars) + len(document.generative_vars)
+        )
+        prompt_token_count = sum(len(tokens) for tokens in self.prompt_tokens.values())
+        self.size = sys.getsizeof(content) + _OBJECT_OVERHEAD * (
+            len(self.tokens) + variable_count + prompt_token_count
+        )
+
+    def is_generated(self, kind: TokenKind, target: str) -> bool:
+        """
+        Indica si una variable se obtiene invocando un handler generativo.
+
+        Args:
+            kind: Tipo de token
+            target: Nombre de la variable
+
+        Returns:
+            True para variables generativas y para metadata con una definición KMC válida
+        """
+        if kind is TokenKind.GENERATIVE:
+            return True
+        if kind is TokenKind.METADATA:
+            definition = self.definitions.get(target)
+            return bool(definition) and len(definition.source_var.split(':')) >= 2
+        return False
+
+    def node_signature(self, kind: TokenKind, target: str) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        Obtiene la fuente generativa, el prompt sin resolver y el formato de un nodo.
+
+        Args:
+            kind: Tipo de token (METADATA para definiciones o GENERATIVE)
+            target: Nombre de la variable
+
+        Returns:
+            Tupla (fuente generativa, prompt, formato)
+        """
+        if kind is TokenKind.METADATA:
+            definition = self.definitions[target]
+            return definition.source_var, definition.prompt, definition.format
+        var = self.generative_vars.get(f"{{{{{target}}}}}")
+        if var is None:
+            return target, None, None
+        return target, var.prompt, var.parameters.get('format')
+
+    def node_prompt_tokens(self, kind: TokenKind, target: str) -> List[Token]:
+        """Obtiene los tokens del prompt asociado a una definición o variable generativa"""
+        if kind is TokenKind.METADATA:
+            prompt = self.definitions[target].prompt
+        else:
+            var = self.generative_vars.get(f"{{{{{target}}}}}")
+            prompt = var.prompt if var else None
+        if not prompt:
+            return []
+        if prompt not in self.prompt_tokens:
+            self.prompt_tokens[prompt] = tokenize(prompt)
+        return self.prompt_tokens[prompt]
+
+    def _lookup_groups(self) -> Dict[Tuple[TokenKind, str], List[str]]:
+        """Agrupa por (tipo de token, tipo de variable) los nombres de variables a resolver"""
+        groups: Dict[Tuple[TokenKind, str], Dict[str, None]] = {}
+        for token in itertools.chain(self.occurrences, *self.prompt_tokens.values()):
+            if token.kind is not TokenKind.CONTEXTUAL and token.kind is not TokenKind.METADATA:
+                continue
+            # Las definiciones se generan; no las resuelve el handler de metadata
+            if (token.kind, token.target) in self.graph:
+                continue
+            var_type, var_name = token.target.split(':', 1)
+            groups.setdefault((token.kind, var_type), {})[var_name] = None
+        return {group: list(names) for group, names in groups.items()}
+
+    def _build_graph(self) -> DependencyGraph:
+        """
+        Construye el grafo de dependencias entre invocaciones generativas.
+
+        Un nodo depende de las definiciones (`[{tipo:nombre}]` con KMC_DEFINITION) y de
+        las variables generativas que aparecen en su prompt.
+
+        Returns:
+            El grafo de dependencias, con los nodos en orden de documento
+        """
+        dependencies: Dict[Tuple[TokenKind, str], List[Tuple[TokenKind, str]]] = {}
+        pending = [
+            (token.kind, token.target) for token in self.occurrences
+            if self.is_generated(token.kind, token.target)
+        ]
+        index = 0
+        while index < len(pending):
+            node = pending[index]
+            index += 1
+            if node in dependencies:
+                continue
+            deps = [
+                (token.kind, token.target) for token in self.node_prompt_tokens(*node)
+                if self.is_generated(token.kind, token.target)
+            ]
+            dependencies[node] = deps
+            pending.extend(deps)
+
+        return DependencyGraph(dependencies)
+
+    def emit(self, values: Dict[Tuple[TokenKind, str], Optional[str]]) -> str:
+        """
+        Construye el documento renderizado en una única pasada sobre los tokens.
+
+        Args:
+            values: Valores resueltos indexados por (tipo de token, nombre de variable).
+                None indica que el marcador se deja sin reemplazar.
+
+        Returns:
+            El documento renderizado
+        """
+        content = self.content
+        segments = []
+        for token in self.tokens:
+            if token.kind is TokenKind.TEXT:
+                segments.append(content[token.start:token.end])
+            elif token.kind in VARIABLE_KINDS:
+                value = values.get((token.kind, token.target))
+                segments.append(content[token.start:token.end] if value is None else value)
+            # Los comentarios KMC no producen salida
+
+        return ''.join(segments)
+
+    def __repr__(self) -> str:
+        return f"CompiledTemplate(key={self.key[:12]}, tokens={len(self.tokens)}, size={self.size})"
+
+
+def prompt_dependencies(prompt: str, tokens: Optional[List[Token]] = None) -> Dict[str, List[str]]:
+    """
+    Extrae las variables referenciadas en un prompt, con el mismo formato que
+    `KMCVariableDefinition.dependencies`.
+
+    Args:
+        prompt: Texto del prompt
+        tokens: Tokens del prompt ya calculados, si se dispone de ellos
+
+    Returns:
+        Diccionario con las variables encontradas clasificadas por tipo
+    """
+    dependencies = {
+        'context': [],
+        'metadata': [],
+        'generative': []
+    }
+    for token in (tokens if tokens is not None else tokenize(prompt)):
+        if token.kind is TokenKind.CONTEXTUAL:
+            dependencies['context'].append(token.target)
+        elif token.kind is TokenKind.METADATA:
+            dependencies['metadata'].append(token.target)
+        elif token.kind is TokenKind.GENERATIVE:
+            dependencies['generative'].append(token.target)
+    return dependencies
@@ -0,0 +1,29 @@
+"""
+Tests del KMC Parser
+"""
+import unittest
+
+from ..core import registry
+
+
+class RegistryTestCase(unittest.TestCase):
+    """
+    Caso de prueba que restaura el registro global al terminar cada test.
+
+    Los tests que registran handlers o rutas en `registry` heredan de esta clase y
+    llaman a `super().setUp()` y `super().tearDown()` si redefinen esos métodos.
+    """
+
+    def setUp(self):
+        """Guarda el estado del registro global."""
+        self._registry_state = (
+            dict(registry.context_handlers),
+            dict(registry.metadata_handlers),
+            dict(registry.generative_handlers),
+            dict(registry.routes),
+        )
+
+    def tearDown(self):
+        """Restaura el registro global."""
+        (registry.context_handlers, registry.metadata_handlers,
+         registry.generative_handlers, registry.routes) = self._registry_state
@@ -0,0 +1,97 @@
+"""
+Tests para el render asíncrono de documentos KMC.
+"""
+import asyncio
+import time
+import unittest
+from ..parser import KMCParser
+from ..core import registry
+from ..handlers import GenerativeHandler, ContextHandler
+from . import RegistryTestCase
+
+
+class AsyncSummaryHandler(GenerativeHandler):
+    """Handler generativo con hook asíncrono nativo."""
+
+    def _generate_content(self, var):
+        raise AssertionError("arender debe usar el hook asíncrono")
+
+    async def _agenerate_content(self, var):
+        await asyncio.sleep(0.05)
+        return f"async:{var.name}:{var.prompt}"
+
+
+class ProjectHandler(ContextHandler):
+    """Handler contextual síncrono."""
+
+    def _get_context_value(self, var_name):
+        return {"nombre": "Demo"}.get(var_name)
+
+
+class TestKMCAsyncRender(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        registry.register_context_handler("project", ProjectHandler())
+        self.parser = KMCParser()
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+
+        async def coroutine_handler(var):
+            self.en_vuelo += 1
+            self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+            await asyncio.sleep(0.05)
+            self.en_vuelo -= 1
+            return f"coro:{var.name}"
+
+        registry.register_generative_handler("ai:coro", coroutine_handler)
+        self.parser.register_generative_handler("ai:nativo", AsyncSummaryHandler())
+        self.parser.register_generative_handler("ai:sync", lambda var: f"sync:{var.name}:{var.prompt}")
+
+        self.contenido = """# [[project:nombre]]
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:nativo:resumen}}
+PROMPT = "Resume [[project:nombre]]"
+FORMAT = "text/plain"
+-->
+[{doc:resumen}]
+""" + "".join(f"{{{{ai:coro:v{i}}}}}\n" for i in range(6)) + """{{ai:sync:extra}}
+<!-- AI_PROMPT FOR {{ai:sync:extra}}:
+Detalla [[project:nombre]]
+-->"""
+
+    def test_arender_concurrente(self):
+        """arender espera las variables de forma concurrente y usa los hooks asíncronos."""
+        inicio = time.perf_counter()
+        resultado = asyncio.run(self.parser.arender(self.contenido))
+        duracion = time.perf_counter() - inicio
+
+        self.assertIn("# Demo\nasync:resumen:Resume Demo\n", resultado)
+        self.assertIn("coro:v5\n", resultado)
+        self.assertIn("sync:extra:Detalla Demo", resultado)
+        self.assertEqual(resultado.report.handler_invocations, 8)
+        self.assertEqual(self.max_en_vuelo, 6)
+        self.assertLess(duracion, 6 * 0.05)
+
+    def test_mismo_resultado_que_render(self):
+        """render admite handlers corrutina y produce la misma salida que arender."""
+        self.parser.register_generative_handler("ai:nativo", lambda var: f"async:{var.name}:{var.prompt}")
+
+        self.assertEqual(self.parser.render(self.contenido), asyncio.run(self.parser.arender(self.contenido)))
+
+    def test_semaforo_por_handler(self):
+        """El límite de concurrencia por handler_key se aplica también en asyncio."""
+        self.parser.set_concurrency_limit("ai:coro", 2)
+        # El auto-registro añade handlers locales por defecto, que tienen prioridad sobre el registro
+        coroutine_handler = registry.get_generative_handler("ai:coro")
+
+        asyncio.run(self.parser.aprocess_document(
+            markdown_content=self.contenido,
+            default_handlers={"context": {}, "metadata": {}, "generative": {"ai:coro": coroutine_handler}}
+        ))
+
+        self.assertEqual(self.max_en_vuelo, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Tests para la generación en lote de variables generativas.
+"""
+import asyncio
+import unittest
+from ..parser import KMCParser
+from ..core import registry
+from ..handlers.base import GenerativeHandler
+from ..handlers.generative.ai.gpt4 import GPT4Handler
+from ..extensions.api_plugin import StockAPIHandler, WeatherAPIHandler
+from ..models import GenerativeVariable
+from . import RegistryTestCase
+
+
+class LoteHandler(GenerativeHandler):
+    """Handler generativo de prueba que registra sus llamadas individuales y en lote"""
+
+    def __init__(self, config=None, fallos=()):
+        super().__init__(config)
+        self.lotes = []
+        self.individuales = []
+        self.fallos = set(fallos)
+
+    def _generate_content(self, var):
+        self.individuales.append(var.name)
+        return f"({var.name}: {var.prompt})"
+
+    def generate_batch(self, vars):
+        self.lotes.append([var.name for var in vars])
+        return [
+            RuntimeError(var.name) if var.name in self.fallos else f"({var.name}: {var.prompt})"
+            for var in vars
+        ]
+
+
+PLANTILLA = """{{ai:gpt4:a}} {{ai:gpt4:b}} {{ai:gpt4:c}}
+<!-- KMC {{ai:gpt4:a}}:"Prompt a" -->
+<!-- KMC {{ai:gpt4:b}}:"Prompt b" -->
+<!-- KMC {{ai:gpt4:c}}:"Prompt c" -->"""
+
+
+class TestKMCBatchGeneration(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.handler = LoteHandler()
+
+    def _parser(self, handler=None, **kwargs):
+        parser = KMCParser(**kwargs)
+        parser.register_generative_handler("ai:gpt4", handler or self.handler)
+        return parser
+
+    def test_una_llamada_por_lote(self):
+        """Las variables de una oleada con el mismo handler se generan en una llamada."""
+        resultado = self._parser().render(PLANTILLA)
+
+        self.assertEqual(resultado.splitlines()[0], "(a: Prompt a) (b: Prompt b) (c: Prompt c)")
+        self.assertEqual(self.handler.lotes, [["a", "b", "c"]])
+        self.assertEqual(self.handler.individuales, [])
+        self.assertEqual(resultado.report.batch_calls, 1)
+        self.assertEqual(resultado.report.batched_invocations, 3)
+        self.assertEqual(resultado.report.handler_invocations, 1)
+        self.assertEqual(resultado.report.shared_invocations, 0)
+
+    def test_tamano_de_lote(self):
+        """Los lotes no superan batch_size; la configuración del handler tiene prioridad."""
+        self._parser(batch_size=2).render(PLANTILLA)
+        self.assertEqual(self.handler.lotes, [["a", "b"]])
+        self.assertEqual(self.handler.individuales, ["c"])
+
+        handler = LoteHandler({"batch_size": 3})
+        self._parser(handler, batch_size=2).render(PLANTILLA)
+        self.assertEqual(handler.lotes, [["a", "b", "c"]])
+
+    def test_desactivado(self):
+        """Con batch_size=1 cada variable se genera por separado."""
+        resultado = self._parser(batch_size=1).render(PLANTILLA)
+
+        self.assertEqual(self.handler.lotes, [])
+        self.assertEqual(self.handler.individuales, ["a", "b", "c"])
+        self.assertEqual(resultado.report.batch_calls, 0)
+
+    def test_oleadas_dependientes(self):
+        """Una variable cuyo prompt usa otra generativa va en el lote de su oleada."""
+        contenido = PLANTILLA.replace('"Prompt c"', '"Amplía {{ai:gpt4:a}}"')
+
+        resultado = self._parser().render(contenido)
+
+        self.assertEqual(self.handler.lotes, [["a", "b"]])
+        self.assertEqual(self.handler.individuales, ["c"])
+        self.assertIn("(c: Amplía (a: Prompt a))", resultado)
+
+    def test_error_de_una_variable(self):
+        """Un error en un elemento del lote solo afecta a su variable."""
+        handler = LoteHandler(fallos=["b"])
+
+        resultado = self._parser(handler).render(PLANTILLA)
+
+        self.assertEqual(resultado.splitlines()[0], "(a: Prompt a) <ai:gpt4:b> (c: Prompt c)")
+
+    def test_lote_incompleto(self):
+        """Un lote que no retorna un resultado por variable falla para todas."""
+        class Incompleto(LoteHandler):
+            def generate_batch(self, vars):
+                return ["solo uno"]
+
+        resultado = self._parser(Incompleto()).render(PLANTILLA)
+
+        self.assertEqual(resultado.splitlines()[0], "<ai:gpt4:a> <ai:gpt4:b> <ai:gpt4:c>")
+
+    def test_render_con_executor(self):
+        """Con varios hilos el lote se genera una vez y todos los nodos lo esperan."""
+        resultado = self._parser().render(PLANTILLA, max_workers=4)
+
+        self.assertEqual(resultado.splitlines()[0], "(a: Prompt a) (b: Prompt b) (c: Prompt c)")
+        self.assertEqual(self.handler.lotes, [["a", "b", "c"]])
+
+    def test_render_asincrono(self):
+        """arender y astream agrupan en lotes igual que render."""
+        parser = self._parser()
+        resultado = asyncio.run(parser.arender(PLANTILLA))
+
+        async def consumir():
+            return "".join([chunk async for chunk in parser.arender_stream(PLANTILLA)])
+
+        self.assertEqual(resultado.splitlines()[0], "(a: Prompt a) (b: Prompt b) (c: Prompt c)")
+        self.assertEqual(asyncio.run(consumir()), resultado)
+        self.assertEqual(self.handler.lotes, [["a", "b", "c"]] * 2)
+
+    def test_handlers_nativos(self):
+        """Los handlers de APIs y GPT-4 generan en lote lo mismo que por separado."""
+        casos = [
+            (StockAPIHandler({}), ["aapl", "msft", "xyz", "aapl"]),
+            (WeatherAPIHandler({}), ["madrid", "lima", "barcelona"]),
+            (GPT4Handler(), ["resumen", "analisis"]),
+        ]
+        for handler, nombres in casos:
+            variables = [GenerativeVariable("api", "x", nombre, prompt=f"Sobre {nombre}") for nombre in nombres]
+            self.assertTrue(handler.supports_batch())
+            self.assertEqual(handler.generate_batch(variables), [handler.handle(var) for var in variables])
+
+        self.assertFalse(GPT4Handler({"stream": True}).supports_batch())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Tests para la resolución en bloque de variables contextuales y de metadata.
+"""
+import asyncio
+import unittest
+from ..parser import KMCParser
+from ..core import registry
+from ..handlers.base import ContextHandler, MetadataHandler
+from . import RegistryTestCase
+
+
+class ProyectoDB(ContextHandler):
+    """Handler contextual de prueba que simula una consulta por llamada"""
+
+    def __init__(self):
+        super().__init__()
+        self.datos = {"nombre": "Demo", "fase": "piloto", "cliente": "ACME"}
+        self.consultas = []
+
+    def _get_context_value(self, var_name):
+        self.consultas.append([var_name])
+        return self.datos.get(var_name)
+
+    def handle_many(self, names):
+        self.consultas.append(list(names))
+        return {name: self.datos.get(name) for name in names}
+
+
+class DocMetadata(MetadataHandler):
+    """Handler de metadata de prueba sin implementación en bloque"""
+
+    def __init__(self):
+        super().__init__()
+        self.llamadas = []
+
+    def _get_metadata_value(self, var_name):
+        self.llamadas.append(var_name)
+        return {"version": "v2.1", "titulo": "Informe"}.get(var_name, f"<doc:{var_name}>")
+
+
+CONTENIDO = """# [[project:nombre]] ([{doc:version}])
+Cliente: [[project:cliente]] - [[project:nombre]] - [{doc:titulo}]
+{{ai:gpt4:resumen}}
+<!-- KMC {{ai:gpt4:resumen}}:"Resume [[project:nombre]] en fase [[project:fase]]" -->"""
+
+
+class TestKMCBulkLookup(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.proyecto = ProyectoDB()
+        self.doc = DocMetadata()
+        registry.register_context_handler("project", self.proyecto)
+        registry.register_metadata_handler("doc", self.doc)
+        self.parser = KMCParser()
+        self.parser.register_generative_handler("ai:gpt4", lambda var: f"({var.prompt})")
+
+    def test_una_consulta_por_tipo(self):
+        """Todas las variables de un tipo, del cuerpo y de los prompts, se piden en una llamada."""
+        resultado = self.parser.render(CONTENIDO)
+
+        self.assertEqual(self.proyecto.consultas, [["nombre", "cliente", "fase"]])
+        self.assertIn("# Demo (2.1)", resultado)
+        self.assertIn("Cliente: ACME - Demo - Informe", resultado)
+        self.assertIn("(Resume Demo en fase piloto)", resultado)
+        self.assertEqual(resultado.report.bulk_lookups, 2)
+        self.assertEqual(resultado.report.variables_resolved, 5)
+
+    def test_handle_many_por_defecto(self):
+        """Sin implementación propia, handle_many llama a handle para cada nombre."""
+        self.parser.render(CONTENIDO)
+
+        self.assertEqual(self.doc.llamadas, ["version", "titulo"])
+        self.assertEqual(self.doc.handle_many(["titulo"]), {"titulo": "Informe"})
+
+    def test_handlers_funcion(self):
+        """Los handlers registrados como funciones se siguen invocando por nombre."""
+        llamadas = []
+        registry.register_context_handler("project", lambda name: llamadas.append(name) or name.upper())
+
+        resultado = self.parser.render("[[project:nombre]] [[project:fase]]")
+
+        self.assertEqual(resultado, "NOMBRE FASE")
+        self.assertEqual(llamadas, ["nombre", "fase"])
+
+    def test_arender_en_bloque(self):
+        """El render asíncrono también hace una llamada en bloque por tipo."""
+        resultado = asyncio.run(self.parser.arender(CONTENIDO))
+
+        self.assertEqual(self.proyecto.consultas, [["nombre", "cliente", "fase"]])
+        self.assertIn("Cliente: ACME - Demo - Informe", resultado)
+
+    def test_render_stream_en_bloque(self):
+        """El render por fragmentos comparte la resolución en bloque."""
+        resultado = "".join(self.parser.render_stream(CONTENIDO))
+
+        self.assertEqual(self.proyecto.consultas, [["nombre", "cliente", "fase"]])
+        self.assertIn("(Resume Demo en fase piloto)", resultado)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Tests para el render concurrente de documentos KMC.
+"""
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from ..parser import KMCParser
+from ..core import registry
+from ..core.resolution import ResolutionTable
+from ..lexer import TokenKind
+from . import RegistryTestCase
+
+
+def _documento(n):
+    """Genera un documento con n definiciones y n variables generativas en línea."""
+    partes = []
+    for i in range(n):
+        partes.append(f"""<!-- KMC_DEFINITION FOR [{{doc:seccion{i}}}]:
+GENERATIVE_SOURCE = {{{{ai:lento:seccion{i}}}}}
+PROMPT = "Escribe la sección {i} de [[project:nombre]]"
+FORMAT = "text/plain"
+-->
+""")
+    for i in range(n):
+        partes.append(f"## [{{doc:seccion{i}}}]\n{{{{ai:lento:nota{i}}}}}\n")
+    return "".join(partes)
+
+
+class TestKMCConcurrentRender(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        registry.register_context_handler("project", lambda var: "Demo" if var == "nombre" else None)
+
+        self.parser = KMCParser()
+        self.lock = threading.Lock()
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+
+        def slow_handler(var):
+            with self.lock:
+                self.en_vuelo += 1
+                self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+            time.sleep(0.05)
+            with self.lock:
+                self.en_vuelo -= 1
+            return f"<{var.name}|{var.prompt}>"
+
+        self.parser.register_generative_handler("ai:lento", slow_handler)
+
+    def test_salida_identica_al_modo_secuencial(self):
+        """El render concurrente produce exactamente la misma salida que el secuencial."""
+        contenido = _documento(6)
+
+        secuencial = self.parser.render(contenido)
+        concurrente = self.parser.render(contenido, max_workers=8)
+
+        self.assertEqual(concurrente, secuencial)
+        self.assertEqual(concurrente.report.handler_invocations, 12)
+        self.assertGreater(self.max_en_vuelo, 1)
+
+    def test_executor_propio(self):
+        """Se puede usar un executor externo, que no se cierra al terminar."""
+        contenido = _documento(4)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            inicio = time.perf_counter()
+            resultado = self.parser.render(contenido, executor=executor)
+            duracion = time.perf_counter() - inicio
+            # El executor sigue disponible después del render
+            self.assertEqual(executor.submit(lambda: 1).result(), 1)
+
+        self.assertEqual(resultado, self.parser.render(contenido))
+        self.assertLess(duracion, 8 * 0.05)
+
+    def test_limite_por_handler(self):
+        """El límite de concurrencia por handler_key se respeta en modo concurrente."""
+        self.parser.set_concurrency_limit("ai:lento", 2)
+
+        self.parser.render(_documento(5), max_workers=10)
+
+        self.assertEqual(self.max_en_vuelo, 2)
+        with self.assertRaises(ValueError):
+            self.parser.set_concurrency_limit("ai:lento", 0)
+
+    def test_variables_resueltas_fuera_del_lock(self):
+        """Variables distintas se resuelven a la vez y cada una una sola vez."""
+        llamadas = []
+        resolviendo = [0, 0]
+
+        def lento(var_type, var_name):
+            with self.lock:
+                llamadas.append(var_name)
+                resolviendo[0] += 1
+                resolviendo[1] = max(resolviendo)
+            time.sleep(0.05)
+            with self.lock:
+                resolviendo[0] -= 1
+            return var_name.upper()
+
+        tabla = ResolutionTable({TokenKind.CONTEXTUAL: lento})
+        nombres = ["dato:a", "dato:b", "dato:comun", "dato:comun", "dato:c", "dato:comun"]
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            valores = list(executor.map(lambda nombre: tabla.resolve(TokenKind.CONTEXTUAL, nombre), nombres))
+
+        self.assertEqual(valores, ["A", "B", "COMUN", "COMUN", "C", "COMUN"])
+        self.assertEqual(sorted(llamadas), ["a", "b", "c", "comun"])
+        self.assertEqual(tabla.resolved, 4)
+        self.assertGreater(resolviendo[1], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Tests para la cache de datos de handlers contextuales y de metadata.
+"""
+import json
+import os
+import tempfile
+import unittest
+from ..parser import KMCParser
+from ..core import registry, DataCache
+from ..handlers.context.project import ProjectHandler
+from ..handlers.metadata.doc import DocumentMetadataHandler
+from . import RegistryTestCase
+
+
+class TestKMCDataCache(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "proyecto.json")
+        self._escribir({"nombre": "Demo", "estado": "Activo"})
+        self.cache = DataCache()
+
+    def tearDown(self):
+        """Restaura el registro global y elimina los ficheros temporales."""
+        super().tearDown()
+        self._tmp.cleanup()
+
+    def _escribir(self, datos, mtime=None):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        if mtime is not None:
+            os.utime(self.path, ns=(mtime, mtime))
+
+    def test_carga_perezosa_y_unica(self):
+        """El archivo se lee al primer uso y una sola vez para todas las variables."""
+        handler = ProjectHandler({"project_path": self.path, "data_cache": self.cache})
+        self.assertEqual(self.cache.stats()["loads"], 0)
+
+        registry.register_context_handler("project", handler)
+        resultado = KMCParser().render("[[project:nombre]] - [[project:estado]] - [[project:cliente]]")
+
+        self.assertEqual(resultado, "Demo - Activo - <project:cliente>")
+        self.assertEqual(self.cache.stats()["loads"], 1)
+
+    def test_handlers_comparten_la_carga(self):
+        """Varios handlers con la misma ruta comparten los datos cargados."""
+        for _ in range(3):
+            ProjectHandler({"project_path": self.path, "data_cache": self.cache}).handle("nombre")
+
+        self.assertEqual(self.cache.stats()["loads"], 1)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_recarga_al_cambiar_el_archivo(self):
+        """Un cambio de mtime o tamaño del archivo provoca una nueva carga."""
+        handler = ProjectHandler({"project_path": self.path, "data_cache": self.cache})
+        self.assertEqual(handler.handle("nombre"), "Demo")
+
+        self._escribir({"nombre": "Demo renombrado"}, mtime=10 ** 18)
+
+        self.assertEqual(handler.handle("nombre"), "Demo renombrado")
+        self.assertEqual(self.cache.stats()["reloads"], 1)
+
+    def test_intervalo_de_validacion(self):
+        """Dentro del intervalo de validación no se consulta la firma de la fuente."""
+        ahora = [0.0]
+        firmas = []
+        cache = DataCache(check_interval=5, clock=lambda: ahora[0])
+
+        def validador():
+            firmas.append(ahora[0])
+            return "etag-1"
+
+        for instante in (0, 1, 2, 6):
+            ahora[0] = instante
+            cache.load("fuente", lambda: {"a": 1}, validador)
+
+        self.assertEqual(firmas, [0, 6])
+
+    def test_etag_del_handler(self):
+        """Un validador basado en ETag recarga los datos cuando el ETag cambia."""
+        version = ["v1"]
+        cargas = []
+
+        def cargar():
+            cargas.append(version[0])
+            return {"valor": version[0]}
+
+        self.assertEqual(self.cache.load("kb", cargar, lambda: version[0])["valor"], "v1")
+        self.assertEqual(self.cache.load("kb", cargar, lambda: version[0])["valor"], "v1")
+        version[0] = "v2"
+        self.assertEqual(self.cache.load("kb", cargar, lambda: version[0])["valor"], "v2")
+        self.assertEqual(cargas, ["v1", "v2"])
+
+    def test_get_many(self):
+        """get_many obtiene varios valores con una sola carga."""
+        handler = DocumentMetadataHandler({"doc_id": "informe", "data_cache": self.cache})
+
+        valores = handler.get_many(["titulo", "version", "inexistente"])
+
+        self.assertEqual(valores, {"titulo": "Documento informe", "version": "1.0", "inexistente": "<doc:inexistente>"})
+        self.assertEqual(self.cache.stats(), {"hits": 0, "loads": 1, "reloads": 0, "entries": 1})
+
+    def test_invalidacion(self):
+        """Las fuentes sin validador se mantienen hasta invalidarlas."""
+        datos = {"a": 1}
+        self.cache.load("fuente", lambda: dict(datos))
+        datos["a"] = 2
+        self.assertEqual(self.cache.load("fuente", lambda: dict(datos))["a"], 1)
+
+        self.cache.invalidate("fuente")
+        self.assertEqual(self.cache.load("fuente", lambda: dict(datos))["a"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
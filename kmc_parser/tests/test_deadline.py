@@ -0,0 +1,211 @@
+"""
+Tests para los renders con límite de tiempo y salida parcial.
+"""
+import asyncio
+import threading
+import time
+import unittest
+from ..parser import KMCParser
+from ..models import VariableStatus
+from ..core import registry, Deadline, DeadlineExceeded, Resilience, RetryPolicy, remaining_time
+from ..core.cache import OutputCache
+from ..handlers.base import GenerativeHandler
+from . import RegistryTestCase
+
+
+def documento(*nombres):
+    return " ".join(f"{{{{ai:gpt4:{nombre}}}}}" for nombre in nombres)
+
+
+class TestKMCDeadline(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.liberar = threading.Event()
+
+    def tearDown(self):
+        """Restaura el registro global."""
+        self.liberar.set()
+        super().tearDown()
+
+    def _parser(self, handler, **kwargs):
+        parser = KMCParser(batch_size=1, **kwargs)
+        parser.register_generative_handler("ai:gpt4", handler)
+        return parser
+
+    def _con_rezagado(self, var):
+        """Handler que bloquea las variables llamadas `lenta` hasta el final del test"""
+        if var.name == "lenta":
+            self.liberar.wait(5)
+        if var.name == "rota":
+            raise ValueError("fallo del proveedor")
+        return var.name.upper()
+
+    def test_limite_de_tiempo(self):
+        """El presupuesto se agota y el reloj indica el tiempo restante."""
+        ahora = [0.0]
+        limite = Deadline(2, clock=lambda: ahora[0])
+
+        self.assertEqual(limite.remaining(), 2)
+        ahora[0] = 3
+        self.assertEqual(limite.remaining(), 0)
+        self.assertTrue(limite.expired())
+        with self.assertRaises(DeadlineExceeded):
+            limite.check()
+
+    def test_salida_parcial(self):
+        """Los nodos rezagados se abandonan con su placeholder y su estado."""
+        parser = self._parser(self._con_rezagado)
+
+        inicio = time.monotonic()
+        resultado = parser.render(documento("rapida", "lenta", "rota"), deadline=0.2, max_workers=3)
+
+        self.assertLess(time.monotonic() - inicio, 2)
+        self.assertEqual(resultado, "RAPIDA <ai:gpt4:lenta> <ai:gpt4:rota>")
+        self.assertTrue(resultado.report.deadline_exceeded)
+        self.assertEqual(resultado.report.variable_status, {
+            "{{ai:gpt4:rapida}}": "resolved",
+            "{{ai:gpt4:lenta}}": "timed_out",
+            "{{ai:gpt4:rota}}": "failed",
+        })
+
+    def test_limite_sin_hilos_en_paralelo(self):
+        """Sin max_workers, un render con límite invoca los handlers de uno en uno."""
+        lock = threading.Lock()
+        en_curso = [0, 0]
+
+        def handler(var):
+            with lock:
+                en_curso[0] += 1
+                en_curso[1] = max(en_curso)
+            time.sleep(0.01)
+            with lock:
+                en_curso[0] -= 1
+            return var.name.upper()
+
+        resultado = self._parser(handler).render(documento("a", "b", "c", "d"), deadline=5)
+
+        self.assertEqual(resultado, "A B C D")
+        self.assertEqual(en_curso[1], 1)
+
+    def test_dependientes_de_un_nodo_abandonado(self):
+        """Un prompt que depende de un nodo abandonado no llega a invocar al handler."""
+        llamadas = []
+
+        def handler(var):
+            llamadas.append(var.name)
+            return self._con_rezagado(var)
+
+        contenido = """<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:lenta}}
+PROMPT = "Resume el proyecto"
+-->
+[{doc:resumen}] / {{ai:gpt4:titulo}}
+<!-- AI_PROMPT FOR {{ai:gpt4:titulo}}:
+Título para [{doc:resumen}]
+-->"""
+        resultado = self._parser(handler).render(contenido, deadline=0.1)
+
+        self.assertEqual(resultado.strip(), "<doc:resumen> / <ai:gpt4:titulo>")
+        self.assertEqual(llamadas, ["lenta"])
+        self.assertEqual(set(resultado.report.variable_status.values()), {"timed_out"})
+
+    def test_estado_cached(self):
+        """Los nodos reutilizados de la cache de valores se marcan como cached."""
+        parser = self._parser(lambda var: var.name, output_cache=OutputCache())
+
+        parser.render(documento("a"))
+        resultado = parser.render(documento("a", "b"), deadline=5)
+
+        self.assertFalse(resultado.report.deadline_exceeded)
+        self.assertEqual(resultado.report.variable_status,
+                         {"{{ai:gpt4:a}}": VariableStatus.CACHED.value, "{{ai:gpt4:b}}": "resolved"})
+
+    def test_tiempo_restante_en_el_handler(self):
+        """Los handlers consultan el tiempo que les queda con remaining_time()."""
+        restantes = []
+
+        def handler(var):
+            restantes.append(remaining_time())
+            return var.name
+
+        parser = self._parser(handler)
+        parser.render(documento("a"), deadline=10)
+        parser.render(documento("b"))
+
+        self.assertTrue(0 < restantes[0] <= 10)
+        self.assertIsNone(restantes[1])
+
+    def test_sin_reintentos_fuera_de_plazo(self):
+        """No se reintenta si la espera no cabe en el tiempo restante."""
+        llamadas = []
+
+        def handler(var):
+            llamadas.append(var.name)
+            raise ConnectionError("caído")
+
+        capa = Resilience(RetryPolicy(base_delay=30, jitter=0), sleep=lambda segundos: None)
+        resultado = self._parser(handler, resilience=capa).render(documento("a"), deadline=5)
+
+        self.assertEqual(llamadas, ["a"])
+        self.assertEqual(resultado.report.retries, 0)
+        self.assertEqual(resultado.report.variable_status, {"{{ai:gpt4:a}}": "failed"})
+
+    def test_render_asincrono(self):
+        """En asyncio las tareas rezagadas se cancelan al agotar el límite."""
+        canceladas = []
+
+        async def handler(var):
+            if var.name == "lenta":
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    canceladas.append(var.name)
+                    raise
+            return var.name.upper()
+
+        async def main():
+            resultado = await self._parser(handler).arender(documento("rapida", "lenta"), deadline=0.1)
+            await asyncio.sleep(0)
+            return resultado
+
+        resultado = asyncio.run(main())
+
+        self.assertEqual(resultado, "RAPIDA <ai:gpt4:lenta>")
+        self.assertEqual(canceladas, ["lenta"])
+        self.assertEqual(resultado.report.variable_status,
+                         {"{{ai:gpt4:rapida}}": "resolved", "{{ai:gpt4:lenta}}": "timed_out"})
+
+    def test_tiempo_restante_en_handlers_de_clase(self):
+        """Los handlers de clase síncronos ven el límite también desde arender."""
+        restante = {}
+
+        class Medidor(GenerativeHandler):
+            def _generate_content(handler_self, var):
+                restante[var.name] = remaining_time()
+                return var.name.upper()
+
+        resultado = asyncio.run(self._parser(Medidor()).arender(documento("a"), deadline=5))
+
+        self.assertEqual(resultado, "A")
+        self.assertIsNotNone(restante["a"])
+        self.assertLessEqual(restante["a"], 5)
+
+    def test_procesar_documento(self):
+        """process_document y aprocess_document aplican el límite al render."""
+        async def handler(var):
+            if var.name == "lenta":
+                await asyncio.sleep(5)
+            return var.name.upper()
+
+        contenido = documento("rapida", "lenta")
+        resultado = self._parser(self._con_rezagado).process_document(markdown_content=contenido, deadline=0.2)
+        aresultado = asyncio.run(self._parser(handler).aprocess_document(markdown_content=contenido, deadline=0.1))
+
+        for resultado in (resultado, aresultado):
+            self.assertEqual(resultado, "RAPIDA <ai:gpt4:lenta>")
+            self.assertTrue(resultado.report.deadline_exceeded)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Tests para la capa de invocación de handlers generativos.
+"""
+import unittest
+from ..parser import KMCParser
+from ..core import registry
+from ..core.dispatch import InvocationLedger
+from ..models import GenerativeVariable
+from . import RegistryTestCase
+
+
+class TestInvocationLedger(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.parser = KMCParser()
+        self.calls = []
+
+        def ai_handler(var):
+            self.calls.append((var.name, var.prompt))
+            return f"[{var.name}: {var.prompt}]"
+
+        self.parser.register_generative_handler("ai:gpt4", ai_handler)
+
+    def test_definiciones_equivalentes_comparten_invocacion(self):
+        """Definiciones con la misma fuente, prompt y formato invocan el handler una vez."""
+        contenido = """<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume el proyecto"
+FORMAT = "text/plain"
+-->
+<!-- KMC_DEFINITION FOR [{doc:sumario}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume el proyecto"
+FORMAT = "text/plain"
+-->
+<!-- KMC_DEFINITION FOR [{doc:otro}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume el proyecto"
+FORMAT = "markdown"
+-->
+[{doc:resumen}] [{doc:sumario}] [{doc:otro}]"""
+
+        resultado = self.parser.render(contenido)
+
+        self.assertEqual(resultado.count("[extract: Resume el proyecto]"), 3)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(resultado.report.handler_invocations, 2)
+        self.assertEqual(resultado.report.shared_invocations, 1)
+        self.assertEqual(resultado.report.invocations_by_handler, {"ai:gpt4": 2})
+
+    def test_reporte_en_documento_estatico(self):
+        """Un documento sin marcadores retorna un reporte vacío."""
+        resultado = self.parser.render("Sin variables")
+
+        self.assertEqual(resultado, "Sin variables")
+        self.assertEqual(resultado.report.handler_invocations, 0)
+        self.assertEqual(resultado.report.variables_resolved, 0)
+
+    def test_errores_compartidos(self):
+        """Un error del handler se comparte con todos los solicitantes sin reintentar."""
+        ledger = InvocationLedger()
+        intentos = []
+
+        def failing_handler(var):
+            intentos.append(var.name)
+            raise RuntimeError("fallo")
+
+        for _ in range(3):
+            var = GenerativeVariable(category="ai", subtype="gpt4", name="extract", prompt="p")
+            with self.assertRaises(RuntimeError):
+                ledger.invoke(var, failing_handler)
+
+        self.assertEqual(intentos, ["extract"])
+        self.assertEqual((ledger.invocations, ledger.shared), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+"""
+Tests para el gobernador de ritmo y de invocaciones en vuelo por handler.
+"""
+import asyncio
+import threading
+import time
+import unittest
+from ..parser import KMCParser
+from ..core import registry, ConcurrencyLimits, DeadlineExceeded
+from ..core.concurrency import TokenBucket
+from ..extensions.api_plugin import ExternalAPIsPlugin
+from ..handlers.base import GenerativeHandler
+from . import RegistryTestCase
+
+
+class LentoHandler(GenerativeHandler):
+    """Handler generativo asíncrono de prueba que mide las llamadas simultáneas"""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+
+    def _generate_content(self, var):
+        return var.name
+
+    async def _agenerate_content(self, var):
+        self.en_vuelo += 1
+        self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        await asyncio.sleep(0.01)
+        self.en_vuelo -= 1
+        return var.name
+
+
+def documento(n):
+    return " ".join(f"{{{{ai:lento:v{i}}}}}" for i in range(n))
+
+
+class TestKMCGovernor(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+
+    def test_cubo_de_tokens(self):
+        """El cubo permite una ráfaga y después reparte las llamadas al ritmo fijado."""
+        ahora = [0.0]
+        cubo = TokenBucket(rate=2, burst=2, clock=lambda: ahora[0])
+
+        self.assertEqual([cubo.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+        ahora[0] = 2.0
+        self.assertEqual(cubo.reserve(), 0.0)
+
+    def test_ritmo_desde_la_configuracion_del_handler(self):
+        """El ritmo de la configuración del handler espacia sus invocaciones."""
+        parser = KMCParser(batch_size=1)
+        parser.register_generative_handler("ai:lento", LentoHandler({"rate_limit": 50, "rate_burst": 1}))
+
+        inicio = time.monotonic()
+        resultado = parser.render(documento(4))
+
+        self.assertEqual(resultado, "v0 v1 v2 v3")
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.05)
+        stats = parser.concurrency_limits.stats()["ai:lento"]
+        self.assertEqual(stats["acquired"], 4)
+        self.assertEqual(stats["throttled"], 3)
+        self.assertGreater(stats["wait_max"], 0)
+        self.assertEqual(stats["rate_limit"], 50)
+
+    def test_limite_en_vuelo_asincrono(self):
+        """max_in_flight limita las tareas simultáneas y contabiliza las esperas."""
+        handler = LentoHandler({"max_in_flight": 2})
+        parser = KMCParser(batch_size=1)
+        parser.register_generative_handler("ai:lento", handler)
+
+        resultado = asyncio.run(parser.arender(documento(6)))
+
+        self.assertEqual(resultado, " ".join(f"v{i}" for i in range(6)))
+        self.assertEqual(handler.max_en_vuelo, 2)
+        stats = parser.concurrency_limits.stats()["ai:lento"]
+        self.assertEqual(stats["queued"], 4)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_limite_explicito_tiene_prioridad(self):
+        """Un límite fijado en el parser prevalece sobre la configuración del handler."""
+        handler = LentoHandler({"max_in_flight": 4})
+        parser = KMCParser(batch_size=1)
+        parser.set_concurrency_limit("ai:lento", 1)
+        parser.register_generative_handler("ai:lento", handler)
+
+        asyncio.run(parser.arender(documento(4)))
+
+        self.assertEqual(handler.max_en_vuelo, 1)
+
+    def test_compartido_entre_hilos_y_tareas(self):
+        """Un hilo y una tarea de asyncio comparten el mismo hueco."""
+        limites = ConcurrencyLimits({"api:x": 1})
+        eventos = []
+        dentro = threading.Event()
+        liberar = threading.Event()
+
+        def hilo():
+            with limites.slot("api:x"):
+                eventos.append("hilo")
+                dentro.set()
+                liberar.wait(5)
+
+        async def tarea():
+            async with limites.aslot("api:x"):
+                eventos.append("tarea")
+
+        trabajador = threading.Thread(target=hilo)
+        trabajador.start()
+        dentro.wait(5)
+
+        async def main():
+            pendiente = asyncio.ensure_future(tarea())
+            await asyncio.sleep(0.02)
+            self.assertEqual(eventos, ["hilo"])
+            liberar.set()
+            await pendiente
+
+        asyncio.run(main())
+        trabajador.join()
+        self.assertEqual(eventos, ["hilo", "tarea"])
+        self.assertEqual(limites.stats()["api:x"]["queued"], 1)
+
+    def test_cancelacion_no_pierde_huecos(self):
+        """Una tarea cancelada mientras espera no se queda con el hueco."""
+        limites = ConcurrencyLimits({"api:x": 1})
+
+        async def main():
+            async with limites.aslot("api:x"):
+                esperando = asyncio.ensure_future(limites.aslot("api:x").__aenter__())
+                await asyncio.sleep(0)
+                esperando.cancel()
+                await asyncio.sleep(0)
+            async with limites.aslot("api:x"):
+                return limites.stats()["api:x"]["in_flight"]
+
+        self.assertEqual(asyncio.run(main()), 1)
+
+    def test_esperas_acotadas(self):
+        """Sin tiempo para el turno se renuncia sin consumir tokens ni ocupar huecos."""
+        ahora = [0.0]
+        cubo = TokenBucket(rate=1, burst=1, clock=lambda: ahora[0])
+        self.assertEqual(cubo.reserve(timeout=0), 0.0)
+        self.assertIsNone(cubo.reserve(timeout=0.5))
+        self.assertEqual(cubo.reserve(timeout=1), 1.0)
+
+        limites = ConcurrencyLimits({"api:x": 1})
+        with limites.slot("api:x"):
+            with self.assertRaises(DeadlineExceeded):
+                with limites.slot("api:x", timeout=0.02):
+                    pass
+
+            async def tarea():
+                async with limites.aslot("api:x", timeout=0.02):
+                    pass
+
+            with self.assertRaises(DeadlineExceeded):
+                asyncio.run(tarea())
+        with limites.slot("api:x", timeout=0):
+            self.assertEqual(limites.stats()["api:x"]["in_flight"], 1)
+
+    def test_token_devuelto_sin_hueco(self):
+        """Si el hueco no llega a tiempo, el token reservado del ritmo se devuelve."""
+        limites = ConcurrencyLimits({"api:x": 1}, clock=lambda: 0.0)
+        limites.set_rate("api:x", 1, burst=2)
+
+        with limites.slot("api:x"):
+            for _ in range(3):
+                with self.assertRaises(DeadlineExceeded):
+                    with limites.slot("api:x", timeout=0.01):
+                        pass
+
+            async def tarea():
+                async with limites.aslot("api:x", timeout=0.01):
+                    pass
+
+            with self.assertRaises(DeadlineExceeded):
+                asyncio.run(tarea())
+
+        # Queda el segundo token del cubo: la llamada no espera al ritmo
+        with limites.slot("api:x", timeout=0):
+            self.assertEqual(limites.stats()["api:x"]["in_flight"], 1)
+
+    def test_render_con_limite_no_espera_turno(self):
+        """Un render con deadline no espera un hueco que no llegará a tiempo."""
+        liberar = threading.Event()
+        self.addCleanup(liberar.set)
+
+        def bloqueante(var):
+            liberar.wait(5)
+            return var.name
+
+        ocupado = KMCParser(batch_size=1, concurrency_limits={"ai:lento": 1})
+        ocupado.register_generative_handler("ai:lento", bloqueante)
+        hilo = threading.Thread(target=ocupado.render, args=(documento(1),))
+        hilo.start()
+        self.addCleanup(hilo.join)
+        time.sleep(0.02)
+
+        parser = KMCParser(batch_size=1, concurrency_limits=ocupado.concurrency_limits)
+        parser.register_generative_handler("ai:lento", LentoHandler())
+        resultado = parser.render("{{ai:lento:otra}}", deadline=0.05)
+        self.assertEqual(resultado, "<ai:lento:otra>")
+
+        # La espera del hueco también termina con el límite, en lugar de quedarse en la cola
+        puerta = ocupado.concurrency_limits._gates["ai:lento"]
+        fin = time.monotonic() + 1
+        while puerta._waiters and time.monotonic() < fin:
+            time.sleep(0.005)
+        self.assertEqual(len(puerta._waiters), 0)
+        self.assertEqual(puerta.active, 1)
+        liberar.set()
+
+    def test_configuracion_del_plugin(self):
+        """ExternalAPIsPlugin traslada sus límites a la configuración de los handlers."""
+        plugin = ExternalAPIsPlugin({"stock_rate_limit": 5, "weather_max_in_flight": 2})
+        plugin.register_handlers()
+
+        self.assertEqual(registry.get_generative_handler("api:stock").config["rate_limit"], 5)
+        self.assertEqual(registry.get_generative_handler("api:weather").config["max_in_flight"], 2)
+
+        limites = ConcurrencyLimits()
+        limites.configure("api:stock", registry.get_generative_handler("api:stock"))
+        self.assertEqual(limites.get_rate("api:stock"), 5)
+        self.assertIsNone(limites.get_limit("api:stock"))
+
+
+if __name__ == '__main__':
+    unittest.main()
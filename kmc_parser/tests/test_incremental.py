@@ -0,0 +1,142 @@
+"""
+Tests para el re-análisis incremental de documentos KMC.
+"""
+import unittest
+from ..parser import KMCParser
+from ..lexer import tokenize
+
+
+CONTENIDO = """# [[project:nombre]] [{doc:version}]
+{{ai:gpt4:analisis}}
+<!-- AI_PROMPT FOR {{ai:gpt4:analisis}}:
+Analiza [[project:nombre]]
+-->
+<!-- KMC {{ai:gpt4:otro}}:"Resume [{doc:titulo}]" FORMAT "text/plain" -->
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume [[project:nombre]]"
+FORMAT = "text/plain"
+-->
+{{ai:gpt4:otro}} [{doc:resumen}] [[user:email]]
+Texto final sin variables.
+"""
+
+
+class TestIncrementalParse(unittest.TestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        self.parser = KMCParser()
+
+    def _edit(self, doc, offset, deleted_len, inserted_text):
+        """Aplica la edición y comprueba que el documento coincide con un análisis completo."""
+        changes = doc.apply_edit(offset, deleted_len, inserted_text)
+        expected = self.parser.parse(doc.content)
+
+        self.assertEqual(doc.tokens, tokenize(doc.content))
+        self.assertEqual(doc.contextual_vars, expected.contextual_vars)
+        self.assertEqual(doc.metadata_vars, expected.metadata_vars)
+        self.assertEqual(doc.generative_vars, expected.generative_vars)
+        self.assertEqual(doc.prompts, expected.prompts)
+        self.assertEqual(
+            {name: d.to_dict() for name, d in doc.definitions.items()},
+            {name: d.to_dict() for name, d in expected.definitions.items()}
+        )
+        return changes
+
+    def test_edicion_dentro_de_variable(self):
+        """Renombrar una variable la reporta como eliminada y añadida."""
+        doc = self.parser.parse(CONTENIDO)
+        offset = CONTENIDO.index("user:email") + len("user:")
+
+        changes = self._edit(doc, offset, len("email"), "telefono")
+
+        self.assertEqual(changes.added, ["[[user:telefono]]"])
+        self.assertEqual(changes.removed, ["[[user:email]]"])
+        self.assertEqual(changes.changed, [])
+
+    def test_edicion_en_texto_no_cambia_variables(self):
+        """Escribir texto plano solo re-tokeniza la región afectada."""
+        doc = self.parser.parse(CONTENIDO)
+        tokens_previos = list(doc.tokens)
+        offset = CONTENIDO.index("Texto final")
+
+        changes = self._edit(doc, offset, 0, "Más ")
+
+        self.assertEqual((changes.added, changes.removed, changes.changed), ([], [], []))
+        self.assertLess(changes.relexed[1] - changes.relexed[0], len(doc.content))
+        # Los tokens anteriores a la edición se conservan
+        self.assertIs(doc.tokens[0], tokens_previos[0])
+
+    def test_crear_y_eliminar_comentario(self):
+        """Un prompt inline nuevo cambia el prompt de la variable existente."""
+        doc = self.parser.parse(CONTENIDO)
+        comentario = '<!-- KMC {{ai:gpt4:analisis}}:"Nuevo prompt" -->\n'
+        offset = CONTENIDO.index("{{ai:gpt4:otro}} [{doc:resumen}]")
+
+        changes = self._edit(doc, offset, 0, comentario)
+
+        self.assertIn("{{ai:gpt4:analisis}}", changes.changed)
+        self.assertEqual(changes.added, ["{{ai:gpt4:analisis}}"])
+        self.assertEqual(doc.generative_vars[0].prompt, "Nuevo prompt")
+
+        changes = self._edit(doc, offset, len(comentario), "")
+
+        self.assertEqual(changes.removed, ["{{ai:gpt4:analisis}}"])
+        self.assertEqual(doc.generative_vars[0].prompt, "Analiza [[project:nombre]]")
+
+    def test_editar_prompt_de_definicion(self):
+        """Cambiar el prompt de una definición la reporta como modificada."""
+        doc = self.parser.parse(CONTENIDO)
+        definicion_anterior = doc.definitions["doc:resumen"]
+        offset = CONTENIDO.index('PROMPT = "Resume') + len('PROMPT = "')
+
+        changes = self._edit(doc, offset, len("Resume"), "Sintetiza")
+
+        self.assertEqual(changes.changed, ["[{doc:resumen}]"])
+        self.assertIsNot(doc.definitions["doc:resumen"], definicion_anterior)
+        self.assertEqual(doc.definitions["doc:resumen"].prompt, "Sintetiza [[project:nombre]]")
+
+    def test_borrado_entre_tokens(self):
+        """Un borrado que abarca varios tokens elimina todas sus variables."""
+        doc = self.parser.parse(CONTENIDO)
+        inicio = CONTENIDO.index("{{ai:gpt4:analisis}}\n")
+        fin = CONTENIDO.index("<!-- KMC_DEFINITION")
+
+        changes = self._edit(doc, inicio, fin - inicio, "")
+
+        self.assertIn("{{ai:gpt4:analisis}}", changes.removed)
+        self.assertIn("[[project:nombre]]", changes.removed)
+        self.assertEqual(doc.prompts, {})
+
+    def test_comentario_sin_cerrar(self):
+        """Cerrar un comentario abierto antes de la edición lo convierte en token KMC."""
+        contenido = '[[a:b]] <!-- KMC {{ai:gpt4:x}}:"Prompt" [[c:d]] {{ai:gpt4:x}}'
+        offset = contenido.index(' [[c:d]]')
+        doc = self.parser.parse(contenido)
+
+        changes = self._edit(doc, offset, 0, " -->")
+
+        self.assertEqual(doc.generative_vars[0].prompt, "Prompt")
+        self.assertEqual(changes.added, [])
+
+        self._edit(doc, offset, len(" -->"), "")
+        self.assertIsNone(doc.generative_vars[0].prompt)
+
+    def test_marcador_partido(self):
+        """Completar un marcador iniciado antes de la edición crea la variable."""
+        doc = self.parser.parse("Hola [")
+
+        changes = self._edit(doc, len("Hola ["), 0, "[user:nombre]] y {{ai:x}}")
+
+        self.assertEqual(changes.added, ["[[user:nombre]]", "{{ai:x}}"])
+
+    def test_edicion_fuera_de_rango(self):
+        """Una edición fuera del contenido lanza ValueError."""
+        doc = self.parser.parse("abc")
+
+        with self.assertRaises(ValueError):
+            doc.apply_edit(2, 5, "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests para el lexer KMC.
+"""
+import unittest
+from ..lexer import tokenize, has_markers, TokenKind
+from ..models import KMCVariableDefinition
+from ..parser import KMCParser
+
+
+class TestKMCLexer(unittest.TestCase):
+    def test_documento_sin_marcadores(self):
+        """Un documento sin marcadores produce un único token de texto."""
+        contenido = "# Título\n\nTexto plano sin variables."
+
+        tokens = tokenize(contenido)
+
+        self.assertFalse(has_markers(contenido))
+        self.assertEqual(len(tokens), 1)
+        self.assertEqual(tokens[0].kind, TokenKind.TEXT)
+        self.assertEqual((tokens[0].start, tokens[0].end), (0, len(contenido)))
+
+    def test_tokens_cubren_el_documento(self):
+        """Los tokens cubren el contenido completo sin huecos y con offsets correctos."""
+        contenido = """# [[project:nombre]] v[{doc:version}]
+{{ai:gpt4:resumen}} {{sin_categoria}} [[no valido]]
+<!-- comentario normal [[project:fecha]] -->
+"""
+        tokens = tokenize(contenido)
+
+        self.assertEqual("".join(contenido[t.start:t.end] for t in tokens), contenido)
+        for previo, siguiente in zip(tokens, tokens[1:]):
+            self.assertEqual(previo.end, siguiente.start)
+
+        variables = [(t.kind, t.target) for t in tokens if t.kind is not TokenKind.TEXT]
+        self.assertEqual(variables, [
+            (TokenKind.CONTEXTUAL, "project:nombre"),
+            (TokenKind.METADATA, "doc:version"),
+            (TokenKind.GENERATIVE, "ai:gpt4:resumen"),
+            (TokenKind.CONTEXTUAL, "project:fecha"),
+        ])
+
+    def test_comentarios_kmc(self):
+        """Los comentarios KMC se emiten como un token con sus variables internas."""
+        contenido = """{{ai:gpt4:analisis}}
+<!-- AI_PROMPT FOR {{ai:gpt4:analisis}}:
+Analiza [[project:datos]]
+-->
+<!-- KMC {{ai:gpt4:otro}}:"Resume [{doc:titulo}]" FORMAT "markdown" -->
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume [[project:nombre]]"
+FORMAT = "text/plain"
+-->
+Fin"""
+        tokens = [t for t in tokenize(contenido) if t.kind is not TokenKind.TEXT]
+
+        ai_prompt, inline, definicion = tokens[1:]
+        self.assertEqual(ai_prompt.kind, TokenKind.AI_PROMPT)
+        self.assertEqual(ai_prompt.target, "ai:gpt4:analisis")
+        self.assertEqual(ai_prompt.prompt, "Analiza [[project:datos]]")
+        self.assertEqual([c.target for c in ai_prompt.children], ["ai:gpt4:analisis", "project:datos"])
+
+        self.assertEqual(inline.kind, TokenKind.INLINE)
+        self.assertEqual((inline.target, inline.prompt, inline.format),
+                         ("ai:gpt4:otro", "Resume [{doc:titulo}]", "markdown"))
+
+        self.assertEqual(definicion.kind, TokenKind.DEFINITION)
+        self.assertEqual((definicion.target, definicion.source, definicion.prompt, definicion.format),
+                         ("doc:resumen", "ai:gpt4:extract", "Resume [[project:nombre]]", "text/plain"))
+        # El salto de línea posterior al comentario forma parte del token
+        self.assertTrue(contenido[definicion.start:definicion.end].endswith("-->\n"))
+
+    def test_parse_construido_sobre_tokens(self):
+        """parse() y parse_definitions obtienen las mismas variables que el lexer."""
+        contenido = """# [[project:nombre]]
+{{ai:gpt4:analisis}}
+<!-- AI_PROMPT FOR {{ai:gpt4:analisis}}:
+Analiza [[project:datos]]
+-->
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume [[project:nombre]]"
+FORMAT = "text/plain"
+-->
+[{doc:resumen}]"""
+        doc = KMCParser().parse(contenido)
+
+        self.assertEqual([v.fullname for v in doc.contextual_vars],
+                         ["[[project:nombre]]", "[[project:datos]]", "[[project:nombre]]"])
+        self.assertEqual([v.fullname for v in doc.metadata_vars], ["[{doc:resumen}]", "[{doc:resumen}]"])
+        self.assertEqual(doc.generative_vars[0].prompt, "Analiza [[project:datos]]")
+        self.assertEqual(doc.prompts, {"ai:gpt4:analisis": "Analiza [[project:datos]]"})
+        self.assertEqual(doc.definitions["doc:resumen"].source_var, "ai:gpt4:extract")
+        self.assertEqual(list(KMCVariableDefinition.parse_definitions(contenido)), ["doc:resumen"])
+
+
+if __name__ == '__main__':
+    unittest.main()
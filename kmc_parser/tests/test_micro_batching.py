@@ -0,0 +1,188 @@
+"""
+Tests para la agrupación en lotes de invocaciones de renders concurrentes.
+"""
+import asyncio
+import threading
+import time
+import unittest
+from ..parser import KMCParser
+from ..core import registry, Deadline, DeadlineExceeded, MicroBatcher, Resilience, RetryPolicy
+from ..core.dispatch import InvocationLedger
+from ..handlers.base import GenerativeHandler
+from ..models import GenerativeVariable
+from . import RegistryTestCase
+
+
+class LoteHandler(GenerativeHandler):
+    """Handler generativo de prueba que registra los lotes recibidos"""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.lotes = []
+        self.individuales = []
+
+    def _generate_content(self, var):
+        self.individuales.append(var.prompt)
+        return f"({var.prompt})"
+
+    def generate_batch(self, vars):
+        self.lotes.append(sorted(var.prompt for var in vars))
+        return [ValueError(var.prompt) if "falla" in var.prompt else f"({var.prompt})" for var in vars]
+
+
+def contenido(tema):
+    return f'{{{{ai:gpt4:resumen}}}}\n<!-- KMC {{{{ai:gpt4:resumen}}}}:"{tema}" -->'
+
+
+class TestKMCMicroBatching(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.handler = LoteHandler()
+        self.batcher = MicroBatcher(window=5, max_batch_size=3)
+        self.parser = KMCParser(micro_batcher=self.batcher)
+        self.parser.register_generative_handler("ai:gpt4", self.handler)
+
+    def _render_en_hilos(self, temas):
+        resultados = {}
+
+        def render(tema):
+            resultados[tema] = self.parser.render(contenido(tema))
+
+        hilos = [threading.Thread(target=render, args=(tema,)) for tema in temas]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(10)
+        return resultados
+
+    def test_renders_en_hilos(self):
+        """Las invocaciones de varios renders simultáneos se generan en un lote."""
+        resultados = self._render_en_hilos(["a", "b", "c"])
+
+        self.assertEqual(self.handler.lotes, [["a", "b", "c"]])
+        self.assertEqual(self.handler.individuales, [])
+        for tema, resultado in resultados.items():
+            self.assertEqual(resultado.strip(), f"({tema})")
+            self.assertEqual(resultado.report.micro_batched_invocations, 1)
+        stats = self.batcher.stats()
+        self.assertEqual(stats["batch_sizes"], {3: 1})
+        self.assertEqual(stats["pending"], 0)
+
+    def test_ventana(self):
+        """Al vencer la ventana el lote se genera aunque no esté completo."""
+        batcher = MicroBatcher(window=0.01, max_batch_size=8)
+        parser = KMCParser(micro_batcher=batcher)
+        parser.register_generative_handler("ai:gpt4", self.handler)
+
+        self.assertEqual(parser.render(contenido("solo")).strip(), "(solo)")
+        stats = batcher.stats()
+        self.assertEqual(stats["batch_sizes"], {1: 1})
+        self.assertGreater(stats["max_queue_delay"], 0)
+
+    def test_renders_asincronos(self):
+        """En asyncio las tareas del mismo bucle comparten el lote."""
+        async def main():
+            return await asyncio.gather(*(self.parser.arender(contenido(tema)) for tema in "xyz"))
+
+        resultados = asyncio.run(main())
+
+        self.assertEqual(self.handler.lotes, [["x", "y", "z"]])
+        self.assertEqual([r.strip() for r in resultados], ["(x)", "(y)", "(z)"])
+
+    def test_errores_por_solicitante(self):
+        """El error de una variable del lote solo llega a su render."""
+        resultados = self._render_en_hilos(["a", "falla", "c"])
+
+        self.assertEqual(resultados["a"].strip(), "(a)")
+        self.assertEqual(resultados["falla"].strip(), "<ai:gpt4:resumen>")
+        self.assertEqual(self.batcher.stats()["errors"], 1)
+
+    def test_handlers_sin_lote(self):
+        """Los handlers sin generación en lote o que la desactivan no esperan en la cola."""
+        self.parser.register_generative_handler("ai:gpt4", lambda var: f"[{var.prompt}]")
+        self.assertEqual(self.parser.render(contenido("a")).strip(), "[a]")
+
+        handler = LoteHandler({"micro_batch": False})
+        self.parser.register_generative_handler("ai:gpt4", handler)
+        self.assertEqual(self.parser.render(contenido("b")).strip(), "(b)")
+        self.assertEqual(handler.individuales, ["b"])
+        self.assertEqual(self.batcher.stats()["batches"], 0)
+
+    def test_parametros_invalidos(self):
+        """La ventana no puede ser negativa y el tamaño de lote debe ser positivo."""
+        with self.assertRaises(ValueError):
+            MicroBatcher(window=-1)
+        with self.assertRaises(ValueError):
+            MicroBatcher(max_batch_size=0)
+
+
+    def test_lotes_dentro_del_limite_de_concurrencia(self):
+        """Cada lote ocupa un hueco del límite de concurrencia de su handler."""
+        lock = threading.Lock()
+        en_vuelo = [0, 0]
+
+        class Lento(LoteHandler):
+            def generate_batch(handler_self, vars):
+                with lock:
+                    en_vuelo[0] += 1
+                    en_vuelo[1] = max(en_vuelo)
+                time.sleep(0.02)
+                with lock:
+                    en_vuelo[0] -= 1
+                return super().generate_batch(vars)
+
+        self.batcher.max_batch_size = 1
+        self.parser.register_generative_handler("ai:gpt4", Lento())
+        self.parser.set_concurrency_limit("ai:gpt4", 1)
+
+        resultados = self._render_en_hilos(["a", "b", "c", "d"])
+
+        self.assertEqual([resultados[tema].strip() for tema in "abcd"], ["(a)", "(b)", "(c)", "(d)"])
+        self.assertEqual(en_vuelo[1], 1)
+
+    def test_lotes_con_reintentos(self):
+        """Un lote que falla se reintenta con la capa de resiliencia del render."""
+        class Inestable(LoteHandler):
+            def generate_batch(handler_self, vars):
+                if not handler_self.lotes:
+                    handler_self.lotes.append(None)
+                    raise ConnectionError("servicio no disponible")
+                return super().generate_batch(vars)
+
+        handler = Inestable()
+        capa = Resilience(RetryPolicy(max_attempts=2, base_delay=0), sleep=lambda delay: None)
+        parser = KMCParser(micro_batcher=MicroBatcher(window=0.01), resilience=capa)
+        parser.register_generative_handler("ai:gpt4", handler)
+
+        self.assertEqual(parser.render(contenido("a")).strip(), "(a)")
+        self.assertEqual(handler.lotes, [None, ["a"]])
+        self.assertEqual(capa.stats()["retries"], 1)
+
+    def test_espera_acotada_por_el_limite(self):
+        """Un render con límite de tiempo no espera a un lote que no termina."""
+        liberar = threading.Event()
+        self.addCleanup(liberar.set)
+
+        class Bloqueado(LoteHandler):
+            def generate_batch(handler_self, vars):
+                liberar.wait(5)
+                return super().generate_batch(vars)
+
+        handler = Bloqueado()
+        ledger = InvocationLedger(micro_batcher=MicroBatcher(window=0.01), deadline=Deadline(0.1))
+
+        inicio = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            ledger.invoke(GenerativeVariable("ai", "gpt4", "resumen", prompt="a"), handler)
+        self.assertLess(time.monotonic() - inicio, 2)
+
+        parser = KMCParser(micro_batcher=MicroBatcher(window=0.01))
+        parser.register_generative_handler("ai:gpt4", handler)
+        resultado = parser.render(contenido("b"), deadline=0.1)
+        self.assertEqual(resultado.strip(), "<ai:gpt4:resumen>")
+        self.assertEqual(resultado.report.variable_status, {"{{ai:gpt4:resumen}}": "timed_out"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Tests para la reutilización de valores generados mediante claves Merkle.
+"""
+import asyncio
+import unittest
+from ..parser import KMCParser
+from ..core import registry, OutputCache
+from . import RegistryTestCase
+
+
+CONTENIDO = """<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:resumen}}
+PROMPT = "Resume [[project:nombre]]"
+-->
+<!-- KMC_DEFINITION FOR [{doc:riesgos}]:
+GENERATIVE_SOURCE = {{ai:gpt4:riesgos}}
+PROMPT = "Riesgos de [[project:fase]]"
+-->
+<!-- KMC_DEFINITION FOR [{doc:conclusion}]:
+GENERATIVE_SOURCE = {{ai:gpt4:conclusion}}
+PROMPT = "Concluye a partir de [{doc:resumen}]"
+-->
+[{doc:resumen}] | [{doc:riesgos}] | [{doc:conclusion}]"""
+
+
+class TestKMCOutputCache(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.proyecto = {"nombre": "Demo", "fase": "piloto"}
+        registry.register_context_handler("project", lambda var: self.proyecto.get(var))
+
+        self.output_cache = OutputCache()
+        self.parser = KMCParser(output_cache=self.output_cache)
+        self.calls = []
+
+        def ai_handler(var):
+            self.calls.append(var.name)
+            return f"({var.name}: {var.prompt})"
+
+        self.parser.register_generative_handler("ai:gpt4", ai_handler)
+
+    def test_render_repetido_reutiliza_todo(self):
+        """Un segundo render idéntico no invoca ningún handler."""
+        primero = self.parser.render(CONTENIDO)
+        self.calls.clear()
+
+        segundo = self.parser.render(CONTENIDO)
+
+        self.assertEqual(segundo, primero)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(segundo.report.handler_invocations, 0)
+        self.assertEqual(
+            segundo.report.reused_nodes,
+            ["[{doc:resumen}]", "[{doc:riesgos}]", "[{doc:conclusion}]"]
+        )
+        self.assertEqual(segundo.report.regenerated_nodes, [])
+
+    def test_editar_prompt_regenera_el_subarbol(self):
+        """Cambiar un prompt regenera ese nodo y los que dependen de él."""
+        self.parser.render(CONTENIDO)
+        self.calls.clear()
+
+        resultado = self.parser.render(CONTENIDO.replace("Resume [[", "Sintetiza [["))
+
+        self.assertEqual(sorted(self.calls), ["conclusion", "resumen"])
+        self.assertEqual(resultado.report.reused_nodes, ["[{doc:riesgos}]"])
+        self.assertEqual(resultado.report.regenerated_nodes, ["[{doc:resumen}]", "[{doc:conclusion}]"])
+        self.assertIn("(conclusion: Concluye a partir de (resumen: Sintetiza Demo))", resultado)
+
+    def test_cambio_de_contexto_invalida_dependientes(self):
+        """Cambiar el valor de una variable contextual regenera solo los nodos que la usan."""
+        self.parser.render(CONTENIDO)
+        self.calls.clear()
+
+        self.proyecto["fase"] = "producción"
+        resultado = self.parser.render(CONTENIDO)
+
+        self.assertEqual(self.calls, ["riesgos"])
+        self.assertIn("(riesgos: Riesgos de producción)", resultado)
+
+    def test_placeholders_no_se_almacenan(self):
+        """Los nodos que fallan se vuelven a intentar en el siguiente render."""
+        contenido = "{{ai:fallo:x}}"
+        intentos = []
+
+        def fallo(var):
+            intentos.append(var.name)
+            raise RuntimeError("sin servicio")
+
+        self.parser.register_generative_handler("ai:fallo", fallo)
+        self.parser.render(contenido)
+        resultado = self.parser.render(contenido)
+
+        self.assertEqual(resultado, "<ai:fallo:x>")
+        self.assertEqual(intentos, ["x", "x"])
+
+    def test_arender_reutiliza_valores(self):
+        """El render asíncrono usa las mismas claves que el síncrono."""
+        self.parser.render(CONTENIDO)
+        self.calls.clear()
+
+        resultado = asyncio.run(self.parser.arender(CONTENIDO))
+
+        self.assertEqual(self.calls, [])
+        self.assertEqual(len(resultado.report.reused_nodes), 3)
+
+    def test_sin_cache_se_regenera_todo(self):
+        """Sin cache de valores cada render invoca todos los handlers."""
+        parser = KMCParser()
+        parser.register_generative_handler("ai:gpt4", self.parser.generative_handlers["ai:gpt4"])
+
+        parser.render(CONTENIDO)
+        resultado = parser.render(CONTENIDO)
+
+        self.assertEqual(len(self.calls), 6)
+        self.assertEqual(resultado.report.reused_nodes, [])
+        self.assertEqual(len(resultado.report.regenerated_nodes), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests para el renderizado de documentos KMC.
+"""
+import unittest
+from ..parser import KMCParser
+from ..core import registry
+from . import RegistryTestCase
+
+
+class TestKMCRender(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.parser = KMCParser()
+        self.calls = []
+
+        registry.register_context_handler("project", lambda var: {
+            "nombre": "Proyecto Demo",
+            "descripcion": "Plataforma [[project:nombre]]"
+        }.get(var))
+        registry.register_metadata_handler("doc", lambda var: {
+            "version": "v1.0",
+            "titulo": "Informe"
+        }.get(var, f"<doc:{var}>"))
+
+        def ai_handler(var):
+            self.calls.append((var.name, var.prompt))
+            return f"[{var.name}: {var.prompt}]"
+
+        self.parser.register_generative_handler("ai:gpt4", ai_handler)
+
+    def test_render_en_una_pasada(self):
+        """Todas las variables y comentarios se resuelven en una única pasada."""
+        contenido = """# [[project:nombre]] [{doc:version}]
+{{ai:gpt4:analisis}}
+<!-- AI_PROMPT FOR {{ai:gpt4:analisis}}:
+Analiza [[project:nombre]]
+-->
+<!-- KMC {{ai:gpt4:otro}}:"Resume [{doc:titulo}]" -->
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume [[project:nombre]]"
+FORMAT = "text/plain"
+-->
+{{ai:gpt4:otro}} [{doc:resumen}] [[user:email]]"""
+
+        resultado = self.parser.render(contenido)
+
+        self.assertEqual(resultado, """# Proyecto Demo 1.0
+[analisis: Analiza Proyecto Demo]
+[otro: Resume Informe] [extract: Resume Proyecto Demo] [[user:email]]""")
+
+    def test_valores_no_se_vuelven_a_sustituir(self):
+        """Los valores resueltos se emiten tal cual, sin reprocesar sus marcadores."""
+        resultado = self.parser.render("[[project:descripcion]] / [[project:nombre]]")
+
+        self.assertEqual(resultado, "Plataforma [[project:nombre]] / Proyecto Demo")
+
+    def test_variables_repetidas_y_definiciones(self):
+        """Cada definición y variable generativa se genera una vez aunque se repita."""
+        contenido = """<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume el proyecto"
+FORMAT = "text/plain"
+-->
+[{doc:resumen}] {{ai:gpt4:nota}} [{doc:resumen}] {{ai:gpt4:nota}}"""
+
+        resultado = self.parser.render(contenido)
+
+        self.assertEqual(resultado.count("[extract: Resume el proyecto]"), 2)
+        self.assertEqual(sorted(name for name, _ in self.calls), ["extract", "nota"])
+
+    def test_cada_variable_se_resuelve_una_vez(self):
+        """Cada variable distinta se resuelve una sola vez para el cuerpo y los prompts."""
+        consultas = []
+
+        def project_handler(var):
+            consultas.append(var)
+            return var.upper()
+
+        registry.register_context_handler("project", project_handler)
+        contenido = "[[project:nombre]] " * 40 + """
+{{ai:gpt4:analisis}}
+<!-- AI_PROMPT FOR {{ai:gpt4:analisis}}:
+Analiza [[project:nombre]] y [[project:fecha]]
+-->
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:extract}}
+PROMPT = "Resume [[project:nombre]] desde [[project:fecha]]"
+FORMAT = "text/plain"
+-->
+[{doc:resumen}]"""
+
+        resultado = self.parser.render(contenido)
+
+        self.assertEqual(sorted(consultas), ["fecha", "nombre"])
+        self.assertEqual(resultado.count("NOMBRE"), 42)
+        self.assertIn("[extract: Resume NOMBRE desde FECHA]", resultado)
+
+    def test_documento_sin_marcadores(self):
+        """Un documento sin marcadores se devuelve sin cambios."""
+        contenido = "# Documento\n\nSin variables."
+
+        self.assertEqual(self.parser.render(contenido), contenido)
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
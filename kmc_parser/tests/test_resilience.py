@@ -0,0 +1,181 @@
+"""
+Tests para la capa de reintentos y cortacircuitos de handlers generativos.
+"""
+import asyncio
+import unittest
+from ..parser import KMCParser
+from ..core import registry, Resilience, RetryPolicy, CircuitBreaker, CircuitOpenError, is_transient_error
+from . import RegistryTestCase
+
+
+def documento(*nombres):
+    return " ".join(f"{{{{ai:gpt4:{nombre}}}}}" for nombre in nombres)
+
+
+class TestKMCResilience(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.ahora = [0.0]
+        self.esperas = []
+        self.llamadas = []
+
+    def _capa(self, **kwargs):
+        kwargs.setdefault("policy", RetryPolicy(max_attempts=3, jitter=0))
+        return Resilience(clock=lambda: self.ahora[0], sleep=self.esperas.append, **kwargs)
+
+    def _parser(self, handler, resilience, **kwargs):
+        parser = KMCParser(resilience=resilience, **kwargs)
+        parser.register_generative_handler("ai:gpt4", handler)
+        return parser
+
+    def _inestable(self, fallos):
+        """Handler que falla las primeras `fallos` llamadas de cada variable."""
+        def handler(var):
+            self.llamadas.append(var.name)
+            if self.llamadas.count(var.name) <= fallos:
+                raise ConnectionError("servicio no disponible")
+            return var.name.upper()
+        return handler
+
+    def test_esperas_exponenciales(self):
+        """Las esperas crecen exponencialmente, con tope y reducción aleatoria."""
+        self.assertEqual(list(RetryPolicy(max_attempts=5, base_delay=1, max_delay=5, jitter=0).delays()),
+                         [1, 2, 4, 5])
+        self.assertEqual(list(RetryPolicy(base_delay=1, jitter=0.5, random_source=lambda: 1.0).delays()),
+                         [0.5, 1.0])
+
+    def test_reintento_recupera_el_valor(self):
+        """Un fallo transitorio se reintenta y el render obtiene el valor."""
+        parser = self._parser(self._inestable(2), self._capa())
+
+        resultado = parser.render(documento("resumen"))
+
+        self.assertEqual(resultado, "RESUMEN")
+        self.assertEqual(self.esperas, [0.1, 0.2])
+        self.assertEqual(resultado.report.retries, 2)
+        self.assertEqual(resultado.report.handler_invocations, 1)
+
+    def test_presupuesto_de_reintentos(self):
+        """Agotado el presupuesto del render, los errores ya no se reintentan."""
+        parser = self._parser(self._inestable(10), self._capa(failure_threshold=100), retry_budget=1)
+
+        resultado = parser.render(documento("a", "b"))
+
+        self.assertEqual(resultado, "<ai:gpt4:a> <ai:gpt4:b>")
+        self.assertEqual(len(self.llamadas), 3)
+        self.assertEqual(resultado.report.retries, 1)
+
+    def test_cortacircuitos(self):
+        """Tras varios fallos el cortacircuitos falla al momento y luego prueba de nuevo."""
+        capa = self._capa(policy=RetryPolicy(max_attempts=1), failure_threshold=2, recovery_time=30)
+        fallar = [True]
+
+        def handler(var):
+            self.llamadas.append(var.name)
+            if fallar[0]:
+                raise ConnectionError("caído")
+            return var.name
+
+        parser = self._parser(handler, capa)
+        resultado = parser.render(documento("a", "b", "c"))
+
+        self.assertEqual(self.llamadas, ["a", "b"])
+        self.assertEqual(resultado, "<ai:gpt4:a> <ai:gpt4:b> <ai:gpt4:c>")
+        self.assertEqual(resultado.report.rejected_invocations, 1)
+        self.assertEqual(capa.breaker("ai:gpt4").state, CircuitBreaker.OPEN)
+
+        self.ahora[0] = 31
+        fallar[0] = False
+        self.assertEqual(parser.render(documento("d")), "d")
+        self.assertEqual(capa.stats()["breakers"]["ai:gpt4"]["state"], CircuitBreaker.CLOSED)
+
+    def test_llamada_de_prueba_unica(self):
+        """En estado semiabierto solo pasa una llamada de prueba a la vez."""
+        breaker = CircuitBreaker("api:x", failure_threshold=1, recovery_time=1, clock=lambda: self.ahora[0])
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+
+        self.ahora[0] = 2
+        breaker.allow()
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_configuracion_del_handler(self):
+        """Un handler con {"retry": False} no se reintenta."""
+        class Handler:
+            config = {"retry": False}
+
+            def __call__(handler_self, var):
+                self.llamadas.append(var.name)
+                raise ConnectionError("caído")
+
+        resultado = self._parser(Handler(), self._capa()).render(documento("a"))
+
+        self.assertEqual(resultado, "<ai:gpt4:a>")
+        self.assertEqual(self.llamadas, ["a"])
+
+    def test_errores_no_reintentables(self):
+        """Solo se reintentan los errores indicados en la política y no abren el cortacircuitos."""
+        def handler(var):
+            self.llamadas.append(var.name)
+            raise ValueError("prompt inválido")
+
+        capa = self._capa(policy=RetryPolicy(retry_on=(ConnectionError,)), failure_threshold=1)
+        parser = self._parser(handler, capa)
+        parser.render(documento("a"))
+        parser.render(documento("b"))
+
+        self.assertEqual(self.llamadas, ["a", "b"])
+        self.assertEqual(capa.breaker("ai:gpt4").state, CircuitBreaker.CLOSED)
+        self.assertEqual(capa.stats()["failures"], 2)
+
+    def test_solo_errores_transitorios(self):
+        """Con la política por defecto los errores del llamador no se reintentan ni abren el cortacircuitos."""
+        class ErrorHTTP(Exception):
+            def __init__(self, status):
+                super().__init__({"statusCode": str(status), "message": "error"})
+
+        capa = self._capa(policy=RetryPolicy(jitter=0), failure_threshold=1)
+        for error in (ValueError("prompt inválido"), KeyError("campo"), ErrorHTTP(404)):
+            self.llamadas = []
+
+            def handler(var):
+                self.llamadas.append(var.name)
+                raise error
+
+            self._parser(handler, capa).render(documento("a"))
+            self.assertEqual(self.llamadas, ["a"])
+            self.assertEqual(capa.breaker("ai:gpt4").state, CircuitBreaker.CLOSED)
+            self.assertEqual(capa.breaker("ai:gpt4").failures, 0)
+        self.assertEqual(capa.stats()["retries"], 0)
+
+        for error in (TimeoutError(), ConnectionResetError(), ErrorHTTP(503), ErrorHTTP(429)):
+            self.assertTrue(is_transient_error(error))
+
+    def test_render_asincrono(self):
+        """En asyncio las esperas entre reintentos no bloquean el bucle."""
+        esperas = []
+
+        async def dormir(segundos):
+            esperas.append(segundos)
+
+        async def handler(var):
+            self.llamadas.append(var.name)
+            if len(self.llamadas) == 1:
+                raise ConnectionError("caído")
+            return var.name
+
+        capa = Resilience(RetryPolicy(jitter=0), async_sleep=dormir)
+        resultado = asyncio.run(self._parser(handler, capa).arender(documento("a")))
+
+        self.assertEqual(resultado, "a")
+        self.assertEqual(esperas, [0.1])
+        self.assertEqual(resultado.report.retries, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Tests para la cache de resultados de handlers generativos.
+"""
+import asyncio
+import unittest
+from ..parser import KMCParser
+from ..core import registry, ResultCache
+from ..extensions.api_plugin import StockAPIHandler
+from ..handlers.base import GenerativeHandler
+from . import RegistryTestCase
+
+
+class EchoHandler(GenerativeHandler):
+    """Handler generativo de prueba que cuenta sus invocaciones"""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.calls = []
+
+    def _generate_content(self, var):
+        self.calls.append(var.name)
+        return f"[{self.config.get('modelo', 'base')} {var.name}: {var.prompt}]"
+
+
+class TestKMCResultCache(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.now = 0.0
+        self.cache = ResultCache(max_entries=8, clock=lambda: self.now)
+        self.handler = EchoHandler()
+        registry.register_context_handler("project", lambda var: {"descripcion": "Demo"}.get(var))
+        self.parser = KMCParser(result_cache=self.cache)
+        self.parser.register_generative_handler("ai:gpt4", self.handler)
+        self.contenido = """{{ai:gpt4:resumen}}
+<!-- KMC {{ai:gpt4:resumen}}:"Resume [[project:descripcion]]" FORMAT "text/plain" -->"""
+
+    def test_resultados_reutilizados_entre_renders(self):
+        """El mismo prompt resuelto no vuelve a invocar al handler en otro render."""
+        primero = self.parser.render(self.contenido)
+        segundo = self.parser.render(self.contenido)
+
+        self.assertEqual(segundo, primero)
+        self.assertEqual(self.handler.calls, ["resumen"])
+        self.assertEqual(segundo.report.cached_invocations, 1)
+        self.assertEqual(segundo.report.handler_invocations, 0)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_caducidad_por_handler(self):
+        """Los resultados caducan según el tiempo de vida de su handler_key."""
+        self.cache.set_ttl("ai:gpt4", 10)
+        self.parser.render(self.contenido)
+
+        self.now = 5
+        self.parser.render(self.contenido)
+        self.assertEqual(len(self.handler.calls), 1)
+
+        self.now = 11
+        self.parser.render(self.contenido)
+        self.assertEqual(len(self.handler.calls), 2)
+        self.assertEqual(self.cache.stats()["expirations"], 1)
+
+    def test_exclusion_de_handler(self):
+        """Los handlers excluidos se invocan siempre."""
+        self.cache.disable("ai:gpt4")
+        self.parser.render(self.contenido)
+        self.parser.render(self.contenido)
+
+        self.assertEqual(len(self.handler.calls), 2)
+        self.assertEqual(len(self.cache), 0)
+
+        handler = EchoHandler({"cache": False})
+        self.cache.enable("ai:gpt4")
+        self.parser.register_generative_handler("ai:gpt4", handler)
+        self.parser.render(self.contenido)
+        self.parser.render(self.contenido)
+        self.assertEqual(len(handler.calls), 2)
+
+    def test_configuracion_forma_parte_de_la_clave(self):
+        """Un handler con otra configuración no reutiliza los resultados del anterior."""
+        self.parser.render(self.contenido)
+        otro = EchoHandler({"modelo": "grande"})
+        self.parser.register_generative_handler("ai:gpt4", otro)
+
+        resultado = self.parser.render(self.contenido)
+
+        self.assertIn("[grande resumen:", resultado)
+        self.assertEqual(otro.calls, ["resumen"])
+
+    def test_expulsion_lru(self):
+        """Al superar el tamaño máximo se expulsan los resultados menos usados."""
+        for indice in range(10):
+            self.parser.render(f"{{{{ai:gpt4:nota{indice}}}}}")
+
+        self.assertEqual(len(self.cache), 8)
+        self.assertEqual(self.cache.stats()["evictions"], 2)
+
+    def test_handlers_de_api(self):
+        """Los handlers del plugin de APIs usan la cache con su propio tiempo de vida."""
+        stock = StockAPIHandler({"currency": "EUR", "cache_ttl": 60})
+        self.parser.register_generative_handler("api:stock", stock)
+
+        self.parser.render("{{api:stock:AAPL}}")
+        self.now = 30
+        resultado = self.parser.render("{{api:stock:AAPL}}")
+        self.assertEqual(resultado.report.cached_invocations, 1)
+
+        self.now = 61
+        resultado = self.parser.render("{{api:stock:AAPL}}")
+        self.assertEqual(resultado.report.cached_invocations, 0)
+        self.assertIn("EUR 182.63", resultado)
+
+    def test_arender_usa_la_cache(self):
+        """El render asíncrono comparte la cache con el síncrono."""
+        self.parser.render(self.contenido)
+
+        resultado = asyncio.run(self.parser.arender(self.contenido))
+
+        self.assertEqual(self.handler.calls, ["resumen"])
+        self.assertEqual(resultado.report.cached_invocations, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+"""
+Tests para el almacén persistente de resultados generativos.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from ..parser import KMCParser
+from ..core import registry, ResultCache, ResultStore
+from ..core.cache import handler_fingerprint, is_portable_fingerprint
+from ..handlers.base import GenerativeHandler
+from . import RegistryTestCase
+
+
+class EchoHandler(GenerativeHandler):
+    """Handler generativo de prueba que cuenta sus invocaciones"""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.calls = []
+
+    def _generate_content(self, var):
+        self.calls.append(var.name)
+        return f"[{var.name}: {var.prompt}] " + "texto repetido " * 50
+
+
+class Traductor:
+    """Handler invocable sin configuración, con estado propio"""
+
+    def __init__(self, idioma):
+        self.idioma = idioma
+
+    def __call__(self, var):
+        return f"{self.idioma}:{var.name}"
+
+
+class TestKMCResultStore(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "results.db")
+        self.contenido = '{{ai:gpt4:resumen}}\n<!-- KMC {{ai:gpt4:resumen}}:"Resume el proyecto" -->'
+
+    def tearDown(self):
+        """Restaura el registro global y elimina la base de datos temporal."""
+        super().tearDown()
+        self._tmp.cleanup()
+
+    def _worker(self, **store_options):
+        """Crea un parser con su propia cache en memoria sobre el almacén compartido."""
+        handler = EchoHandler({"model": "gpt-4"})
+        cache = ResultCache(store=ResultStore(self.path, **store_options))
+        parser = KMCParser(result_cache=cache)
+        parser.register_generative_handler("ai:gpt4", handler)
+        return parser, cache, handler
+
+    def test_resultados_compartidos_entre_workers(self):
+        """Un resultado generado por un worker se reutiliza en otro con la memoria vacía."""
+        primero, _, handler_a = self._worker()
+        segundo, cache_b, handler_b = self._worker()
+
+        resultado_a = primero.render(self.contenido)
+        resultado_b = segundo.render(self.contenido)
+
+        self.assertEqual(resultado_b, resultado_a)
+        self.assertEqual(handler_a.calls, ["resumen"])
+        self.assertEqual(handler_b.calls, [])
+        self.assertEqual(cache_b.stats()["store_hits"], 1)
+
+    def test_valores_comprimidos(self):
+        """Los resultados se guardan comprimidos."""
+        parser, cache, _ = self._worker()
+        resultado = parser.render(self.contenido)
+
+        self.assertLess(cache.store.stats()["bytes"], len(resultado.encode("utf-8")))
+        with sqlite3.connect(self.path) as connection:
+            (blob,) = connection.execute("SELECT value FROM results").fetchone()
+        self.assertNotIn(b"texto repetido", blob)
+
+    def test_expulsion_por_tamano(self):
+        """Al superar el tamaño máximo se expulsan los resultados usados hace más tiempo."""
+        store = ResultStore(self.path, max_bytes=400)
+        for indice in range(20):
+            store.put(("ai:gpt4", f"nota{indice}", None, None, "h"), f"resultado {indice} " * 20)
+
+        self.assertLessEqual(store.stats()["bytes"], 400)
+        self.assertLess(len(store), 20)
+        self.assertIsNone(store.get(("ai:gpt4", "nota0", None, None, "h")))
+        self.assertIsNotNone(store.get(("ai:gpt4", "nota19", None, None, "h")))
+
+    def test_caducidad(self):
+        """Los resultados caducados no se sirven y se eliminan."""
+        store = ResultStore(self.path)
+        store.put(("api:weather", "madrid", None, None, "h"), "Soleado", ttl=-1)
+
+        self.assertIsNone(store.get(("api:weather", "madrid", None, None, "h")))
+        self.assertEqual(store.stats(), {"entries": 0, "bytes": 0})
+
+    def test_arranque_en_caliente(self):
+        """warm_start precarga en memoria los resultados más usados."""
+        store = ResultStore(self.path)
+        for indice in range(5):
+            store.put(("ai:gpt4", f"nota{indice}", None, None, "h"), f"valor {indice}")
+        for _ in range(3):
+            store.get(("ai:gpt4", "nota3", None, None, "h"))
+
+        cache = ResultCache(max_entries=2, store=ResultStore(self.path))
+
+        self.assertEqual(cache.warm_start(), 2)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(("ai:gpt4", "nota3", None, None, "h")), "valor 3")
+        self.assertEqual(cache.stats()["store_hits"], 0)
+
+    def test_huella_de_funciones(self):
+        """La huella de una función incluye lo que captura y sus valores por defecto."""
+        def con_sufijo(sufijo):
+            return lambda var: var.name + sufijo
+
+        def con_defecto(var, sufijo="a"):
+            return var.name + sufijo
+
+        def con_otro_defecto(var, sufijo="b"):
+            return var.name + sufijo
+        con_otro_defecto.__code__ = con_defecto.__code__
+        con_otro_defecto.__qualname__ = con_defecto.__qualname__
+
+        self.assertEqual(handler_fingerprint(con_sufijo("!")), handler_fingerprint(con_sufijo("!")))
+        self.assertNotEqual(handler_fingerprint(con_sufijo("!")), handler_fingerprint(con_sufijo("?")))
+        self.assertNotEqual(handler_fingerprint(con_defecto), handler_fingerprint(con_otro_defecto))
+        self.assertTrue(is_portable_fingerprint(handler_fingerprint(con_sufijo("!"))))
+
+    def test_huella_de_instancias(self):
+        """Las instancias sin configuración ni huella explícita no salen del proceso."""
+        es, en = Traductor("es"), Traductor("en")
+
+        self.assertNotEqual(handler_fingerprint(es), handler_fingerprint(en))
+        self.assertFalse(is_portable_fingerprint(handler_fingerprint(es)))
+        self.assertNotEqual(handler_fingerprint(es.__call__), handler_fingerprint(en.__call__))
+
+        es.fingerprint = "es"
+        otro = Traductor("es")
+        otro.cache_key = lambda: "es"
+        self.assertTrue(is_portable_fingerprint(handler_fingerprint(es)))
+        self.assertEqual(handler_fingerprint(es), handler_fingerprint(otro))
+
+    def test_handlers_locales_fuera_del_almacen(self):
+        """Los resultados de un handler con huella local se quedan en la memoria del proceso."""
+        cache = ResultCache(store=ResultStore(self.path))
+        parser = KMCParser(result_cache=cache)
+        parser.register_generative_handler("ai:gpt4", Traductor("es"))
+
+        self.assertEqual(parser.render("{{ai:gpt4:a}}"), "es:a")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(len(cache.store), 0)
+
+    def test_errores_del_almacen(self):
+        """Un fallo de SQLite no hace fallar la variable: el resultado se genera igual."""
+        parser, cache, handler = self._worker()
+
+        def bloqueada():
+            raise sqlite3.OperationalError("database is locked")
+        cache.store._connection = bloqueada
+
+        with self.assertLogs("kmc.store", level="WARNING"):
+            resultado = parser.render(self.contenido)
+
+        self.assertIn("[resumen: Resume el proyecto]", resultado)
+        self.assertEqual(resultado.report.variable_status, {"{{ai:gpt4:resumen}}": "resolved"})
+        self.assertEqual(handler.calls, ["resumen"])
+
+    def test_resultados_danados(self):
+        """Un resultado que no se puede descomprimir cuenta como ausente."""
+        store = ResultStore(self.path)
+        clave = ("ai:gpt4", "nota", None, None, "h")
+        store.put(clave, "valor")
+        store._connection().execute("UPDATE results SET value = ?", (b"basura",))
+
+        with self.assertLogs("kmc.store", level="WARNING"):
+            self.assertIsNone(store.get(clave))
+            self.assertEqual(store.hot(), [])
+        store.close()
+
+    def test_lecturas_con_errores_del_almacen(self):
+        """hot, stats y len no propagan los errores de SQLite."""
+        store = ResultStore(self.path)
+        store.put(("ai:gpt4", "nota", None, None, "h"), "valor")
+
+        def bloqueada():
+            raise sqlite3.OperationalError("database is locked")
+        store._connection = bloqueada
+
+        with self.assertLogs("kmc.store", level="WARNING"):
+            self.assertEqual(store.hot(), [])
+            self.assertEqual(store.stats(), {"entries": 0, "bytes": 0})
+            self.assertEqual(len(store), 0)
+
+    def test_accesos_acumulados(self):
+        """Las lecturas acumulan los accesos y los vuelcan en lotes."""
+        store = ResultStore(self.path, access_batch=3, access_interval=3600)
+        clave = ("ai:gpt4", "nota", None, None, "h")
+        store.put(clave, "valor")
+
+        def aciertos():
+            with sqlite3.connect(self.path) as connection:
+                return connection.execute("SELECT hits FROM results").fetchone()[0]
+
+        store.get(clave)
+        store.get(clave)
+        self.assertEqual(aciertos(), 0)
+        store.get(clave)
+        self.assertEqual(aciertos(), 3)
+        store.get(clave)
+        store.close()
+        self.assertEqual(aciertos(), 4)
+
+    def test_escrituras_concurrentes(self):
+        """Varias conexiones pueden escribir a la vez sin perder resultados."""
+        def escribir(worker):
+            store = ResultStore(self.path)
+            for indice in range(25):
+                store.put(("ai:gpt4", f"w{worker}-{indice}", None, None, "h"), f"valor {indice}")
+            store.close()
+
+        hilos = [threading.Thread(target=escribir, args=(worker,)) for worker in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(ResultStore(self.path)), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Tests para el enrutado de handlers generativos entre varios backends.
+"""
+import asyncio
+import threading
+import unittest
+from ..parser import KMCParser
+from ..core import registry, FallbackPolicy, HedgePolicy, LatencyPolicy, Resilience, RetryPolicy
+from ..core.routing import LatencyHistogram
+from . import RegistryTestCase
+
+
+def documento(*nombres):
+    return " ".join(f"{{{{ai:gpt4:{nombre}}}}}" for nombre in nombres)
+
+
+class TestKMCRouting(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.liberar = threading.Event()
+        self.llamadas = []
+
+    def tearDown(self):
+        """Restaura el registro global."""
+        self.liberar.set()
+        super().tearDown()
+
+    def _parser(self, policy, route_workers=8, **handlers):
+        parser = KMCParser(batch_size=1, route_workers=route_workers)
+        for handler_key, handler in handlers.items():
+            parser.register_generative_handler(handler_key.replace("_", ":"), handler)
+        parser.set_routing_policy("ai:gpt4", policy)
+        return parser
+
+    def _backend(self, nombre, lento=False, error=False):
+        def handler(var):
+            self.llamadas.append((nombre, var.handler_key))
+            if lento:
+                self.liberar.wait(5)
+            if error:
+                raise ConnectionError(nombre)
+            return f"{nombre}:{var.name}"
+        return handler
+
+    def test_histograma(self):
+        """El histograma cuenta por tramos y calcula percentiles."""
+        histograma = LatencyHistogram()
+        for milisegundos in range(1, 101):
+            histograma.record(milisegundos / 1000)
+
+        resumen = histograma.snapshot()
+        self.assertEqual(resumen["count"], 100)
+        self.assertEqual(resumen["p95"], 0.095)
+        self.assertEqual(resumen["buckets"]["<=5ms"], 5)
+        self.assertEqual(resumen["buckets"]["<=100ms"], 50)
+        self.assertEqual(resumen["buckets"][">10000ms"], 0)
+
+    def test_fallback(self):
+        """Un error del backend principal pasa la variable al siguiente con su handler_key."""
+        parser = self._parser(FallbackPolicy(["ai:gpt4", "ai:qa"]),
+                              ai_gpt4=self._backend("gpt4", error=True), ai_qa=self._backend("qa"))
+
+        self.assertEqual(parser.render(documento("a")), "qa:a")
+        self.assertEqual(self.llamadas, [("gpt4", "ai:gpt4"), ("qa", "ai:qa")])
+        stats = parser.routing_stats()["ai:gpt4"]
+        self.assertEqual(stats["ai:gpt4"]["errors"], 1)
+        self.assertEqual(stats["ai:qa"]["wins"], 1)
+
+    def test_cobertura(self):
+        """Si el principal tarda, la cobertura responde y el perdedor se cancela."""
+        parser = self._parser(HedgePolicy(["ai:gpt4", "ai:qa"], after=0.05),
+                              ai_gpt4=self._backend("gpt4", lento=True), ai_qa=self._backend("qa"))
+
+        self.assertEqual(parser.render(documento("a")), "qa:a")
+        stats = parser.routing_stats()["ai:gpt4"]
+        self.assertEqual(stats["ai:qa"]["hedged"], 1)
+        self.assertEqual(stats["ai:qa"]["wins"], 1)
+        self.assertEqual(stats["ai:gpt4"]["cancelled"], 1)
+        self.assertEqual(stats["ai:qa"]["latency"]["count"], 1)
+
+    def test_cobertura_tras_el_percentil(self):
+        """Sin espera fija, la cobertura se lanza tras el p95 observado del backend."""
+        policy = HedgePolicy(["ai:gpt4", "ai:qa"], min_samples=3, initial_delay=10)
+        parser = self._parser(policy, ai_gpt4=self._backend("gpt4"), ai_qa=self._backend("qa"))
+        route = parser.routes["ai:gpt4"]
+
+        self.assertEqual(policy.hedge_delay("ai:gpt4", route._stats), 10)
+        parser.render(documento("a", "b", "c"))
+        self.assertEqual(policy.hedge_delay("ai:gpt4", route._stats),
+                         route._stats["ai:gpt4"].latency.percentile(95))
+        self.assertEqual(route.stats()["ai:gpt4"]["wins"], 3)
+        self.assertEqual(route.stats()["ai:qa"]["calls"], 0)
+
+    def test_latencia_observada(self):
+        """La política por latencia prueba primero el backend más rápido."""
+        policy = LatencyPolicy(["ai:gpt4", "ai:qa"], min_samples=1)
+        parser = self._parser(policy, ai_gpt4=self._backend("gpt4"), ai_qa=self._backend("qa"))
+        route = parser.routes["ai:gpt4"]
+        route._stats["ai:gpt4"].latency.record(2.0)
+        route._stats["ai:qa"].latency.record(0.1)
+
+        self.assertEqual(parser.render(documento("a")), "qa:a")
+
+    def test_render_asincrono_cancela_al_perdedor(self):
+        """En asyncio la llamada perdedora se cancela."""
+        canceladas = []
+
+        async def lento(var):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                canceladas.append(var.handler_key)
+                raise
+
+        async def rapido(var):
+            return f"qa:{var.name}"
+
+        parser = self._parser(HedgePolicy(["ai:gpt4", "ai:qa"], after=0.02), ai_gpt4=lento, ai_qa=rapido)
+
+        async def main():
+            resultado = await parser.arender(documento("a"))
+            await asyncio.sleep(0)
+            return resultado
+
+        self.assertEqual(asyncio.run(main()), "qa:a")
+        self.assertEqual(canceladas, ["ai:gpt4"])
+        self.assertEqual(parser.routing_stats()["ai:gpt4"]["ai:gpt4"]["cancelled"], 1)
+
+    def test_intentos_por_el_registro_de_invocaciones(self):
+        """Cada backend usa su cortacircuitos y su registro de latencias."""
+        capa = Resilience(RetryPolicy(max_attempts=1), failure_threshold=2)
+        parser = KMCParser(batch_size=1, resilience=capa)
+        parser.register_generative_handler("ai:gpt4", self._backend("gpt4", error=True))
+        parser.register_generative_handler("ai:qa", self._backend("qa"))
+        parser.set_routing_policy("ai:gpt4", FallbackPolicy(["ai:gpt4", "ai:qa"]))
+
+        self.assertEqual(parser.render(documento("a", "b", "c")), "qa:a qa:b qa:c")
+
+        # Con el cortacircuitos de ai:gpt4 abierto, la tercera variable no llega a llamarlo
+        self.assertEqual([nombre for nombre, _ in self.llamadas], ["gpt4", "qa", "gpt4", "qa", "qa"])
+        self.assertEqual(capa.breaker("ai:gpt4").state, "open")
+        self.assertEqual(capa.breaker("ai:qa").state, "closed")
+        self.assertEqual(parser.latency_tracker.stats()["ai:qa"]["count"], 3)
+        self.assertEqual(parser.latency_tracker.stats()["ai:gpt4"]["count"], 2)
+
+    def test_executor_acotado_del_parser(self):
+        """Las coberturas en hilos usan el executor del parser, que se cierra con close()."""
+        parser = self._parser(HedgePolicy(["ai:gpt4", "ai:qa"], after=0.05), route_workers=2,
+                              ai_gpt4=self._backend("gpt4", lento=True), ai_qa=self._backend("qa"))
+
+        self.assertEqual(parser.render(documento("a")), "qa:a")
+        executor = parser._route_executor
+        self.assertEqual(executor._max_workers, 2)
+
+        parser.close()
+        self.assertIsNone(parser._route_executor)
+        with self.assertRaises(RuntimeError):
+            executor.submit(print)
+
+    def test_ruta_en_el_registro(self):
+        """El registro enruta sus handlers y el último error se propaga como placeholder."""
+        registry.register_generative_handler("ai:gpt4", self._backend("gpt4", error=True))
+        registry.register_generative_handler("ai:qa", self._backend("qa", error=True))
+        registry.set_routing_policy("ai:gpt4", FallbackPolicy(["ai:gpt4", "ai:qa"]))
+
+        self.assertEqual(KMCParser(batch_size=1).render(documento("a")), "<ai:gpt4:a>")
+        self.assertEqual(len(self.llamadas), 2)
+        self.assertEqual(registry.routing_stats()["ai:gpt4"]["ai:qa"]["errors"], 1)
+
+        registry.set_routing_policy("ai:gpt4", None)
+        self.assertNotIn("ai:gpt4", registry.routes)
+
+
+if __name__ == '__main__':
+    unittest.main()
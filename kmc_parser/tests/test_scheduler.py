@@ -0,0 +1,148 @@
+"""
+Tests para la planificación de invocaciones generativas por dependencias.
+"""
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from ..parser import KMCParser
+from ..core import registry, DependencyGraph, DependencyCycleError
+from . import RegistryTestCase
+
+
+class TestKMCDependencyScheduler(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        registry.register_metadata_handler("doc", lambda var: f"meta-{var}")
+        self.parser = KMCParser()
+        self.orden = []
+        self.lock = threading.Lock()
+
+        def ai_handler(var):
+            time.sleep(0.02)
+            with self.lock:
+                self.orden.append(var.name)
+            return f"({var.name}: {var.prompt})"
+
+        self.parser.register_generative_handler("ai:gpt4", ai_handler)
+
+    def test_encadenamiento_de_definiciones(self):
+        """Un prompt que usa otra definición recibe su valor ya generado."""
+        contenido = """<!-- KMC_DEFINITION FOR [{doc:conclusion}]:
+GENERATIVE_SOURCE = {{ai:gpt4:conclusion}}
+PROMPT = "Concluye a partir de [{doc:resumen}] y {{ai:gpt4:datos}}"
+FORMAT = "text/plain"
+-->
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:resumen}}
+PROMPT = "Resume [{doc:titulo}]"
+FORMAT = "text/plain"
+-->
+[{doc:conclusion}]"""
+
+        for max_workers in (None, 4):
+            self.orden = []
+            resultado = self.parser.render(contenido, max_workers=max_workers)
+
+            self.assertEqual(
+                resultado,
+                "(conclusion: Concluye a partir de (resumen: Resume meta-titulo) y (datos: None))"
+            )
+            self.assertEqual(self.orden[-1], "conclusion")
+            self.assertEqual(resultado.report.dependency_waves, 2)
+
+        self.assertEqual(asyncio.run(self.parser.arender(contenido)), resultado)
+
+    def test_variable_generativa_depende_de_definicion(self):
+        """Las variables generativas del cuerpo también esperan a sus dependencias."""
+        contenido = """{{ai:gpt4:titular}}
+<!-- AI_PROMPT FOR {{ai:gpt4:titular}}:
+Titular para [{doc:resumen}]
+-->
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:resumen}}
+PROMPT = "Resume el informe"
+FORMAT = "text/plain"
+-->
+[{doc:resumen}]"""
+
+        resultado = self.parser.render(contenido)
+
+        self.assertEqual(
+            resultado,
+            "(titular: Titular para (resumen: Resume el informe))\n(resumen: Resume el informe)"
+        )
+        self.assertEqual(self.orden, ["resumen", "titular"])
+
+    def test_ciclos_detectados_antes_de_invocar(self):
+        """Un ciclo entre definiciones se notifica sin invocar ningún handler."""
+        contenido = """<!-- KMC_DEFINITION FOR [{doc:a}]:
+GENERATIVE_SOURCE = {{ai:gpt4:a}}
+PROMPT = "Usa [{doc:b}]"
+FORMAT = "text/plain"
+-->
+<!-- KMC_DEFINITION FOR [{doc:b}]:
+GENERATIVE_SOURCE = {{ai:gpt4:b}}
+PROMPT = "Usa [{doc:a}]"
+FORMAT = "text/plain"
+-->
+[{doc:a}] {{ai:gpt4:libre}}"""
+
+        with self.assertRaises(DependencyCycleError) as error:
+            self.parser.render(contenido)
+
+        self.assertEqual(sorted(node[1] for node in error.exception.cycle), ["doc:a", "doc:b"])
+        self.assertEqual(self.orden, [])
+
+    def test_nodos_arrancan_al_estar_listos(self):
+        """Con executor un nodo no espera al resto de su oleada."""
+        grafo = DependencyGraph({"lento": [], "rapido": [], "hijo": ["rapido"]})
+        inicio = {}
+
+        def execute(nodo):
+            inicio[nodo] = time.perf_counter()
+            time.sleep(0.2 if nodo == "lento" else 0.01)
+            return nodo.upper()
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            resultados = grafo.run(execute, executor)
+
+        self.assertEqual(grafo.waves, [["lento", "rapido"], ["hijo"]])
+        self.assertEqual(resultados, {"lento": "LENTO", "rapido": "RAPIDO", "hijo": "HIJO"})
+        self.assertLess(inicio["hijo"] - inicio["lento"], 0.1)
+
+    def test_preparacion_sin_esperar_a_la_oleada(self):
+        """Al preparar lotes, una cadena corta termina antes que un nodo lento de su oleada."""
+        grafo = DependencyGraph({"lento": [], "rapido": [], "hijo": ["rapido"], "tardio": ["lento"],
+                                 "nieto": ["hijo"]})
+        fin = {}
+        grupos = []
+
+        def execute(nodo):
+            time.sleep(0.3 if nodo == "lento" else 0.01)
+            fin[nodo] = time.perf_counter()
+            return nodo.upper()
+
+        async def aexecute(nodo):
+            await asyncio.sleep(0.3 if nodo == "lento" else 0.01)
+            fin[nodo] = time.perf_counter()
+            return nodo.upper()
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            resultados = grafo.run(execute, executor, grupos.append)
+        self.assertEqual(resultados["nieto"], "NIETO")
+        self.assertLess(fin["nieto"], fin["lento"])
+        self.assertEqual(grupos, [["lento", "rapido"], ["hijo"], ["nieto"], ["tardio"]])
+
+        fin.clear()
+        grupos.clear()
+        resultados = asyncio.run(grafo.arun(aexecute, grupos.append))
+        self.assertEqual(resultados["nieto"], "NIETO")
+        self.assertLess(fin["nieto"], fin["lento"])
+        self.assertEqual(grupos, [["lento", "rapido"], ["hijo"], ["nieto"], ["tardio"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
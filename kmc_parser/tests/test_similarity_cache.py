@@ -0,0 +1,124 @@
+"""
+Tests para la cache de resultados de prompts casi idénticos.
+"""
+import unittest
+from ..parser import KMCParser
+from ..core import registry, SimilarityCache
+from ..core.similarity import normalize_prompt
+from ..handlers.base import GenerativeHandler
+from . import RegistryTestCase
+
+
+class EchoHandler(GenerativeHandler):
+    """Handler generativo de prueba que cuenta sus invocaciones"""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.calls = []
+
+    def _generate_content(self, var):
+        self.calls.append(var.prompt)
+        return f"[{var.name}: {var.prompt}]"
+
+
+PLANTILLA = """{{{{ai:gpt4:resumen}}}}
+<!-- KMC {{{{ai:gpt4:resumen}}}}:"{prompt}" -->"""
+
+PROMPT = "Resume el estado del proyecto Demo, iniciado el [[project:fecha_inicio]], con foco en los riesgos técnicos"
+
+
+class TestKMCSimilarityCache(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.proyecto = {"fecha_inicio": "2024-01-15"}
+        registry.register_context_handler("project", lambda var: self.proyecto.get(var))
+        self.cache = SimilarityCache(threshold=0.9)
+        self.handler = EchoHandler({"approximate_cache": True})
+        self.parser = KMCParser(similarity_cache=self.cache)
+        self.parser.register_generative_handler("ai:gpt4", self.handler)
+
+    def _render(self, prompt=PROMPT):
+        return self.parser.render(PLANTILLA.format(prompt=prompt))
+
+    def test_normalizacion(self):
+        """La normalización ignora mayúsculas, acentos, puntuación, espacios y fechas."""
+        self.assertEqual(
+            normalize_prompt("  Resume   el PROYECTO, iniciado el 15/01/2024 (técnico)."),
+            "resume el proyecto iniciado el fecha tecnico"
+        )
+
+    def test_fecha_distinta_reutiliza_resultado(self):
+        """Un prompt que solo cambia en la fecha reutiliza el resultado anterior."""
+        primero = self._render()
+        self.proyecto["fecha_inicio"] = "2024-02-20"
+
+        segundo = self._render()
+
+        self.assertEqual(segundo, primero)
+        self.assertEqual(len(self.handler.calls), 1)
+        self.assertEqual(segundo.report.approximate_invocations, 1)
+        self.assertEqual(segundo.report.handler_invocations, 0)
+
+    def test_variaciones_menores(self):
+        """Espacios y puntuación distintos no fuerzan una nueva invocación."""
+        self._render()
+        self._render(PROMPT.replace(", ", "  ").replace("Resume", "resume") + ".")
+
+        self.assertEqual(len(self.handler.calls), 1)
+
+    def test_prompts_distintos_se_generan(self):
+        """Un prompt con otro contenido no supera el umbral y se genera."""
+        self._render()
+        resultado = self._render("Escribe un poema sobre el mar")
+
+        self.assertEqual(len(self.handler.calls), 2)
+        self.assertIn("poema", resultado)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_solo_handlers_tolerantes(self):
+        """Los handlers que no toleran resultados aproximados se invocan siempre."""
+        estricto = EchoHandler()
+        self.parser.register_generative_handler("ai:gpt4", estricto)
+
+        self._render()
+        self.proyecto["fecha_inicio"] = "2024-02-20"
+        self._render()
+        self.assertEqual(len(estricto.calls), 2)
+
+        self.cache.allow("ai:gpt4")
+        self._render()
+        self.assertEqual(len(estricto.calls), 3)
+        self.proyecto["fecha_inicio"] = "2024-03-01"
+        self._render()
+        self.assertEqual(len(estricto.calls), 3)
+
+    def test_ambito_por_variable(self):
+        """El resultado de una variable no se reutiliza para otra con prompt similar."""
+        self._render()
+        resultado = self.parser.render(PLANTILLA.format(prompt=PROMPT).replace("resumen", "informe"))
+
+        self.assertEqual(len(self.handler.calls), 2)
+        self.assertIn("[informe:", resultado)
+
+    def test_expulsion_lru(self):
+        """Al superar el tamaño máximo se expulsan los resultados menos usados."""
+        cache = SimilarityCache(max_entries=2)
+        cache.allow("ai:gpt4")
+        parser = KMCParser(similarity_cache=cache)
+        parser.register_generative_handler("ai:gpt4", EchoHandler())
+
+        for tema in ("el mar", "la montaña", "el desierto"):
+            parser.render(PLANTILLA.format(prompt=f"Escribe un poema sobre {tema}"))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_umbral_invalido(self):
+        """El umbral debe estar entre 0 y 1."""
+        with self.assertRaises(ValueError):
+            SimilarityCache(threshold=1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Tests para la agrupación de invocaciones generativas idénticas en curso.
+"""
+import asyncio
+import threading
+import time
+import unittest
+from ..parser import KMCParser
+from ..core import registry, SingleFlight
+from . import RegistryTestCase
+
+
+CONTENIDO = '{{ai:gpt4:resumen}}\n<!-- KMC {{ai:gpt4:resumen}}:"Resume el proyecto" -->'
+
+
+def esperar(condicion, limite=5.0):
+    """Espera activamente hasta que se cumpla la condición."""
+    fin = time.monotonic() + limite
+    while not condicion():
+        if time.monotonic() > fin:
+            raise AssertionError("condición no alcanzada")
+        time.sleep(0.001)
+
+
+class TestKMCSingleFlight(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.flights = SingleFlight()
+        self.parser = KMCParser(single_flight=self.flights)
+        self.liberar = threading.Event()
+        self.calls = []
+
+    def _handler_bloqueante(self, error=None):
+        """Registra un handler que no termina hasta que se libera el evento."""
+        def handler(var):
+            self.calls.append(var.name)
+            self.liberar.wait(5)
+            if error is not None:
+                raise error
+            return f"({var.name}: {var.prompt})"
+
+        self.parser.register_generative_handler("ai:gpt4", handler)
+
+    def _render_en_hilos(self, hilos):
+        """Renderiza CONTENIDO en varios hilos a la vez y retorna resultados o excepciones."""
+        resultados = [None] * hilos
+
+        def render(indice):
+            try:
+                resultados[indice] = self.parser.render(CONTENIDO)
+            except Exception as e:
+                resultados[indice] = e
+
+        trabajadores = [threading.Thread(target=render, args=(indice,)) for indice in range(hilos)]
+        for trabajador in trabajadores:
+            trabajador.start()
+        esperar(lambda: self.flights.stats()["coalesced"] == hilos - 1)
+        self.liberar.set()
+        for trabajador in trabajadores:
+            trabajador.join()
+        return resultados
+
+    def test_renders_simultaneos_en_hilos(self):
+        """Los renders simultáneos esperan a la primera invocación en lugar de repetirla."""
+        self._handler_bloqueante()
+
+        resultados = self._render_en_hilos(4)
+
+        self.assertEqual(self.calls, ["resumen"])
+        self.assertEqual(len(set(resultados)), 1)
+        self.assertIn("(resumen: Resume el proyecto)", resultados[0])
+        self.assertEqual(sum(r.report.handler_invocations for r in resultados), 1)
+        self.assertEqual(sum(r.report.coalesced_invocations for r in resultados), 3)
+        self.assertEqual(self.flights.stats(), {"leaders": 1, "coalesced": 3, "in_flight": 0})
+
+    def test_renders_simultaneos_asincronos(self):
+        """En asyncio las tareas con la misma invocación esperan el mismo future."""
+        async def handler(var):
+            self.calls.append(var.name)
+            await asyncio.sleep(0.01)
+            return f"({var.name}: {var.prompt})"
+
+        self.parser.register_generative_handler("ai:gpt4", handler)
+
+        async def main():
+            return await asyncio.gather(*(self.parser.arender(CONTENIDO) for _ in range(3)))
+
+        resultados = asyncio.run(main())
+
+        self.assertEqual(self.calls, ["resumen"])
+        self.assertEqual(len(set(resultados)), 1)
+        self.assertEqual(sum(r.report.coalesced_invocations for r in resultados), 2)
+
+    def test_errores_se_propagan_a_todos(self):
+        """Un error del handler llega a todos los que esperan y no queda almacenado."""
+        self._handler_bloqueante(RuntimeError("sin servicio"))
+
+        resultados = self._render_en_hilos(3)
+
+        self.assertEqual(self.calls, ["resumen"])
+        self.assertEqual([r.strip() for r in resultados], ["<ai:gpt4:resumen>"] * 3)
+        self.assertEqual(len(self.flights), 0)
+
+        self._handler_bloqueante()
+        self.assertIn("(resumen: Resume el proyecto)", self.parser.render(CONTENIDO))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_lider_cancelado_por_su_limite(self):
+        """Si el render que ejecuta la invocación agota su límite, el otro render la repite."""
+        async def handler(var):
+            self.calls.append(var.name)
+            await asyncio.sleep(0.2)
+            return f"({var.name}: {var.prompt})"
+
+        self.parser.register_generative_handler("ai:gpt4", handler)
+
+        async def main():
+            con_limite = asyncio.ensure_future(self.parser.arender(CONTENIDO, deadline=0.05))
+            await asyncio.sleep(0.01)
+            sin_limite = asyncio.ensure_future(self.parser.arender(CONTENIDO))
+            return await con_limite, await sin_limite
+
+        con_limite, sin_limite = asyncio.run(main())
+
+        self.assertEqual(con_limite.strip(), "<ai:gpt4:resumen>")
+        self.assertTrue(con_limite.report.deadline_exceeded)
+        self.assertIn("(resumen: Resume el proyecto)", sin_limite)
+        self.assertEqual(self.calls, ["resumen", "resumen"])
+        self.assertEqual(len(self.flights), 0)
+
+    def test_prompts_distintos_no_se_agrupan(self):
+        """Las invocaciones con prompts distintos se ejecutan por separado."""
+        def handler(var):
+            self.calls.append(var.prompt)
+            return var.prompt
+
+        self.parser.register_generative_handler("ai:gpt4", handler)
+
+        self.parser.render(CONTENIDO)
+        self.parser.render(CONTENIDO.replace("Resume", "Sintetiza"))
+
+        self.assertEqual(self.calls, ["Resume el proyecto", "Sintetiza el proyecto"])
+        self.assertEqual(self.flights.stats()["coalesced"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests para el render por fragmentos de documentos KMC.
+"""
+import asyncio
+import io
+import threading
+import unittest
+from ..parser import KMCParser
+from ..core import registry
+from . import RegistryTestCase
+
+
+CONTENIDO = """# [[project:nombre]]
+
+Introducción de [[project:nombre]].
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:lento:resumen}}
+PROMPT = "Resume [[project:nombre]]"
+FORMAT = "text/plain"
+-->
+## Resumen
+[{doc:resumen}]
+
+## Cierre
+{{ai:lento:cierre}}
+"""
+
+
+class TestKMCStreamRender(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        registry.register_context_handler("project", lambda var: "Demo" if var == "nombre" else None)
+        self.parser = KMCParser()
+        self.liberar = threading.Event()
+
+        def slow_handler(var):
+            # Bloquea hasta que el test haya recibido el primer fragmento
+            self.assertTrue(self.liberar.wait(5))
+            return f"<{var.name}: {var.prompt}>"
+
+        self.parser.register_generative_handler("ai:lento", slow_handler)
+
+    def tearDown(self):
+        """Restaura el registro global."""
+        self.liberar.set()
+        super().tearDown()
+
+    def test_primer_fragmento_antes_de_generar(self):
+        """El prefijo con valores contextuales se emite antes de que terminen los handlers."""
+        fragmentos = []
+        for fragmento in self.parser.render_stream(CONTENIDO):
+            fragmentos.append(fragmento)
+            self.liberar.set()
+
+        self.assertEqual(fragmentos[0], "# Demo\n\nIntroducción de Demo.\n## Resumen\n")
+        self.assertEqual("".join(fragmentos), self.parser.render(CONTENIDO))
+
+    def test_render_a_sink(self):
+        """render_to escribe los fragmentos en el destino y retorna el reporte."""
+        self.liberar.set()
+        destino = io.StringIO()
+
+        reporte = self.parser.render_to(CONTENIDO, destino, max_workers=2)
+
+        self.assertEqual(destino.getvalue(), self.parser.render(CONTENIDO))
+        self.assertEqual(reporte.handler_invocations, 2)
+
+    def test_stream_asincrono(self):
+        """arender_stream emite el prefijo antes que los valores generativos."""
+        async def consumir():
+            fragmentos = []
+            async for fragmento in self.parser.arender_stream(CONTENIDO):
+                fragmentos.append(fragmento)
+                self.liberar.set()
+            return fragmentos
+
+        fragmentos = asyncio.run(consumir())
+
+        self.assertEqual(fragmentos[0], "# Demo\n\nIntroducción de Demo.\n## Resumen\n")
+        self.assertEqual("".join(fragmentos), self.parser.render(CONTENIDO))
+
+    def test_documento_estatico(self):
+        """Un documento sin marcadores se emite en un único fragmento."""
+        self.assertEqual(list(self.parser.render_stream("Texto")), ["Texto"])
+
+
+if __name__ == '__main__':
+    unittest.main()
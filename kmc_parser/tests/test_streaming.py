@@ -0,0 +1,111 @@
+"""
+Tests para los handlers generativos que emiten deltas de texto.
+"""
+import asyncio
+import threading
+import unittest
+from ..parser import KMCParser
+from ..core import registry
+from ..models import GenerativeVariable
+from ..handlers.generative.ai.gpt4 import GPT4Handler
+from . import RegistryTestCase
+
+
+CONTENIDO = """# Informe
+<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:stream:resumen}}
+PROMPT = "Resume el informe"
+FORMAT = "text/plain"
+-->
+[{doc:resumen}]
+Fin"""
+
+
+class TestKMCStreamingHandlers(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.parser = KMCParser()
+        self.continuar = threading.Event()
+
+    def tearDown(self):
+        """Restaura el registro global."""
+        self.continuar.set()
+        super().tearDown()
+
+    def test_simulacion_gpt4_por_deltas(self):
+        """El modo simulación de GPT-4 emite deltas cuya concatenación es la respuesta completa."""
+        self.parser.register_generative_handler("ai:stream", GPT4Handler({"stream": True}))
+        completo = KMCParser()
+        completo.register_generative_handler("ai:stream", GPT4Handler())
+
+        variable = GenerativeVariable("ai", "stream", "resumen", prompt="Resume el informe")
+        deltas = list(GPT4Handler({"stream": True})(variable))
+        fragmentos = list(self.parser.render_stream(CONTENIDO))
+
+        self.assertGreater(len(deltas), 3)
+        self.assertEqual("".join(fragmentos), completo.render(CONTENIDO))
+        self.assertEqual(self.parser.render(CONTENIDO), completo.render(CONTENIDO))
+
+    def test_deltas_reenviados_durante_la_generacion(self):
+        """Los deltas del placeholder en curso se emiten antes de que el handler termine."""
+        def streaming_handler(var):
+            yield "Primera parte. "
+            self.assertTrue(self.continuar.wait(5))
+            yield "Segunda parte."
+
+        self.parser.register_generative_handler("ai:stream", streaming_handler)
+
+        fragmentos = []
+        for fragmento in self.parser.render_stream(CONTENIDO):
+            fragmentos.append(fragmento)
+            if fragmento == "Primera parte. ":
+                self.continuar.set()
+
+        self.assertEqual(fragmentos, ["# Informe\n", "Primera parte. ", "Segunda parte.", "\nFin"])
+
+    def test_deltas_asincronos(self):
+        """Los iteradores asíncronos de deltas se reenvían en arender_stream."""
+        evento = {}
+
+        async def streaming_handler(var):
+            yield "Uno, "
+            await evento["continuar"].wait()
+            yield "dos."
+
+        self.parser.register_generative_handler("ai:stream", streaming_handler)
+
+        async def consumir():
+            evento["continuar"] = asyncio.Event()
+            fragmentos = []
+            async for fragmento in self.parser.arender_stream(CONTENIDO):
+                fragmentos.append(fragmento)
+                evento["continuar"].set()
+            return fragmentos
+
+        self.assertEqual(asyncio.run(consumir()), ["# Informe\n", "Uno, ", "dos.", "\nFin"])
+        # render bloqueante también consume iteradores asíncronos
+        evento.clear()
+        self.parser.register_generative_handler("ai:stream", lambda var: iter(["Uno, ", "dos."]))
+        self.assertEqual(self.parser.render(CONTENIDO), "# Informe\nUno, dos.\nFin")
+
+    def test_error_a_mitad_del_flujo(self):
+        """Si el flujo falla, el texto parcial va seguido del placeholder de error."""
+        def failing_handler(var):
+            yield "Parcial "
+            self.assertTrue(self.continuar.wait(5))
+            raise RuntimeError("corte")
+
+        self.parser.register_generative_handler("ai:stream", failing_handler)
+
+        fragmentos = []
+        for fragmento in self.parser.render_stream(CONTENIDO):
+            fragmentos.append(fragmento)
+            self.continuar.set()
+
+        self.assertEqual("".join(fragmentos), "# Informe\nParcial <doc:resumen>\nFin")
+        self.assertEqual(self.parser.render(CONTENIDO), "# Informe\n<doc:resumen>\nFin")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests para las plantillas compiladas y su cache.
+"""
+import unittest
+from ..parser import KMCParser
+from ..template import CompiledTemplate
+from ..core import registry
+from ..core.cache import TemplateCache
+from . import RegistryTestCase
+
+
+class TestCompiledTemplate(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.cache = TemplateCache()
+        self.parser = KMCParser(template_cache=self.cache)
+        self.contenido = """# [[project:nombre]]
+{{ai:gpt4:resumen}}
+<!-- AI_PROMPT FOR {{ai:gpt4:resumen}}:
+Resume [[project:nombre]]
+-->"""
+
+    def test_compile_usa_cache(self):
+        """Compilar el mismo contenido devuelve la misma plantilla desde la cache."""
+        primera = self.parser.compile(self.contenido)
+        segunda = self.parser.compile(self.contenido)
+
+        self.assertIsInstance(primera, CompiledTemplate)
+        self.assertIs(primera, segunda)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(primera.dependencies["{{ai:gpt4:resumen}}"]["context"], ["project:nombre"])
+
+    def test_render_reutiliza_plantilla_con_distintos_contextos(self):
+        """Una plantilla compilada se renderiza varias veces sin modificarse."""
+        self.parser.register_generative_handler("ai:gpt4", lambda var: f"<{var.prompt}>")
+        plantilla = self.parser.compile(self.contenido)
+
+        registry.register_context_handler("project", lambda var: "Alfa")
+        primero = self.parser.render(plantilla)
+        registry.register_context_handler("project", lambda var: "Beta")
+        segundo = self.parser.render(self.contenido)
+
+        self.assertEqual(primero, "# Alfa\n<Resume Alfa>\n")
+        self.assertEqual(segundo, "# Beta\n<Resume Beta>\n")
+        self.assertEqual(plantilla.generative_vars["{{ai:gpt4:resumen}}"].prompt, "Resume [[project:nombre]]")
+
+    def test_process_document_compila_una_vez(self):
+        """process_document analiza el contenido una única vez."""
+        self.parser.process_document(markdown_content=self.contenido)
+
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_expulsion_por_tamano(self):
+        """La cache expulsa las plantillas menos usadas al superar su tamaño máximo."""
+        plantilla = self.parser.compile("[[project:a]]" + "x" * 1000)
+        cache = TemplateCache(max_entries=10, max_bytes=plantilla.size * 2)
+        parser = KMCParser(template_cache=cache)
+
+        parser.compile("[[project:a]]" + "x" * 1000)
+        parser.compile("[[project:b]]" + "x" * 1000)
+        parser.compile("[[project:a]]" + "x" * 1000)
+        parser.compile("[[project:c]]" + "x" * 1000)
+
+        stats = cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["entries"], 2)
+        self.assertLessEqual(stats["bytes"], plantilla.size * 2)
+        # "b" fue la menos usada recientemente y se expulsó
+        self.assertEqual(parser.compile("[[project:a]]" + "x" * 1000).content[:13], "[[project:a]]")
+        self.assertEqual(cache.stats()["hits"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
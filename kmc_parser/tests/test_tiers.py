@@ -0,0 +1,155 @@
+"""
+Tests para la degradación a generadores más baratos según el tiempo restante del render.
+"""
+import asyncio
+import threading
+import unittest
+from ..parser import KMCParser
+from ..core import registry, LatencyTracker, Tier, TierGroup
+from ..core.cache import OutputCache
+from . import RegistryTestCase
+
+
+def documento(*nombres):
+    return " ".join(f"{{{{ai:gpt4:{nombre}}}}}" for nombre in nombres)
+
+
+class TestKMCTiers(RegistryTestCase):
+    def setUp(self):
+        """Configuración inicial para cada test."""
+        super().setUp()
+        self.parser = KMCParser(batch_size=1)
+        for handler_key in ("ai:gpt4", "ai:mini", "local:stub"):
+            self.parser.register_generative_handler(
+                handler_key, lambda var: f"{var.handler_key}:{var.name}")
+        self.tiers = [Tier("ai:gpt4", cost=10), Tier("ai:mini", cost=1), Tier("local:stub", cost=0)]
+        self.parser.set_handler_tiers("ai:gpt4", self.tiers, min_samples=1)
+
+    def _observar(self, handler_key, segundos):
+        self.parser.latency_tracker.record(handler_key, segundos)
+
+    def test_eleccion_de_nivel(self):
+        """Se elige el primer nivel cuya latencia cabe en el tiempo restante."""
+        latencias = LatencyTracker()
+        grupo = TierGroup([Tier("ai:gpt4"), Tier("ai:mini", latency=0.5), "local:stub"], min_samples=2)
+        latencias.record("ai:gpt4", 3)
+        latencias.record("ai:gpt4", 4)
+
+        self.assertEqual(grupo.select(None, latencias).handler_key, "ai:gpt4")
+        self.assertEqual(grupo.select(10, latencias).handler_key, "ai:gpt4")
+        self.assertEqual(grupo.select(1, latencias).handler_key, "ai:mini")
+        self.assertEqual(grupo.select(0.1, latencias).handler_key, "local:stub")
+
+    def test_sin_limite_usa_el_primer_nivel(self):
+        """Sin deadline se usa siempre el mejor nivel, aunque sea lento."""
+        self._observar("ai:gpt4", 30)
+
+        resultado = self.parser.render(documento("a"))
+
+        self.assertEqual(resultado, "ai:gpt4:a")
+        self.assertEqual(resultado.report.tier_choices, {"{{ai:gpt4:a}}": "ai:gpt4"})
+        self.assertEqual(resultado.report.degraded_nodes, [])
+
+    def test_degradacion_por_presupuesto(self):
+        """Con poco tiempo restante la variable se genera con un nivel más barato."""
+        self._observar("ai:gpt4", 30)
+        self._observar("ai:mini", 0.01)
+
+        resultado = self.parser.render(documento("a", "b"), deadline=5)
+
+        self.assertEqual(resultado, "ai:mini:a ai:mini:b")
+        self.assertEqual(resultado.report.tier_choices,
+                         {"{{ai:gpt4:a}}": "ai:mini", "{{ai:gpt4:b}}": "ai:mini"})
+        self.assertEqual(resultado.report.degraded_nodes, ["{{ai:gpt4:a}}", "{{ai:gpt4:b}}"])
+        self.assertEqual(resultado.report.tier_cost, 2)
+        self.assertEqual(resultado.report.variable_status["{{ai:gpt4:a}}"], "resolved")
+
+    def test_definiciones(self):
+        """Las KMC_DEFINITION también se degradan y su placeholder no cambia."""
+        self._observar("ai:gpt4", 30)
+        self._observar("ai:mini", 30)
+        contenido = """<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:resumen}}
+PROMPT = "Resume el proyecto"
+-->
+[{doc:resumen}]"""
+
+        resultado = self.parser.render(contenido, deadline=5)
+        self.assertEqual(resultado.strip(), "local:stub:resumen")
+        self.assertEqual(resultado.report.tier_choices, {"[{doc:resumen}]": "local:stub"})
+
+        self.parser.generative_handlers.pop("local:stub")
+        self.assertEqual(self.parser.render(contenido, deadline=5).strip(), "<doc:resumen>")
+
+    def test_valores_degradados_fuera_de_la_cache(self):
+        """Los valores de un nivel degradado no se reutilizan en un render con tiempo."""
+        parser = KMCParser(batch_size=1, output_cache=OutputCache())
+        for handler_key in ("ai:gpt4", "ai:mini"):
+            parser.register_generative_handler(handler_key, lambda var: f"{var.handler_key}:{var.name}")
+        parser.set_handler_tiers("ai:gpt4", ["ai:gpt4", "ai:mini"], min_samples=1)
+        parser.latency_tracker.record("ai:gpt4", 30)
+        contenido = """<!-- KMC_DEFINITION FOR [{doc:resumen}]:
+GENERATIVE_SOURCE = {{ai:gpt4:resumen}}
+PROMPT = "Resume el proyecto"
+-->
+[{doc:resumen}] / {{ai:gpt4:titulo}}
+<!-- AI_PROMPT FOR {{ai:gpt4:titulo}}:
+Título para [{doc:resumen}]
+-->"""
+
+        degradado = parser.render(contenido, deadline=5)
+        self.assertEqual(degradado.strip(), "ai:mini:resumen / ai:mini:titulo")
+
+        completo = parser.render(contenido)
+        self.assertEqual(completo.strip(), "ai:gpt4:resumen / ai:gpt4:titulo")
+        self.assertEqual(set(completo.report.variable_status.values()), {"resolved"})
+
+    def test_nivel_que_no_termina_a_tiempo(self):
+        """Un nivel que agota el límite cuenta como lento y el siguiente render se degrada."""
+        liberar = threading.Event()
+        self.addCleanup(liberar.set)
+
+        def lento(var):
+            liberar.wait(5)
+            return f"ai:gpt4:{var.name}"
+
+        self.parser.register_generative_handler("ai:gpt4", lento)
+        self.parser.set_handler_tiers("ai:gpt4", self.tiers, min_samples=1, unknown_floor=0.05)
+
+        primero = self.parser.render(documento("a"), deadline=0.1)
+        self.assertEqual(primero, "<ai:gpt4:a>")
+        self.assertGreaterEqual(self.parser.latency_tracker.stats()["ai:gpt4"]["p95"], 0.1)
+
+        segundo = self.parser.render(documento("a"), deadline=0.1)
+        self.assertEqual(segundo, "ai:mini:a")
+        self.assertEqual(segundo.report.degraded_nodes, ["{{ai:gpt4:a}}"])
+
+    def test_nivel_sin_muestras_con_poco_tiempo(self):
+        """Un nivel sin latencia conocida se salta si queda menos tiempo que el mínimo."""
+        grupo = TierGroup(["ai:gpt4", Tier("ai:mini", latency=0.01), "local:stub"], unknown_floor=1)
+        latencias = LatencyTracker()
+
+        self.assertEqual(grupo.select(2, latencias).handler_key, "ai:gpt4")
+        self.assertEqual(grupo.select(0.5, latencias).handler_key, "ai:mini")
+        self.assertEqual(grupo.select(0.001, latencias).handler_key, "local:stub")
+
+    def test_latencia_observada_por_el_registro(self):
+        """Cada llamada al handler se mide en el registro de latencias del parser."""
+        self.parser.render(documento("a", "b", "c"))
+
+        self.assertEqual(self.parser.latency_tracker.stats()["ai:gpt4"]["count"], 3)
+
+    def test_render_asincrono(self):
+        """arender elige el nivel igual que render."""
+        self._observar("ai:gpt4", 30)
+        self._observar("ai:mini", 30)
+
+        resultado = asyncio.run(self.parser.arender(documento("a"), deadline=5))
+
+        self.assertEqual(resultado, "local:stub:a")
+        self.assertEqual(resultado.report.tier_cost, 0)
+        self.assertEqual(self.parser.latency_tracker.stats()["local:stub"]["count"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()